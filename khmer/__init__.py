@@ -7,7 +7,7 @@
 """This is khmer; please see http://khmer.readthedocs.org/."""
 
 from __future__ import print_function
-from math import log
+from math import exp, log
 import json
 
 from khmer._khmer import Countgraph as _Countgraph
@@ -34,6 +34,12 @@ from khmer._khmer import ReadParser  # sandbox/to-casava-1.8-fastq.py
 # tests/test_read_parsers.py,scripts/{filter-abund-single,load-graph}.py
 # scripts/{abundance-dist-single,load-into-counting}.py
 
+from khmer._khmer import ReadBuffer  # scripts/trim-low-abund.py
+from khmer._khmer import StreamingTrimmer  # scripts/trim-low-abund.py
+from khmer._khmer import StreamingCorrector  # sandbox/correct-reads.py
+from khmer._khmer import LabelSweepWriter  # sandbox/sweep-reads.py
+from khmer._khmer import RecordWriter  # khmer/kfile.py
+
 import sys
 
 from struct import pack, unpack
@@ -43,30 +49,52 @@ __version__ = get_versions()['version']
 del get_versions
 
 
-def load_nodegraph(filename):
+def load_nodegraph(filename, mmap=False):
     """Load a nodegraph object from the given filename and return it.
 
     Keyword argument:
     filename -- the name of the nodegraph file
+    mmap -- map the file copy-on-write instead of reading it; processes
+        loading the same file then share its pages until they modify them.
+        The file must not be changed while the nodegraph is in use.
     """
     nodegraph = _Nodegraph(1, [1])
-    nodegraph.load(filename)
+    nodegraph.load(filename, mmap)
 
     return nodegraph
 
 
-def load_countgraph(filename):
+def load_countgraph(filename, mmap=False):
     """Load a countgraph object from the given filename and return it.
 
     Keyword argument:
     filename -- the name of the countgraph file
+    mmap -- map the file copy-on-write instead of reading it; processes
+        loading the same file then share its pages until they modify them.
+        Ignored for gzipped files. The file must not be changed while the
+        countgraph is in use.
     """
     countgraph = _Countgraph(1, [1])
-    countgraph.load(filename)
+    countgraph.load(filename, mmap)
 
     return countgraph
 
 
+def load_hllcounter(filename):
+    """Load a HyperLogLog counter from the given filename and return it.
+
+    The k-mer size, error rate and hash function are those of the saved
+    counter.
+
+    Keyword argument:
+    filename -- the name of the HLL counter file
+    """
+    hllcounter = HLLCounter()
+    hllcounter.load(filename)
+
+    return hllcounter
+
+
 def extract_nodegraph_info(filename):
     """Open the given nodegraph file and return a tuple of information.
 
@@ -161,7 +189,14 @@ def calc_expected_collisions(graph, force=False, max_false_pos=.2):
     min_size = min(sizes)
 
     fp_one = occupancy / min_size
-    fp_all = fp_one ** n_ht
+    if isinstance(graph, _Countgraph) and graph.is_blocked():
+        bins_per_block = 64
+        if graph.is_small_count():
+            bins_per_block = 128
+        fp_all = _blocked_false_positive_rate(fp_one, len(sizes),
+                                              bins_per_block)
+    else:
+        fp_all = fp_one ** n_ht
 
     if fp_all > max_false_pos:
         print("**", file=sys.stderr)
@@ -184,6 +219,29 @@ def calc_expected_collisions(graph, force=False, max_false_pos=.2):
     return fp_all
 
 
+def _blocked_false_positive_rate(fp_one, n_tables, bins_per_block=64):
+    """Estimate the false positive rate of a blocked countgraph.
+
+    All of a k-mer's counters share one block, so the tables are not
+    independent: a query landing in a crowded block is likely to collide in
+    every table. The number of k-mers in a block is Poisson distributed with
+    a mean that is recovered from the per-table occupancy `fp_one`; the
+    result is the expected value of (per-block occupancy) ** n_tables.
+    """
+    if fp_one >= 1:
+        return 1.0
+    width = bins_per_block // n_tables
+    keep = 1.0 - 1.0 / width
+    lam = -width * log(1.0 - fp_one)
+
+    fp_all = 0.0
+    binom = 1.0
+    for j in range(n_tables + 1):
+        fp_all += (-1) ** j * binom * exp(-lam * (1.0 - keep ** j))
+        binom = binom * (n_tables - j) / (j + 1)
+    return max(fp_all, 0.0)
+
+
 def is_prime(number):
     """Check if a number is prime."""
     if number < 2:
@@ -235,9 +293,10 @@ def get_n_primes_near_x(number, target):
 
 class Countgraph(_Countgraph):
 
-    def __new__(cls, k, starting_size, n_tables):
+    def __new__(cls, k, starting_size, n_tables, blocked=False,
+                small_count=False):
         primes = get_n_primes_near_x(n_tables, starting_size)
-        c = _Countgraph.__new__(cls, k, primes)
+        c = _Countgraph.__new__(cls, k, primes, blocked, small_count)
         c.primes = primes
         return c
 
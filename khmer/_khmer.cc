@@ -12,6 +12,8 @@
 // Must be first.
 #include <Python.h>
 
+#include <algorithm>
+#include <deque>
 #include <iostream>
 
 #include "khmer.hh"
@@ -23,6 +25,11 @@
 #include "labelhash.hh"
 #include "khmer_exception.hh"
 #include "hllcounter.hh"
+#include "pmap_file.hh"
+#include "read_buffer.hh"
+#include "trimming.hh"
+#include "label_writer.hh"
+#include "record_writer.hh"
 
 using namespace khmer;
 using namespace read_parsers;
@@ -210,6 +217,9 @@ typedef struct {
     PyObject_HEAD
     //! Pointer to the low-level parser object.
     read_parsers:: IParser *  parser;
+    //! Reads fetched by batch from the parser but not yet iterated over.
+    //! Only the single-read iterator draws from this buffer.
+    std:: deque< Read > *   read_buffer;
 } khmer_ReadParser_Object;
 
 
@@ -228,6 +238,8 @@ _ReadParser_dealloc(khmer_ReadParser_Object * obj)
 {
     Py_DECREF(obj->parser);
     obj->parser = NULL;
+    delete obj->read_buffer;
+    obj->read_buffer = NULL;
     Py_TYPE(obj)->tp_free((PyObject*)obj);
 }
 
@@ -267,6 +279,13 @@ _ReadParser_new( PyTypeObject * subtype, PyObject * args, PyObject * kwds )
         PyErr_SetString( PyExc_OSError, exc.what() );
         return NULL;
     }
+    try {
+        myself->read_buffer = new std:: deque< Read >( );
+    } catch (std::bad_alloc &exc) {
+        delete myself->parser;
+        myself->parser = NULL;
+        return PyErr_NoMemory();
+    }
     return self;
 }
 
@@ -277,53 +296,89 @@ _ReadParser_iternext( PyObject * self )
 {
     khmer_ReadParser_Object * myself  = (khmer_ReadParser_Object *)self;
     IParser *       parser  = myself->parser;
+    std:: deque< Read > * read_buffer = myself->read_buffer;
+
+    // Refill the buffer with a whole batch of reads at once, so that the
+    // parser lock is taken once per batch rather than once per read.
+    if (read_buffer->empty( )) {
+        bool        stop_iteration  = false;
+        std::string value_exception;
+        std::string file_exception;
+        bool        out_of_memory   = false;
+        std:: vector< Read >    batch;
+        size_t      n_reads         = 0;
+
+        Py_BEGIN_ALLOW_THREADS
+        stop_iteration = parser->is_complete( );
+        if (!stop_iteration) {
+            try {
+                n_reads = parser->imprint_next_read_batch( batch );
+                stop_iteration = (n_reads == 0);
+            } catch (NoMoreReadsAvailable &exc) {
+                stop_iteration = true;
+            } catch (khmer_file_exception &exc) {
+                file_exception = exc.what();
+            } catch (khmer_value_exception &exc) {
+                value_exception = exc.what();
+            } catch (std::bad_alloc &exc) {
+                out_of_memory = true;
+            }
+        }
+        Py_END_ALLOW_THREADS
+
+        if (out_of_memory) {
+            return PyErr_NoMemory();
+        }
+        if (!file_exception.empty()) {
+            PyErr_SetString(PyExc_OSError, file_exception.c_str());
+            return NULL;
+        }
+        if (!value_exception.empty()) {
+            PyErr_SetString(PyExc_ValueError, value_exception.c_str());
+            return NULL;
+        }
+
+        // Another thread may have refilled the buffer while we were
+        // parsing without the GIL, so append rather than assign.
+        read_buffer->insert( read_buffer->end( ),
+                             batch.begin( ), batch.begin( ) + n_reads );
+
+        // Note: Can simply return NULL instead of setting the StopIteration
+        //       exception.
+        if (stop_iteration && read_buffer->empty( )) {
+            return NULL;
+        }
+    }
 
-    bool        stop_iteration  = false;
-    const char *value_exception = NULL;
-    const char *file_exception  = NULL;
     Read       *the_read_PTR    = NULL;
     try {
         the_read_PTR = new Read( );
     } catch (std::bad_alloc &exc) {
         return PyErr_NoMemory();
     }
+    std:: swap( *the_read_PTR, read_buffer->front( ) );
+    read_buffer->pop_front( );
 
-    Py_BEGIN_ALLOW_THREADS
-    stop_iteration = parser->is_complete( );
-    if (!stop_iteration) {
-        try {
-            parser->imprint_next_read( *the_read_PTR );
-        } catch (NoMoreReadsAvailable &exc) {
-            stop_iteration = true;
-        } catch (khmer_file_exception &exc) {
-            file_exception = exc.what();
-        } catch (khmer_value_exception &exc) {
-            value_exception = exc.what();
-        }
-    }
-    Py_END_ALLOW_THREADS
+    PyObject * the_read_OBJECT = khmer_Read_Type.tp_alloc( &khmer_Read_Type, 1 );
+    ((khmer_Read_Object *)the_read_OBJECT)->read = the_read_PTR;
+    return the_read_OBJECT;
+}
 
-    // Note: Can simply return NULL instead of setting the StopIteration
-    //       exception.
-    if (stop_iteration) {
-        delete the_read_PTR;
-        return NULL;
-    }
 
-    if (file_exception != NULL) {
-        delete the_read_PTR;
-        PyErr_SetString(PyExc_OSError, file_exception);
-        return NULL;
-    }
-    if (value_exception != NULL) {
-        delete the_read_PTR;
-        PyErr_SetString(PyExc_ValueError, value_exception);
+// Hand any reads the single-read iterator has buffered back to the parser,
+// so that whatever reads from it next, here or in C++, gets them first; and
+// return the parser, or NULL with a Python exception set.
+static
+IParser *
+_ReadParser_unbuffered(khmer_ReadParser_Object * myself)
+{
+    try {
+        myself->parser->unread( *myself->read_buffer );
+    } catch (std::bad_alloc &exc) {
+        PyErr_NoMemory();
         return NULL;
     }
-
-    PyObject * the_read_OBJECT = khmer_Read_Type.tp_alloc( &khmer_Read_Type, 1 );
-    ((khmer_Read_Object *)the_read_OBJECT)->read = the_read_PTR;
-    return the_read_OBJECT;
+    return myself->parser;
 }
 
 
@@ -332,13 +387,16 @@ PyObject *
 _ReadPairIterator_iternext(khmer_ReadPairIterator_Object * myself)
 {
     khmer_ReadParser_Object * parent = (khmer_ReadParser_Object*)myself->parent;
-    IParser    *parser    = parent->parser;
+    IParser    *parser    = _ReadParser_unbuffered(parent);
+    if (parser == NULL) {
+        return NULL;
+    }
     uint8_t     pair_mode = myself->pair_mode;
 
     ReadPair    the_read_pair;
     bool        stop_iteration  = false;
-    const char *value_exception = NULL;
-    const char *file_exception  = NULL;
+    std::string value_exception;
+    std::string file_exception;
 
     Py_BEGIN_ALLOW_THREADS
     stop_iteration = parser->is_complete( );
@@ -359,12 +417,12 @@ _ReadPairIterator_iternext(khmer_ReadPairIterator_Object * myself)
     if (stop_iteration) {
         return NULL;
     }
-    if (file_exception != NULL) {
-        PyErr_SetString(PyExc_OSError, file_exception);
+    if (!file_exception.empty()) {
+        PyErr_SetString(PyExc_OSError, file_exception.c_str());
         return NULL;
     }
-    if (value_exception != NULL) {
-        PyErr_SetString(PyExc_ValueError, value_exception);
+    if (!value_exception.empty()) {
+        PyErr_SetString(PyExc_ValueError, value_exception.c_str());
         return NULL;
     }
 
@@ -432,7 +490,9 @@ static
 PyObject *
 ReadParser_get_num_reads(khmer_ReadParser_Object * me)
 {
-    return PyLong_FromLong(me->parser->get_num_reads());
+    // Reads sitting in the batch buffer have not been handed out yet.
+    return PyLong_FromLong(me->parser->get_num_reads() -
+                           me->read_buffer->size());
 }
 
 static
@@ -593,7 +653,34 @@ _PyObject_to_khmer_ReadParser( PyObject * py_object )
 {
     // TODO: Add type-checking.
 
-    return ((python:: khmer_ReadParser_Object *)py_object)->parser;
+    return python::_ReadParser_unbuffered(
+               (python:: khmer_ReadParser_Object *)py_object );
+}
+
+//
+// _PyObject_to_string -- copy a Python str or bytes object into a
+//                        std::string; sets a Python exception on failure.
+//
+
+static
+bool
+_PyObject_to_string( PyObject * py_object, std::string &out )
+{
+    if (PyUnicode_Check(py_object)) {
+        PyObject * encoded = PyUnicode_AsEncodedString(py_object, "utf-8",
+                             "strict");
+        if (encoded == NULL) {
+            return false;
+        }
+        out.assign(PyBytes_AS_STRING(encoded), PyBytes_GET_SIZE(encoded));
+        Py_DECREF(encoded);
+        return true;
+    } else if (PyBytes_Check(py_object)) {
+        out.assign(PyBytes_AS_STRING(py_object), PyBytes_GET_SIZE(py_object));
+        return true;
+    }
+    PyErr_SetString(PyExc_TypeError, "expected a sequence string");
+    return false;
 }
 
 typedef struct {
@@ -833,6 +920,9 @@ hashtable_consume_fasta_with_reads_parser(khmer_KHashtable_Object * me,
 
     read_parsers:: IParser * rparser =
         _PyObject_to_khmer_ReadParser( rparser_obj );
+    if (rparser == NULL) {
+        return NULL;
+    }
 
     // call the C++ function, and trap signals => Python
     unsigned long long  n_consumed      = 0;
@@ -938,13 +1028,23 @@ hashtable_load(khmer_KHashtable_Object * me, PyObject * args)
     Hashtable * hashtable = me->hashtable;
 
     const char * filename = NULL;
+    PyObject * use_mmap_o = NULL;
 
-    if (!PyArg_ParseTuple(args, "s", &filename)) {
+    if (!PyArg_ParseTuple(args, "s|O", &filename, &use_mmap_o)) {
         return NULL;
     }
 
+    bool use_mmap = false;
+    if (use_mmap_o != NULL) {
+        int is_true = PyObject_IsTrue(use_mmap_o);
+        if (is_true < 0) {
+            return NULL;
+        }
+        use_mmap = (bool) is_true;
+    }
+
     try {
-        hashtable->load(filename);
+        hashtable->load(filename, use_mmap);
     } catch (khmer_file_exception &e) {
         PyErr_SetString(PyExc_OSError, e.what());
         return NULL;
@@ -1183,6 +1283,83 @@ hashtable_median_at_least(khmer_KHashtable_Object * me, PyObject * args)
 
 }
 
+static
+PyObject *
+hashtable_normalize_fragments(khmer_KHashtable_Object * me, PyObject * args)
+{
+    Hashtable * hashtable = me->hashtable;
+
+    PyObject * fragments_o;
+    unsigned int cutoff;
+
+    if (!PyArg_ParseTuple(args, "OI", &fragments_o, &cutoff)) {
+        return NULL;
+    }
+
+    PyObject * fragments_fast = PySequence_Fast(fragments_o,
+                                "fragments must be a sequence");
+    if (fragments_fast == NULL) {
+        return NULL;
+    }
+    Py_ssize_t n_fragments = PySequence_Fast_GET_SIZE(fragments_fast);
+
+    // Copy all sequences out while we still hold the GIL.
+    std::vector< std::vector<std::string> > fragments(n_fragments);
+    for (Py_ssize_t i = 0; i < n_fragments; i++) {
+        PyObject * seqs_fast = PySequence_Fast(
+                                   PySequence_Fast_GET_ITEM(fragments_fast, i),
+                                   "each fragment must be a sequence of reads");
+        if (seqs_fast == NULL) {
+            Py_DECREF(fragments_fast);
+            return NULL;
+        }
+        Py_ssize_t n_seqs = PySequence_Fast_GET_SIZE(seqs_fast);
+        fragments[i].resize(n_seqs);
+        for (Py_ssize_t j = 0; j < n_seqs; j++) {
+            std::string &seq = fragments[i][j];
+            if (!_PyObject_to_string(PySequence_Fast_GET_ITEM(seqs_fast, j),
+                                     seq)) {
+                Py_DECREF(seqs_fast);
+                Py_DECREF(fragments_fast);
+                return NULL;
+            }
+            if (seq.length() < hashtable->ksize()) {
+                Py_DECREF(seqs_fast);
+                Py_DECREF(fragments_fast);
+                PyErr_SetString(PyExc_ValueError,
+                                "string length must >= the hashtable k-mer size");
+                return NULL;
+            }
+        }
+        Py_DECREF(seqs_fast);
+    }
+    Py_DECREF(fragments_fast);
+
+    std::vector<bool> keep(n_fragments);
+
+    Py_BEGIN_ALLOW_THREADS
+    for (Py_ssize_t i = 0; i < n_fragments; i++) {
+        std::vector<std::string> &seqs = fragments[i];
+        for (size_t j = 0; j < seqs.size(); j++) {
+            std::replace(seqs[j].begin(), seqs[j].end(), 'N', 'A');
+        }
+        keep[i] = hashtable->normalize_fragment(seqs, cutoff);
+    }
+    Py_END_ALLOW_THREADS
+
+    PyObject * x = PyList_New(n_fragments);
+    if (x == NULL) {
+        return NULL;
+    }
+    for (Py_ssize_t i = 0; i < n_fragments; i++) {
+        PyObject * flag = keep[i] ? Py_True : Py_False;
+        Py_INCREF(flag);
+        PyList_SET_ITEM(x, i, flag);
+    }
+
+    return x;
+}
+
 static
 PyObject *
 hashtable_n_tags(khmer_KHashtable_Object * me, PyObject * args)
@@ -1311,7 +1488,7 @@ hashtable_calc_connected_graph_size(khmer_KHashtable_Object * me,
     unsigned long long size = 0;
 
     Py_BEGIN_ALLOW_THREADS
-    SeenSet keeper;
+    KmerSet keeper;
     hashtable->calc_connected_graph_size(_kmer, size, keeper, max_size,
                                          break_on_circum);
     Py_END_ALLOW_THREADS
@@ -1442,6 +1619,67 @@ hashtable_do_subset_partition(khmer_KHashtable_Object * me, PyObject * args)
 }
 
 
+static
+PyObject *
+hashtable_partition_graph(khmer_KHashtable_Object * me, PyObject * args)
+{
+    Hashtable * hashtable = me->hashtable;
+
+    unsigned int n_threads = 1;
+    PyObject * break_on_stop_tags_o = NULL;
+    PyObject * stop_big_traversals_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "|IOO", &n_threads,
+                          &break_on_stop_tags_o,
+                          &stop_big_traversals_o)) {
+        return NULL;
+    }
+
+    bool break_on_stop_tags = false;
+    if (break_on_stop_tags_o != NULL) {
+        int is_true = PyObject_IsTrue(break_on_stop_tags_o);
+        if (is_true < 0) {
+            return NULL;
+        }
+        break_on_stop_tags = (bool) is_true;
+    }
+    bool stop_big_traversals = false;
+    if (stop_big_traversals_o != NULL) {
+        int is_true = PyObject_IsTrue(stop_big_traversals_o);
+        if (is_true < 0) {
+            return NULL;
+        }
+        stop_big_traversals = (bool) is_true;
+    }
+
+    bool out_of_memory = false;
+    std::string error;
+
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        hashtable->partition->partition_graph(n_threads, break_on_stop_tags,
+                                              stop_big_traversals);
+    } catch (std::bad_alloc &e) {
+        out_of_memory = true;
+    } catch (khmer_exception &e) {
+        error = e.what();
+        if (error.empty()) {
+            error = "error while partitioning the graph";
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    if (out_of_memory) {
+        return PyErr_NoMemory();
+    }
+    if (!error.empty()) {
+        PyErr_SetString(PyExc_RuntimeError, error.c_str());
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
 static
 PyObject *
 hashtable_join_partitions_by_path(khmer_KHashtable_Object * me, PyObject * args)
@@ -1498,6 +1736,72 @@ hashtable_merge_from_disk(khmer_KHashtable_Object * me, PyObject * args)
     Py_RETURN_NONE;
 }
 
+static
+PyObject *
+hashtable_merge_partitionmap_files(khmer_KHashtable_Object * me,
+                                   PyObject * args)
+{
+    Hashtable * hashtable = me->hashtable;
+
+    PyObject * infiles_o = NULL;
+    const char * outfile = NULL;
+    if (!PyArg_ParseTuple(args, "Os", &infiles_o, &outfile)) {
+        return NULL;
+    }
+
+    PyObject * infiles_fast = PySequence_Fast(infiles_o,
+                              "pmap files must be a sequence of filenames");
+    if (infiles_fast == NULL) {
+        return NULL;
+    }
+    Py_ssize_t n_infiles = PySequence_Fast_GET_SIZE(infiles_fast);
+
+    std::vector<std::string> infiles(n_infiles);
+    for (Py_ssize_t i = 0; i < n_infiles; i++) {
+        if (!_PyObject_to_string(PySequence_Fast_GET_ITEM(infiles_fast, i),
+                                 infiles[i])) {
+            Py_DECREF(infiles_fast);
+            return NULL;
+        }
+    }
+    Py_DECREF(infiles_fast);
+
+    std::string outfile_s = outfile;
+    std::string file_exception;
+    std::string error;
+    bool out_of_memory = false;
+
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        merge_pmap_files(infiles, outfile_s, hashtable->ksize(),
+                         hashtable->stop_tags);
+    } catch (khmer_file_exception &e) {
+        file_exception = e.what();
+    } catch (std::bad_alloc &e) {
+        out_of_memory = true;
+    } catch (khmer_exception &e) {
+        error = e.what();
+        if (error.empty()) {
+            error = "error while merging partition map files";
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    if (out_of_memory) {
+        return PyErr_NoMemory();
+    }
+    if (!file_exception.empty()) {
+        PyErr_SetString(PyExc_OSError, file_exception.c_str());
+        return NULL;
+    }
+    if (!error.empty()) {
+        PyErr_SetString(PyExc_RuntimeError, error.c_str());
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
 static
 PyObject *
 hashtable_consume_fasta_and_tag_with_reads_parser(khmer_KHashtable_Object * me,
@@ -1512,7 +1816,11 @@ hashtable_consume_fasta_and_tag_with_reads_parser(khmer_KHashtable_Object * me,
         return NULL;
     }
 
-    read_parsers:: IParser * rparser = rparser_obj-> parser;
+    read_parsers:: IParser * rparser =
+        _PyObject_to_khmer_ReadParser( (PyObject *) rparser_obj );
+    if (rparser == NULL) {
+        return NULL;
+    }
 
     // call the C++ function, and trap signals => Python
     const char         *value_exception = NULL;
@@ -1718,7 +2026,7 @@ hashtable_get_stop_tags(khmer_KHashtable_Object * me, PyObject * args)
     }
 
     WordLength k = hashtable->ksize();
-    SeenSet::const_iterator si;
+    KmerSet::const_iterator si;
 
     PyObject * x = PyList_New(hashtable->stop_tags.size());
     unsigned long long i = 0;
@@ -1743,7 +2051,7 @@ hashtable_get_tagset(khmer_KHashtable_Object * me, PyObject * args)
     }
 
     WordLength k = hashtable->ksize();
-    SeenSet::const_iterator si;
+    KmerSet::const_iterator si;
 
     PyObject * x = PyList_New(hashtable->all_tags.size());
     unsigned long long i = 0;
@@ -2059,18 +2367,23 @@ hashtable_save_subset_partitionmap(khmer_KHashtable_Object * me,
     }
 
     SubsetPartition * subset_p = subset_obj->subset;
+    std::string file_exception;
 
     Py_BEGIN_ALLOW_THREADS
 
     try {
         subset_p->save_partitionmap(filename);
     } catch (khmer_file_exception &e) {
-        PyErr_SetString(PyExc_OSError, e.what());
-        return NULL;
+        file_exception = e.what();
     }
 
     Py_END_ALLOW_THREADS
 
+    if (!file_exception.empty()) {
+        PyErr_SetString(PyExc_OSError, file_exception.c_str());
+        return NULL;
+    }
+
     Py_RETURN_NONE;
 }
 
@@ -2094,7 +2407,7 @@ hashtable_load_subset_partitionmap(khmer_KHashtable_Object * me,
         return PyErr_NoMemory();
     }
 
-    const char         *file_exception  = NULL;
+    std::string file_exception;
 
     Py_BEGIN_ALLOW_THREADS
     try {
@@ -2104,8 +2417,8 @@ hashtable_load_subset_partitionmap(khmer_KHashtable_Object * me,
     }
     Py_END_ALLOW_THREADS
 
-    if (file_exception != NULL) {
-        PyErr_SetString(PyExc_OSError, file_exception);
+    if (!file_exception.empty()) {
+        PyErr_SetString(PyExc_OSError, file_exception.c_str());
         delete subset_p;
         return NULL;
     }
@@ -2407,63 +2720,270 @@ hashtable_get_kmer_hashes(khmer_KHashtable_Object * me, PyObject * args)
 }
 
 
-static PyMethodDef khmer_hashtable_methods[] = {
-    //
-    // Basic methods
-    //
+//
+// Batch queries. These fill any writable buffer of unsigned integers of the
+// right size (array.array, numpy arrays, ...) with the GIL released, rather
+// than building a list of Python ints; without an output buffer they return
+// a new array.array.
+//
 
+// Get a C-contiguous buffer of unsigned integers of itemsize bytes holding at
+// least n items from obj. Sets a Python exception and returns false if obj
+// doesn't provide one.
+static
+bool
+_get_uint_buffer(PyObject * obj, Py_buffer * view, Py_ssize_t itemsize,
+                 bool writable, Py_ssize_t n)
+{
+    int flags = PyBUF_FORMAT | PyBUF_C_CONTIGUOUS;
+    if (writable) {
+        flags |= PyBUF_WRITABLE;
+    }
+    if (PyObject_GetBuffer(obj, view, flags) == -1) {
+        return false;
+    }
+
+    const char * format = view->format ? view->format : "B";
+    char code = format[strlen(format) - 1];
+    if (view->itemsize != itemsize || !strchr("BHILQN", code) ||
+            format[0] == '>' || format[0] == '!') {
+        PyErr_Format(PyExc_ValueError,
+                     "expected an array of native %d-byte unsigned integers",
+                     (int) itemsize);
+        PyBuffer_Release(view);
+        return false;
+    }
+    if (view->len / itemsize < n) {
+        PyErr_Format(PyExc_ValueError,
+                     "array too short: need room for %zd entries", n);
+        PyBuffer_Release(view);
+        return false;
+    }
+    return true;
+}
+
+// A new, zeroed array.array of n items of the given type code.
+static
+PyObject *
+_new_uint_array(const char * typecode, Py_ssize_t itemsize, Py_ssize_t n)
+{
+    PyObject * array_mod = PyImport_ImportModule("array");
+    if (array_mod == NULL) {
+        return NULL;
+    }
+
+    PyObject * zeros = PyBytes_FromStringAndSize(NULL, n * itemsize);
+    if (zeros == NULL) {
+        Py_DECREF(array_mod);
+        return NULL;
+    }
+    memset(PyBytes_AS_STRING(zeros), 0, n * itemsize);
+
+    PyObject * array = PyObject_CallMethod(array_mod, (char *) "array",
+                                           (char *) "sO", typecode, zeros);
+    Py_DECREF(zeros);
+    Py_DECREF(array_mod);
+    return array;
+}
+
+#define COUNTS_ARRAY_TYPECODE "H"
+#define HASHES_ARRAY_TYPECODE \
+    (sizeof(unsigned long) == sizeof(HashIntoType) ? "L" : "Q")
+
+// out_o if it's given, or a new array of n items; a new reference.
+static
+PyObject *
+_get_out_array(PyObject * out_o, const char * typecode, Py_ssize_t itemsize,
+               Py_ssize_t n)
+{
+    if (out_o == NULL || out_o == Py_None) {
+        return _new_uint_array(typecode, itemsize, n);
+    }
+    Py_INCREF(out_o);
+    return out_o;
+}
+
+static
+PyObject *
+hashtable_get_kmer_counts_array(khmer_KHashtable_Object * me, PyObject * args)
+{
+    Hashtable * hashtable = me->hashtable;
+    const char * sequence;
+    PyObject * out_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "s|O", &sequence, &out_o)) {
+        return NULL;
+    }
+
+    std::string seq(sequence);
+    Py_ssize_t n_kmers = 0;
+    if (seq.length() >= hashtable->ksize()) {
+        n_kmers = seq.length() - hashtable->ksize() + 1;
+    }
+
+    out_o = _get_out_array(out_o, COUNTS_ARRAY_TYPECODE,
+                           sizeof(BoundedCounterType), n_kmers);
+    if (out_o == NULL) {
+        return NULL;
+    }
+
+    Py_buffer out;
+    if (!_get_uint_buffer(out_o, &out, sizeof(BoundedCounterType), true,
+                          n_kmers)) {
+        Py_DECREF(out_o);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    hashtable->get_kmer_counts(seq, (BoundedCounterType *) out.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out);
+    return out_o;
+}
+
+static
+PyObject *
+hashtable_get_kmer_hashes_array(khmer_KHashtable_Object * me, PyObject * args)
+{
+    Hashtable * hashtable = me->hashtable;
+    const char * sequence;
+    PyObject * out_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "s|O", &sequence, &out_o)) {
+        return NULL;
+    }
+
+    std::string seq(sequence);
+    Py_ssize_t n_kmers = 0;
+    if (seq.length() >= hashtable->ksize()) {
+        n_kmers = seq.length() - hashtable->ksize() + 1;
+    }
+
+    out_o = _get_out_array(out_o, HASHES_ARRAY_TYPECODE, sizeof(HashIntoType),
+                           n_kmers);
+    if (out_o == NULL) {
+        return NULL;
+    }
+
+    Py_buffer out;
+    if (!_get_uint_buffer(out_o, &out, sizeof(HashIntoType), true, n_kmers)) {
+        Py_DECREF(out_o);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    hashtable->get_kmer_hashes(seq, (HashIntoType *) out.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out);
+    return out_o;
+}
+
+static
+PyObject *
+hashtable_get_counts_for_hashes(khmer_KHashtable_Object * me, PyObject * args)
+{
+    Hashtable * hashtable = me->hashtable;
+    PyObject * hashes_o;
+    PyObject * out_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O|O", &hashes_o, &out_o)) {
+        return NULL;
+    }
+
+    Py_buffer hashes;
+    if (!_get_uint_buffer(hashes_o, &hashes, sizeof(HashIntoType), false, 0)) {
+        return NULL;
+    }
+    Py_ssize_t n_hashes = hashes.len / sizeof(HashIntoType);
+
+    out_o = _get_out_array(out_o, COUNTS_ARRAY_TYPECODE,
+                           sizeof(BoundedCounterType), n_hashes);
+    if (out_o == NULL) {
+        PyBuffer_Release(&hashes);
+        return NULL;
+    }
+
+    Py_buffer out;
+    if (!_get_uint_buffer(out_o, &out, sizeof(BoundedCounterType), true,
+                          n_hashes)) {
+        PyBuffer_Release(&hashes);
+        Py_DECREF(out_o);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    hashtable->get_counts_for_hashes((const HashIntoType *) hashes.buf,
+                                     n_hashes,
+                                     (BoundedCounterType *) out.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&out);
+    PyBuffer_Release(&hashes);
+    return out_o;
+}
+
+
+static PyMethodDef khmer_hashtable_methods[] = {
+    //
+    // Basic methods
+    //
+
+    {
+        "ksize",
+        (PyCFunction)hashtable_get_ksize, METH_VARARGS,
+        "Returns the k-mer size of this graph."
+    },
+    { "hashsizes", (PyCFunction)hashtable_get_hashsizes, METH_VARARGS, "" },
+    {
+        "n_unique_kmers",
+        (PyCFunction)hashtable_n_unique_kmers, METH_VARARGS,
+        "Count the number of unique kmers in this graph."
+    },
+    {
+        "n_occupied", (PyCFunction)hashtable_n_occupied, METH_VARARGS,
+        "Count the number of occupied bins."
+    },
+    {
+        "count",
+        (PyCFunction)hashtable_count, METH_VARARGS,
+        "Increment the count of this k-mer."
+    },
+    {
+        "consume",
+        (PyCFunction)hashtable_consume, METH_VARARGS,
+        "Increment the counts of all of the k-mers in the string."
+    },
+    {
+        "consume_fasta",
+        (PyCFunction)hashtable_consume_fasta, METH_VARARGS,
+        "Incrment the counts of all the k-mers in the sequences in the "
+        "given file"
+    },
+    {
+        "consume_fasta_with_reads_parser",
+        (PyCFunction)hashtable_consume_fasta_with_reads_parser, METH_VARARGS,
+        "Count all k-mers retrieved with this reads parser object."
+    },
+    {
+        "get",
+        (PyCFunction)hashtable_get, METH_VARARGS,
+        "Retrieve the count for the given k-mer."
+    },
+    {
+        "load",
+        (PyCFunction)hashtable_load, METH_VARARGS,
+        "Load the graph from the specified file; if the optional second "
+        "argument is true, map an uncompressed file copy-on-write instead "
+        "of reading it."
+    },
+    {
+        "save",
+        (PyCFunction)hashtable_save, METH_VARARGS,
+        "Save the graph to the specified file."
+    },
     {
-        "ksize",
-        (PyCFunction)hashtable_get_ksize, METH_VARARGS,
-        "Returns the k-mer size of this graph."
-    },
-    { "hashsizes", (PyCFunction)hashtable_get_hashsizes, METH_VARARGS, "" },
-    {
-        "n_unique_kmers",
-        (PyCFunction)hashtable_n_unique_kmers, METH_VARARGS,
-        "Count the number of unique kmers in this graph."
-    },
-    {
-        "n_occupied", (PyCFunction)hashtable_n_occupied, METH_VARARGS,
-        "Count the number of occupied bins."
-    },
-    {
-        "count",
-        (PyCFunction)hashtable_count, METH_VARARGS,
-        "Increment the count of this k-mer."
-    },
-    {
-        "consume",
-        (PyCFunction)hashtable_consume, METH_VARARGS,
-        "Increment the counts of all of the k-mers in the string."
-    },
-    {
-        "consume_fasta",
-        (PyCFunction)hashtable_consume_fasta, METH_VARARGS,
-        "Incrment the counts of all the k-mers in the sequences in the "
-        "given file"
-    },
-    {
-        "consume_fasta_with_reads_parser",
-        (PyCFunction)hashtable_consume_fasta_with_reads_parser, METH_VARARGS,
-        "Count all k-mers retrieved with this reads parser object."
-    },
-    {
-        "get",
-        (PyCFunction)hashtable_get, METH_VARARGS,
-        "Retrieve the count for the given k-mer."
-    },
-    {
-        "load",
-        (PyCFunction)hashtable_load, METH_VARARGS,
-        "Load the graph from the specified file."
-    },
-    {
-        "save",
-        (PyCFunction)hashtable_save, METH_VARARGS,
-        "Save the graph to the specified file."
-    },
-    {
         "get_median_count",
         (PyCFunction)hashtable_get_median_count, METH_VARARGS,
         "Get the median, average, and stddev of the k-mer counts "
@@ -2484,6 +3004,24 @@ static PyMethodDef khmer_hashtable_methods[] = {
         (PyCFunction)hashtable_get_kmer_counts, METH_VARARGS,
         "Retrieve an ordered list of the counts of all k-mers in the string."
     },
+    {
+        "get_kmer_hashes_array",
+        (PyCFunction)hashtable_get_kmer_hashes_array, METH_VARARGS,
+        "Fill a buffer of 64-bit unsigned integers, or a new array.array, "
+        "with the hashes of all k-mers in the string."
+    },
+    {
+        "get_kmer_counts_array",
+        (PyCFunction)hashtable_get_kmer_counts_array, METH_VARARGS,
+        "Fill a buffer of 16-bit unsigned integers, or a new array.array, "
+        "with the counts of all k-mers in the string."
+    },
+    {
+        "get_counts_for_hashes",
+        (PyCFunction)hashtable_get_counts_for_hashes, METH_VARARGS,
+        "Given a buffer of 64-bit k-mer hashes, fill a buffer of 16-bit "
+        "unsigned integers, or a new array.array, with their counts."
+    },
 
     //
     // graph/traversal functionality
@@ -2515,6 +3053,13 @@ static PyMethodDef khmer_hashtable_methods[] = {
     { "consume_fasta_and_tag", (PyCFunction)hashtable_consume_fasta_and_tag, METH_VARARGS, "Count all k-mers in a given file" },
     { "get_median_count", (PyCFunction)hashtable_get_median_count, METH_VARARGS, "Get the median, average, and stddev of the k-mer counts in the string" },
     { "median_at_least", (PyCFunction)hashtable_median_at_least, METH_VARARGS, "Return true if the median is at least the given cutoff" },
+    {
+        "normalize_fragments",
+        (PyCFunction)hashtable_normalize_fragments, METH_VARARGS,
+        "Apply digital normalization to a list of fragments, each a tuple of "
+        "one or two read sequences, without holding the GIL; returns a list "
+        "of booleans, True for each fragment kept (and consumed)."
+    },
     { "extract_unique_paths", (PyCFunction)hashtable_extract_unique_paths, METH_VARARGS, "" },
     { "print_tagset", (PyCFunction)hashtable_print_tagset, METH_VARARGS, "" },
     { "add_tag", (PyCFunction)hashtable_add_tag, METH_VARARGS, "" },
@@ -2528,6 +3073,7 @@ static PyMethodDef khmer_hashtable_methods[] = {
 
     // partitioning
     { "do_subset_partition", (PyCFunction)hashtable_do_subset_partition, METH_VARARGS, "" },
+    { "partition_graph", (PyCFunction)hashtable_partition_graph, METH_VARARGS, "Partition all tags on n_threads threads, merging into this graph's partition map." },
     { "find_all_tags", (PyCFunction)hashtable_find_all_tags, METH_VARARGS, "" },
     { "assign_partition_id", (PyCFunction)hashtable_assign_partition_id, METH_VARARGS, "" },
     { "output_partitions", (PyCFunction)hashtable_output_partitions, METH_VARARGS, "" },
@@ -2544,6 +3090,7 @@ static PyMethodDef khmer_hashtable_methods[] = {
     { "join_partitions_by_path", (PyCFunction)hashtable_join_partitions_by_path, METH_VARARGS, "" },
     { "merge_subset", (PyCFunction)hashtable_merge_subset, METH_VARARGS, "" },
     { "merge_subset_from_disk", (PyCFunction)hashtable_merge_from_disk, METH_VARARGS, "" },
+    { "merge_partitionmap_files", (PyCFunction)hashtable_merge_partitionmap_files, METH_VARARGS, "Merge sorted pmap files into one packed pmap file, streaming." },
     { "count_partitions", (PyCFunction)hashtable_count_partitions, METH_VARARGS, "" },
     { "subset_count_partitions", (PyCFunction)hashtable_subset_count_partitions, METH_VARARGS, "" },
     { "subset_partition_size_distribution", (PyCFunction)hashtable_subset_partition_size_distribution, METH_VARARGS, "" },
@@ -2664,6 +3211,75 @@ count_trim_on_abundance(khmer_KCountingHash_Object * me, PyObject * args)
     return ret;
 }
 
+static
+PyObject *
+count_median_and_trim_many(khmer_KCountingHash_Object * me, PyObject * args)
+{
+    CountingHash * counting = me->counting;
+
+    PyObject * seqs_o = NULL;
+    unsigned int min_count_i = 0;
+
+    if (!PyArg_ParseTuple(args, "OI", &seqs_o, &min_count_i)) {
+        return NULL;
+    }
+
+    PyObject * seqs_fast = PySequence_Fast(seqs_o,
+                                           "expected a sequence of strings");
+    if (seqs_fast == NULL) {
+        return NULL;
+    }
+
+    Py_ssize_t n_seqs = PySequence_Fast_GET_SIZE(seqs_fast);
+    std::vector<std::string> seqs(n_seqs);
+    for (Py_ssize_t i = 0; i < n_seqs; i++) {
+        PyObject * seq_o = PySequence_Fast_GET_ITEM(seqs_fast, i);
+        PyObject * seq_bytes = NULL;
+
+        if (PyUnicode_Check(seq_o)) {
+            seq_bytes = PyUnicode_AsUTF8String(seq_o);
+        } else if (PyBytes_Check(seq_o)) {
+            Py_INCREF(seq_o);
+            seq_bytes = seq_o;
+        } else {
+            PyErr_SetString(PyExc_TypeError,
+                            "expected a sequence of strings");
+        }
+        if (seq_bytes == NULL) {
+            Py_DECREF(seqs_fast);
+            return NULL;
+        }
+
+        seqs[i].assign(PyBytes_AS_STRING(seq_bytes),
+                       PyBytes_GET_SIZE(seq_bytes));
+        Py_DECREF(seq_bytes);
+    }
+    Py_DECREF(seqs_fast);
+
+    std::vector<BoundedCounterType> medians;
+    std::vector<unsigned long> trim_at;
+    BoundedCounterType min_count = min_count_i;
+
+    Py_BEGIN_ALLOW_THREADS
+    counting->median_and_trim_many(seqs, min_count, medians, trim_at);
+    Py_END_ALLOW_THREADS
+
+    PyObject * medians_o = PyList_New(n_seqs);
+    PyObject * trim_at_o = PyList_New(n_seqs);
+    if (medians_o == NULL || trim_at_o == NULL) {
+        Py_XDECREF(medians_o);
+        Py_XDECREF(trim_at_o);
+        return NULL;
+    }
+    for (Py_ssize_t i = 0; i < n_seqs; i++) {
+        PyList_SET_ITEM(medians_o, i, PyInt_FromLong(medians[i]));
+        PyList_SET_ITEM(trim_at_o, i, PyLong_FromUnsignedLong(trim_at[i]));
+    }
+
+    PyObject * ret = Py_BuildValue("NN", medians_o, trim_at_o);
+    return ret;
+}
+
 static
 PyObject *
 count_trim_below_abundance(khmer_KCountingHash_Object * me, PyObject * args)
@@ -2768,6 +3384,14 @@ count_get_raw_tables(khmer_KCountingHash_Object * self, PyObject * args)
 
     khmer::Byte ** table_ptrs = counting->get_raw_tables();
     std::vector<HashIntoType> sizes = counting->get_tablesizes();
+    if (counting->is_blocked()) {
+        // the tables are interleaved in a single array of blocks.
+        sizes.assign(1, counting->blocks_size());
+    } else {
+        for (unsigned int i=0; i<sizes.size(); ++i) {
+            sizes[i] = counting->table_bytes(sizes[i]);
+        }
+    }
 
     PyObject * raw_tables = PyList_New(sizes.size());
     for (unsigned int i=0; i<sizes.size(); ++i) {
@@ -2821,6 +3445,45 @@ count_get_use_bigcount(khmer_KCountingHash_Object * me, PyObject * args)
     return PyBool_FromLong((int)val);
 }
 
+static
+PyObject *
+count_is_blocked(khmer_KCountingHash_Object * me, PyObject * args)
+{
+    CountingHash * counting = me->counting;
+
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+
+    return PyBool_FromLong((int)counting->is_blocked());
+}
+
+static
+PyObject *
+count_is_mapped(khmer_KCountingHash_Object * me, PyObject * args)
+{
+    CountingHash * counting = me->counting;
+
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+
+    return PyBool_FromLong((int)counting->is_mapped());
+}
+
+static
+PyObject *
+count_is_small_count(khmer_KCountingHash_Object * me, PyObject * args)
+{
+    CountingHash * counting = me->counting;
+
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+
+    return PyBool_FromLong((int)counting->is_small_count());
+}
+
 static
 PyObject *
 count_get_min_count(khmer_KCountingHash_Object * me, PyObject * args)
@@ -2965,7 +3628,11 @@ count_abundance_distribution_with_reads_parser(khmer_KCountingHash_Object * me,
         return NULL;
     }
 
-    read_parsers::IParser *rparser      = rparser_obj->parser;
+    read_parsers::IParser *rparser      =
+        _PyObject_to_khmer_ReadParser( (PyObject *) rparser_obj );
+    if (rparser == NULL) {
+        return NULL;
+    }
     Hashbits           *hashbits        = tracking_obj->hashbits;
     HashIntoType       *dist            = NULL;
     const char         *value_exception = NULL;
@@ -3121,11 +3788,30 @@ count_do_subset_partition_with_abundance(khmer_KCountingHash_Object * me,
 static PyMethodDef khmer_counting_methods[] = {
     { "set_use_bigcount", (PyCFunction)count_set_use_bigcount, METH_VARARGS, "" },
     { "get_use_bigcount", (PyCFunction)count_get_use_bigcount, METH_VARARGS, "" },
+    {
+        "is_blocked", (PyCFunction)count_is_blocked, METH_VARARGS,
+        "Are all of the counters for a k-mer kept in one cache-line block?"
+    },
+    {
+        "is_mapped", (PyCFunction)count_is_mapped, METH_VARARGS,
+        "Do the tables point into a memory-mapped file?"
+    },
+    {
+        "is_small_count", (PyCFunction)count_is_small_count, METH_VARARGS,
+        "Does this countgraph use 4-bit counters, saturating at 15?"
+    },
     { "output_fasta_kmer_pos_freq", (PyCFunction)count_output_fasta_kmer_pos_freq, METH_VARARGS, "" },
     { "get_min_count", (PyCFunction)count_get_min_count, METH_VARARGS, "Get the smallest count of all the k-mers in the string" },
     { "get_max_count", (PyCFunction)count_get_max_count, METH_VARARGS, "Get the largest count of all the k-mers in the string" },
     { "trim_on_abundance", (PyCFunction)count_trim_on_abundance, METH_VARARGS, "Trim on >= abundance" },
     { "trim_below_abundance", (PyCFunction)count_trim_below_abundance, METH_VARARGS, "Trim on >= abundance" },
+    {
+        "median_and_trim_many",
+        (PyCFunction)count_median_and_trim_many, METH_VARARGS,
+        "Given a list of sequences and a minimum abundance, return a list of "
+        "their median k-mer counts and a list of their trim_on_abundance "
+        "positions, reading 'N' as 'A'. The work is done without the GIL."
+    },
     { "find_spectral_error_positions", (PyCFunction)count_find_spectral_error_positions, METH_VARARGS, "Identify positions of low-abundance k-mers" },
     { "abundance_distribution", (PyCFunction)count_abundance_distribution, METH_VARARGS, "" },
     { "abundance_distribution_with_reads_parser", (PyCFunction)count_abundance_distribution_with_reads_parser, METH_VARARGS, "" },
@@ -3201,12 +3887,34 @@ static PyObject* _new_counting_hash(PyTypeObject * type, PyObject * args,
     if (self != NULL) {
         WordLength k = 0;
         PyListObject * sizes_list_o = NULL;
+        PyObject * blocked_o = NULL;
+        PyObject * small_count_o = NULL;
 
-        if (!PyArg_ParseTuple(args, "bO!", &k, &PyList_Type, &sizes_list_o)) {
+        if (!PyArg_ParseTuple(args, "bO!|OO", &k, &PyList_Type, &sizes_list_o,
+                              &blocked_o, &small_count_o)) {
             Py_DECREF(self);
             return NULL;
         }
 
+        bool blocked = false;
+        if (blocked_o != NULL) {
+            int is_true = PyObject_IsTrue(blocked_o);
+            if (is_true < 0) {
+                Py_DECREF(self);
+                return NULL;
+            }
+            blocked = (bool) is_true;
+        }
+        bool small_count = false;
+        if (small_count_o != NULL) {
+            int is_true = PyObject_IsTrue(small_count_o);
+            if (is_true < 0) {
+                Py_DECREF(self);
+                return NULL;
+            }
+            small_count = (bool) is_true;
+        }
+
         std::vector<HashIntoType> sizes;
         Py_ssize_t sizes_list_o_length = PyList_GET_SIZE(sizes_list_o);
         if (sizes_list_o_length == -1) {
@@ -3231,10 +3939,14 @@ static PyObject* _new_counting_hash(PyTypeObject * type, PyObject * args,
         }
 
         try {
-            self->counting = new CountingHash(k, sizes);
+            self->counting = new CountingHash(k, sizes, blocked, small_count);
         } catch (std::bad_alloc &e) {
             Py_DECREF(self);
             return PyErr_NoMemory();
+        } catch (khmer_value_exception &e) {
+            Py_DECREF(self);
+            PyErr_SetString(PyExc_ValueError, e.what());
+            return NULL;
         }
         self->khashtable.hashtable = dynamic_cast<Hashtable*>(self->counting);
     }
@@ -3266,13 +3978,30 @@ hashbits_update(khmer_KHashbits_Object * me, PyObject * args)
     Py_RETURN_NONE;
 }
 
-static PyMethodDef khmer_hashbits_methods[] = {
-    {
-        "update",
-        (PyCFunction) hashbits_update, METH_VARARGS,
-        "a set update: update this nodegraph with all the entries from the other"
-    },
-    {NULL, NULL, 0, NULL}           /* sentinel */
+static
+PyObject *
+hashbits_is_mapped(khmer_KHashbits_Object * me, PyObject * args)
+{
+    Hashbits * hashbits = me->hashbits;
+
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+
+    return PyBool_FromLong((int)hashbits->is_mapped());
+}
+
+static PyMethodDef khmer_hashbits_methods[] = {
+    {
+        "update",
+        (PyCFunction) hashbits_update, METH_VARARGS,
+        "a set update: update this nodegraph with all the entries from the other"
+    },
+    {
+        "is_mapped", (PyCFunction) hashbits_is_mapped, METH_VARARGS,
+        "Do the tables point into a memory-mapped file?"
+    },
+    {NULL, NULL, 0, NULL}           /* sentinel */
 };
 
 // __new__ for hashbits; necessary for proper subclassing
@@ -3544,6 +4273,215 @@ static PyMethodDef khmer_subset_methods[] = {
     {NULL, NULL, 0, NULL}           /* sentinel */
 };
 
+//
+// LabelSweepWriter object -- sort reads into files by their labels
+//
+
+typedef struct {
+    PyObject_HEAD
+    LabelSweepWriter * writer;
+} khmer_LabelSweepWriter_Object;
+
+static
+PyObject *
+khmer_labelsweepwriter_new(PyTypeObject * type, PyObject * args,
+                           PyObject * kwds)
+{
+    const char * prefix = NULL;
+    const char * extension = NULL;
+    unsigned long long buffer_size = 0, max_reads = 0, max_buffers = 0;
+    unsigned long long max_open_files = DEFAULT_LABEL_WRITER_OPEN_FILES;
+
+    if (!PyArg_ParseTuple(args, "ssKKK|K", &prefix, &extension,
+                          &buffer_size, &max_reads, &max_buffers,
+                          &max_open_files)) {
+        return NULL;
+    }
+
+    khmer_LabelSweepWriter_Object * self;
+    self = (khmer_LabelSweepWriter_Object *)type->tp_alloc(type, 0);
+    if (self != NULL) {
+        try {
+            self->writer = new LabelSweepWriter(prefix, extension, buffer_size,
+                                                max_reads, max_buffers,
+                                                max_open_files);
+        } catch (std::bad_alloc &e) {
+            Py_DECREF(self);
+            return PyErr_NoMemory();
+        }
+    }
+
+    return (PyObject *) self;
+}
+
+static
+void
+khmer_labelsweepwriter_dealloc(khmer_LabelSweepWriter_Object * obj)
+{
+    delete obj->writer;
+    obj->writer = NULL;
+    Py_TYPE(obj)->tp_free((PyObject*)obj);
+}
+
+static
+PyObject *
+labelsweepwriter_flush(khmer_LabelSweepWriter_Object * me, PyObject * args)
+{
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+
+    me->writer->flush();
+
+    Py_RETURN_NONE;
+}
+
+static
+PyObject *
+labelsweepwriter_get_counts(khmer_LabelSweepWriter_Object * me)
+{
+    PyObject * d = PyDict_New();
+    if (d == NULL) {
+        return NULL;
+    }
+
+    std::map<std::string, unsigned long long>::const_iterator ci;
+    for (ci = me->writer->counts().begin(); ci != me->writer->counts().end();
+            ++ci) {
+        PyObject * val = PyLong_FromUnsignedLongLong(ci->second);
+        if (val == NULL || PyDict_SetItemString(d, ci->first.c_str(), val)) {
+            Py_XDECREF(val);
+            Py_DECREF(d);
+            return NULL;
+        }
+        Py_DECREF(val);
+    }
+
+    return d;
+}
+
+static
+PyObject *
+labelsweepwriter_get_label_dist(khmer_LabelSweepWriter_Object * me)
+{
+    PyObject * d = PyDict_New();
+    if (d == NULL) {
+        return NULL;
+    }
+
+    std::map<size_t, unsigned long long>::const_iterator di;
+    for (di = me->writer->label_dist().begin();
+            di != me->writer->label_dist().end(); ++di) {
+        PyObject * key = PyLong_FromSize_t(di->first);
+        PyObject * val = PyLong_FromUnsignedLongLong(di->second);
+        if (key == NULL || val == NULL || PyDict_SetItem(d, key, val)) {
+            Py_XDECREF(key);
+            Py_XDECREF(val);
+            Py_DECREF(d);
+            return NULL;
+        }
+        Py_DECREF(key);
+        Py_DECREF(val);
+    }
+
+    return d;
+}
+
+static
+PyObject *
+labelsweepwriter_get_n_file_errors(khmer_LabelSweepWriter_Object * me)
+{
+    return PyLong_FromUnsignedLongLong(me->writer->n_file_errors());
+}
+
+static
+PyObject *
+labelsweepwriter_get_n_write_errors(khmer_LabelSweepWriter_Object * me)
+{
+    return PyLong_FromUnsignedLongLong(me->writer->n_write_errors());
+}
+
+static PyMethodDef khmer_labelsweepwriter_methods[] = {
+    {
+        "flush", (PyCFunction)labelsweepwriter_flush,
+        METH_VARARGS,
+        "Write out every buffered read, and close every file."
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyGetSetDef khmer_labelsweepwriter_getseters[] = {
+    {
+        (char *)"counts",
+        (getter)labelsweepwriter_get_counts, NULL,
+        (char *)"Dict of the reads written to each file, by its label, "
+        "'multi' or 'orphaned'.",
+        NULL
+    },
+    {
+        (char *)"label_dist",
+        (getter)labelsweepwriter_get_label_dist, NULL,
+        (char *)"Dict of the reads written, by their number of labels.",
+        NULL
+    },
+    {
+        (char *)"n_file_errors",
+        (getter)labelsweepwriter_get_n_file_errors, NULL,
+        (char *)"Number of times a file could not be opened.",
+        NULL
+    },
+    {
+        (char *)"n_write_errors",
+        (getter)labelsweepwriter_get_n_write_errors, NULL,
+        (char *)"Number of reads that could not be written.",
+        NULL
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyTypeObject khmer_LabelSweepWriter_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_khmer.LabelSweepWriter",                 /* tp_name */
+    sizeof(khmer_LabelSweepWriter_Object),     /* tp_basicsize */
+    0,                                         /* tp_itemsize */
+    (destructor)khmer_labelsweepwriter_dealloc, /* tp_dealloc */
+    0,                                         /* tp_print */
+    0,                                         /* tp_getattr */
+    0,                                         /* tp_setattr */
+    0,                                         /* tp_compare */
+    0,                                         /* tp_repr */
+    0,                                         /* tp_as_number */
+    0,                                         /* tp_as_sequence */
+    0,                                         /* tp_as_mapping */
+    0,                                         /* tp_hash */
+    0,                                         /* tp_call */
+    0,                                         /* tp_str */
+    0,                                         /* tp_getattro */
+    0,                                         /* tp_setattro */
+    0,                                         /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,  /* tp_flags */
+    "LabelSweepWriter(prefix, extension, buffer_size, max_reads, "
+    "max_buffers, max_open_files=128): sorts reads swept with "
+    "GraphLabels.sweep_reads() into files by their labels.", /* tp_doc */
+    0,                                         /* tp_traverse */
+    0,                                         /* tp_clear */
+    0,                                         /* tp_richcompare */
+    0,                                         /* tp_weaklistoffset */
+    0,                                         /* tp_iter */
+    0,                                         /* tp_iternext */
+    khmer_labelsweepwriter_methods,            /* tp_methods */
+    0,                                         /* tp_members */
+    khmer_labelsweepwriter_getseters,          /* tp_getset */
+    0,                                         /* tp_base */
+    0,                                         /* tp_dict */
+    0,                                         /* tp_descr_get */
+    0,                                         /* tp_descr_set */
+    0,                                         /* tp_dictoffset */
+    0,                                         /* tp_init */
+    0,                                         /* tp_alloc */
+    khmer_labelsweepwriter_new,                /* tp_new */
+};
+
 typedef struct {
     PyObject_HEAD
     LabelHash * labelhash;
@@ -3611,11 +4549,12 @@ labelhash_get_label_dict(khmer_KGraphLabels_Object * me, PyObject * args)
     if (d == NULL) {
         return NULL;
     }
-    LabelPtrMap::iterator it;
+    std::vector<Label> labels;
+    hb->tag_labels.get_all_labels(labels);
 
-    for (it = hb->label_ptrs.begin(); it != hb->label_ptrs.end(); ++it) {
-        PyObject * key = Py_BuildValue("K", it->first);
-        PyObject * val = Py_BuildValue("K", it->second);
+    for (size_t i = 0; i < labels.size(); ++i) {
+        PyObject * key = Py_BuildValue("K", labels[i]);
+        PyObject * val = PyLong_FromSize_t(i);
         if (key != NULL && val != NULL) {
             PyDict_SetItem(d, key, val);
         }
@@ -3634,32 +4573,57 @@ labelhash_consume_fasta_and_tag_with_labels(khmer_KGraphLabels_Object * me,
     LabelHash * hb = me->labelhash;
 
     const char * filename;
+    unsigned int n_threads = 1;
 
-    if (!PyArg_ParseTuple(args, "s", &filename)) {
+    if (!PyArg_ParseTuple(args, "s|I", &filename, &n_threads)) {
         return NULL;
     }
 
-    const char         *value_exception = NULL;
-    const char         *file_exception  = NULL;
+    if (n_threads == 0) {
+        PyErr_SetString(PyExc_ValueError, "n_threads must be at least 1");
+        return NULL;
+    }
+
+    std::string         value_exception;
+    std::string         file_exception;
+    std::string         other_exception;
+    bool                value_error     = false;
+    bool                file_error      = false;
+    bool                other_error     = false;
+    bool                out_of_memory   = false;
     unsigned long long  n_consumed      = 0;
     unsigned int        total_reads     = 0;
-    //Py_BEGIN_ALLOW_THREADS
+    Py_BEGIN_ALLOW_THREADS
     try {
         hb->consume_fasta_and_tag_with_labels(filename, total_reads,
-                                              n_consumed);
+                                              n_consumed, n_threads);
     } catch (khmer_file_exception &exc) {
         file_exception = exc.what();
+        file_error = true;
     } catch (khmer_value_exception &exc) {
         value_exception = exc.what();
+        value_error = true;
+    } catch (khmer_exception &exc) {
+        other_exception = exc.what();
+        other_error = true;
+    } catch (std::bad_alloc &exc) {
+        out_of_memory = true;
     }
-    //Py_END_ALLOW_THREADS
+    Py_END_ALLOW_THREADS
 
-    if (file_exception != NULL) {
-        PyErr_SetString(PyExc_OSError, file_exception);
+    if (out_of_memory) {
+        return PyErr_NoMemory();
+    }
+    if (file_error) {
+        PyErr_SetString(PyExc_OSError, file_exception.c_str());
         return NULL;
     }
-    if (value_exception != NULL) {
-        PyErr_SetString(PyExc_ValueError, value_exception);
+    if (value_error) {
+        PyErr_SetString(PyExc_ValueError, value_exception.c_str());
+        return NULL;
+    }
+    if (other_error) {
+        PyErr_SetString(PyExc_RuntimeError, other_exception.c_str());
         return NULL;
     }
 
@@ -3710,9 +4674,7 @@ labelhash_consume_sequence_and_tag_with_labels(khmer_KGraphLabels_Object * me,
         return NULL;
     }
     unsigned long long n_consumed = 0;
-    Label * the_label = hb->check_and_allocate_label(c);
-
-    hb->consume_sequence_and_tag_with_labels(seq, n_consumed, *the_label);
+    hb->consume_sequence_and_tag_with_labels(seq, n_consumed, c);
     return Py_BuildValue("K", n_consumed);
 }
 
@@ -3754,8 +4716,7 @@ labelhash_sweep_label_neighborhood(khmer_KGraphLabels_Object * me,
         return NULL;
     }
 
-    //std::pair<TagLabelPtrPair::iterator, TagLabelPtrPair::iterator> ret;
-    LabelPtrSet found_labels;
+    LabelSet found_labels;
 
     //unsigned int num_traversed = 0;
     //Py_BEGIN_ALLOW_THREADS
@@ -3766,16 +4727,176 @@ labelhash_sweep_label_neighborhood(khmer_KGraphLabels_Object * me,
     //printf("...%u kmers traversed\n", num_traversed);
 
     PyObject * x =  PyList_New(found_labels.size());
-    LabelPtrSet::const_iterator si;
+    LabelSet::const_iterator si;
     unsigned long long i = 0;
     for (si = found_labels.begin(); si != found_labels.end(); ++si) {
-        PyList_SET_ITEM(x, i, Py_BuildValue("K", *(*si)));
+        PyList_SET_ITEM(x, i, Py_BuildValue("K", *si));
         i++;
     }
 
     return x;
 }
 
+static
+PyObject *
+labelhash_sweep_reads(khmer_KGraphLabels_Object * me, PyObject * args)
+{
+    LabelHash * hb = me->labelhash;
+
+    PyObject * parser_o = NULL;
+    int r = -1;
+    unsigned int n_threads = 1;
+    PyObject * writer_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!|iIO", &python::khmer_ReadParser_Type,
+                          &parser_o, &r, &n_threads, &writer_o)) {
+        return NULL;
+    }
+
+    if (writer_o == Py_None) {
+        writer_o = NULL;
+    }
+    if (writer_o != NULL &&
+            !PyObject_TypeCheck(writer_o, &khmer_LabelSweepWriter_Type)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "writer must be a LabelSweepWriter or None");
+        return NULL;
+    }
+    if (n_threads == 0) {
+        PyErr_SetString(PyExc_ValueError, "n_threads must be at least 1");
+        return NULL;
+    }
+
+    unsigned int range = (2 * hb->graph->_get_tag_density()) + 1;
+    if (r >= 0) {
+        range = r;
+    }
+
+    IParser * parser = _PyObject_to_khmer_ReadParser(parser_o);
+    if (parser == NULL) {
+        return NULL;
+    }
+
+    if (writer_o != NULL) {
+        LabelSweepWriter * writer =
+            ((khmer_LabelSweepWriter_Object *) writer_o)->writer;
+        unsigned long long n_written = 0;
+        std::string exc_string;
+        bool file_error = false, value_error = false, other_error = false;
+        bool out_of_memory = false;
+
+        Py_BEGIN_ALLOW_THREADS
+        try {
+            n_written = hb->sweep_reads(parser, *writer, range, false, false,
+                                        n_threads);
+        } catch (khmer_file_exception &exc) {
+            exc_string = exc.what();
+            file_error = true;
+        } catch (khmer_value_exception &exc) {
+            exc_string = exc.what();
+            value_error = true;
+        } catch (khmer_exception &exc) {
+            exc_string = exc.what();
+            other_error = true;
+        } catch (std::bad_alloc &exc) {
+            out_of_memory = true;
+        }
+        Py_END_ALLOW_THREADS
+
+        if (out_of_memory) {
+            return PyErr_NoMemory();
+        } else if (file_error) {
+            PyErr_SetString(PyExc_OSError, exc_string.c_str());
+            return NULL;
+        } else if (value_error) {
+            PyErr_SetString(PyExc_ValueError, exc_string.c_str());
+            return NULL;
+        } else if (other_error) {
+            PyErr_SetString(PyExc_RuntimeError, exc_string.c_str());
+            return NULL;
+        }
+        return PyLong_FromUnsignedLongLong(n_written);
+    }
+
+    PyObject * result = PyList_New(0);
+    if (result == NULL) {
+        return NULL;
+    }
+
+    std::vector<Read> reads;
+    std::vector<LabelSet> labels;
+    WordLength ksize = hb->graph->ksize();
+
+    while (true) {
+        size_t n_reads = 0;
+        std::string exc_string;
+        bool file_error = false, value_error = false, other_error = false;
+        bool out_of_memory = false;
+
+        Py_BEGIN_ALLOW_THREADS
+        try {
+            n_reads = hb->sweep_read_batch(parser, reads, labels, range,
+                                           false, false, n_threads);
+        } catch (khmer_file_exception &exc) {
+            exc_string = exc.what();
+            file_error = true;
+        } catch (khmer_value_exception &exc) {
+            exc_string = exc.what();
+            value_error = true;
+        } catch (khmer_exception &exc) {
+            exc_string = exc.what();
+            other_error = true;
+        } catch (std::bad_alloc &exc) {
+            out_of_memory = true;
+        }
+        Py_END_ALLOW_THREADS
+
+        if (out_of_memory) {
+            PyErr_NoMemory();
+        } else if (file_error) {
+            PyErr_SetString(PyExc_OSError, exc_string.c_str());
+        } else if (value_error) {
+            PyErr_SetString(PyExc_ValueError, exc_string.c_str());
+        } else if (other_error) {
+            PyErr_SetString(PyExc_RuntimeError, exc_string.c_str());
+        }
+        if (out_of_memory || file_error || value_error || other_error) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        if (n_reads == 0) {
+            break;
+        }
+
+        for (size_t i = 0; i < n_reads; ++i) {
+            PyObject * x;
+            if (reads[i].sequence.length() < ksize) {
+                Py_INCREF(Py_None);
+                x = Py_None;
+            } else {
+                x = PyList_New(labels[i].size());
+                if (x == NULL) {
+                    Py_DECREF(result);
+                    return NULL;
+                }
+                LabelSet::const_iterator si;
+                Py_ssize_t j = 0;
+                for (si = labels[i].begin(); si != labels[i].end(); ++si) {
+                    PyList_SET_ITEM(x, j++, PyLong_FromUnsignedLongLong(*si));
+                }
+            }
+            if (PyList_Append(result, x) < 0) {
+                Py_DECREF(x);
+                Py_DECREF(result);
+                return NULL;
+            }
+            Py_DECREF(x);
+        }
+    }
+
+    return result;
+}
+
 // Similar to find_all_tags, but returns tags in a way actually usable by python
 // need a tags_in_sequence iterator or function in c++ land for reuse in all
 // these functions
@@ -3857,16 +4978,16 @@ labelhash_get_tag_labels(khmer_KGraphLabels_Object * me, PyObject * args)
         return NULL;
     }
 
-    LabelPtrSet labels;
+    LabelSet labels;
 
     labels = labelhash->get_tag_labels(tag);
 
     PyObject * x =  PyList_New(labels.size());
-    LabelPtrSet::const_iterator si;
+    LabelSet::const_iterator si;
     unsigned long long i = 0;
     for (si = labels.begin(); si != labels.end(); ++si) {
         //std::string kmer_s = _revhash(*si, labelhash->ksize());
-        PyList_SET_ITEM(x, i, Py_BuildValue("K", *(*si)));
+        PyList_SET_ITEM(x, i, Py_BuildValue("K", *si));
         i++;
     }
 
@@ -3931,6 +5052,15 @@ labelhash_load_labels_and_tags(khmer_KGraphLabels_Object * me, PyObject * args)
 static PyMethodDef khmer_graphlabels_methods[] = {
     { "consume_fasta_and_tag_with_labels", (PyCFunction)labelhash_consume_fasta_and_tag_with_labels, METH_VARARGS, "" },
     { "sweep_label_neighborhood", (PyCFunction)labelhash_sweep_label_neighborhood, METH_VARARGS, "" },
+    {
+        "sweep_reads", (PyCFunction)labelhash_sweep_reads, METH_VARARGS,
+        "sweep_reads(parser, range=-1, n_threads=1, writer=None): sweep the "
+        "neighborhood of each read from a ReadParser for labels, as "
+        "sweep_label_neighborhood does, on n_threads threads. Without a "
+        "writer, return a list of the labels of each read, or None for reads "
+        "shorter than k; with a LabelSweepWriter, write the reads to it and "
+        "return the number written."
+    },
     {"consume_partitioned_fasta_and_tag_with_labels", (PyCFunction)labelhash_consume_partitioned_fasta_and_tag_with_labels, METH_VARARGS, "" },
     {"sweep_tag_neighborhood", (PyCFunction)labelhash_sweep_tag_neighborhood, METH_VARARGS, "" },
     {"get_tag_labels", (PyCFunction)labelhash_get_tag_labels, METH_VARARGS, ""},
@@ -4103,18 +5233,102 @@ static PyObject * readaligner_align_forward(khmer_ReadAligner_Object * me,
     return ret;
 }
 
-static PyObject* khmer_ReadAligner_get_scoring_matrix(
-    khmer_ReadAligner_Object * me, PyObject * args)
+static PyObject * readaligner_align_many(khmer_ReadAligner_Object * me,
+        PyObject * args)
 {
+    ReadAligner * aligner = me->aligner;
 
-    if (!PyArg_ParseTuple(args, "")) {
+    PyObject * reads_o = NULL;
+    unsigned int n_threads = 1;
+
+    if (!PyArg_ParseTuple(args, "O|I", &reads_o, &n_threads)) {
         return NULL;
     }
-    ScoringMatrix matrix = me->aligner->getScoringMatrix();
-
-    return Py_BuildValue( "dddd", matrix.trusted_match, matrix.trusted_mismatch,
-                          matrix.untrusted_match, matrix.untrusted_mismatch);
-}
+
+    if (n_threads == 0) {
+        PyErr_SetString(PyExc_ValueError, "n_threads must be at least 1");
+        return NULL;
+    }
+
+    PyObject * seq_o = PySequence_Fast(reads_o, "reads must be a sequence");
+    if (seq_o == NULL) {
+        return NULL;
+    }
+
+    Py_ssize_t n_reads = PySequence_Fast_GET_SIZE(seq_o);
+    WordLength ksize = aligner->ksize();
+    std::vector<std::string> reads(n_reads);
+    for (Py_ssize_t i = 0; i < n_reads; i++) {
+        PyObject * read_o = PySequence_Fast_GET_ITEM(seq_o, i);
+        if (!_PyObject_to_string(read_o, reads[i])) {
+            Py_DECREF(seq_o);
+            return NULL;
+        }
+        if (reads[i].length() < ksize) {
+            PyErr_SetString(PyExc_ValueError,
+                            "string length must >= the hashtable k-mer size");
+            Py_DECREF(seq_o);
+            return NULL;
+        }
+    }
+    Py_DECREF(seq_o);
+
+    std::vector<Alignment*> alignments;
+    std::string exc_string;
+    bool other_error = false;
+    bool out_of_memory = false;
+
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        aligner->AlignMany(reads, alignments, n_threads);
+    } catch (khmer_exception &exc) {
+        exc_string = exc.what();
+        other_error = true;
+    } catch (std::bad_alloc &exc) {
+        out_of_memory = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (out_of_memory) {
+        return PyErr_NoMemory();
+    }
+    if (other_error) {
+        PyErr_SetString(PyExc_RuntimeError, exc_string.c_str());
+        return NULL;
+    }
+
+    PyObject * ret = PyList_New(n_reads);
+    for (Py_ssize_t i = 0; i < n_reads; i++) {
+        Alignment * aln = alignments[i];
+        if (ret != NULL) {
+            PyObject * x = Py_BuildValue("dssO", aln->score,
+                                         aln->graph_alignment.c_str(),
+                                         aln->read_alignment.c_str(),
+                                         (aln->truncated)? Py_True : Py_False);
+            if (x == NULL) {
+                Py_CLEAR(ret);
+            } else {
+                PyList_SET_ITEM(ret, i, x);
+            }
+        }
+        delete aln;
+    }
+
+    return ret;
+}
+
+static PyObject* khmer_ReadAligner_get_scoring_matrix(
+    khmer_ReadAligner_Object * me, PyObject * args)
+{
+
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+    ScoringMatrix matrix = me->aligner->getScoringMatrix();
+
+    return Py_BuildValue( "dddd", matrix.trusted_match, matrix.trusted_mismatch,
+                          matrix.untrusted_match, matrix.untrusted_mismatch);
+}
 
 static PyObject* khmer_ReadAligner_get_transition_probabilities(
     khmer_ReadAligner_Object * me, PyObject * args)
@@ -4141,6 +5355,12 @@ static PyObject* khmer_ReadAligner_get_transition_probabilities(
 static PyMethodDef khmer_ReadAligner_methods[] = {
     {"align", (PyCFunction)readaligner_align, METH_VARARGS, ""},
     {"align_forward", (PyCFunction)readaligner_align_forward, METH_VARARGS, ""},
+    {
+        "align_many", (PyCFunction)readaligner_align_many, METH_VARARGS,
+        "align_many(reads, n_threads=1): align each of a list of reads as "
+        "align() does, on n_threads threads, returning a list of the "
+        "results."
+    },
     {
         "get_scoring_matrix", (PyCFunction)khmer_ReadAligner_get_scoring_matrix,
         METH_VARARGS,
@@ -4467,6 +5687,46 @@ static PyObject * hllcounter_consume_fasta(khmer_KHLLCounter_Object * me,
 static PyObject * hllcounter_merge(khmer_KHLLCounter_Object * me,
                                    PyObject * args);
 
+static
+PyObject *
+hllcounter_save(khmer_KHLLCounter_Object * me, PyObject * args)
+{
+    const char * filename = NULL;
+
+    if (!PyArg_ParseTuple(args, "s", &filename)) {
+        return NULL;
+    }
+
+    try {
+        me->hllcounter->save(filename);
+    } catch (khmer_file_exception &e) {
+        PyErr_SetString(PyExc_OSError, e.what());
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+static
+PyObject *
+hllcounter_load(khmer_KHLLCounter_Object * me, PyObject * args)
+{
+    const char * filename = NULL;
+
+    if (!PyArg_ParseTuple(args, "s", &filename)) {
+        return NULL;
+    }
+
+    try {
+        me->hllcounter->load(filename);
+    } catch (khmer_file_exception &e) {
+        PyErr_SetString(PyExc_OSError, e.what());
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
 static
 PyObject *
 hllcounter_get_erate(khmer_KHLLCounter_Object * me)
@@ -4510,6 +5770,9 @@ hllcounter_set_ksize(khmer_KHLLCounter_Object * me, PyObject *value,
 
     try {
         me->hllcounter->set_ksize(ksize);
+    } catch (InvalidValue &e) {
+        PyErr_SetString(PyExc_ValueError, e.what());
+        return -1;
     } catch (ReadOnlyAttribute &e) {
         PyErr_SetString(PyExc_AttributeError, e.what());
         return -1;
@@ -4548,6 +5811,41 @@ hllcounter_set_erate(khmer_KHLLCounter_Object * me, PyObject *value,
     return 0;
 }
 
+static
+PyObject *
+hllcounter_get_rolling_hash(khmer_KHLLCounter_Object * me)
+{
+    return PyBool_FromLong(me->hllcounter->get_rolling_hash());
+}
+
+static
+int
+hllcounter_set_rolling_hash(khmer_KHLLCounter_Object * me, PyObject *value,
+                            void *closure)
+{
+    if (value == NULL) {
+        PyErr_SetString(PyExc_TypeError, "Cannot delete attribute");
+        return -1;
+    }
+
+    int rolling_hash = PyObject_IsTrue(value);
+    if (rolling_hash < 0) {
+        return -1;
+    }
+
+    try {
+        me->hllcounter->set_rolling_hash(rolling_hash);
+    } catch (InvalidValue &e) {
+        PyErr_SetString(PyExc_ValueError, e.what());
+        return -1;
+    } catch (ReadOnlyAttribute &e) {
+        PyErr_SetString(PyExc_AttributeError, e.what());
+        return -1;
+    }
+
+    return 0;
+}
+
 static
 PyObject *
 hllcounter_getalpha(khmer_KHLLCounter_Object * me)
@@ -4596,6 +5894,16 @@ static PyMethodDef khmer_hllcounter_methods[] = {
         METH_VARARGS,
         "Merge other counter into this one."
     },
+    {
+        "save", (PyCFunction)hllcounter_save,
+        METH_VARARGS,
+        "Save the counter to a file."
+    },
+    {
+        "load", (PyCFunction)hllcounter_load,
+        METH_VARARGS,
+        "Replace this counter with one saved to a file."
+    },
     {NULL} /* Sentinel */
 };
 
@@ -4622,6 +5930,16 @@ static PyGetSetDef khmer_hllcounter_getseters[] = {
         "that (raising AttributeError)",
         NULL
     },
+    {
+        (char *)"rolling_hash",
+        (getter)hllcounter_get_rolling_hash,
+        (setter)hllcounter_set_rolling_hash,
+        (char *)"Hash k-mers (k <= 32) with a rolling 2-bit hash instead of "
+        "MurmurHash3. Faster, but gives different estimates; can be changed "
+        "prior to first counting, but becomes read-only after that (raising "
+        "AttributeError)",
+        NULL
+    },
     {
         (char *)"counters",
         (getter)hllcounter_getcounters, NULL,
@@ -4693,107 +6011,1368 @@ static PyObject * hllcounter_merge(khmer_KHLLCounter_Object * me,
     Py_RETURN_NONE;
 }
 
-//////////////////////////////
-// standalone functions
+/***********************************************************************/
 
-static PyObject * forward_hash(PyObject * self, PyObject * args)
-{
-    const char * kmer;
-    WordLength ksize;
+//
+// ReadBuffer object -- hold reads compactly for a later pass
+// StreamingTrimmer object -- streaming low-abundance trimming decisions
+// StreamingCorrector object -- streaming error correction with a ReadAligner
+// ReadBufferIterator -- return buffered reads, trimmed or not
+// FirstPassIterator -- run the first trimming pass over a parser
+//
 
-    if (!PyArg_ParseTuple(args, "sb", &kmer, &ksize)) {
-        return NULL;
-    }
+typedef struct {
+    PyObject_HEAD
+    ReadBuffer * buffer;
+} khmer_ReadBuffer_Object;
 
-    if (ksize > KSIZE_MAX) {
-        PyErr_Format(PyExc_ValueError, "k-mer size must be <= %u", KSIZE_MAX);
-        return NULL;
-    }
+typedef struct {
+    PyObject_HEAD
+    StreamingTrimmer * trimmer;
+    //! The countgraph, kept alive for as long as the trimmer.
+    PyObject * graph;
+} khmer_StreamingTrimmer_Object;
 
-    try {
-        PyObject * hash;
-        hash = PyLong_FromUnsignedLongLong(_hash(kmer, ksize));
-        return hash;
-    } catch (khmer_exception &e) {
-        PyErr_SetString(PyExc_RuntimeError, e.what());
-        return NULL;
-    }
+typedef struct {
+    PyObject_HEAD
+    //! Buffer being read, for reference counting purposes.
+    PyObject * buffer;
+    //! Trimmer applied to each read, or NULL.
+    PyObject * trimmer;
+} khmer_ReadBufferIterator_Object;
 
+static
+void
+khmer_ReadBufferIterator_dealloc(khmer_ReadBufferIterator_Object * obj)
+{
+    Py_DECREF(obj->buffer);
+    obj->buffer = NULL;
+    Py_XDECREF(obj->trimmer);
+    obj->trimmer = NULL;
+    PyObject_Del(obj);
 }
 
-static PyObject * forward_hash_no_rc(PyObject * self, PyObject * args)
+static
+PyObject *
+_ReadBufferIterator_iternext(khmer_ReadBufferIterator_Object * myself)
 {
-    const char * kmer;
-    WordLength ksize;
-
-    if (!PyArg_ParseTuple(args, "sb", &kmer, &ksize)) {
-        return NULL;
+    ReadBuffer * buffer = ((khmer_ReadBuffer_Object *) myself->buffer)->buffer;
+    StreamingTrimmer * trimmer = NULL;
+    if (myself->trimmer != NULL) {
+        trimmer = ((khmer_StreamingTrimmer_Object *) myself->trimmer)->trimmer;
     }
 
-    if (ksize > KSIZE_MAX) {
-        PyErr_Format(PyExc_ValueError, "k-mer size must be <= %u", KSIZE_MAX);
+    Read read;
+    bool has_quality = false;
+    unsigned int group = 0;
+    try {
+        while (true) {
+            if (!buffer->next(read, has_quality, group)) {
+                return NULL;
+            }
+            if (trimmer == NULL || trimmer->second_pass(read, has_quality)) {
+                break;
+            }
+        }
+    } catch (khmer_file_exception &e) {
+        PyErr_SetString(PyExc_OSError, e.what());
         return NULL;
     }
 
-    if (strlen(kmer) != ksize) {
-        PyErr_SetString(PyExc_ValueError,
-                        "k-mer length must equal the k-size");
+    PyObject * name_o = PyUnicode_FromStringAndSize(read.name.data(),
+                        read.name.length());
+    PyObject * sequence_o = PyUnicode_FromStringAndSize(read.sequence.data(),
+                            read.sequence.length());
+    PyObject * quality_o = Py_None;
+    if (has_quality) {
+        quality_o = PyUnicode_FromStringAndSize(read.quality.data(),
+                                                read.quality.length());
+    } else {
+        Py_INCREF(Py_None);
+    }
+    if (name_o == NULL || sequence_o == NULL || quality_o == NULL) {
+        Py_XDECREF(name_o);
+        Py_XDECREF(sequence_o);
+        Py_XDECREF(quality_o);
         return NULL;
     }
 
-    return PyLong_FromUnsignedLongLong(_hash_forward(kmer, ksize));
+    return Py_BuildValue("INNN", group, name_o, sequence_o, quality_o);
 }
 
-static PyObject * reverse_hash(PyObject * self, PyObject * args)
+static PyTypeObject khmer_ReadBufferIterator_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)              /* init & ob_size */
+    "_khmer.ReadBufferIterator",                /* tp_name */
+    sizeof(khmer_ReadBufferIterator_Object),    /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)khmer_ReadBufferIterator_dealloc, /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    0,                                          /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                         /* tp_flags */
+    "Iterates over the reads in a 'ReadBuffer'.", /* tp_doc */
+    0,                                          /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    PyObject_SelfIter,                          /* tp_iter */
+    (iternextfunc)_ReadBufferIterator_iternext, /* tp_iternext */
+};
+
+static
+PyObject *
+khmer_readbuffer_new(PyTypeObject * type, PyObject * args, PyObject * kwds)
 {
-    HashIntoType val;
-    WordLength ksize;
+    unsigned long long memory_limit = DEFAULT_READ_BUFFER_MEMORY;
+    const char * spill_filename = NULL;
 
-    if (!PyArg_ParseTuple(args, "Kb", &val, &ksize)) {
+    if (!PyArg_ParseTuple(args, "Ks", &memory_limit, &spill_filename)) {
         return NULL;
     }
 
-    if (ksize > KSIZE_MAX) {
-        PyErr_Format(PyExc_ValueError, "k-mer size must be <= %u", KSIZE_MAX);
-        return NULL;
+    khmer_ReadBuffer_Object * self;
+    self = (khmer_ReadBuffer_Object *)type->tp_alloc(type, 0);
+    if (self != NULL) {
+        try {
+            self->buffer = new ReadBuffer(memory_limit, spill_filename);
+        } catch (std::bad_alloc &e) {
+            Py_DECREF(self);
+            return PyErr_NoMemory();
+        }
     }
 
-    return PyUnicode_FromString(_revhash(val, ksize).c_str());
+    return (PyObject *) self;
 }
 
-static PyObject * murmur3_forward_hash(PyObject * self, PyObject * args)
+static
+void
+khmer_readbuffer_dealloc(khmer_ReadBuffer_Object * obj)
 {
-    const char * kmer;
-
-    if (!PyArg_ParseTuple(args, "s", &kmer)) {
-        return NULL;
-    }
-
-    return PyLong_FromUnsignedLongLong(_hash_murmur(kmer));
+    delete obj->buffer;
+    obj->buffer = NULL;
+    Py_TYPE(obj)->tp_free((PyObject*)obj);
 }
 
-static PyObject * murmur3_forward_hash_no_rc(PyObject * self, PyObject * args)
+// Copy a Read object or screed record into read; records without a
+// quality attribute are given an empty quality string.  has_quality is set
+// if the record has one, or for a Read object, if its quality isn't empty.
+static
+bool
+_PyObject_to_Read(PyObject * record_o, Read& read, bool& has_quality)
 {
-    const char * kmer;
+    if (PyObject_TypeCheck(record_o, &python::khmer_Read_Type)) {
+        read = *((python::khmer_Read_Object *) record_o)->read;
+        has_quality = !read.quality.empty();
+        return true;
+    }
 
-    if (!PyArg_ParseTuple(args, "s", &kmer)) {
-        return NULL;
+    // a screed Record keeps its fields in a dict, d, and looks attributes up
+    // in it from Python, which is slow: read the dict directly, after the
+    // instance's own attributes as Python would.
+    PyObject * attrs_o = PyObject_GetAttrString(record_o, "__dict__");
+    if (attrs_o == NULL) {
+        PyErr_Clear();
+    } else {
+        PyObject * dict_o = NULL;
+        if (PyDict_Check(attrs_o)) {
+            dict_o = PyDict_GetItemString(attrs_o, "d");
+        }
+        if (dict_o != NULL && PyDict_Check(dict_o)) {
+            const char * fields[] = { "name", "sequence", "quality" };
+            PyObject * field_o[3];
+            for (int i = 0; i < 3; i++) {
+                field_o[i] = PyDict_GetItemString(attrs_o, fields[i]);
+                if (field_o[i] == NULL) {
+                    field_o[i] = PyDict_GetItemString(dict_o, fields[i]);
+                }
+            }
+            if (field_o[0] != NULL && field_o[1] != NULL) {
+                bool ok = (_PyObject_to_string(field_o[0], read.name) &&
+                           _PyObject_to_string(field_o[1], read.sequence));
+                has_quality = (field_o[2] != NULL);
+                if (ok && has_quality) {
+                    ok = _PyObject_to_string(field_o[2], read.quality);
+                } else {
+                    read.quality.clear();
+                }
+                Py_DECREF(attrs_o);
+                return ok;
+            }
+        }
+        Py_DECREF(attrs_o);
     }
 
-    return PyLong_FromUnsignedLongLong(_hash_murmur_forward(kmer));
-}
+    PyObject * name_o = PyObject_GetAttrString(record_o, "name");
+    PyObject * sequence_o = PyObject_GetAttrString(record_o, "sequence");
+    bool ok = (name_o != NULL && sequence_o != NULL &&
+               _PyObject_to_string(name_o, read.name) &&
+               _PyObject_to_string(sequence_o, read.sequence));
+    Py_XDECREF(name_o);
+    Py_XDECREF(sequence_o);
+    if (!ok) {
+        return false;
+    }
 
-//
-// technique for resolving literal below found here:
-// https://gcc.gnu.org/onlinedocs/gcc-4.9.1/cpp/Stringification.html
-//
+    PyObject * quality_o = PyObject_GetAttrString(record_o, "quality");
+    has_quality = (quality_o != NULL);
+    if (quality_o == NULL) {
+        PyErr_Clear();
+        read.quality.clear();
+    } else {
+        ok = _PyObject_to_string(quality_o, read.quality);
+        Py_DECREF(quality_o);
+    }
+    return ok;
+}
 
 static
 PyObject *
-get_version_cpp( PyObject * self, PyObject * args )
+readbuffer_append(khmer_ReadBuffer_Object * me, PyObject * args)
 {
-#define xstr(s) str(s)
-#define str(s) #s
+    PyObject * record_o = NULL;
+    unsigned int group = 0;
+
+    if (!PyArg_ParseTuple(args, "O|I", &record_o, &group)) {
+        return NULL;
+    }
+
+    // records without a (non-empty) quality string are FASTA records.
+    Read read;
+    bool has_quality = false;
+    if (!_PyObject_to_Read(record_o, read, has_quality)) {
+        return NULL;
+    }
+
+    try {
+        me->buffer->append(read, has_quality, group);
+    } catch (khmer_file_exception &e) {
+        PyErr_SetString(PyExc_OSError, e.what());
+        return NULL;
+    } catch (khmer_value_exception &e) {
+        PyErr_SetString(PyExc_ValueError, e.what());
+        return NULL;
+    } catch (khmer_exception &e) {
+        PyErr_SetString(PyExc_RuntimeError, e.what());
+        return NULL;
+    }
+
+    Py_RETURN_NONE;
+}
+
+static
+PyObject *
+readbuffer_get_n_reads(khmer_ReadBuffer_Object * me)
+{
+    return PyLong_FromUnsignedLongLong(me->buffer->size());
+}
+
+static
+PyObject *
+readbuffer_get_n_spilled(khmer_ReadBuffer_Object * me)
+{
+    return PyLong_FromUnsignedLongLong(me->buffer->n_spilled());
+}
+
+static
+PyObject *
+readbuffer_get_memory_used(khmer_ReadBuffer_Object * me)
+{
+    return PyLong_FromSize_t(me->buffer->memory_used());
+}
+
+typedef struct {
+    PyObject_HEAD
+    //! Trimmer, parser and buffer, for reference counting purposes.
+    PyObject * trimmer;
+    PyObject * parser;
+    PyObject * buffer;
+    BrokenPairedReader * reader;
+    unsigned int group;
+    unsigned int n_threads;
+} khmer_FirstPassIterator_Object;
+
+static
+void
+khmer_FirstPassIterator_dealloc(khmer_FirstPassIterator_Object * obj)
+{
+    delete obj->reader;
+    obj->reader = NULL;
+    Py_DECREF(obj->trimmer);
+    obj->trimmer = NULL;
+    Py_DECREF(obj->parser);
+    obj->parser = NULL;
+    Py_DECREF(obj->buffer);
+    obj->buffer = NULL;
+    PyObject_Del(obj);
+}
+
+static
+PyObject *
+_FirstPassIterator_iternext(khmer_FirstPassIterator_Object * myself)
+{
+    StreamingTrimmer * trimmer =
+        ((khmer_StreamingTrimmer_Object *) myself->trimmer)->trimmer;
+    ReadBuffer * buffer = ((khmer_ReadBuffer_Object *) myself->buffer)->buffer;
+
+    std::vector<Read> reads;
+    std::vector<size_t> starts;
+    std::string output;
+    size_t n_fragments = 0;
+    std::string file_exception;
+    std::string value_exception;
+    std::string exception;
+    bool out_of_memory = false;
+
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        n_fragments = myself->reader->next_batch(reads, starts,
+                      TRIM_FIRST_PASS_BATCH_SIZE);
+        if (n_fragments > 0) {
+            trimmer->first_pass(reads, starts, *buffer, myself->group,
+                                output, myself->n_threads);
+        }
+    } catch (khmer_file_exception &exc) {
+        file_exception = exc.what();
+    } catch (khmer_value_exception &exc) {
+        value_exception = exc.what();
+    } catch (khmer_exception &exc) {
+        exception = exc.what();
+    } catch (std::bad_alloc &exc) {
+        out_of_memory = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (out_of_memory) {
+        return PyErr_NoMemory();
+    }
+    if (!file_exception.empty()) {
+        PyErr_SetString(PyExc_OSError, file_exception.c_str());
+        return NULL;
+    }
+    if (!value_exception.empty()) {
+        PyErr_SetString(PyExc_ValueError, value_exception.c_str());
+        return NULL;
+    }
+    if (!exception.empty()) {
+        PyErr_SetString(PyExc_RuntimeError, exception.c_str());
+        return NULL;
+    }
+    if (n_fragments == 0) {
+        return NULL;
+    }
+
+    return PyBytes_FromStringAndSize(output.data(), output.length());
+}
+
+static PyTypeObject khmer_FirstPassIterator_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)              /* init & ob_size */
+    "_khmer.FirstPassIterator",                 /* tp_name */
+    sizeof(khmer_FirstPassIterator_Object),     /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)khmer_FirstPassIterator_dealloc, /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    0,                                          /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                         /* tp_flags */
+    "Runs the first trimming pass over the reads from a parser, "
+    "one batch at a time.",                     /* tp_doc */
+    0,                                          /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    PyObject_SelfIter,                          /* tp_iter */
+    (iternextfunc)_FirstPassIterator_iternext,  /* tp_iternext */
+};
+
+static
+PyObject *
+_ReadBufferIterator_new(PyObject * buffer_o, PyObject * trimmer_o)
+{
+    khmer_ReadBuffer_Object * buffer = (khmer_ReadBuffer_Object *) buffer_o;
+
+    try {
+        buffer->buffer->rewind();
+    } catch (khmer_file_exception &e) {
+        PyErr_SetString(PyExc_OSError, e.what());
+        return NULL;
+    }
+
+    khmer_ReadBufferIterator_Object * iter =
+        PyObject_New(khmer_ReadBufferIterator_Object,
+                     &khmer_ReadBufferIterator_Type);
+    if (iter == NULL) {
+        return NULL;
+    }
+    Py_INCREF(buffer_o);
+    iter->buffer = buffer_o;
+    Py_XINCREF(trimmer_o);
+    iter->trimmer = trimmer_o;
+
+    return (PyObject *) iter;
+}
+
+static
+PyObject *
+readbuffer_iter(PyObject * self)
+{
+    return _ReadBufferIterator_new(self, NULL);
+}
+
+static PyMethodDef khmer_readbuffer_methods[] = {
+    {
+        "append", (PyCFunction)readbuffer_append,
+        METH_VARARGS,
+        "Add a read (a Read object or screed record) to the buffer, with an "
+        "optional group number."
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyGetSetDef khmer_readbuffer_getseters[] = {
+    {
+        (char *)"n_reads",
+        (getter)readbuffer_get_n_reads, NULL,
+        (char *)"Number of reads in the buffer.",
+        NULL
+    },
+    {
+        (char *)"n_spilled",
+        (getter)readbuffer_get_n_spilled, NULL,
+        (char *)"Number of reads written out to the spill file.",
+        NULL
+    },
+    {
+        (char *)"memory_used",
+        (getter)readbuffer_get_memory_used, NULL,
+        (char *)"Bytes of encoded reads held in memory.",
+        NULL
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyTypeObject khmer_ReadBuffer_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_khmer.ReadBuffer",                       /* tp_name */
+    sizeof(khmer_ReadBuffer_Object),           /* tp_basicsize */
+    0,                                         /* tp_itemsize */
+    (destructor)khmer_readbuffer_dealloc,      /* tp_dealloc */
+    0,                                         /* tp_print */
+    0,                                         /* tp_getattr */
+    0,                                         /* tp_setattr */
+    0,                                         /* tp_compare */
+    0,                                         /* tp_repr */
+    0,                                         /* tp_as_number */
+    0,                                         /* tp_as_sequence */
+    0,                                         /* tp_as_mapping */
+    0,                                         /* tp_hash */
+    0,                                         /* tp_call */
+    0,                                         /* tp_str */
+    0,                                         /* tp_getattro */
+    0,                                         /* tp_setattro */
+    0,                                         /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,  /* tp_flags */
+    "Reads held compactly in memory, spilling to a file past a memory "
+    "limit.",                                  /* tp_doc */
+    0,                                         /* tp_traverse */
+    0,                                         /* tp_clear */
+    0,                                         /* tp_richcompare */
+    0,                                         /* tp_weaklistoffset */
+    readbuffer_iter,                           /* tp_iter */
+    0,                                         /* tp_iternext */
+    khmer_readbuffer_methods,                  /* tp_methods */
+    0,                                         /* tp_members */
+    khmer_readbuffer_getseters,                /* tp_getset */
+    0,                                         /* tp_base */
+    0,                                         /* tp_dict */
+    0,                                         /* tp_descr_get */
+    0,                                         /* tp_descr_set */
+    0,                                         /* tp_dictoffset */
+    0,                                         /* tp_init */
+    0,                                         /* tp_alloc */
+    khmer_readbuffer_new,                      /* tp_new */
+};
+
+static
+PyObject *
+khmer_streamingtrimmer_new(PyTypeObject * type, PyObject * args,
+                           PyObject * kwds)
+{
+    khmer_KCountingHash_Object * graph_o = NULL;
+    unsigned int cutoff = 0, normalize_limit = 0;
+    PyObject * variable_coverage_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!II|O", &khmer_KCountgraph_Type, &graph_o,
+                          &cutoff, &normalize_limit, &variable_coverage_o)) {
+        return NULL;
+    }
+
+    bool variable_coverage = false;
+    if (variable_coverage_o != NULL) {
+        int is_true = PyObject_IsTrue(variable_coverage_o);
+        if (is_true < 0) {
+            return NULL;
+        }
+        variable_coverage = (bool) is_true;
+    }
+
+    khmer_StreamingTrimmer_Object * self;
+    self = (khmer_StreamingTrimmer_Object *)type->tp_alloc(type, 0);
+    if (self != NULL) {
+        try {
+            self->trimmer = new StreamingTrimmer(graph_o->counting, cutoff,
+                                                 normalize_limit,
+                                                 variable_coverage);
+        } catch (std::bad_alloc &e) {
+            Py_DECREF(self);
+            return PyErr_NoMemory();
+        }
+        Py_INCREF(graph_o);
+        self->graph = (PyObject *) graph_o;
+    }
+
+    return (PyObject *) self;
+}
+
+static
+void
+khmer_streamingtrimmer_dealloc(khmer_StreamingTrimmer_Object * obj)
+{
+    delete obj->trimmer;
+    obj->trimmer = NULL;
+    Py_XDECREF(obj->graph);
+    obj->graph = NULL;
+    Py_TYPE(obj)->tp_free((PyObject*)obj);
+}
+
+static
+PyObject *
+streamingtrimmer_trim_buffered(khmer_StreamingTrimmer_Object * me,
+                               PyObject * args)
+{
+    PyObject * buffer_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!", &khmer_ReadBuffer_Type, &buffer_o)) {
+        return NULL;
+    }
+
+    return _ReadBufferIterator_new(buffer_o, (PyObject *) me);
+}
+
+static
+PyObject *
+streamingtrimmer_trim_first_pass(khmer_StreamingTrimmer_Object * me,
+                                 PyObject * args)
+{
+    PyObject * parser_o = NULL;
+    PyObject * buffer_o = NULL;
+    unsigned int group = 0;
+    unsigned int n_threads = 1;
+    PyObject * force_single_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!O!I|IO", &python::khmer_ReadParser_Type,
+                          &parser_o, &khmer_ReadBuffer_Type, &buffer_o,
+                          &group, &n_threads, &force_single_o)) {
+        return NULL;
+    }
+
+    if (n_threads == 0) {
+        PyErr_SetString(PyExc_ValueError, "n_threads must be at least 1");
+        return NULL;
+    }
+
+    bool force_single = false;
+    if (force_single_o != NULL) {
+        int is_true = PyObject_IsTrue(force_single_o);
+        if (is_true < 0) {
+            return NULL;
+        }
+        force_single = (bool) is_true;
+    }
+
+    IParser * parser = _PyObject_to_khmer_ReadParser(parser_o);
+    if (parser == NULL) {
+        return NULL;
+    }
+    WordLength ksize =
+        ((khmer_KCountingHash_Object *) me->graph)->counting->ksize();
+
+    khmer_FirstPassIterator_Object * iter =
+        PyObject_New(khmer_FirstPassIterator_Object,
+                     &khmer_FirstPassIterator_Type);
+    if (iter == NULL) {
+        return NULL;
+    }
+    try {
+        iter->reader = new BrokenPairedReader(parser, ksize, force_single);
+    } catch (std::bad_alloc &e) {
+        PyObject_Del(iter);
+        return PyErr_NoMemory();
+    }
+    Py_INCREF(me);
+    iter->trimmer = (PyObject *) me;
+    Py_INCREF(parser_o);
+    iter->parser = parser_o;
+    Py_INCREF(buffer_o);
+    iter->buffer = buffer_o;
+    iter->group = group;
+    iter->n_threads = n_threads;
+
+    return (PyObject *) iter;
+}
+
+static
+PyObject *
+streamingtrimmer_get_stats(khmer_StreamingTrimmer_Object * me,
+                           PyObject * args)
+{
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+
+    const TrimStats& stats = me->trimmer->stats();
+    return Py_BuildValue("{s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K,s:K}",
+                         "n_reads", stats.n_reads,
+                         "n_bp", stats.n_bp,
+                         "set_aside_reads", stats.set_aside_reads,
+                         "written_reads", stats.written_reads,
+                         "written_bp", stats.written_bp,
+                         "trimmed_reads", stats.trimmed_reads,
+                         "corrected_reads", stats.corrected_reads,
+                         "skipped_reads", stats.skipped_reads,
+                         "skipped_bp", stats.skipped_bp);
+}
+
+static PyMethodDef khmer_streamingtrimmer_methods[] = {
+    {
+        "trim_first_pass", (PyCFunction)streamingtrimmer_trim_first_pass,
+        METH_VARARGS,
+        "trim_first_pass(parser, buffer, group, n_threads=1, "
+        "force_single=False): run the first pass over the reads and pairs "
+        "from a ReadParser on n_threads threads, setting reads aside in "
+        "buffer under group. Iterate over the result to run it; each item "
+        "is a batch of the reads to write, as FASTA or FASTQ bytes."
+    },
+    {
+        "trim_buffered", (PyCFunction)streamingtrimmer_trim_buffered,
+        METH_VARARGS,
+        "Iterate over the reads in a ReadBuffer set aside by the first pass, "
+        "yielding (group, name, sequence, quality) for each read kept, "
+        "trimmed; quality is None for FASTA reads."
+    },
+    {
+        "get_stats", (PyCFunction)streamingtrimmer_get_stats,
+        METH_VARARGS,
+        "Return a dict of the counts of reads and bases read, set aside, "
+        "written, trimmed or corrected and skipped so far."
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyTypeObject khmer_StreamingTrimmer_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_khmer.StreamingTrimmer",                 /* tp_name */
+    sizeof(khmer_StreamingTrimmer_Object),     /* tp_basicsize */
+    0,                                         /* tp_itemsize */
+    (destructor)khmer_streamingtrimmer_dealloc, /* tp_dealloc */
+    0,                                         /* tp_print */
+    0,                                         /* tp_getattr */
+    0,                                         /* tp_setattr */
+    0,                                         /* tp_compare */
+    0,                                         /* tp_repr */
+    0,                                         /* tp_as_number */
+    0,                                         /* tp_as_sequence */
+    0,                                         /* tp_as_mapping */
+    0,                                         /* tp_hash */
+    0,                                         /* tp_call */
+    0,                                         /* tp_str */
+    0,                                         /* tp_getattro */
+    0,                                         /* tp_setattro */
+    0,                                         /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,  /* tp_flags */
+    "Streaming low-abundance trimming against a countgraph, "
+    "as in trim-low-abund.py.",                /* tp_doc */
+    0,                                         /* tp_traverse */
+    0,                                         /* tp_clear */
+    0,                                         /* tp_richcompare */
+    0,                                         /* tp_weaklistoffset */
+    0,                                         /* tp_iter */
+    0,                                         /* tp_iternext */
+    khmer_streamingtrimmer_methods,            /* tp_methods */
+    0,                                         /* tp_members */
+    0,                                         /* tp_getset */
+    0,                                         /* tp_base */
+    0,                                         /* tp_dict */
+    0,                                         /* tp_descr_get */
+    0,                                         /* tp_descr_set */
+    0,                                         /* tp_dictoffset */
+    0,                                         /* tp_init */
+    0,                                         /* tp_alloc */
+    khmer_streamingtrimmer_new,                /* tp_new */
+};
+
+typedef struct {
+    khmer_StreamingTrimmer_Object trimmer;
+    //! The aligner, kept alive for as long as the corrector.
+    PyObject * aligner;
+} khmer_StreamingCorrector_Object;
+
+static
+PyObject *
+khmer_streamingcorrector_new(PyTypeObject * type, PyObject * args,
+                             PyObject * kwds)
+{
+    khmer_KCountingHash_Object * graph_o = NULL;
+    khmer_ReadAligner_Object * aligner_o = NULL;
+    unsigned int normalize_limit = 0;
+    PyObject * variable_coverage_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O!O!I|O", &khmer_KCountgraph_Type, &graph_o,
+                          &khmer_ReadAlignerType, &aligner_o,
+                          &normalize_limit, &variable_coverage_o)) {
+        return NULL;
+    }
+
+    if (aligner_o->aligner->graph() != graph_o->counting) {
+        PyErr_SetString(PyExc_ValueError,
+                        "the aligner must align against the countgraph given");
+        return NULL;
+    }
+
+    bool variable_coverage = false;
+    if (variable_coverage_o != NULL) {
+        int is_true = PyObject_IsTrue(variable_coverage_o);
+        if (is_true < 0) {
+            return NULL;
+        }
+        variable_coverage = (bool) is_true;
+    }
+
+    khmer_StreamingCorrector_Object * self;
+    self = (khmer_StreamingCorrector_Object *)type->tp_alloc(type, 0);
+    if (self != NULL) {
+        try {
+            self->trimmer.trimmer =
+                new StreamingCorrector(graph_o->counting, aligner_o->aligner,
+                                       normalize_limit, variable_coverage);
+        } catch (std::bad_alloc &e) {
+            Py_DECREF(self);
+            return PyErr_NoMemory();
+        }
+        Py_INCREF(graph_o);
+        self->trimmer.graph = (PyObject *) graph_o;
+        Py_INCREF(aligner_o);
+        self->aligner = (PyObject *) aligner_o;
+    }
+
+    return (PyObject *) self;
+}
+
+static
+void
+khmer_streamingcorrector_dealloc(khmer_StreamingCorrector_Object * obj)
+{
+    delete obj->trimmer.trimmer;
+    obj->trimmer.trimmer = NULL;
+    Py_XDECREF(obj->trimmer.graph);
+    obj->trimmer.graph = NULL;
+    Py_XDECREF(obj->aligner);
+    obj->aligner = NULL;
+    Py_TYPE(obj)->tp_free((PyObject*)obj);
+}
+
+static PyMethodDef khmer_streamingcorrector_methods[] = {
+    {
+        "correct_first_pass", (PyCFunction)streamingtrimmer_trim_first_pass,
+        METH_VARARGS,
+        "correct_first_pass(parser, buffer, group, n_threads=1, "
+        "force_single=False): as trim_first_pass(), correcting reads "
+        "rather than trimming them."
+    },
+    {
+        "correct_buffered", (PyCFunction)streamingtrimmer_trim_buffered,
+        METH_VARARGS,
+        "As trim_buffered(), correcting reads rather than trimming them."
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyTypeObject khmer_StreamingCorrector_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_khmer.StreamingCorrector",               /* tp_name */
+    sizeof(khmer_StreamingCorrector_Object),   /* tp_basicsize */
+    0,                                         /* tp_itemsize */
+    (destructor)khmer_streamingcorrector_dealloc, /* tp_dealloc */
+    0,                                         /* tp_print */
+    0,                                         /* tp_getattr */
+    0,                                         /* tp_setattr */
+    0,                                         /* tp_compare */
+    0,                                         /* tp_repr */
+    0,                                         /* tp_as_number */
+    0,                                         /* tp_as_sequence */
+    0,                                         /* tp_as_mapping */
+    0,                                         /* tp_hash */
+    0,                                         /* tp_call */
+    0,                                         /* tp_str */
+    0,                                         /* tp_getattro */
+    0,                                         /* tp_setattro */
+    0,                                         /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,  /* tp_flags */
+    "Streaming error correction against a countgraph with a ReadAligner, "
+    "as in sandbox/correct-reads.py.",         /* tp_doc */
+    0,                                         /* tp_traverse */
+    0,                                         /* tp_clear */
+    0,                                         /* tp_richcompare */
+    0,                                         /* tp_weaklistoffset */
+    0,                                         /* tp_iter */
+    0,                                         /* tp_iternext */
+    khmer_streamingcorrector_methods,          /* tp_methods */
+    0,                                         /* tp_members */
+    0,                                         /* tp_getset */
+    0,                                         /* tp_base */
+    0,                                         /* tp_dict */
+    0,                                         /* tp_descr_get */
+    0,                                         /* tp_descr_set */
+    0,                                         /* tp_dictoffset */
+    0,                                         /* tp_init */
+    0,                                         /* tp_alloc */
+    khmer_streamingcorrector_new,              /* tp_new */
+};
+
+/***********************************************************************/
+
+//
+// RecordWriter object -- buffered, optionally compressed, FASTA/FASTQ output
+//
+
+typedef struct {
+    PyObject_HEAD
+    RecordWriter * writer;
+    //! The file object written to.
+    PyObject * fileobj;
+    bool closed;
+} khmer_RecordWriter_Object;
+
+// Write data to a file object, as bytes or, for a text stream such as
+// sys.stdout, as a string.
+static
+bool
+_write_to_fileobj(PyObject * fileobj, const std::string& data)
+{
+    if (data.empty()) {
+        return true;
+    }
+
+    PyObject * data_o = PyBytes_FromStringAndSize(data.data(), data.length());
+    if (data_o == NULL) {
+        return false;
+    }
+    PyObject * ret = PyObject_CallMethod(fileobj, (char *)"write",
+                                         (char *)"O", data_o);
+    Py_DECREF(data_o);
+    if (ret == NULL && PyErr_ExceptionMatches(PyExc_TypeError)) {
+        PyErr_Clear();
+        data_o = PyUnicode_DecodeUTF8(data.data(), data.length(), NULL);
+        if (data_o == NULL) {
+            return false;
+        }
+        ret = PyObject_CallMethod(fileobj, (char *)"write", (char *)"O",
+                                  data_o);
+        Py_DECREF(data_o);
+    }
+    if (ret == NULL) {
+        return false;
+    }
+    Py_DECREF(ret);
+    return true;
+}
+
+// Hand the writer's buffer on, or drain it, and write out what's ready.
+static
+bool
+_recordwriter_write_out(khmer_RecordWriter_Object * me, bool drain,
+                        bool finish)
+{
+    std::string output;
+    std::string exception;
+    bool out_of_memory = false;
+
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        if (drain) {
+            me->writer->drain(output, finish);
+        } else {
+            me->writer->hand_over(output);
+        }
+    } catch (khmer_exception &exc) {
+        exception = exc.what();
+    } catch (std::bad_alloc &exc) {
+        out_of_memory = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (out_of_memory) {
+        PyErr_NoMemory();
+        return false;
+    }
+    if (!exception.empty()) {
+        PyErr_SetString(PyExc_OSError, exception.c_str());
+        return false;
+    }
+    return _write_to_fileobj(me->fileobj, output);
+}
+
+static
+bool
+_recordwriter_check_open(khmer_RecordWriter_Object * me)
+{
+    if (me->closed) {
+        PyErr_SetString(PyExc_ValueError, "I/O operation on closed file.");
+        return false;
+    }
+    return true;
+}
+
+static
+PyObject *
+khmer_recordwriter_new(PyTypeObject * type, PyObject * args, PyObject * kwds)
+{
+    PyObject * fileobj = NULL;
+    PyObject * gzip_o = NULL;
+    PyObject * bzip_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O|OO", &fileobj, &gzip_o, &bzip_o)) {
+        return NULL;
+    }
+
+    int gzip = gzip_o ? PyObject_IsTrue(gzip_o) : 0;
+    if (gzip < 0) {
+        return NULL;
+    }
+    int bzip = bzip_o ? PyObject_IsTrue(bzip_o) : 0;
+    if (bzip < 0) {
+        return NULL;
+    }
+    if (gzip && bzip) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Cannot specify both bzip and gzip compression!");
+        return NULL;
+    }
+
+    RecordWriter::Compression compression = RecordWriter::NONE;
+    if (gzip) {
+        compression = RecordWriter::GZIP;
+    } else if (bzip) {
+        compression = RecordWriter::BZIP2;
+    }
+
+    khmer_RecordWriter_Object * self;
+    self = (khmer_RecordWriter_Object *)type->tp_alloc(type, 0);
+    if (self != NULL) {
+        try {
+            self->writer = new RecordWriter(compression);
+        } catch (khmer_exception &e) {
+            Py_DECREF(self);
+            PyErr_SetString(PyExc_RuntimeError, e.what());
+            return NULL;
+        } catch (std::bad_alloc &e) {
+            Py_DECREF(self);
+            return PyErr_NoMemory();
+        }
+        Py_INCREF(fileobj);
+        self->fileobj = fileobj;
+        self->closed = false;
+    }
+
+    return (PyObject *) self;
+}
+
+// Like a GzipFile, a RecordWriter that's deleted unclosed writes out what
+// it holds, but leaves the file object open.
+static
+void
+khmer_recordwriter_dealloc(khmer_RecordWriter_Object * obj)
+{
+    if (obj->writer != NULL && obj->fileobj != NULL && !obj->closed) {
+        PyObject * type, * value, * traceback;
+        PyErr_Fetch(&type, &value, &traceback);
+        if (!_recordwriter_write_out(obj, true, true)) {
+            PyErr_WriteUnraisable((PyObject *) obj);
+        } else {
+            PyObject * ret = PyObject_CallMethod(obj->fileobj,
+                                                 (char *)"flush", NULL);
+            if (ret == NULL) {
+                PyErr_Clear();
+            }
+            Py_XDECREF(ret);
+        }
+        PyErr_Restore(type, value, traceback);
+    }
+
+    delete obj->writer;
+    obj->writer = NULL;
+    Py_XDECREF(obj->fileobj);
+    obj->fileobj = NULL;
+    Py_TYPE(obj)->tp_free((PyObject*)obj);
+}
+
+static
+PyObject *
+recordwriter_write_record(khmer_RecordWriter_Object * me, PyObject * args)
+{
+    PyObject * record_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O", &record_o)) {
+        return NULL;
+    }
+    if (!_recordwriter_check_open(me)) {
+        return NULL;
+    }
+
+    Read read;
+    bool has_quality = false;
+    if (!_PyObject_to_Read(record_o, read, has_quality)) {
+        return NULL;
+    }
+    me->writer->write(read, has_quality);
+
+    if (me->writer->full() && !_recordwriter_write_out(me, false, false)) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static
+PyObject *
+recordwriter_write_record_pair(khmer_RecordWriter_Object * me,
+                               PyObject * args)
+{
+    PyObject * record1_o = NULL;
+    PyObject * record2_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "OO", &record1_o, &record2_o)) {
+        return NULL;
+    }
+    if (!_recordwriter_check_open(me)) {
+        return NULL;
+    }
+
+    Read read1, read2;
+    bool has_quality1 = false, has_quality2 = false;
+    if (!_PyObject_to_Read(record1_o, read1, has_quality1) ||
+            !_PyObject_to_Read(record2_o, read2, has_quality2)) {
+        return NULL;
+    }
+    me->writer->write(read1, has_quality1);
+    me->writer->write(read2, has_quality2);
+
+    if (me->writer->full() && !_recordwriter_write_out(me, false, false)) {
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static
+PyObject *
+recordwriter_write(khmer_RecordWriter_Object * me, PyObject * args)
+{
+    PyObject * data_o = NULL;
+
+    if (!PyArg_ParseTuple(args, "O", &data_o)) {
+        return NULL;
+    }
+    if (!_recordwriter_check_open(me)) {
+        return NULL;
+    }
+
+    std::string data;
+    if (!_PyObject_to_string(data_o, data)) {
+        return NULL;
+    }
+    me->writer->write(data.data(), data.length());
+
+    if (me->writer->full() && !_recordwriter_write_out(me, false, false)) {
+        return NULL;
+    }
+    return PyLong_FromSize_t(data.length());
+}
+
+static
+PyObject *
+recordwriter_flush(khmer_RecordWriter_Object * me, PyObject * args)
+{
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+    if (!_recordwriter_check_open(me)) {
+        return NULL;
+    }
+
+    if (!_recordwriter_write_out(me, true, false)) {
+        return NULL;
+    }
+    return PyObject_CallMethod(me->fileobj, (char *)"flush", NULL);
+}
+
+static
+PyObject *
+recordwriter_close(khmer_RecordWriter_Object * me, PyObject * args)
+{
+    if (!PyArg_ParseTuple(args, "")) {
+        return NULL;
+    }
+    if (me->closed) {
+        Py_RETURN_NONE;
+    }
+
+    if (!_recordwriter_write_out(me, true, true)) {
+        return NULL;
+    }
+    me->closed = true;
+    return PyObject_CallMethod(me->fileobj, (char *)"close", NULL);
+}
+
+static
+PyObject *
+recordwriter_get_fileobj(khmer_RecordWriter_Object * me)
+{
+    Py_INCREF(me->fileobj);
+    return me->fileobj;
+}
+
+static
+PyObject *
+recordwriter_get_name(khmer_RecordWriter_Object * me)
+{
+    return PyObject_GetAttrString(me->fileobj, "name");
+}
+
+static
+PyObject *
+recordwriter_get_closed(khmer_RecordWriter_Object * me)
+{
+    return PyBool_FromLong(me->closed);
+}
+
+static PyMethodDef khmer_recordwriter_methods[] = {
+    {
+        "write_record", (PyCFunction)recordwriter_write_record,
+        METH_VARARGS,
+        "Write a Read object or screed record, as FASTQ if it has a quality "
+        "string and as FASTA if not."
+    },
+    {
+        "write_record_pair", (PyCFunction)recordwriter_write_record_pair,
+        METH_VARARGS,
+        "Write the two reads of a pair."
+    },
+    {
+        "write", (PyCFunction)recordwriter_write,
+        METH_VARARGS,
+        "Write bytes or a string as they are."
+    },
+    {
+        "flush", (PyCFunction)recordwriter_flush,
+        METH_VARARGS,
+        "Write out everything written so far, and flush the file object."
+    },
+    {
+        "close", (PyCFunction)recordwriter_close,
+        METH_VARARGS,
+        "Write out everything written, end the compressed stream if any, and "
+        "close the file object."
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyGetSetDef khmer_recordwriter_getseters[] = {
+    {
+        (char *)"fileobj",
+        (getter)recordwriter_get_fileobj, NULL,
+        (char *)"The file object written to.",
+        NULL
+    },
+    {
+        (char *)"name",
+        (getter)recordwriter_get_name, NULL,
+        (char *)"The name of the file object written to.",
+        NULL
+    },
+    {
+        (char *)"closed",
+        (getter)recordwriter_get_closed, NULL,
+        (char *)"True once the writer has been closed.",
+        NULL
+    },
+    {NULL} /* Sentinel */
+};
+
+static PyTypeObject khmer_RecordWriter_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_khmer.RecordWriter",                     /* tp_name */
+    sizeof(khmer_RecordWriter_Object),         /* tp_basicsize */
+    0,                                         /* tp_itemsize */
+    (destructor)khmer_recordwriter_dealloc,    /* tp_dealloc */
+    0,                                         /* tp_print */
+    0,                                         /* tp_getattr */
+    0,                                         /* tp_setattr */
+    0,                                         /* tp_compare */
+    0,                                         /* tp_repr */
+    0,                                         /* tp_as_number */
+    0,                                         /* tp_as_sequence */
+    0,                                         /* tp_as_mapping */
+    0,                                         /* tp_hash */
+    0,                                         /* tp_call */
+    0,                                         /* tp_str */
+    0,                                         /* tp_getattro */
+    0,                                         /* tp_setattro */
+    0,                                         /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,  /* tp_flags */
+    "RecordWriter(fileobj, gzip=False, bzip=False): writes FASTA and FASTQ "
+    "records to a file object in large buffers, gzip or bzip2 compressed "
+    "on a thread of its own if asked.",        /* tp_doc */
+    0,                                         /* tp_traverse */
+    0,                                         /* tp_clear */
+    0,                                         /* tp_richcompare */
+    0,                                         /* tp_weaklistoffset */
+    0,                                         /* tp_iter */
+    0,                                         /* tp_iternext */
+    khmer_recordwriter_methods,                /* tp_methods */
+    0,                                         /* tp_members */
+    khmer_recordwriter_getseters,              /* tp_getset */
+    0,                                         /* tp_base */
+    0,                                         /* tp_dict */
+    0,                                         /* tp_descr_get */
+    0,                                         /* tp_descr_set */
+    0,                                         /* tp_dictoffset */
+    0,                                         /* tp_init */
+    0,                                         /* tp_alloc */
+    khmer_recordwriter_new,                    /* tp_new */
+};
+
+
+//////////////////////////////
+// standalone functions
+
+static PyObject * forward_hash(PyObject * self, PyObject * args)
+{
+    const char * kmer;
+    WordLength ksize;
+
+    if (!PyArg_ParseTuple(args, "sb", &kmer, &ksize)) {
+        return NULL;
+    }
+
+    if (ksize > KSIZE_MAX) {
+        PyErr_Format(PyExc_ValueError, "k-mer size must be <= %u", KSIZE_MAX);
+        return NULL;
+    }
+
+    try {
+        PyObject * hash;
+        hash = PyLong_FromUnsignedLongLong(_hash(kmer, ksize));
+        return hash;
+    } catch (khmer_exception &e) {
+        PyErr_SetString(PyExc_RuntimeError, e.what());
+        return NULL;
+    }
+
+}
+
+static PyObject * forward_hash_no_rc(PyObject * self, PyObject * args)
+{
+    const char * kmer;
+    WordLength ksize;
+
+    if (!PyArg_ParseTuple(args, "sb", &kmer, &ksize)) {
+        return NULL;
+    }
+
+    if (ksize > KSIZE_MAX) {
+        PyErr_Format(PyExc_ValueError, "k-mer size must be <= %u", KSIZE_MAX);
+        return NULL;
+    }
+
+    if (strlen(kmer) != ksize) {
+        PyErr_SetString(PyExc_ValueError,
+                        "k-mer length must equal the k-size");
+        return NULL;
+    }
+
+    return PyLong_FromUnsignedLongLong(_hash_forward(kmer, ksize));
+}
+
+static PyObject * reverse_hash(PyObject * self, PyObject * args)
+{
+    HashIntoType val;
+    WordLength ksize;
+
+    if (!PyArg_ParseTuple(args, "Kb", &val, &ksize)) {
+        return NULL;
+    }
+
+    if (ksize > KSIZE_MAX) {
+        PyErr_Format(PyExc_ValueError, "k-mer size must be <= %u", KSIZE_MAX);
+        return NULL;
+    }
+
+    return PyUnicode_FromString(_revhash(val, ksize).c_str());
+}
+
+static PyObject * murmur3_forward_hash(PyObject * self, PyObject * args)
+{
+    const char * kmer;
+
+    if (!PyArg_ParseTuple(args, "s", &kmer)) {
+        return NULL;
+    }
+
+    return PyLong_FromUnsignedLongLong(_hash_murmur(kmer));
+}
+
+static PyObject * murmur3_forward_hash_no_rc(PyObject * self, PyObject * args)
+{
+    const char * kmer;
+
+    if (!PyArg_ParseTuple(args, "s", &kmer)) {
+        return NULL;
+    }
+
+    return PyLong_FromUnsignedLongLong(_hash_murmur_forward(kmer));
+}
+
+//
+// technique for resolving literal below found here:
+// https://gcc.gnu.org/onlinedocs/gcc-4.9.1/cpp/Stringification.html
+//
+
+static
+PyObject *
+get_version_cpp( PyObject * self, PyObject * args )
+{
+#define xstr(s) str(s)
+#define str(s) #s
     std::string dVersion = xstr(VERSION);
     return PyUnicode_FromString(dVersion.c_str());
 }
@@ -4892,6 +7471,35 @@ MOD_INIT(_khmer)
         return MOD_ERROR_VAL;
     }
 
+    if (PyType_Ready(&khmer_ReadBuffer_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    if (PyType_Ready(&khmer_LabelSweepWriter_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    if (PyType_Ready(&khmer_StreamingTrimmer_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    khmer_StreamingCorrector_Type.tp_base = &khmer_StreamingTrimmer_Type;
+    if (PyType_Ready(&khmer_StreamingCorrector_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    if (PyType_Ready(&khmer_RecordWriter_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    if (PyType_Ready(&khmer_FirstPassIterator_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    if (PyType_Ready(&khmer_ReadBufferIterator_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
     PyObject * m;
 
     MOD_DEF(m, "_khmer", "interface for the khmer module low-level extensions",
@@ -4937,6 +7545,36 @@ MOD_INIT(_khmer)
         return MOD_ERROR_VAL;
     }
 
+    Py_INCREF(&khmer_ReadBuffer_Type);
+    if (PyModule_AddObject(m, "ReadBuffer",
+                           (PyObject *)&khmer_ReadBuffer_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    Py_INCREF(&khmer_StreamingTrimmer_Type);
+    if (PyModule_AddObject(m, "StreamingTrimmer",
+                           (PyObject *)&khmer_StreamingTrimmer_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    Py_INCREF(&khmer_StreamingCorrector_Type);
+    if (PyModule_AddObject(m, "StreamingCorrector",
+                           (PyObject *)&khmer_StreamingCorrector_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    Py_INCREF(&khmer_RecordWriter_Type);
+    if (PyModule_AddObject(m, "RecordWriter",
+                           (PyObject *)&khmer_RecordWriter_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
+    Py_INCREF(&khmer_LabelSweepWriter_Type);
+    if (PyModule_AddObject(m, "LabelSweepWriter",
+                           (PyObject *)&khmer_LabelSweepWriter_Type) < 0) {
+        return MOD_ERROR_VAL;
+    }
+
     return MOD_SUCCESS_VAL(m);
 }
 
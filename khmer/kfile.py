@@ -13,9 +13,8 @@ import os
 import sys
 import errno
 from stat import S_ISBLK, S_ISFIFO, S_ISCHR
-import gzip
-import bz2file
 from khmer import khmer_args
+from khmer._khmer import RecordWriter
 
 
 def check_input_files(file_path, force):
@@ -175,8 +174,13 @@ def check_valid_file_exists(in_files):
 
 def is_block(fthing):
     """Take in a file object and checks to see if it's a block or fifo."""
+    if isinstance(fthing, RecordWriter):
+        fthing = fthing.fileobj
     if fthing is sys.stdout or fthing is sys.stdin:
         return True
+    elif fthing is getattr(sys.stdout, 'buffer', None) or \
+            fthing is getattr(sys.stdin, 'buffer', None):
+        return True
     else:
         mode = os.stat(fthing.name).st_mode
         return S_ISBLK(mode) or S_ISCHR(mode)
@@ -199,17 +203,13 @@ def add_output_compression_type(parser):
 
 
 def get_file_writer(file_handle, do_gzip, do_bzip):
-    """Generate and return a file object with specified compression."""
-    ofile = None
+    """Generate and return a file object with specified compression.
 
+    The file object is a khmer.RecordWriter, which buffers records for
+    write_record() and write_record_pair() and compresses them on a thread
+    of its own; closing it closes file_handle.
+    """
     if do_gzip and do_bzip:
         raise Exception("Cannot specify both bzip and gzip compression!")
 
-    if do_gzip:
-        ofile = gzip.GzipFile(fileobj=file_handle, mode='w')
-    elif do_bzip:
-        ofile = bz2file.open(file_handle, mode='w')
-    else:
-        ofile = file_handle
-
-    return ofile
+    return RecordWriter(file_handle, do_gzip, do_bzip)
@@ -28,6 +28,7 @@ DEFAULT_K = 32
 DEFAULT_N_TABLES = 4
 DEFAULT_MAX_TABLESIZE = 1e6
 DEFAULT_N_THREADS = 1
+SMALL_COUNT_MAX = 15
 
 
 class _VersionStdErrAction(_VersionAction):
@@ -284,6 +285,13 @@ def build_graph_args(descr=None, epilog=None, parser=None):
 def build_counting_args(descr=None, epilog=None):
     """Build an ArgumentParser with args for countgraph based scripts."""
     parser = build_graph_args(descr=descr, epilog=epilog)
+    parser.add_argument('--blocked', default=False, action='store_true',
+                        help='keep all of the counters for a k-mer in one '
+                        'cache line; faster on large tables, at a slightly '
+                        'higher false positive rate')
+    parser.add_argument('--small-count', default=False, action='store_true',
+                        help='use 4-bit counters that saturate at 15, fitting '
+                        'twice as many k-mers in the same memory')
 
     return parser
 
@@ -303,13 +311,16 @@ def add_loadgraph_args(parser):
 
 
 def calculate_graphsize(args, graphtype, multiplier=1.0):
-    if graphtype not in ('countgraph', 'nodegraph'):
+    if graphtype not in ('countgraph', 'smallcountgraph', 'nodegraph'):
         raise ValueError("unknown graph type: %s" % (graphtype,))
 
     if args.max_memory_usage:
         if graphtype == 'countgraph':
             tablesize = args.max_memory_usage / args.n_tables / \
                 float(multiplier)
+        elif graphtype == 'smallcountgraph':
+            tablesize = 2. * args.max_memory_usage / args.n_tables / \
+                float(multiplier)
         elif graphtype == 'nodegraph':
             tablesize = 8. * args.max_memory_usage / args.n_tables / \
                 float(multiplier)
@@ -341,8 +352,21 @@ def create_countgraph(args, ksize=None, multiplier=1.0, fp_rate=0.1):
         print_error("\n** ERROR: khmer only supports k-mer sizes <= 32.\n")
         sys.exit(1)
 
-    tablesize = calculate_graphsize(args, 'countgraph', multiplier=multiplier)
-    return khmer.Countgraph(ksize, tablesize, args.n_tables)
+    small_count = getattr(args, 'small_count', False)
+    graphtype = 'smallcountgraph' if small_count else 'countgraph'
+    tablesize = calculate_graphsize(args, graphtype, multiplier=multiplier)
+    return khmer.Countgraph(ksize, tablesize, args.n_tables,
+                            blocked=getattr(args, 'blocked', False),
+                            small_count=small_count)
+
+
+def check_small_count_cutoff(countgraph, cutoff):
+    """Exit if countgraph has 4-bit counters that cannot reach cutoff."""
+    if countgraph.is_small_count() and cutoff > SMALL_COUNT_MAX:
+        print_error("\n** ERROR: this countgraph has 4-bit counters (see "
+                    "--small-count), which stop at {0}; a cutoff of {1} can "
+                    "never be reached.\n".format(SMALL_COUNT_MAX, cutoff))
+        sys.exit(1)
 
 
 def report_on_config(args, graphtype='countgraph'):
@@ -354,6 +378,8 @@ def report_on_config(args, graphtype='countgraph'):
     check_conflicting_args(args, graphtype)
     if graphtype not in ('countgraph', 'nodegraph'):
         raise ValueError("unknown graph type: %s" % (graphtype,))
+    if graphtype == 'countgraph' and getattr(args, 'small_count', False):
+        graphtype = 'smallcountgraph'
 
     tablesize = calculate_graphsize(args, graphtype)
 
@@ -367,6 +393,11 @@ def report_on_config(args, graphtype='countgraph'):
             "Estimated memory usage is {0:.2g} bytes "
             "(n_tables x max_tablesize)".format(
                 args.n_tables * tablesize))
+    elif graphtype == 'smallcountgraph':
+        log_info(
+            "Estimated memory usage is {0:.2g} bytes "
+            "(n_tables x max_tablesize / 2)".format(
+                args.n_tables * tablesize / 2))
     elif graphtype == 'nodegraph':
         log_info(
             "Estimated memory usage is {0:.2g} bytes "
@@ -14,6 +14,7 @@ import sys
 import screed
 from khmer import utils
 from khmer.utils import write_record
+from khmer._khmer import RecordWriter
 # stdlib queue module was renamed on Python 3
 try:
     import queue
@@ -132,6 +133,10 @@ class ThreadedSequenceProcessor(object):
             g = SequenceGroup(0, batch)
             self.inqueue.put(g)
 
+    def process_group(self, records):
+        """Return a (name, sequence) result for each of records."""
+        return [self.process_fn(record) for record in records]
+
     def do_process(self):
         inq = self.inqueue
 
@@ -145,8 +150,8 @@ class ThreadedSequenceProcessor(object):
             bp_written = 0
 
             keep = []
-            for record in g.seqlist:
-                name, sequence = self.process_fn(record)
+            results = self.process_group(g.seqlist)
+            for record, (name, sequence) in zip(g.seqlist, results):
                 bp_processed += len(record['sequence'])
                 if name:
                     quality = record.get('quality')
@@ -183,6 +188,8 @@ class ThreadedSequenceProcessor(object):
 
     def do_write(self, outfp):
         outq = self.outqueue
+        if not isinstance(outfp, RecordWriter):
+            outfp = RecordWriter(outfp)
         while self.worker_count > 0 or not outq.empty():
             try:
                 g = outq.get(True, 1)
@@ -196,6 +203,7 @@ class ThreadedSequenceProcessor(object):
                 else:
                     record = screed.Record(name=name, sequence=seq)
                 write_record(record, outfp)
+        outfp.flush()
 
         if self.verbose:
             print("DONE writing.\nprocessed %d / wrote %d / removed %d" %
@@ -208,4 +216,18 @@ class ThreadedSequenceProcessor(object):
             f = float(discarded) / float(self.bp_processed) * 100
             print("discarded %.1f%%" % f, file=sys.stderr)
 
+
+class BatchSequenceProcessor(ThreadedSequenceProcessor):
+    """A ThreadedSequenceProcessor whose process_fn takes a whole group.
+
+    process_fn is given a list of records and returns a list of (name,
+    sequence) results, one per record. A process_fn that makes a single
+    call into the C++ library for the group, such as
+    Countgraph.median_and_trim_many, releases the GIL for all of its work,
+    so that the worker threads actually run in parallel.
+    """
+
+    def process_group(self, records):
+        return self.process_fn(records)
+
 # vim: set ft=python ts=4 sts=4 sw=4 et tw=79:
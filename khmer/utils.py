@@ -8,6 +8,8 @@ from __future__ import print_function, unicode_literals
 # Convenience functions for performing common argument-checking tasks in
 # scripts.
 
+from khmer._khmer import RecordWriter
+
 
 def print_error(msg):
     """Print the given message to 'stderr'."""
@@ -178,6 +180,10 @@ def broken_paired_reader(screed_iter, min_length=None,
 
 def write_record(record, fileobj):
     """Write sequence record to 'fileobj' in FASTA/FASTQ format."""
+    if isinstance(fileobj, RecordWriter):
+        fileobj.write_record(record)
+        return
+
     if hasattr(record, 'quality'):
         recstr = '@{name}\n{sequence}\n+\n{quality}\n'.format(
             name=record.name,
@@ -198,6 +204,10 @@ def write_record_pair(read1, read2, fileobj):
     """Write a pair of sequence records to 'fileobj' in FASTA/FASTQ format."""
     if hasattr(read1, 'quality'):
         assert hasattr(read2, 'quality')
+    if isinstance(fileobj, RecordWriter):
+        fileobj.write_record_pair(read1, read2)
+        return
+
     write_record(read1, fileobj)
     write_record(read2, fileobj)
 
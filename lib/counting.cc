@@ -21,6 +21,163 @@ using namespace std;
 using namespace khmer;
 using namespace khmer:: read_parsers;
 
+KmerCountMap::KmerCountMap()
+{
+    for (unsigned int i = 0; i < BIGCOUNT_N_SHARDS; i++) {
+        _shards[i].n_entries = 0;
+        _shards[i].capacity = 0;
+        _shards[i].entries = NULL;
+        _shards[i].spin_lock = 0;
+    }
+}
+
+KmerCountMap::~KmerCountMap()
+{
+    clear();
+}
+
+void KmerCountMap::_reserve_one(Shard& shard)
+{
+    // keep the load factor at or below one half.
+    if (2 * (shard.n_entries + 1) <= shard.capacity) {
+        return;
+    }
+
+    size_t old_capacity = shard.capacity;
+    Entry * old_entries = shard.entries;
+
+    shard.capacity = old_capacity ? 2 * old_capacity : 16;
+    shard.entries = new Entry[shard.capacity];
+    for (size_t i = 0; i < shard.capacity; i++) {
+        shard.entries[i].count = 0;
+    }
+
+    for (size_t i = 0; i < old_capacity; i++) {
+        if (old_entries[i].count != 0) {
+            HashIntoType kmer = old_entries[i].kmer;
+            *_find(shard, kmer, _mix_hash(kmer)) = old_entries[i];
+        }
+    }
+    delete[] old_entries;
+}
+
+void KmerCountMap::set(HashIntoType kmer, BoundedCounterType count)
+{
+    if (count == 0) {           // zero marks an empty slot
+        return;
+    }
+
+    HashIntoType mixed = _mix_hash(kmer);
+    Shard& shard = _get_shard(mixed);
+
+    _lock(shard);
+    _reserve_one(shard);
+    Entry * entry = _find(shard, kmer, mixed);
+    if (entry->count == 0) {
+        entry->kmer = kmer;
+        shard.n_entries++;
+    }
+    entry->count = count;
+    _unlock(shard);
+}
+
+size_t KmerCountMap::size() const
+{
+    size_t n = 0;
+    for (unsigned int i = 0; i < BIGCOUNT_N_SHARDS; i++) {
+        _lock(_shards[i]);
+        n += _shards[i].n_entries;
+        _unlock(_shards[i]);
+    }
+    return n;
+}
+
+void KmerCountMap::clear()
+{
+    for (unsigned int i = 0; i < BIGCOUNT_N_SHARDS; i++) {
+        _lock(_shards[i]);
+        delete[] _shards[i].entries;
+        _shards[i].entries = NULL;
+        _shards[i].capacity = 0;
+        _shards[i].n_entries = 0;
+        _unlock(_shards[i]);
+    }
+}
+
+void KmerCountMap::get_entries(std::vector<KmerCount> &entries) const
+{
+    entries.clear();
+    for (unsigned int i = 0; i < BIGCOUNT_N_SHARDS; i++) {
+        Shard& shard = _shards[i];
+        _lock(shard);
+        for (size_t j = 0; j < shard.capacity; j++) {
+            if (shard.entries[j].count != 0) {
+                entries.push_back(KmerCount(shard.entries[j].kmer,
+                                            shard.entries[j].count));
+            }
+        }
+        _unlock(shard);
+    }
+    std::sort(entries.begin(), entries.end());
+}
+
+// Bigcounts are saved as packed (k-mer, count) records, moved to and from
+// disk BIGCOUNT_IO_BATCH records at a time.
+#define BIGCOUNT_RECORD_SIZE (sizeof(HashIntoType) + sizeof(BoundedCounterType))
+#define BIGCOUNT_IO_BATCH 65536
+
+static void pack_bigcounts(
+    const std::vector<KmerCount>    &entries,
+    size_t                          start,
+    size_t                          n,
+    std::vector<char>               &buf)
+{
+    buf.resize(n * BIGCOUNT_RECORD_SIZE);
+    char * p = &buf[0];
+    for (size_t i = start; i < start + n; i++) {
+        memcpy(p, &entries[i].first, sizeof(HashIntoType));
+        memcpy(p + sizeof(HashIntoType), &entries[i].second,
+               sizeof(BoundedCounterType));
+        p += BIGCOUNT_RECORD_SIZE;
+    }
+}
+
+static void unpack_bigcounts(const char * buf, size_t n, KmerCountMap &map)
+{
+    HashIntoType kmer;
+    BoundedCounterType count;
+
+    for (size_t i = 0; i < n; i++) {
+        memcpy(&kmer, buf, sizeof(HashIntoType));
+        memcpy(&count, buf + sizeof(HashIntoType), sizeof(BoundedCounterType));
+        map.set(kmer, count);
+        buf += BIGCOUNT_RECORD_SIZE;
+    }
+}
+
+// Countgraph file types, one for each combination of layout and counter
+// size.
+static bool is_counting_ht_type(unsigned char ht_type)
+{
+    return ht_type == SAVED_COUNTING_HT ||
+           ht_type == SAVED_BLOCKED_COUNTING_HT ||
+           ht_type == SAVED_SMALL_COUNTING_HT ||
+           ht_type == SAVED_SMALL_BLOCKED_COUNTING_HT;
+}
+
+static unsigned char get_counting_ht_type(const CountingHash &ht)
+{
+    if (ht.is_small_count()) {
+        if (ht.is_blocked()) {
+            return SAVED_SMALL_BLOCKED_COUNTING_HT;
+        }
+        return SAVED_SMALL_COUNTING_HT;
+    } else if (ht.is_blocked()) {
+        return SAVED_BLOCKED_COUNTING_HT;
+    }
+    return SAVED_COUNTING_HT;
+}
+
 ///
 /// output_fasta_kmer_pos_freq: outputs the kmer frequencies for each read
 ///
@@ -282,9 +439,9 @@ void CountingHash::save(std::string outfilename)
     CountingHashFile::save(outfilename, *this);
 }
 
-void CountingHash::load(std::string infilename)
+void CountingHash::load(std::string infilename, bool use_mmap)
 {
-    CountingHashFile::load(infilename, *this);
+    CountingHashFile::load(infilename, *this, use_mmap);
 }
 
 unsigned long CountingHash::trim_on_abundance(
@@ -323,6 +480,61 @@ const
 }
 
 
+void CountingHash::median_and_trim_many(
+    const std::vector<std::string>     &seqs,
+    BoundedCounterType                 min_abund,
+    std::vector<BoundedCounterType>    &medians,
+    std::vector<unsigned long>         &trim_at)
+const
+{
+    medians.assign(seqs.size(), 0);
+    trim_at.assign(seqs.size(), 0);
+
+    std::string seq, trim_seq;
+    std::vector<BoundedCounterType> counts, trim_counts;
+    for (size_t n = 0; n < seqs.size(); n++) {
+        seq = seqs[n];
+        for (size_t i = 0; i < seq.length(); i++) {
+            if (seq[i] == 'N') {
+                seq[i] = 'A';
+            }
+        }
+        if (seq.length() < _ksize) {
+            continue;
+        }
+
+        // get_median_count() counts the k-mers of the read as it is, and
+        // trim_on_abundance() those of the read normalized, if it's valid.
+        counts.clear();
+        get_kmer_counts(seq, counts);
+
+        trim_seq = seq;
+        if (check_and_normalize_read(trim_seq)) {
+            const std::vector<BoundedCounterType> * tc = &counts;
+            if (trim_seq != seq) {
+                trim_counts.clear();
+                get_kmer_counts(trim_seq, trim_counts);
+                tc = &trim_counts;
+            }
+
+            // like trim_on_abundance(), a lone k-mer trims to nothing.
+            if (tc->size() > 1 && (*tc)[0] >= min_abund) {
+                size_t i = 1;
+                while (i < tc->size() && (*tc)[i] >= min_abund) {
+                    i++;
+                }
+                trim_at[n] = (i == tc->size()) ? seq.length() :
+                             i + _ksize - 1;
+            }
+        }
+
+        std::nth_element(counts.begin(), counts.begin() + counts.size() / 2,
+                         counts.end());
+        medians[n] = counts[counts.size() / 2];
+    }
+}
+
+
 unsigned long CountingHash::trim_below_abundance(
     std::string     seq,
     BoundedCounterType  max_abund)
@@ -417,16 +629,18 @@ const
 
 void CountingHashFile::load(
     const std::string   &infilename,
-    CountingHash    &ht)
+    CountingHash    &ht,
+    bool        use_mmap)
 {
     std::string filename(infilename);
     size_t found = filename.find_last_of(".");
     std::string type = filename.substr(found + 1);
 
+    // compressed files can't be mapped, so are always read.
     if (type == "gz") {
         CountingHashGzFileReader(filename, ht);
     } else {
-        CountingHashFileReader(filename, ht);
+        CountingHashFileReader(filename, ht, use_mmap);
     }
 }
 
@@ -447,9 +661,20 @@ void CountingHashFile::save(
 }
 
 
+// The blocks of a blocked countgraph start on a COUNTING_BLOCK_SIZE
+// boundary in the file, so that when the file is mapped (at a page
+// boundary) every block sits in a single cache line. This is the number of
+// zero bytes between the table size and the blocks.
+static unsigned int _block_padding(unsigned long long offset)
+{
+    return (COUNTING_BLOCK_SIZE - offset % COUNTING_BLOCK_SIZE) %
+           COUNTING_BLOCK_SIZE;
+}
+
 CountingHashFileReader::CountingHashFileReader(
     const std::string   &infilename,
-    CountingHash    &ht)
+    CountingHash    &ht,
+    bool        use_mmap)
 {
     ifstream infile;
     // configure ifstream to raise exceptions for everything.
@@ -468,16 +693,15 @@ CountingHashFileReader::CountingHashFileReader(
         throw khmer_file_exception(err + " " + strerror(errno));
     }
 
-    if (ht._counts) {
-        for (unsigned int i = 0; i < ht._n_tables; i++) {
-            delete[] ht._counts[i];
-            ht._counts[i] = NULL;
-        }
-        delete[] ht._counts;
-        ht._counts = NULL;
-    }
+    ht._free_counters();
     ht._tablesizes.clear();
 
+    // With use_mmap the header and bigcounts are still read through infile,
+    // but the tables are skipped over and pointed into the mapping instead.
+    if (use_mmap) {
+        ht._mapping = new MappedFile(infilename);
+    }
+
     try {
         unsigned int save_ksize = 0;
         unsigned char save_n_tables = 0;
@@ -503,7 +727,7 @@ CountingHashFileReader::CountingHashFileReader(
                 << " while reading k-mer count file from " << infilename
                 << "; should be " << (int) SAVED_FORMAT_VERSION;
             throw khmer_file_exception(err.str());
-        } else if (!(ht_type == SAVED_COUNTING_HT)) {
+        } else if (!is_counting_ht_type(ht_type)) {
             std::ostringstream err;
             err << "Incorrect file format type " << (int) ht_type
                 << " while reading k-mer count file from " << infilename;
@@ -521,25 +745,64 @@ CountingHashFileReader::CountingHashFileReader(
         ht._init_bitstuff();
 
         ht._use_bigcount = use_bigcount;
-
-        ht._counts = new Byte*[ht._n_tables];
-        for (unsigned int i = 0; i < ht._n_tables; i++) {
-            ht._counts[i] = NULL;
+        ht._blocked = (ht_type == SAVED_BLOCKED_COUNTING_HT ||
+                       ht_type == SAVED_SMALL_BLOCKED_COUNTING_HT);
+        ht._small_count = (ht_type == SAVED_SMALL_COUNTING_HT ||
+                           ht_type == SAVED_SMALL_BLOCKED_COUNTING_HT);
+        ht._max_count = ht._small_count ? MAX_SMALL_KCOUNT : MAX_KCOUNT;
+
+        // The blocked layout is stored as one array holding all of the blocks.
+        unsigned int n_arrays = ht._n_tables;
+        if (ht._blocked) {
+            n_arrays = 1;
+        }
+        if (!ht._blocked || ht._mapping) {
+            ht._counts = new Byte*[ht._n_tables];
+            for (unsigned int i = 0; i < ht._n_tables; i++) {
+                ht._counts[i] = NULL;
+            }
         }
 
-        for (unsigned int i = 0; i < ht._n_tables; i++) {
+        for (unsigned int i = 0; i < n_arrays; i++) {
             HashIntoType tablesize;
 
             infile.read((char *) &save_tablesize, sizeof(save_tablesize));
+            if (ht._blocked) {
+                infile.seekg(_block_padding(infile.tellg()), ios::cur);
+            }
 
             tablesize = (HashIntoType) save_tablesize;
-            ht._tablesizes.push_back(tablesize);
+            if (ht._mapping) {
+                if (ht._blocked) {
+                    ht._set_block_geometry(tablesize);
+                    tablesize = ht.blocks_size();
+                } else {
+                    ht._tablesizes.push_back(tablesize);
+                    tablesize = ht.table_bytes(tablesize);
+                }
 
-            ht._counts[i] = new Byte[tablesize];
+                unsigned long long offset = infile.tellg();
+                if (offset + tablesize > ht._mapping->size()) {
+                    throw khmer_file_exception("Unexpected end of k-mer "
+                                               "count file: " + infilename);
+                }
+                ht._counts[i] = (Byte *) ht._mapping->data() + offset;
+                infile.seekg(tablesize, ios::cur);
+                continue;
+            }
+
+            if (ht._blocked) {
+                ht._allocate_blocks(tablesize);
+                tablesize = ht.blocks_size();
+            } else {
+                ht._tablesizes.push_back(tablesize);
+                tablesize = ht.table_bytes(tablesize);
+                ht._counts[i] = new Byte[tablesize];
+            }
 
             unsigned long long loaded = 0;
             while (loaded != tablesize) {
-                infile.read((char *) ht._counts[i], tablesize - loaded);
+                infile.read((char *) ht._counts[i] + loaded, tablesize - loaded);
                 loaded += infile.gcount();
             }
         }
@@ -547,17 +810,14 @@ CountingHashFileReader::CountingHashFileReader(
         HashIntoType n_counts = 0;
         infile.read((char *) &n_counts, sizeof(n_counts));
 
-        if (n_counts) {
-            ht._bigcounts.clear();
-
-            HashIntoType kmer;
-            BoundedCounterType count;
-
-            for (HashIntoType n = 0; n < n_counts; n++) {
-                infile.read((char *) &kmer, sizeof(kmer));
-                infile.read((char *) &count, sizeof(count));
-                ht._bigcounts[kmer] = count;
-            }
+        ht._bigcounts.clear();
+        std::vector<char> buf;
+        for (HashIntoType n = 0; n < n_counts; n += BIGCOUNT_IO_BATCH) {
+            size_t n_batch = std::min((HashIntoType) BIGCOUNT_IO_BATCH,
+                                      n_counts - n);
+            buf.resize(n_batch * BIGCOUNT_RECORD_SIZE);
+            infile.read(&buf[0], buf.size());
+            unpack_bigcounts(&buf[0], n_batch, ht._bigcounts);
         }
 
         infile.close();
@@ -583,14 +843,7 @@ CountingHashGzFileReader::CountingHashGzFileReader(
         throw khmer_file_exception(err);
     }
 
-    if (ht._counts) {
-        for (unsigned int i = 0; i < ht._n_tables; i++) {
-            delete[] ht._counts[i];
-            ht._counts[i] = NULL;
-        }
-        delete[] ht._counts;
-        ht._counts = NULL;
-    }
+    ht._free_counters();
     ht._tablesizes.clear();
 
     unsigned int save_ksize = 0;
@@ -615,7 +868,7 @@ CountingHashGzFileReader::CountingHashGzFileReader(
             SAVED_SIGNATURE;
         throw khmer_file_exception(err.str());
     } else if (!(version == SAVED_FORMAT_VERSION)
-               || !(ht_type == SAVED_COUNTING_HT)) {
+               || !is_counting_ht_type(ht_type)) {
         if (!(version == SAVED_FORMAT_VERSION)) {
             std::ostringstream err;
             err << "Incorrect file format version " << (int) version
@@ -623,7 +876,7 @@ CountingHashGzFileReader::CountingHashGzFileReader(
                 << "; should be " << (int) SAVED_FORMAT_VERSION;
             gzclose(infile);
             throw khmer_file_exception(err.str());
-        } else if (!(ht_type == SAVED_COUNTING_HT)) {
+        } else {
             std::ostringstream err;
             err << "Incorrect file format type " << (int) ht_type
                 << " while reading k-mer count file from " << infilename;
@@ -652,9 +905,24 @@ CountingHashGzFileReader::CountingHashGzFileReader(
     ht._init_bitstuff();
 
     ht._use_bigcount = use_bigcount;
+    ht._blocked = (ht_type == SAVED_BLOCKED_COUNTING_HT ||
+                   ht_type == SAVED_SMALL_BLOCKED_COUNTING_HT);
+    ht._small_count = (ht_type == SAVED_SMALL_COUNTING_HT ||
+                       ht_type == SAVED_SMALL_BLOCKED_COUNTING_HT);
+    ht._max_count = ht._small_count ? MAX_SMALL_KCOUNT : MAX_KCOUNT;
+
+    // The blocked layout is stored as one array holding all of the blocks.
+    unsigned int n_arrays = ht._n_tables;
+    if (ht._blocked) {
+        n_arrays = 1;
+    } else {
+        ht._counts = new Byte*[ht._n_tables];
+        for (unsigned int i = 0; i < ht._n_tables; i++) {
+            ht._counts[i] = NULL;
+        }
+    }
 
-    ht._counts = new Byte*[ht._n_tables];
-    for (unsigned int i = 0; i < ht._n_tables; i++) {
+    for (unsigned int i = 0; i < n_arrays; i++) {
         HashIntoType tablesize;
 
         read_b = gzread(infile, (char *) &save_tablesize,
@@ -673,10 +941,27 @@ CountingHashGzFileReader::CountingHashGzFileReader(
             throw khmer_file_exception(err);
         }
 
-        tablesize = (HashIntoType) save_tablesize;
-        ht._tablesizes.push_back(tablesize);
+        if (ht._blocked) {
+            char padding[COUNTING_BLOCK_SIZE];
+            unsigned int to_skip = _block_padding(gztell(infile));
+            if (to_skip > 0 &&
+                    gzread(infile, padding, to_skip) != (int) to_skip) {
+                std::string err = "K-mer count file header read error: "
+                                  + infilename;
+                gzclose(infile);
+                throw khmer_file_exception(err);
+            }
+        }
 
-        ht._counts[i] = new Byte[tablesize];
+        tablesize = (HashIntoType) save_tablesize;
+        if (ht._blocked) {
+            ht._allocate_blocks(tablesize);
+            tablesize = ht.blocks_size();
+        } else {
+            ht._tablesizes.push_back(tablesize);
+            tablesize = ht.table_bytes(tablesize);
+            ht._counts[i] = new Byte[tablesize];
+        }
 
         HashIntoType loaded = 0;
         while (loaded != tablesize) {
@@ -688,7 +973,8 @@ CountingHashGzFileReader::CountingHashGzFileReader(
             } else {
                 to_read_int = to_read_ll;
             }
-            read_b = gzread(infile, (char *) ht._counts[i], to_read_int);
+            read_b = gzread(infile, (char *) ht._counts[i] + loaded,
+                            to_read_int);
 
             if (read_b <= 0) {
                 std::string gzerr = gzerror(infile, &read_b);
@@ -720,30 +1006,27 @@ CountingHashGzFileReader::CountingHashGzFileReader(
         throw khmer_file_exception(err);
     }
 
-    if (n_counts) {
-        ht._bigcounts.clear();
-
-        HashIntoType kmer;
-        BoundedCounterType count;
-
-        for (HashIntoType n = 0; n < n_counts; n++) {
-            int read_k = gzread(infile, (char *) &kmer, sizeof(kmer));
-            int read_c = gzread(infile, (char *) &count, sizeof(count));
+    ht._bigcounts.clear();
+    std::vector<char> buf;
+    for (HashIntoType n = 0; n < n_counts; n += BIGCOUNT_IO_BATCH) {
+        size_t n_batch = std::min((HashIntoType) BIGCOUNT_IO_BATCH,
+                                  n_counts - n);
+        buf.resize(n_batch * BIGCOUNT_RECORD_SIZE);
+        read_b = gzread(infile, &buf[0], buf.size());
 
-            if (read_k <= 0 || read_c <= 0) {
-                std::string gzerr = gzerror(infile, &read_b);
-                std::string err = "K-mer count read error: " + infilename;
-                if (read_b == Z_ERRNO) {
-                    err = err + " " + strerror(errno);
-                } else {
-                    err = err + " " + gzerr;
-                }
-                gzclose(infile);
-                throw khmer_file_exception(err);
+        if (read_b != (int) buf.size()) {
+            std::string gzerr = gzerror(infile, &read_b);
+            std::string err = "K-mer count read error: " + infilename;
+            if (read_b == Z_ERRNO) {
+                err = err + " " + strerror(errno);
+            } else {
+                err = err + " " + gzerr;
             }
-
-            ht._bigcounts[kmer] = count;
+            gzclose(infile);
+            throw khmer_file_exception(err);
         }
+
+        unpack_bigcounts(&buf[0], n_batch, ht._bigcounts);
     }
 
     gzclose(infile);
@@ -756,6 +1039,10 @@ CountingHashFileWriter::CountingHashFileWriter(
     if (!ht._counts[0]) {
         throw khmer_exception();
     }
+    if (ht._mapping && ht._mapping->is_same_file(outfilename)) {
+        throw khmer_file_exception("Cannot save a countgraph over the file "
+                                   "it is mapped from: " + outfilename);
+    }
 
     unsigned int save_ksize = ht._ksize;
     unsigned char save_n_tables = ht._n_tables;
@@ -768,7 +1055,7 @@ CountingHashFileWriter::CountingHashFileWriter(
     unsigned char version = SAVED_FORMAT_VERSION;
     outfile.write((const char *) &version, 1);
 
-    unsigned char ht_type = SAVED_COUNTING_HT;
+    unsigned char ht_type = get_counting_ht_type(ht);
     outfile.write((const char *) &ht_type, 1);
 
     unsigned char use_bigcount = 0;
@@ -782,23 +1069,39 @@ CountingHashFileWriter::CountingHashFileWriter(
     outfile.write((const char *) &save_occupied_bins,
                   sizeof(save_occupied_bins));
 
-    for (unsigned int i = 0; i < save_n_tables; i++) {
+    // The blocked layout is stored as one array holding all of the blocks.
+    unsigned int n_arrays = save_n_tables;
+    if (ht._blocked) {
+        n_arrays = 1;
+    }
+
+    for (unsigned int i = 0; i < n_arrays; i++) {
         save_tablesize = ht._tablesizes[i];
+        unsigned long long save_bytes = ht.table_bytes(save_tablesize);
+        if (ht._blocked) {
+            save_tablesize = ht.blocks_size();
+            save_bytes = save_tablesize;
+        }
 
         outfile.write((const char *) &save_tablesize, sizeof(save_tablesize));
-        outfile.write((const char *) ht._counts[i], save_tablesize);
+        if (ht._blocked) {
+            const char padding[COUNTING_BLOCK_SIZE] = { 0 };
+            outfile.write(padding, _block_padding(outfile.tellp()));
+        }
+        outfile.write((const char *) ht._counts[i], save_bytes);
     }
 
-    HashIntoType n_counts = ht._bigcounts.size();
+    std::vector<KmerCount> entries;
+    ht._bigcounts.get_entries(entries);
+    HashIntoType n_counts = entries.size();
     outfile.write((const char *) &n_counts, sizeof(n_counts));
 
-    if (n_counts) {
-        KmerCountMap::const_iterator it = ht._bigcounts.begin();
-
-        for (; it != ht._bigcounts.end(); ++it) {
-            outfile.write((const char *) &it->first, sizeof(it->first));
-            outfile.write((const char *) &it->second, sizeof(it->second));
-        }
+    std::vector<char> buf;
+    for (size_t i = 0; i < entries.size(); i += BIGCOUNT_IO_BATCH) {
+        size_t n_batch = std::min((size_t) BIGCOUNT_IO_BATCH,
+                                  entries.size() - i);
+        pack_bigcounts(entries, i, n_batch, buf);
+        outfile.write(&buf[0], buf.size());
     }
     if (outfile.fail()) {
         throw khmer_file_exception(strerror(errno));
@@ -813,6 +1116,10 @@ CountingHashGzFileWriter::CountingHashGzFileWriter(
     if (!ht._counts[0]) {
         throw khmer_exception();
     }
+    if (ht._mapping && ht._mapping->is_same_file(outfilename)) {
+        throw khmer_file_exception("Cannot save a countgraph over the file "
+                                   "it is mapped from: " + outfilename);
+    }
 
     int errnum = 0;
     unsigned int save_ksize = ht._ksize;
@@ -834,7 +1141,7 @@ CountingHashGzFileWriter::CountingHashGzFileWriter(
     unsigned char version = SAVED_FORMAT_VERSION;
     gzwrite(outfile, (const char *) &version, 1);
 
-    unsigned char ht_type = SAVED_COUNTING_HT;
+    unsigned char ht_type = get_counting_ht_type(ht);
     gzwrite(outfile, (const char *) &ht_type, 1);
 
     unsigned char use_bigcount = 0;
@@ -848,14 +1155,32 @@ CountingHashGzFileWriter::CountingHashGzFileWriter(
     gzwrite(outfile, (const char *) &save_occupied_bins,
             sizeof(save_occupied_bins));
 
-    for (unsigned int i = 0; i < save_n_tables; i++) {
+    // The blocked layout is stored as one array holding all of the blocks.
+    unsigned int n_arrays = save_n_tables;
+    if (ht._blocked) {
+        n_arrays = 1;
+    }
+
+    for (unsigned int i = 0; i < n_arrays; i++) {
         save_tablesize = ht._tablesizes[i];
+        unsigned long long save_bytes = ht.table_bytes(save_tablesize);
+        if (ht._blocked) {
+            save_tablesize = ht.blocks_size();
+            save_bytes = save_tablesize;
+        }
 
         gzwrite(outfile, (const char *) &save_tablesize,
                 sizeof(save_tablesize));
+        if (ht._blocked) {
+            const char padding[COUNTING_BLOCK_SIZE] = { 0 };
+            unsigned int to_pad = _block_padding(gztell(outfile));
+            if (to_pad > 0) {
+                gzwrite(outfile, padding, to_pad);
+            }
+        }
         unsigned long long written = 0;
-        while (written != save_tablesize) {
-            unsigned long long  to_write_ll = save_tablesize - written;
+        while (written != save_bytes) {
+            unsigned long long  to_write_ll = save_bytes - written;
             unsigned int        to_write_int;
             int                 gz_result;
             // Zlib can only write chunks of at most INT_MAX bytes.
@@ -864,7 +1189,7 @@ CountingHashGzFileWriter::CountingHashGzFileWriter(
             } else {
                 to_write_int = to_write_ll;
             }
-            gz_result = gzwrite(outfile, (const char *) ht._counts[i],
+            gz_result = gzwrite(outfile, (const char *) ht._counts[i] + written,
                                 to_write_int);
             // Zlib returns 0 on error
             if (gz_result == 0) {
@@ -890,16 +1215,17 @@ CountingHashGzFileWriter::CountingHashGzFileWriter(
         }
     }
 
-    HashIntoType n_counts = ht._bigcounts.size();
+    std::vector<KmerCount> entries;
+    ht._bigcounts.get_entries(entries);
+    HashIntoType n_counts = entries.size();
     gzwrite(outfile, (const char *) &n_counts, sizeof(n_counts));
 
-    if (n_counts) {
-        KmerCountMap::const_iterator it = ht._bigcounts.begin();
-
-        for (; it != ht._bigcounts.end(); ++it) {
-            gzwrite(outfile, (const char *) &it->first, sizeof(it->first));
-            gzwrite(outfile, (const char *) &it->second, sizeof(it->second));
-        }
+    std::vector<char> buf;
+    for (size_t i = 0; i < entries.size(); i += BIGCOUNT_IO_BATCH) {
+        size_t n_batch = std::min((size_t) BIGCOUNT_IO_BATCH,
+                                  entries.size() - i);
+        pack_bigcounts(entries, i, n_batch, buf);
+        gzwrite(outfile, &buf[0], buf.size());
     }
     const char * error = gzerror(outfile, &errnum);
     if (errnum == Z_ERRNO) {
@@ -10,7 +10,9 @@
 
 #include <stddef.h>
 #include <stdint.h>
+#include <stdlib.h>
 #include <string.h>
+#include <new>
 #include <map>
 #include <string>
 #include <utility>
@@ -32,7 +34,118 @@ struct IParser;
 
 namespace khmer
 {
-typedef std::map<HashIntoType, BoundedCounterType> KmerCountMap;
+typedef std::pair<HashIntoType, BoundedCounterType> KmerCount;
+
+//
+// Store for counts beyond what the count-min sketch can hold. Entries are
+// spread over BIGCOUNT_N_SHARDS open-addressing tables with linear probing,
+// each behind its own spin lock, so that counting threads rarely contend.
+// A count of zero marks an empty slot.
+//
+class KmerCountMap
+{
+protected:
+    struct Entry {
+        HashIntoType kmer;
+        BoundedCounterType count;
+    };
+
+    // padded to a cache line so that the locks do not share one.
+    struct Shard {
+        size_t n_entries;
+        size_t capacity;        // zero, or a power of two
+        Entry * entries;
+        uint32_t spin_lock;
+        char _pad[64 - 2 * sizeof(size_t) - sizeof(Entry *)
+                  - sizeof(uint32_t)];
+    };
+
+    mutable Shard _shards[BIGCOUNT_N_SHARDS];
+
+    Shard& _get_shard(HashIntoType mixed) const
+    {
+        return _shards[mixed >> (64 - BIGCOUNT_SHARD_BITS)];
+    }
+
+    static void _lock(Shard& shard)
+    {
+        while (!__sync_bool_compare_and_swap(&shard.spin_lock, 0, 1));
+    }
+
+    static void _unlock(Shard& shard)
+    {
+        __sync_bool_compare_and_swap(&shard.spin_lock, 1, 0);
+    }
+
+    // Slot holding kmer, or the empty slot where it belongs. The shard
+    // must be locked.
+    static Entry * _find(const Shard& shard, HashIntoType kmer,
+                         HashIntoType mixed)
+    {
+        size_t mask = shard.capacity - 1;
+        size_t i = mixed & mask;
+        while (shard.entries[i].count != 0 && shard.entries[i].kmer != kmer) {
+            i = (i + 1) & mask;
+        }
+        return &shard.entries[i];
+    }
+
+    // Make room for one more entry. The shard must be locked.
+    static void _reserve_one(Shard& shard);
+
+public:
+    KmerCountMap();
+    ~KmerCountMap();
+
+    // Start kmer at first_count, or add one to its count up to max_count.
+    void increment(HashIntoType kmer, BoundedCounterType first_count,
+                   BoundedCounterType max_count)
+    {
+        HashIntoType mixed = _mix_hash(kmer);
+        Shard& shard = _get_shard(mixed);
+
+        _lock(shard);
+        _reserve_one(shard);
+        Entry * entry = _find(shard, kmer, mixed);
+        if (entry->count == 0) {
+            entry->kmer = kmer;
+            entry->count = first_count;
+            shard.n_entries++;
+        } else if (entry->count < max_count) {
+            entry->count++;
+        }
+        _unlock(shard);
+    }
+
+    // Look up kmer; returns false if it has no count.
+    bool get(HashIntoType kmer, BoundedCounterType &count) const
+    {
+        HashIntoType mixed = _mix_hash(kmer);
+        Shard& shard = _get_shard(mixed);
+
+        _lock(shard);
+        count = 0;
+        if (shard.n_entries) {
+            count = _find(shard, kmer, mixed)->count;
+        }
+        _unlock(shard);
+
+        return count != 0;
+    }
+
+    void set(HashIntoType kmer, BoundedCounterType count);
+
+    size_t size() const;
+    void clear();
+
+    // All entries, sorted by k-mer.
+    void get_entries(std::vector<KmerCount> &entries) const;
+
+private:
+    // the shards own their entry arrays.
+    KmerCountMap(const KmerCountMap&);
+    KmerCountMap& operator=(const KmerCountMap&);
+};
 
 class CountingHashFile;
 class CountingHashFileReader;
@@ -52,7 +165,6 @@ class CountingHash : public khmer::Hashtable
 
 protected:
     bool _use_bigcount;		// keep track of counts > Bloom filter hash count threshold?
-    uint32_t _bigcount_spin_lock;
     std::vector<HashIntoType> _tablesizes;
     size_t _n_tables;
     HashIntoType _n_unique_kmers;
@@ -60,52 +172,188 @@ protected:
 
     Byte ** _counts;
 
+    // In the blocked layout all of the counters for a k-mer live in one
+    // cache-line sized block, stored contiguously in _counts[0]. Table i
+    // owns bins [i * _block_width, (i + 1) * _block_width) of each block.
+    bool _blocked;
+    HashIntoType _n_blocks;
+    unsigned int _block_width;
+
+    // 4-bit saturating counters, two to a byte; see _increment_counter().
+    bool _small_count;
+
+    // Set when the tables point into a memory-mapped file rather than
+    // memory of our own.
+    MappedFile * _mapping;
+
     virtual void _allocate_counters()
     {
         _n_tables = _tablesizes.size();
+        if (_small_count) {
+            _max_count = MAX_SMALL_KCOUNT;
+        }
+
+        if (_blocked) {
+            HashIntoType n_bytes = 0;
+            for (size_t i = 0; i < _n_tables; i++) {
+                n_bytes += table_bytes(_tablesizes[i]);
+            }
+            _allocate_blocks(n_bytes);
+            return;
+        }
 
         _counts = new Byte*[_n_tables];
         for (size_t i = 0; i < _n_tables; i++) {
-            _counts[i] = new Byte[_tablesizes[i]];
-            memset(_counts[i], 0, _tablesizes[i]);
+            _counts[i] = new Byte[table_bytes(_tablesizes[i])];
+            memset(_counts[i], 0, table_bytes(_tablesizes[i]));
         }
     }
-public:
-    KmerCountMap _bigcounts;
 
-    CountingHash( WordLength ksize, HashIntoType single_tablesize ) :
-        khmer::Hashtable(ksize), _use_bigcount(false),
-        _bigcount_spin_lock(false), _n_unique_kmers(0), _occupied_bins(0)
+    // Size the block array to hold at least n_bytes.
+    void _set_block_geometry(HashIntoType n_bytes)
     {
-        _tablesizes.push_back(single_tablesize);
-
-        _allocate_counters();
+        if (_n_tables == 0 || _n_tables > COUNTING_BLOCK_SIZE) {
+            throw khmer_value_exception("blocked countgraph needs between 1 "
+                                        "and 64 tables");
+        }
+        _block_width = COUNTING_BLOCK_SIZE / _n_tables;
+        if (_small_count) {
+            _block_width = 2 * COUNTING_BLOCK_SIZE / _n_tables;
+        }
+        _n_blocks = (n_bytes + COUNTING_BLOCK_SIZE - 1) / COUNTING_BLOCK_SIZE;
+        if (_n_blocks % 2 == 0) {
+            _n_blocks++;    // see _find_block()
+        }
+        _tablesizes.assign(_n_tables, _n_blocks * _block_width);
     }
 
-    CountingHash( WordLength ksize, std::vector<HashIntoType>& tablesizes ) :
-        khmer::Hashtable(ksize), _use_bigcount(false),
-        _bigcount_spin_lock(false), _tablesizes(tablesizes),
-        _n_unique_kmers(0), _occupied_bins(0)
+    // Allocate at least n_bytes of zeroed, cache-line aligned blocks.
+    void _allocate_blocks(HashIntoType n_bytes)
     {
+        _set_block_geometry(n_bytes);
 
-        _allocate_counters();
+        void * blocks = NULL;
+        if (posix_memalign(&blocks, COUNTING_BLOCK_SIZE,
+                           _n_blocks * COUNTING_BLOCK_SIZE)) {
+            throw std::bad_alloc();
+        }
+        memset(blocks, 0, _n_blocks * COUNTING_BLOCK_SIZE);
+
+        _counts = new Byte*[_n_tables];
+        for (size_t i = 0; i < _n_tables; i++) {
+            _counts[i] = NULL;
+        }
+        _counts[0] = (Byte *) blocks;
     }
 
-    virtual ~CountingHash()
+    void _free_counters()
     {
         if (_counts) {
             for (size_t i = 0; i < _n_tables; i++) {
-                if (_counts[i]) {
-                    delete[] _counts[i];
+                if (_counts[i] && !_mapping) {
+                    if (_blocked) {
+                        free(_counts[i]);
+                    } else {
+                        delete[] _counts[i];
+                    }
                     _counts[i] = NULL;
                 }
             }
 
             delete[] _counts;
             _counts = NULL;
+        }
+
+        delete _mapping;
+        _mapping = NULL;
+    }
 
-            _n_tables = 0;
+    // Find the block for khash, and seed the bits used to place each
+    // table's counter within it. The block is the high word of
+    // mixed * _n_blocks, which avoids a 64-bit division; with an odd number
+    // of blocks the low word is uniform within the block and supplies the
+    // in-block offsets.
+    Byte * _find_block(HashIntoType khash, HashIntoType &bits) const
+    {
+        unsigned __int128 product = (unsigned __int128) _mix_hash(khash) *
+                                    _n_blocks;
+        bits = (HashIntoType) product;
+        return _counts[0] + (HashIntoType) (product >> 64) * COUNTING_BLOCK_SIZE;
+    }
+
+    // Offset of table i's counter within its slice of the block, taken
+    // from the top 16 bits; rehash once every four tables.
+    unsigned int _block_offset(HashIntoType &bits, unsigned int i) const
+    {
+        if (i > 0 && i % 4 == 0) {
+            bits = _mix_hash(bits);
+        }
+        unsigned int offset = ((bits >> 48) * _block_width) >> 16;
+        bits = (bits << 16) | (bits >> 48);
+        return offset;
+    }
+
+    BoundedCounterType _get_counter(const Byte * table, HashIntoType bin)
+    const
+    {
+        if (_small_count) {
+            return (table[bin >> 1] >> ((bin & 1) << 2)) & 0x0f;
         }
+        return table[bin];
+    }
+
+    void _increment_counter(Byte * table, HashIntoType bin)
+    {
+        if (!_small_count) {
+            __sync_add_and_fetch(table + bin, 1);
+            return;
+        }
+
+        // Two counters share each byte, so an increment may not spill into
+        // the neighbour: retry the compare-and-swap until it goes through
+        // or the counter is full.
+        Byte * byte = table + (bin >> 1);
+        unsigned int shift = (bin & 1) << 2;
+        Byte old_byte = *byte;
+        while (((old_byte >> shift) & 0x0f) < _max_count) {
+            Byte seen = __sync_val_compare_and_swap(byte, old_byte,
+                                                    old_byte + (1 << shift));
+            if (seen == old_byte) {
+                break;
+            }
+            old_byte = seen;
+        }
+    }
+public:
+    KmerCountMap _bigcounts;
+
+    CountingHash( WordLength ksize, HashIntoType single_tablesize ) :
+        khmer::Hashtable(ksize), _use_bigcount(false),
+        _n_unique_kmers(0), _occupied_bins(0),
+        _blocked(false), _n_blocks(0), _block_width(0), _small_count(false),
+        _mapping(NULL)
+    {
+        _tablesizes.push_back(single_tablesize);
+
+        _allocate_counters();
+    }
+
+    CountingHash( WordLength ksize, std::vector<HashIntoType>& tablesizes,
+                  bool blocked = false, bool small_count = false ) :
+        khmer::Hashtable(ksize), _use_bigcount(false),
+        _tablesizes(tablesizes),
+        _n_unique_kmers(0), _occupied_bins(0),
+        _blocked(blocked), _n_blocks(0), _block_width(0),
+        _small_count(small_count), _mapping(NULL)
+    {
+
+        _allocate_counters();
+    }
+
+    virtual ~CountingHash()
+    {
+        _free_counters();
+        _n_tables = 0;
     }
 
     // Writing to the tables outside of defined methods has undefined behavior!
@@ -115,6 +363,37 @@ public:
         return _counts;
     }
 
+    // are the tables mapped from a file? see CountingHashFileReader.
+    bool is_mapped() const
+    {
+        return _mapping != NULL;
+    }
+
+    bool is_blocked() const
+    {
+        return _blocked;
+    }
+
+    // size in bytes of the block array used by the blocked layout
+    HashIntoType blocks_size() const
+    {
+        return _n_blocks * COUNTING_BLOCK_SIZE;
+    }
+
+    bool is_small_count() const
+    {
+        return _small_count;
+    }
+
+    // bytes needed to hold n_bins counters
+    HashIntoType table_bytes(HashIntoType n_bins) const
+    {
+        if (_small_count) {
+            return (n_bins + 1) / 2;
+        }
+        return n_bins;
+    }
+
     virtual BoundedCounterType test_and_set_bits(const char * kmer)
     {
         BoundedCounterType x = get_count(kmer); // @CTB just hash it, yo.
@@ -149,7 +428,7 @@ public:
     }
 
     virtual void save(std::string);
-    virtual void load(std::string);
+    virtual void load(std::string, bool use_mmap = false);
 
     const size_t n_tables() const
     {
@@ -173,9 +452,25 @@ public:
         bool is_new_kmer = false;
         unsigned int  n_full	  = 0;
 
+        Byte * block = NULL;
+        HashIntoType bits = 0;
+        HashIntoType slice = 0;     // first bin of table i's part of the block
+        if (_blocked) {
+            block = _find_block(khash, bits);
+        }
+
         for (unsigned int i = 0; i < _n_tables; i++) {
-            const HashIntoType bin = khash % _tablesizes[i];
-            Byte current_count = _counts[ i ][ bin ];
+            Byte * table;
+            HashIntoType bin;
+            if (_blocked) {
+                table = block;
+                bin = slice + _block_offset(bits, i);
+                slice += _block_width;
+            } else {
+                table = _counts[ i ];
+                bin = khash % _tablesizes[i];
+            }
+            Byte current_count = _get_counter(table, bin);
             if (!is_new_kmer) {
                 if (current_count == 0) {
                     is_new_kmer = true;
@@ -191,22 +486,14 @@ public:
             //	 bit of slop here? It can always be trimmed off later, if
             //	 that would help with stats.
             if ( _max_count > current_count ) {
-                __sync_add_and_fetch( *(_counts + i) + bin, 1 );
+                _increment_counter(table, bin);
             } else {
                 n_full++;
             }
         } // for each table
 
         if (n_full == _n_tables && _use_bigcount) {
-            while (!__sync_bool_compare_and_swap( &_bigcount_spin_lock, 0, 1 ));
-            if (_bigcounts[khash] == 0) {
-                _bigcounts[khash] = _max_count + 1;
-            } else {
-                if (_bigcounts[khash] < _max_bigcount) {
-                    _bigcounts[khash] += 1;
-                }
-            }
-            __sync_bool_compare_and_swap( &_bigcount_spin_lock, 1, 0 );
+            _bigcounts.increment(khash, _max_count + 1, _max_bigcount);
         }
 
         if (is_new_kmer) {
@@ -227,16 +514,32 @@ public:
     {
         unsigned int	  max_count	= _max_count;
         BoundedCounterType  min_count	= max_count;
-        for (unsigned int i = 0; i < _n_tables; i++) {
-            BoundedCounterType the_count = _counts[i][khash % _tablesizes[i]];
-            if (the_count < min_count) {
-                min_count = the_count;
+
+        if (_blocked) {
+            HashIntoType bits;
+            const Byte * block = _find_block(khash, bits);
+            HashIntoType slice = 0;
+            for (unsigned int i = 0; i < _n_tables; i++) {
+                BoundedCounterType the_count =
+                    _get_counter(block, slice + _block_offset(bits, i));
+                if (the_count < min_count) {
+                    min_count = the_count;
+                }
+                slice += _block_width;
+            }
+        } else {
+            for (unsigned int i = 0; i < _n_tables; i++) {
+                BoundedCounterType the_count =
+                    _get_counter(_counts[i], khash % _tablesizes[i]);
+                if (the_count < min_count) {
+                    min_count = the_count;
+                }
             }
         }
         if (min_count == max_count && _use_bigcount) {
-            KmerCountMap::const_iterator it = _bigcounts.find(khash);
-            if (it != _bigcounts.end()) {
-                min_count = it->second;
+            BoundedCounterType big_count;
+            if (_bigcounts.get(khash, big_count)) {
+                min_count = big_count;
             }
         }
         return min_count;
@@ -269,6 +572,16 @@ public:
                                     BoundedCounterType min_abund) const;
     unsigned long trim_below_abundance(std::string seq,
                                        BoundedCounterType max_abund) const;
+
+    // For each of seqs, with 'N' (but not 'n') read as 'A', the median k-mer
+    // count, as get_median_count() finds it, and the trim_on_abundance()
+    // position. As with those, an invalid read still gets a median but is
+    // trimmed to nothing; a read shorter than k gets a median and trim
+    // position of 0.
+    void median_and_trim_many(const std::vector<std::string> &seqs,
+                              BoundedCounterType min_abund,
+                              std::vector<BoundedCounterType> &medians,
+                              std::vector<unsigned long> &trim_at) const;
     std::vector<unsigned int> find_spectral_error_positions(std::string seq,
             BoundedCounterType min_abund) const;
 
@@ -282,14 +595,16 @@ public:
 class CountingHashFile
 {
 public:
-    static void load(const std::string &infilename, CountingHash &ht);
+    static void load(const std::string &infilename, CountingHash &ht,
+                     bool use_mmap = false);
     static void save(const std::string &outfilename, const CountingHash &ht);
 };
 
 class CountingHashFileReader : public CountingHashFile
 {
 public:
-    CountingHashFileReader(const std::string &infilename, CountingHash &ht);
+    CountingHashFileReader(const std::string &infilename, CountingHash &ht,
+                           bool use_mmap = false);
 };
 
 class CountingHashGzFileReader : public CountingHashFile
@@ -28,6 +28,11 @@ void Hashbits::save(std::string outfilename)
     unsigned long long save_tablesize;
     unsigned long long save_occupied_bins = _occupied_bins;
 
+    if (_mapping && _mapping->is_same_file(outfilename)) {
+        throw khmer_file_exception("Cannot save a nodegraph over the file "
+                                   "it is mapped from: " + outfilename);
+    }
+
     ofstream outfile(outfilename.c_str(), ios::binary);
 
     outfile.write(SAVED_SIGNATURE, 4);
@@ -60,7 +65,7 @@ void Hashbits::save(std::string outfilename)
  * Loads @param infilename into Hashbits, with error checking on
  * file type and file version.  Populates _counts internally.
  */
-void Hashbits::load(std::string infilename)
+void Hashbits::load(std::string infilename, bool use_mmap)
 {
     ifstream infile;
 
@@ -80,16 +85,15 @@ void Hashbits::load(std::string infilename)
         throw khmer_file_exception(err);
     }
 
-    if (_counts) {
-        for (unsigned int i = 0; i < _n_tables; i++) {
-            delete[] _counts[i];
-            _counts[i] = NULL;
-        }
-        delete[] _counts;
-        _counts = NULL;
-    }
+    _free_counters();
     _tablesizes.clear();
 
+    // With use_mmap the tables are skipped over in infile and pointed into
+    // a copy-on-write mapping of the file instead of being read.
+    if (use_mmap) {
+        _mapping = new MappedFile(infilename);
+    }
+
     try {
         unsigned int save_ksize = 0;
         unsigned char save_n_tables = 0;
@@ -132,6 +136,10 @@ void Hashbits::load(std::string infilename)
         _init_bitstuff();
 
         _counts = new Byte*[_n_tables];
+        for (unsigned int i = 0; i < _n_tables; i++) {
+            _counts[i] = NULL;
+        }
+
         for (unsigned int i = 0; i < _n_tables; i++) {
             HashIntoType tablesize;
             unsigned long long tablebytes;
@@ -142,11 +150,23 @@ void Hashbits::load(std::string infilename)
             _tablesizes.push_back(tablesize);
 
             tablebytes = tablesize / 8 + 1;
+
+            if (_mapping) {
+                unsigned long long offset = infile.tellg();
+                if (offset + tablebytes > _mapping->size()) {
+                    throw khmer_file_exception("Unexpected end of k-mer graph "
+                                               "file: " + infilename);
+                }
+                _counts[i] = (Byte *) _mapping->data() + offset;
+                infile.seekg(tablebytes, ios::cur);
+                continue;
+            }
+
             _counts[i] = new Byte[tablebytes];
 
             unsigned long long loaded = 0;
             while (loaded != tablebytes) {
-                infile.read((char *) _counts[i], tablebytes - loaded);
+                infile.read((char *) _counts[i] + loaded, tablebytes - loaded);
                 loaded += infile.gcount();
             }
         }
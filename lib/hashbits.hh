@@ -31,6 +31,9 @@ protected:
     HashIntoType _n_unique_kmers;
     Byte ** _counts;
 
+    // Set when the tables point into a memory-mapped file; see load().
+    MappedFile * _mapping;
+
     virtual void _allocate_counters()
     {
         _n_tables = _tablesizes.size();
@@ -46,6 +49,23 @@ protected:
         }
     }
 
+    void _free_counters()
+    {
+        if (_counts) {
+            for (size_t i = 0; i < _n_tables; i++) {
+                if (!_mapping) {
+                    delete[] _counts[i];
+                }
+                _counts[i] = NULL;
+            }
+            delete[] _counts;
+            _counts = NULL;
+        }
+
+        delete _mapping;
+        _mapping = NULL;
+    }
+
 public:
     Hashbits(WordLength ksize, std::vector<HashIntoType>& tablesizes)
         : khmer::Hashtable(ksize),
@@ -53,23 +73,15 @@ public:
     {
         _occupied_bins = 0;
         _n_unique_kmers = 0;
+        _mapping = NULL;
 
         _allocate_counters();
     }
 
     ~Hashbits()
     {
-        if (_counts) {
-            for (size_t i = 0; i < _n_tables; i++) {
-                delete[] _counts[i];
-                _counts[i] = NULL;
-            }
-            delete[] _counts;
-            _counts = NULL;
-
-            _n_tables = 0;
-        }
-
+        _free_counters();
+        _n_tables = 0;
     }
 
     // Accessors for protected/private table info members
@@ -84,7 +96,13 @@ public:
     }
 
     virtual void save(std::string);
-    virtual void load(std::string);
+    virtual void load(std::string, bool use_mmap = false);
+
+    // are the tables mapped from a file?
+    bool is_mapped() const
+    {
+        return _mapping != NULL;
+    }
 
     // count number of occupied bins
     virtual const HashIntoType n_occupied() const
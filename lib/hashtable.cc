@@ -6,7 +6,11 @@
 //
 
 #include <errno.h>
+#include <fcntl.h>
 #include <math.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 #include <algorithm>
 #include <deque>
 #include <fstream>
@@ -24,6 +28,57 @@ using namespace std;
 using namespace khmer;
 using namespace khmer:: read_parsers;
 
+MappedFile::MappedFile(const std::string &filename)
+{
+    int fd = open(filename.c_str(), O_RDONLY);
+    if (fd < 0) {
+        throw khmer_file_exception("Cannot open graph file: " + filename
+                                   + " " + strerror(errno));
+    }
+
+    struct stat st;
+    if (fstat(fd, &st) < 0) {
+        int stat_errno = errno;
+        close(fd);
+        throw khmer_file_exception("Cannot map graph file: " + filename + " "
+                                   + strerror(stat_errno));
+    }
+    _data = NULL;
+    _size = st.st_size;
+    _device = st.st_dev;
+    _inode = st.st_ino;
+
+    // an empty file has nothing to map; the header read reports it.
+    if (_size) {
+        void * data = mmap(NULL, _size, PROT_READ | PROT_WRITE, MAP_PRIVATE,
+                           fd, 0);
+        if (data == MAP_FAILED) {
+            int map_errno = errno;
+            close(fd);
+            throw khmer_file_exception("Cannot map graph file: " + filename
+                                       + " " + strerror(map_errno));
+        }
+        _data = (char *) data;
+    }
+    close(fd);
+}
+
+MappedFile::~MappedFile()
+{
+    if (_data) {
+        munmap(_data, _size);
+    }
+}
+
+bool MappedFile::is_same_file(const std::string &filename) const
+{
+    struct stat st;
+    if (stat(filename.c_str(), &st) < 0) {
+        return false;
+    }
+    return st.st_dev == _device && st.st_ino == _inode;
+}
+
 //
 // check_and_process_read: checks for non-ACGT characters before consuming
 //
@@ -99,22 +154,23 @@ consume_fasta(
     unsigned int		    &total_reads, unsigned long long  &n_consumed
 )
 {
-    Read			  read;
+    std::vector<Read>	  reads;
+    size_t		  n_reads;
 
-    // Iterate through the reads and consume their k-mers.
-    while (!parser->is_complete( )) {
-        bool is_valid;
-        try {
-            read = parser->get_next_read( );
-        } catch (NoMoreReadsAvailable) {
-            break;
-        }
+    // Iterate through batches of reads and consume their k-mers.
+    // Fetching a batch at a time keeps parser lock contention low when
+    // several threads share the same parser.
+    while ((n_reads = parser->imprint_next_read_batch( reads )) > 0) {
+        unsigned long long batch_n_consumed = 0;
 
-        unsigned int this_n_consumed =
-            check_and_process_read(read.sequence, is_valid);
+        for (size_t i = 0; i < n_reads; ++i) {
+            bool is_valid;
+            batch_n_consumed +=
+                check_and_process_read(reads[i].sequence, is_valid);
+        }
 
-        __sync_add_and_fetch( &n_consumed, this_n_consumed );
-        __sync_add_and_fetch( &total_reads, 1 );
+        __sync_add_and_fetch( &n_consumed, batch_n_consumed );
+        __sync_add_and_fetch( &total_reads, (unsigned int) n_reads );
 
     } // while reads left for parser
 
@@ -211,6 +267,33 @@ bool Hashtable::median_at_least(const std::string &s,
     return false;
 }
 
+//
+// normalize_fragment: digital normalization of a single fragment, i.e. one
+// read or the reads of a pair. If any read has a median k-mer count below
+// the cutoff, every read is consumed and the fragment is kept.
+//
+
+bool Hashtable::normalize_fragment(const std::vector<std::string> &seqs,
+                                   unsigned int cutoff)
+{
+    bool keep = false;
+
+    for (size_t i = 0; i < seqs.size(); ++i) {
+        if (!median_at_least(seqs[i], cutoff)) {
+            keep = true;
+            break;
+        }
+    }
+
+    if (keep) {
+        for (size_t i = 0; i < seqs.size(); ++i) {
+            consume_string(seqs[i]);
+        }
+    }
+
+    return keep;
+}
+
 void Hashtable::save_tagset(std::string outfilename)
 {
     ofstream outfile(outfilename.c_str(), ios::binary);
@@ -231,7 +314,7 @@ void Hashtable::save_tagset(std::string outfilename)
     outfile.write((const char *) &_tag_density, sizeof(_tag_density));
 
     unsigned int i = 0;
-    for (SeenSet::iterator pi = all_tags.begin(); pi != all_tags.end();
+    for (KmerSet::const_iterator pi = all_tags.begin(); pi != all_tags.end();
             ++pi, i++) {
         buf[i] = *pi;
     }
@@ -318,6 +401,7 @@ void Hashtable::load_tagset(std::string infilename, bool clear_tags)
 
         infile.read((char *) buf, sizeof(HashIntoType) * tagset_size);
 
+        all_tags.reserve(all_tags.size() + tagset_size);
         for (unsigned int i = 0; i < tagset_size; i++) {
             all_tags.insert(buf[i]);
         }
@@ -578,7 +662,7 @@ void Hashtable::divide_tags_into_subsets(unsigned int subset_size,
 {
     unsigned int i = 0;
 
-    for (SeenSet::const_iterator si = all_tags.begin(); si != all_tags.end();
+    for (KmerSet::const_iterator si = all_tags.begin(); si != all_tags.end();
             ++si) {
         if (i % subset_size == 0) {
             divvy.insert(*si);
@@ -687,7 +771,7 @@ void Hashtable::consume_fasta_and_traverse(const std::string &filename,
             }
 
             if (!is_first_kmer) {	// traverse
-                SeenSet keeper;
+                KmerSet keeper;
 
                 unsigned int n = traverse_from_kmer(kmer, radius, keeper);
                 if (n >= big_threshold) {
@@ -716,7 +800,7 @@ void Hashtable::consume_fasta_and_traverse(const std::string &filename,
 void Hashtable::calc_connected_graph_size(const HashIntoType kmer_f,
         const HashIntoType kmer_r,
         unsigned long long& count,
-        SeenSet& keeper,
+        KmerSet& keeper,
         const unsigned long long threshold,
         bool break_on_circum)
 const
@@ -914,7 +998,7 @@ unsigned int Hashtable::count_kmers_within_radius(HashIntoType kmer_f,
         HashIntoType kmer_r,
         unsigned int radius,
         unsigned int max_count,
-        const SeenSet * seen)
+        const KmerSet * seen)
 const
 {
     HashIntoType f, r;
@@ -925,7 +1009,7 @@ const
     const unsigned int rc_left_shift = _ksize*2 - 2;
     unsigned int total = 0;
 
-    SeenSet keeper;		// keep track of traversed kmers
+    KmerSet keeper;		// keep track of traversed kmers
     if (seen) {
         keeper = *seen;
     }
@@ -1070,13 +1154,13 @@ void Hashtable::traverse_from_tags(unsigned int distance,
     unsigned int i = 0;
     unsigned int n = 0;
     unsigned int n_big = 0;
-    SeenSet keeper;
+    KmerSet keeper;
 
 #if VERBOSE_REPARTITION
     std::cout << all_tags.size() << " tags...\n";
 #endif // 0
 
-    for (SeenSet::const_iterator si = all_tags.begin(); si != all_tags.end();
+    for (KmerSet::const_iterator si = all_tags.begin(); si != all_tags.end();
             ++si, i++) {
         n++;
         unsigned int count = traverse_from_kmer(*si, distance, keeper);
@@ -1084,8 +1168,8 @@ void Hashtable::traverse_from_tags(unsigned int distance,
         if (count >= threshold) {
             n_big++;
 
-            SeenSet::const_iterator ti;
-            for (ti = keeper.begin(); ti != keeper.end(); ++ti) {
+            KmerSet::unordered_iterator ti = keeper.unordered_begin();
+            for (; ti != keeper.unordered_end(); ++ti) {
                 if (counting.get_count(*ti) > frequency) {
                     stop_tags.insert(*ti);
                 } else {
@@ -1110,7 +1194,7 @@ void Hashtable::traverse_from_tags(unsigned int distance,
 
 unsigned int Hashtable::traverse_from_kmer(HashIntoType start,
         unsigned int radius,
-        SeenSet &keeper)
+        KmerSet &keeper)
 const
 {
     std::string kmer_s = _revhash(start, _ksize);
@@ -1321,6 +1405,7 @@ void Hashtable::load_stop_tags(std::string infilename, bool clear_tags)
 
         infile.read((char *) buf, sizeof(HashIntoType) * tagset_size);
 
+        stop_tags.reserve(stop_tags.size() + tagset_size);
         for (unsigned int i = 0; i < tagset_size; i++) {
             stop_tags.insert(buf[i]);
         }
@@ -1350,7 +1435,7 @@ void Hashtable::save_stop_tags(std::string outfilename)
     outfile.write((const char *) &tagset_size, sizeof(tagset_size));
 
     unsigned int i = 0;
-    for (SeenSet::iterator pi = stop_tags.begin(); pi != stop_tags.end();
+    for (KmerSet::const_iterator pi = stop_tags.begin(); pi != stop_tags.end();
             ++pi, i++) {
         buf[i] = *pi;
     }
@@ -1366,7 +1451,7 @@ void Hashtable::print_stop_tags(std::string infilename)
     ofstream printfile(infilename.c_str());
 
     unsigned int i = 0;
-    for (SeenSet::iterator pi = stop_tags.begin(); pi != stop_tags.end();
+    for (KmerSet::const_iterator pi = stop_tags.begin(); pi != stop_tags.end();
             ++pi, i++) {
         std::string kmer = _revhash(*pi, _ksize);
         printfile << kmer << "\n";
@@ -1380,7 +1465,7 @@ void Hashtable::print_tagset(std::string infilename)
     ofstream printfile(infilename.c_str());
 
     unsigned int i = 0;
-    for (SeenSet::iterator pi = all_tags.begin(); pi != all_tags.end();
+    for (KmerSet::const_iterator pi = all_tags.begin(); pi != all_tags.end();
             ++pi, i++) {
         std::string kmer = _revhash(*pi, _ksize);
         printfile << kmer << "\n";
@@ -1389,14 +1474,14 @@ void Hashtable::print_tagset(std::string infilename)
     printfile.close();
 }
 
-unsigned int Hashtable::count_and_transfer_to_stoptags(SeenSet &keeper,
+unsigned int Hashtable::count_and_transfer_to_stoptags(KmerSet &keeper,
         unsigned int threshold,
         CountingHash &counting)
 {
     unsigned int n_inserted = 0;
 
-    SeenSet::const_iterator ti;
-    for (ti = keeper.begin(); ti != keeper.end(); ++ti) {
+    KmerSet::unordered_iterator ti = keeper.unordered_begin();
+    for (; ti != keeper.unordered_end(); ++ti) {
         if (counting.get_count(*ti) >= threshold) {
             stop_tags.insert(*ti);
             n_inserted++;
@@ -1558,6 +1643,10 @@ void Hashtable::get_kmer_counts(const std::string &s,
 {
     KMerIterator kmers(s.c_str(), _ksize);
 
+    if (s.length() >= _ksize) {
+        counts.reserve(counts.size() + s.length() - _ksize + 1);
+    }
+
     while(!kmers.done()) {
         HashIntoType kmer = kmers.next();
         BoundedCounterType c = this->get_count(kmer);
@@ -1565,4 +1654,35 @@ void Hashtable::get_kmer_counts(const std::string &s,
     }
 }
 
+
+void Hashtable::get_kmer_hashes(const std::string &s,
+                                HashIntoType * kmers) const
+{
+    KMerIterator kmer_iter(s.c_str(), _ksize);
+
+    while(!kmer_iter.done()) {
+        *kmers++ = kmer_iter.next();
+    }
+}
+
+
+void Hashtable::get_kmer_counts(const std::string &s,
+                                BoundedCounterType * counts) const
+{
+    KMerIterator kmers(s.c_str(), _ksize);
+
+    while(!kmers.done()) {
+        *counts++ = this->get_count(kmers.next());
+    }
+}
+
+
+void Hashtable::get_counts_for_hashes(const HashIntoType * kmers, size_t n,
+                                      BoundedCounterType * counts) const
+{
+    for (size_t i = 0; i < n; i++) {
+        counts[i] = this->get_count(kmers[i]);
+    }
+}
+
 // vim: set sts=2 sw=2:
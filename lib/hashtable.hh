@@ -12,6 +12,7 @@
 #include <stddef.h>
 #include <stdint.h>
 #include <string.h>
+#include <sys/types.h>
 #include <fstream>
 #include <iostream>
 #include <list>
@@ -27,6 +28,7 @@
 #include "kmer_hash.hh"
 #include "read_parsers.hh"
 #include "subset.hh"
+#include "kmer_set.hh"
 
 namespace khmer
 {
@@ -47,8 +49,6 @@ struct IParser;
 #define prev_f(kmer_f, ch) ((kmer_f) >> 2 | twobit_repr(ch) << rc_left_shift)
 #define prev_r(kmer_r, ch) ((((kmer_r) << 2) & bitmask) | (twobit_comp(ch)))
 
-#define set_contains(s, e) ((s).find(e) != (s).end())
-
 #define CALLBACK_PERIOD 100000
 
 namespace khmer
@@ -161,6 +161,37 @@ public:
     }
 }; // class KMerIterator
 
+//
+// A private, copy-on-write memory map of a whole graph file. Tables loaded
+// through one point straight into the page cache, so that several processes
+// loading the same file share its pages until they write to them.
+//
+class MappedFile
+{
+protected:
+    char * _data;
+    size_t _size;
+    dev_t _device;
+    ino_t _inode;
+public:
+    explicit MappedFile(const std::string &filename);
+    ~MappedFile();
+
+    char * data() const
+    {
+        return _data;
+    }
+
+    size_t size() const
+    {
+        return _size;
+    }
+
+    // Does filename name the mapped file? Truncating or rewriting the file
+    // under the map would fault on pages not yet copied.
+    bool is_same_file(const std::string &filename) const;
+}; // class MappedFile
+
 class Hashtable  		// Base class implementation of a Bloom ht.
 {
     friend class SubsetPartition;
@@ -236,9 +267,9 @@ protected:
 
 public:
     SubsetPartition * partition;
-    SeenSet all_tags;
-    SeenSet stop_tags;
-    SeenSet repart_small_tags;
+    KmerSet all_tags;
+    KmerSet stop_tags;
+    KmerSet repart_small_tags;
 
     // accessor to get 'k'
     const WordLength ksize() const
@@ -254,7 +285,8 @@ public:
     virtual const BoundedCounterType get_count(HashIntoType khash) const = 0;
 
     virtual void save(std::string) = 0;
-    virtual void load(std::string) = 0;
+    // use_mmap maps uncompressed files copy-on-write instead of reading them.
+    virtual void load(std::string, bool use_mmap = false) = 0;
 
     // count every k-mer in the string.
     unsigned int consume_string(const std::string &s);
@@ -286,6 +318,11 @@ public:
     bool median_at_least(const std::string &s,
                          unsigned int cutoff);
 
+    // diginorm decision for one fragment (a read or a read pair); consumes
+    // all of its reads and returns true if it is kept.
+    bool normalize_fragment(const std::vector<std::string> &seqs,
+                            unsigned int cutoff);
+
     void get_median_count(const std::string &s,
                           BoundedCounterType &median,
                           float &average,
@@ -398,7 +435,7 @@ public:
                                            HashIntoType kmer_r,
                                            unsigned int radius,
                                            unsigned int max_count,
-                                           const SeenSet * seen=0) const;
+                                           const KmerSet * seen=0) const;
 
     size_t trim_on_stoptags(std::string sequence) const;
 
@@ -409,9 +446,9 @@ public:
 
     unsigned int traverse_from_kmer(HashIntoType start,
                                     unsigned int radius,
-                                    SeenSet &keeper) const;
+                                    KmerSet &keeper) const;
 
-    unsigned int count_and_transfer_to_stoptags(SeenSet &keeper,
+    unsigned int count_and_transfer_to_stoptags(KmerSet &keeper,
             unsigned int threshold,
             CountingHash &counting);
 
@@ -431,7 +468,7 @@ public:
 
     void calc_connected_graph_size(const char * kmer,
                                    unsigned long long& count,
-                                   SeenSet& keeper,
+                                   KmerSet& keeper,
                                    const unsigned long long threshold=0,
                                    bool break_on_circum=false) const
     {
@@ -443,7 +480,7 @@ public:
     void calc_connected_graph_size(const HashIntoType kmer_f,
                                    const HashIntoType kmer_r,
                                    unsigned long long& count,
-                                   SeenSet& keeper,
+                                   KmerSet& keeper,
                                    const unsigned long long threshold=0,
                                    bool break_on_circum=false) const;
 
@@ -470,6 +507,16 @@ public:
     // return counts of all k-mers in this string.
     void get_kmer_counts(const std::string &s,
                          std::vector<BoundedCounterType> &counts) const;
+
+    // As above, but fill caller-provided arrays, which must have room for
+    // s.length() - ksize() + 1 entries.
+    void get_kmer_hashes(const std::string &s, HashIntoType * kmers) const;
+    void get_kmer_counts(const std::string &s,
+                         BoundedCounterType * counts) const;
+
+    // return counts of n k-mer hashes.
+    void get_counts_for_hashes(const HashIntoType * kmers, size_t n,
+                               BoundedCounterType * counts) const;
 };
 };
 
@@ -5,11 +5,15 @@
 // Contact: khmer-project@idyll.org
 //
 
+#include <errno.h>
 #include <math.h>
 #include <stdlib.h>
+#include <string.h>
 #include <algorithm>
+#include <fstream>
 #include <map>
 #include <numeric>
+#include <sstream>
 #include <utility>
 
 #include "hllcounter.hh"
@@ -17,6 +21,7 @@
 #include "khmer_exception.hh"
 #include "kmer_hash.hh"
 #include "read_parsers.hh"
+#include "MurmurHash3.h"
 
 #ifdef _OPENMP
 #include <omp.h>
@@ -229,10 +234,15 @@ double ep_sum(double acc, int b)
 
 int get_rho(HashIntoType w, int max_width)
 {
-    return max_width - floor(log2(w));
+    // the position of the leftmost 1-bit in the max_width low bits of w.
+    if (w == 0) {
+        return max_width + 1;
+    }
+    return max_width - (63 - __builtin_clzll(w));
 }
 
 HLLCounter::HLLCounter(double error_rate, WordLength ksize)
+    : _rolling_hash(false)
 {
     if (error_rate < 0) {
         throw InvalidValue("Please set error rate to a value "
@@ -243,6 +253,7 @@ HLLCounter::HLLCounter(double error_rate, WordLength ksize)
 }
 
 HLLCounter::HLLCounter(int p, WordLength ksize)
+    : _rolling_hash(false)
 {
     this->init(p, ksize);
 }
@@ -286,10 +297,28 @@ void HLLCounter::set_ksize(WordLength new_ksize)
         throw ReadOnlyAttribute("You can only change k-mer size prior to "
                                 "first counting");
     }
+    if (_rolling_hash && new_ksize > KSIZE_MAX) {
+        throw InvalidValue("The rolling hash only supports k-mer sizes up "
+                           "to 32");
+    }
 
     this->init(this->p, new_ksize);
 }
 
+void HLLCounter::set_rolling_hash(bool rolling_hash)
+{
+    if (count(this->M.begin(), this->M.end(), 0) != this->m) {
+        throw ReadOnlyAttribute("You can only change the hash function prior "
+                                "to first counting");
+    }
+    if (rolling_hash && _ksize > KSIZE_MAX) {
+        throw InvalidValue("The rolling hash only supports k-mer sizes up "
+                           "to 32");
+    }
+
+    _rolling_hash = rolling_hash;
+}
+
 double HLLCounter::_Ep()
 {
     double sum = accumulate(this->M.begin(), this->M.end(), 0.0, ep_sum);
@@ -315,34 +344,83 @@ HashIntoType HLLCounter::estimate_cardinality()
     return this->_Ep();
 }
 
-void HLLCounter::add(const std::string &value)
+void HLLCounter::_add_hash(HashIntoType x)
 {
-    HashIntoType x = khmer::_hash_murmur(value);
     HashIntoType j = x & (this->m - 1);
     this->M[j] = std::max(this->M[j], get_rho(x >> this->p, 64 - this->p));
 }
 
+void HLLCounter::add(const std::string &value)
+{
+    if (_rolling_hash) {
+        if (value.length() > KSIZE_MAX) {
+            throw khmer_exception("The rolling hash only supports k-mers up "
+                                  "to 32 bases long");
+        }
+        HashIntoType f, r;
+        _hash(value.c_str(), value.length(), f, r);
+        _add_hash(_mix_hash(uniqify_rc(f, r)));
+    } else {
+        _add_hash(khmer::_hash_murmur(value));
+    }
+}
+
 unsigned int HLLCounter::consume_string(const std::string &inp)
 {
-    unsigned int n_consumed = 0;
-    std::string kmer = "";
     std::string s = inp;
 
     for (unsigned int i = 0; i < s.length(); i++)  {
         s[i] &= 0xdf; // toupper - knock out the "lowercase bit"
     }
 
-    for(std::string::const_iterator it = s.begin(); it != s.end(); ++it) {
-        kmer.push_back(*it);
-        if (kmer.size() < _ksize) {
-            continue;
+    if (s.length() < _ksize) {
+        return 0;
+    }
+    if (_rolling_hash) {
+        return _consume_string_rolling(s);
+    }
+
+    // Hash each k-mer, and its reverse complement, in place: the reverse
+    // complement of the k-mer at i starts at length - k - i in the
+    // reverse complement of the whole sequence.
+    const std::string rc = _revcomp(s);
+    const size_t n_kmers = s.length() - _ksize + 1;
+    const uint32_t seed = 0;
+    HashIntoType out[2];
+
+    for (size_t i = 0; i < n_kmers; i++) {
+        MurmurHash3_x64_128(s.data() + i, _ksize, seed, &out);
+        HashIntoType h = out[0];
+        MurmurHash3_x64_128(rc.data() + n_kmers - 1 - i, _ksize, seed, &out);
+
+        _add_hash(h ^ out[0]);
+    }
+
+    return n_kmers;
+}
+
+unsigned int HLLCounter::_consume_string_rolling(const std::string &s)
+{
+    const HashIntoType bitmask = (_ksize == KSIZE_MAX) ? ~(HashIntoType) 0 :
+                                 ((HashIntoType) 1 << (2 * _ksize)) - 1;
+    const unsigned int rc_left_shift = _ksize * 2 - 2;
+    HashIntoType f = 0, r = 0;
+
+    for (size_t i = 0; i < s.length(); i++) {
+        const char ch = s[i];
+        if (!is_valid_dna(ch)) {
+            throw khmer_exception("Invalid base in read");
         }
-        this->add(kmer);
 
-        kmer.erase(0, 1);
-        n_consumed++;
+        f = ((f << 2) | twobit_repr(ch)) & bitmask;
+        r = (r >> 2) | (twobit_comp(ch) << rc_left_shift);
+
+        if (i + 1 >= _ksize) {
+            _add_hash(_mix_hash(uniqify_rc(f, r)));
+        }
     }
-    return n_consumed;
+
+    return s.length() - _ksize + 1;
 }
 
 void HLLCounter::consume_fasta(
@@ -362,11 +440,12 @@ void HLLCounter::consume_fasta(
     unsigned int &      total_reads,
     unsigned long long &    n_consumed)
 {
-
-    read_parsers::Read read;
     HLLCounter** counters;
-    unsigned int *n_consumed_partial;
+    unsigned long long *n_consumed_partial;
     unsigned int *total_reads_partial;
+    // batches of reads not in use by any task; the sequence buffers of a
+    // batch are reused by the parser the next time it is filled.
+    std::vector< std::vector<read_parsers::Read> * > free_batches;
 
     n_consumed = 0;
 
@@ -374,39 +453,74 @@ void HLLCounter::consume_fasta(
     {
         #pragma omp single
         {
-            counters = (HLLCounter**)calloc(omp_get_num_threads(),
-            sizeof(HLLCounter*));
-            n_consumed_partial = (unsigned int*)calloc(omp_get_num_threads(),
-            sizeof(unsigned int));
-            total_reads_partial = (unsigned int*)calloc(omp_get_num_threads(),
-            sizeof(unsigned int));
-
-            for (int i=0; i < omp_get_num_threads(); i++)
+            int n_threads = omp_get_num_threads();
+
+            counters = (HLLCounter**)calloc(n_threads, sizeof(HLLCounter*));
+            n_consumed_partial = (unsigned long long*)calloc(n_threads,
+                                 sizeof(unsigned long long));
+            total_reads_partial = (unsigned int*)calloc(n_threads,
+                                  sizeof(unsigned int));
+
+            // the first thread adds straight into this counter, so a
+            // single-threaded run has nothing to allocate or merge.
+            counters[0] = this;
+            for (int i=1; i < n_threads; i++)
             {
                 HLLCounter *newc = new HLLCounter(this->p, this->_ksize);
+                newc->_rolling_hash = this->_rolling_hash;
                 counters[i] = newc;
             }
 
-            while (!parser->is_complete())
+            while (true)
             {
-                // Iterate through the reads and consume their k-mers.
+                std::vector<read_parsers::Read> * batch = NULL;
+
+                #pragma omp critical (hll_free_batches)
+                {
+                    if (!free_batches.empty()) {
+                        batch = free_batches.back();
+                        free_batches.pop_back();
+                    }
+                }
+                if (batch == NULL) {
+                    batch = new std::vector<read_parsers::Read>();
+                }
+
+                // Fetch a batch of reads under a single parser lock and
+                // hand the whole batch to one task.
+                size_t n_reads;
                 try {
-                    read = parser->get_next_read();
-                } catch (read_parsers::NoMoreReadsAvailable) {
+                    n_reads = parser->imprint_next_read_batch(*batch,
+                              HLL_READ_BATCH_SIZE);
+                } catch (read_parsers::NoMoreReadsAvailable &) {
+                    n_reads = 0;
+                }
+                if (n_reads == 0) {
+                    delete batch;
                     break;
                 }
 
-                #pragma omp task default(none) firstprivate(read) \
-                shared(counters, n_consumed_partial, total_reads_partial)
+                #pragma omp task default(none) firstprivate(batch, n_reads) \
+                shared(counters, n_consumed_partial, total_reads_partial, \
+                       free_batches)
                 {
-                    bool is_valid;
-                    int n, t = omp_get_thread_num();
-                    n = counters[t]->check_and_process_read(read.sequence,
-                                                            is_valid);
-                    n_consumed_partial[t] += n;
-                    if (is_valid) {
-                        total_reads_partial[t] += 1;
+                    int t = omp_get_thread_num();
+                    unsigned long long batch_consumed = 0;
+                    unsigned int batch_reads = 0;
+
+                    for (size_t i = 0; i < n_reads; ++i) {
+                        bool is_valid;
+                        batch_consumed += counters[t]->check_and_process_read(
+                                              (*batch)[i].sequence, is_valid);
+                        if (is_valid) {
+                            batch_reads++;
+                        }
                     }
+                    n_consumed_partial[t] += batch_consumed;
+                    total_reads_partial[t] += batch_reads;
+
+                    #pragma omp critical (hll_free_batches)
+                    free_batches.push_back(batch);
                 }
 
             } // while reads left for parser
@@ -417,16 +531,22 @@ void HLLCounter::consume_fasta(
         {
             for (int i=0; i < omp_get_num_threads(); ++i)
             {
-                this->merge(*counters[i]);
-                delete counters[i];
+                if (i > 0) {
+                    this->merge(*counters[i]);
+                    delete counters[i];
+                }
                 n_consumed += n_consumed_partial[i];
-                total_reads += total_reads_partial[i];;
+                total_reads += total_reads_partial[i];
             }
             free(counters);
             free(n_consumed_partial);
             free(total_reads_partial);
         }
     }
+
+    for (size_t i = 0; i < free_batches.size(); ++i) {
+        delete free_batches[i];
+    }
 }
 
 unsigned int HLLCounter::check_and_process_read(std::string &read,
@@ -462,10 +582,101 @@ bool HLLCounter::check_and_normalize_read(std::string &read) const
 
 void HLLCounter::merge(HLLCounter &other)
 {
-    if (this->p != other.p || this->_ksize != other._ksize) {
+    if (this->p != other.p || this->_ksize != other._ksize ||
+            this->_rolling_hash != other._rolling_hash) {
         throw khmer_exception("HLLCounters to be merged must be created with same parameters");
     }
     for(unsigned int i=0; i < this->M.size(); ++i) {
         this->M[i] = std::max(other.M[i], this->M[i]);
     }
 }
+
+// The saved counter is the usual khmer header followed by the k-mer size,
+// p, the hash function in use and then one byte per register; registers
+// never exceed 65, and m is at most 2^16, so files stay under 64 KB.
+
+void HLLCounter::save(std::string outfilename)
+{
+    std::ofstream outfile(outfilename.c_str(), std::ios::binary);
+
+    outfile.write(SAVED_SIGNATURE, 4);
+    unsigned char version = SAVED_FORMAT_VERSION;
+    outfile.write((const char *) &version, 1);
+    unsigned char ht_type = SAVED_HLLCOUNTER;
+    outfile.write((const char *) &ht_type, 1);
+
+    unsigned int save_ksize = _ksize;
+    unsigned char save_p = p;
+    unsigned char save_rolling_hash = _rolling_hash;
+    outfile.write((const char *) &save_ksize, sizeof(save_ksize));
+    outfile.write((const char *) &save_p, sizeof(save_p));
+    outfile.write((const char *) &save_rolling_hash,
+                  sizeof(save_rolling_hash));
+
+    std::vector<unsigned char> registers(M.begin(), M.end());
+    outfile.write((const char *) &registers[0], registers.size());
+
+    if (outfile.fail()) {
+        throw khmer_file_exception(strerror(errno));
+    }
+    outfile.close();
+}
+
+void HLLCounter::load(std::string infilename)
+{
+    std::ifstream infile(infilename.c_str(), std::ios::binary);
+    if (!infile.is_open()) {
+        throw khmer_file_exception("Cannot open HLL counter file: " +
+                                   infilename);
+    }
+
+    char signature[4];
+    unsigned char version = 0, ht_type = 0;
+    unsigned int save_ksize = 0;
+    unsigned char save_p = 0, save_rolling_hash = 0;
+
+    infile.read(signature, 4);
+    infile.read((char *) &version, 1);
+    infile.read((char *) &ht_type, 1);
+    if (!infile || std::string(signature, 4) != SAVED_SIGNATURE) {
+        throw khmer_file_exception("Does not start with signature for a "
+                                   "khmer file: " + infilename);
+    } else if (version != SAVED_FORMAT_VERSION) {
+        std::ostringstream err;
+        err << "Incorrect file format version " << (int) version
+            << " while reading HLL counter from " << infilename
+            << "; should be " << (int) SAVED_FORMAT_VERSION;
+        throw khmer_file_exception(err.str());
+    } else if (ht_type != SAVED_HLLCOUNTER) {
+        std::ostringstream err;
+        err << "Incorrect file format type " << (int) ht_type
+            << " while reading HLL counter from " << infilename;
+        throw khmer_file_exception(err.str());
+    }
+
+    infile.read((char *) &save_ksize, sizeof(save_ksize));
+    infile.read((char *) &save_p, sizeof(save_p));
+    infile.read((char *) &save_rolling_hash, sizeof(save_rolling_hash));
+    if (!infile || save_p < 4 || save_p > 16 || save_rolling_hash > 1 ||
+            (save_rolling_hash && save_ksize > KSIZE_MAX)) {
+        throw khmer_file_exception("Corrupt HLL counter file: " +
+                                   infilename);
+    }
+
+    std::vector<unsigned char> registers(1 << save_p);
+    infile.read((char *) &registers[0], registers.size());
+    if (!infile) {
+        throw khmer_file_exception("Unexpected end of HLL counter file: " +
+                                   infilename);
+    }
+    for (size_t i = 0; i < registers.size(); ++i) {
+        if (registers[i] > 64 - save_p + 1) {
+            throw khmer_file_exception("Corrupt HLL counter file: " +
+                                       infilename);
+        }
+    }
+
+    this->init(save_p, (WordLength) save_ksize);
+    _rolling_hash = save_rolling_hash;
+    M.assign(registers.begin(), registers.end());
+}
@@ -14,6 +14,9 @@
 #include "khmer.hh"
 #include "read_parsers.hh"
 
+// reads handed to each task by HLLCounter::consume_fasta().
+#define HLL_READ_BATCH_SIZE 1024
+
 namespace khmer
 {
 namespace read_parsers
@@ -45,6 +48,8 @@ public:
     bool check_and_normalize_read(std::string &) const;
     HashIntoType estimate_cardinality();
     void merge(HLLCounter &);
+    void save(std::string);
+    void load(std::string);
     virtual ~HLLCounter() {}
 
     double get_alpha()
@@ -68,6 +73,13 @@ public:
     {
         return M;
     }
+    bool get_rolling_hash()
+    {
+        return _rolling_hash;
+    }
+    // Hash k-mers (k <= 32) by their canonical 2-bit encoding rather than
+    // with MurmurHash3; much faster, but the estimates differ.
+    void set_rolling_hash(bool rolling_hash);
     double get_erate();
     void set_erate(double new_erate);
 private:
@@ -77,8 +89,11 @@ private:
     int m;
     WordLength _ksize;
     std::vector<int> M;
+    bool _rolling_hash;
 
     void init(int p, WordLength ksize);
+    void _add_hash(HashIntoType x);
+    unsigned int _consume_string_rolling(const std::string &);
 };
 
 };
@@ -46,6 +46,7 @@ private:\
 #include "khmer_exception.hh"
 
 #   define MAX_KCOUNT 255
+#   define MAX_SMALL_KCOUNT 15	// 4-bit counters
 #   define MAX_BIGCOUNT 65535
 #   define DEFAULT_TAG_DENSITY 40   // must be even
 
@@ -61,6 +62,19 @@ private:\
 #   define SAVED_STOPTAGS 4
 #   define SAVED_SUBSET 5
 #   define SAVED_LABELSET 6
+#   define SAVED_BLOCKED_COUNTING_HT 7
+#   define SAVED_SMALL_COUNTING_HT 8
+#   define SAVED_SMALL_BLOCKED_COUNTING_HT 9
+#   define SAVED_PACKED_SUBSET 10
+#   define SAVED_HLLCOUNTER 11
+
+#   define COUNTING_BLOCK_SIZE 64	// bytes; one cache line
+
+#   define BIGCOUNT_SHARD_BITS 6
+#   define BIGCOUNT_N_SHARDS (1 << BIGCOUNT_SHARD_BITS)
+
+#   define TAG_LABELS_SHARD_BITS 6
+#   define TAG_LABELS_N_SHARDS (1 << TAG_LABELS_SHARD_BITS)
 
 #   define VERBOSE_REPARTITION 0
 
@@ -91,11 +105,8 @@ typedef void (*CallbackFn)(const char * info, void * callback_data,
 typedef unsigned int PartitionID;
 typedef std::set<HashIntoType> SeenSet;
 typedef std::set<PartitionID> PartitionSet;
-typedef std::map<HashIntoType, PartitionID*> PartitionMap;
-typedef std::map<PartitionID, PartitionID*> PartitionPtrMap;
+typedef std::map<PartitionID, uint32_t> PartitionNodeMap;
 typedef std::map<PartitionID, SeenSet*> PartitionsToTagsMap;
-typedef std::set<PartitionID *> PartitionPtrSet;
-typedef std::map<PartitionID, PartitionPtrSet*> ReversePartitionMap;
 typedef std::queue<HashIntoType> NodeQueue;
 typedef std::map<PartitionID, PartitionID*> PartitionToPartitionPMap;
 typedef std::map<HashIntoType, unsigned int> TagCountMap;
@@ -105,13 +116,8 @@ PartitionCountDistribution;
 
 // types used in @camillescott's sparse labeling extension
 typedef unsigned long long int Label;
-typedef std::multimap<HashIntoType, Label*> TagLabelPtrMap;
-typedef std::multimap<Label, HashIntoType> LabelTagMap;
-typedef std::pair<HashIntoType, Label*> TagLabelPtrPair;
-typedef std::pair<Label, HashIntoType> LabelTagPair;
-typedef std::set<Label*> LabelPtrSet;
-typedef std::set<HashIntoType> TagSet;
-typedef std::map<Label, Label*> LabelPtrMap;
+typedef std::pair<HashIntoType, Label> TagLabelPair;
+typedef std::set<Label> LabelSet;
 
 template <typename T>
 void deallocate_ptr_set(T& s)
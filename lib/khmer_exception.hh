@@ -8,7 +8,9 @@
 #ifndef KHMER_EXCEPTION_HH
 #define KHMER_EXCEPTION_HH
 
+#include <stdint.h>
 #include <exception>
+#include <new>
 #include <string>
 
 namespace khmer
@@ -99,6 +101,88 @@ public:
         : khmer_exception(msg) { }
 };
 
+///
+// Holds the first exception thrown by any thread of an OpenMP parallel
+// region, which no exception may leave, to be thrown again once the region
+// is over. capture() is called from a catch block; the exception thrown
+// again is a khmer_file_exception, khmer_value_exception, khmer_exception
+// or std::bad_alloc, as the one captured was or derived from.
+//
+
+class DeferredException
+{
+public:
+    DeferredException() : _kind(NONE), _lock(0) { }
+
+    bool is_set() const
+    {
+        return _kind != NONE;
+    }
+
+    void capture()
+    {
+        Kind kind = OTHER;
+        std::string msg;
+        try {
+            try {
+                throw;
+            } catch (std::bad_alloc &e) {
+                kind = OUT_OF_MEMORY;
+            } catch (khmer_file_exception &e) {
+                kind = FILE_ERROR;
+                msg = e.what();
+            } catch (khmer_value_exception &e) {
+                kind = VALUE_ERROR;
+                msg = e.what();
+            } catch (std::exception &e) {
+                msg = e.what();
+            } catch (...) {
+                msg = "Unknown error";
+            }
+        } catch (std::bad_alloc &e) {
+            kind = OUT_OF_MEMORY;
+            msg.clear();
+        }
+
+        while (!__sync_bool_compare_and_swap(&_lock, 0, 1));
+        if (_kind == NONE) {
+            _msg.swap(msg);
+            __sync_synchronize();
+            _kind = kind;
+        }
+        __sync_bool_compare_and_swap(&_lock, 1, 0);
+    }
+
+    void rethrow() const
+    {
+        switch (_kind) {
+        case NONE:
+            return;
+        case OUT_OF_MEMORY:
+            throw std::bad_alloc();
+        case FILE_ERROR:
+            throw khmer_file_exception(_msg);
+        case VALUE_ERROR:
+            throw khmer_value_exception(_msg);
+        default:
+            throw khmer_exception(_msg);
+        }
+    }
+
+protected:
+    enum Kind {
+        NONE,
+        OUT_OF_MEMORY,
+        FILE_ERROR,
+        VALUE_ERROR,
+        OTHER
+    };
+
+    volatile Kind _kind;
+    std::string _msg;
+    uint32_t _lock;
+};
+
 } // end namespace khmer
 
 #endif // KHMER_EXCEPTION_HH
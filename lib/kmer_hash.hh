@@ -16,6 +16,13 @@
 
 #include "khmer.hh"
 
+namespace khmer
+{
+// 2-bit encodings of each base and of its complement, indexed by character.
+extern const unsigned char _twobit_repr_table[256];
+extern const unsigned char _twobit_comp_table[256];
+}
+
 // test validity
 #ifdef KHMER_EXTRA_SANITY_CHECKS
 #   define is_valid_dna(ch) ((toupper(ch)) == 'A' || (toupper(ch)) == 'C' || \
@@ -34,10 +41,10 @@
 			    (toupper(ch)) == 'C' ? 2LL : 3LL)
 #else
 // NOTE: Assumes data is already sanitized as it should be by parsers.
-//	     This assumption eliminates 4 function calls.
-#   define twobit_repr(ch) ((ch) == 'A' ? 0LL : \
-			    (ch) == 'T' ? 1LL : \
-			    (ch) == 'C' ? 2LL : 3LL)
+//	     A table lookup keeps the k-mer walk branch-free; anything other
+//	     than A, T or C is encoded as G, as with the sanity-checked form.
+#   define twobit_repr(ch) \
+	((khmer::HashIntoType) khmer::_twobit_repr_table[(unsigned char) (ch)])
 #endif
 
 #define revtwobit_repr(n) ((n) == 0 ? 'A' : \
@@ -50,10 +57,8 @@
 			    (toupper(ch)) == 'C' ? 3LL : 2LL)
 #else
 // NOTE: Assumes data is already sanitized as it should be by parsers.
-//	     This assumption eliminates 4 function calls.
-#   define twobit_comp(ch) ((ch) == 'A' ? 1LL : \
-			    (ch) == 'T' ? 0LL : \
-			    (ch) == 'C' ? 3LL : 2LL)
+#   define twobit_comp(ch) \
+	((khmer::HashIntoType) khmer::_twobit_comp_table[(unsigned char) (ch)])
 #endif
 
 // choose wisely between forward and rev comp.
@@ -79,6 +84,20 @@ HashIntoType _hash_murmur(const std::string& kmer);
 HashIntoType _hash_murmur(const std::string& kmer,
                           HashIntoType& h, HashIntoType& r);
 HashIntoType _hash_murmur_forward(const std::string& kmer);
+
+std::string _revcomp(const std::string& kmer);
+
+// 64-bit finalizer from MurmurHash3; spreads the 2-bit k-mer encoding
+// over all bits.
+inline HashIntoType _mix_hash(HashIntoType h)
+{
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdULL;
+    h ^= h >> 33;
+    h *= 0xc4ceb9fe1a85ec53ULL;
+    h ^= h >> 33;
+    return h;
+}
 };
 
 #endif // KMER_HASH_HH
@@ -0,0 +1,327 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef KMER_SET_HH
+#define KMER_SET_HH
+
+#include <stddef.h>
+#include <stdint.h>
+#include <algorithm>
+#include <vector>
+
+#include "khmer.hh"
+#include "kmer_hash.hh"
+
+// marks a free slot; the value itself is kept aside.
+#define KMER_SET_EMPTY_SLOT (~(khmer::HashIntoType) 0)
+
+namespace khmer
+{
+
+//
+// Compact set of k-mer hashes, for the tag sets and for the k-mers seen by
+// a traversal. Membership is kept in an open-addressing table with linear
+// probing, at eight bytes a slot rather than the forty-odd bytes of a
+// std::set node.
+//
+// Iteration, and find(), go through a sorted copy of the contents that is
+// made when first needed after a change, so tags come out in the same
+// order as they would from a SeenSet. Loops that don't care about order
+// can use unordered_begin() and unordered_end() instead, which walk the
+// table itself and make no copy. Iterators are invalidated by any change
+// to the set. Concurrent readers are safe once the set is no longer being
+// changed.
+//
+class KmerSet
+{
+public:
+    typedef std::vector<HashIntoType>::const_iterator const_iterator;
+    typedef const_iterator iterator;
+
+    // Walks the table slots, then KMER_SET_EMPTY_SLOT if it is in the set.
+    class unordered_iterator
+    {
+    protected:
+        const KmerSet * _set;
+        size_t _i;
+
+        void _skip_empty()
+        {
+            const std::vector<HashIntoType>& slots = _set->_slots;
+            while (_i < slots.size() && slots[_i] == KMER_SET_EMPTY_SLOT) {
+                _i++;
+            }
+            if (_i == slots.size() && !_set->_has_empty_slot_value) {
+                _i++;
+            }
+        }
+
+    public:
+        unordered_iterator(const KmerSet * set, size_t i) : _set(set), _i(i)
+        {
+            _skip_empty();
+        }
+
+        HashIntoType operator*() const
+        {
+            if (_i < _set->_slots.size()) {
+                return _set->_slots[_i];
+            }
+            return KMER_SET_EMPTY_SLOT;
+        }
+
+        unordered_iterator& operator++()
+        {
+            _i++;
+            _skip_empty();
+            return *this;
+        }
+
+        bool operator==(const unordered_iterator& other) const
+        {
+            return _i == other._i;
+        }
+
+        bool operator!=(const unordered_iterator& other) const
+        {
+            return _i != other._i;
+        }
+    };
+
+protected:
+    std::vector<HashIntoType> _slots;
+    size_t _n_entries;
+    bool _has_empty_slot_value;     // KMER_SET_EMPTY_SLOT is in the set
+
+    mutable std::vector<HashIntoType> _sorted;
+    mutable bool _sorted_ok;
+    mutable uint32_t _sort_spin_lock;
+
+    size_t _find_slot(HashIntoType kmer) const
+    {
+        size_t mask = _slots.size() - 1;
+        size_t i = _mix_hash(kmer) & mask;
+        while (_slots[i] != KMER_SET_EMPTY_SLOT && _slots[i] != kmer) {
+            i = (i + 1) & mask;
+        }
+        return i;
+    }
+
+    void _resize(size_t n_slots)
+    {
+        std::vector<HashIntoType> old_slots(n_slots, KMER_SET_EMPTY_SLOT);
+        old_slots.swap(_slots);
+
+        for (size_t i = 0; i < old_slots.size(); i++) {
+            if (old_slots[i] != KMER_SET_EMPTY_SLOT) {
+                _slots[_find_slot(old_slots[i])] = old_slots[i];
+            }
+        }
+    }
+
+    void _sort() const
+    {
+        while (!__sync_bool_compare_and_swap(&_sort_spin_lock, 0, 1));
+        if (!_sorted_ok) {
+            std::vector<HashIntoType> sorted;
+            sorted.reserve(_n_entries);
+            for (size_t i = 0; i < _slots.size(); i++) {
+                if (_slots[i] != KMER_SET_EMPTY_SLOT) {
+                    sorted.push_back(_slots[i]);
+                }
+            }
+            std::sort(sorted.begin(), sorted.end());
+            if (_has_empty_slot_value) {
+                sorted.push_back(KMER_SET_EMPTY_SLOT);
+            }
+            _sorted.swap(sorted);
+            __sync_synchronize();
+            _sorted_ok = true;
+        }
+        __sync_bool_compare_and_swap(&_sort_spin_lock, 1, 0);
+    }
+
+public:
+    KmerSet() : _n_entries(0), _has_empty_slot_value(false), _sorted_ok(true),
+        _sort_spin_lock(0) {}
+
+    KmerSet(const KmerSet &other) : _slots(other._slots),
+        _n_entries(other._n_entries),
+        _has_empty_slot_value(other._has_empty_slot_value),
+        _sorted_ok(false), _sort_spin_lock(0) {}
+
+    KmerSet& operator=(const KmerSet &other)
+    {
+        _slots = other._slots;
+        _n_entries = other._n_entries;
+        _has_empty_slot_value = other._has_empty_slot_value;
+        _sorted.clear();
+        _sorted_ok = false;
+        _sort_spin_lock = 0;
+        return *this;
+    }
+
+    size_t size() const
+    {
+        return _n_entries;
+    }
+
+    bool empty() const
+    {
+        return _n_entries == 0;
+    }
+
+    bool contains(HashIntoType kmer) const
+    {
+        if (kmer == KMER_SET_EMPTY_SLOT) {
+            return _has_empty_slot_value;
+        }
+        if (_slots.empty()) {
+            return false;
+        }
+        return _slots[_find_slot(kmer)] == kmer;
+    }
+
+    // Make room for n entries without growing the table again.
+    void reserve(size_t n)
+    {
+        size_t n_slots = 16;
+        while (n_slots * 3 < n * 4) {
+            n_slots *= 2;
+        }
+        if (n_slots > _slots.size()) {
+            _resize(n_slots);
+        }
+    }
+
+    // Add kmer; returns false if it was already there.
+    bool insert(HashIntoType kmer)
+    {
+        if (kmer == KMER_SET_EMPTY_SLOT) {
+            if (_has_empty_slot_value) {
+                return false;
+            }
+            _has_empty_slot_value = true;
+        } else {
+            if ((_n_entries + 1) * 4 > _slots.size() * 3) {
+                _resize(_slots.empty() ? 16 : 2 * _slots.size());
+            }
+            size_t i = _find_slot(kmer);
+            if (_slots[i] == kmer) {
+                return false;
+            }
+            _slots[i] = kmer;
+        }
+        _n_entries++;
+        _sorted_ok = false;
+        return true;
+    }
+
+    // Remove kmer; returns the number of entries removed.
+    size_t erase(HashIntoType kmer)
+    {
+        if (kmer == KMER_SET_EMPTY_SLOT) {
+            if (!_has_empty_slot_value) {
+                return 0;
+            }
+            _has_empty_slot_value = false;
+        } else {
+            if (_slots.empty()) {
+                return 0;
+            }
+            size_t i = _find_slot(kmer);
+            if (_slots[i] != kmer) {
+                return 0;
+            }
+
+            // Move back any later entry of the probe run that may live in
+            // the gap, so that lookups never need tombstones.
+            size_t mask = _slots.size() - 1;
+            size_t j = i;
+            while (true) {
+                _slots[i] = KMER_SET_EMPTY_SLOT;
+                size_t home;
+                do {
+                    j = (j + 1) & mask;
+                    if (_slots[j] == KMER_SET_EMPTY_SLOT) {
+                        break;
+                    }
+                    home = _mix_hash(_slots[j]) & mask;
+                } while (i <= j ? (i < home && home <= j) :
+                         (i < home || home <= j));
+                if (_slots[j] == KMER_SET_EMPTY_SLOT) {
+                    break;
+                }
+                _slots[i] = _slots[j];
+                i = j;
+            }
+        }
+        _n_entries--;
+        _sorted_ok = false;
+        return 1;
+    }
+
+    void clear()
+    {
+        std::vector<HashIntoType>().swap(_slots);
+        std::vector<HashIntoType>().swap(_sorted);
+        _n_entries = 0;
+        _has_empty_slot_value = false;
+        _sorted_ok = true;
+    }
+
+    const_iterator begin() const
+    {
+        if (!_sorted_ok) {
+            _sort();
+        }
+        return _sorted.begin();
+    }
+
+    const_iterator end() const
+    {
+        if (!_sorted_ok) {
+            _sort();
+        }
+        return _sorted.end();
+    }
+
+    unordered_iterator unordered_begin() const
+    {
+        return unordered_iterator(this, 0);
+    }
+
+    unordered_iterator unordered_end() const
+    {
+        return unordered_iterator(this, _slots.size() + 1);
+    }
+
+    // Position of kmer in iteration order, or end(); use contains() for a
+    // plain membership test.
+    const_iterator find(HashIntoType kmer) const
+    {
+        if (!contains(kmer)) {
+            return end();
+        }
+        return std::lower_bound(begin(), end(), kmer);
+    }
+};
+
+template <typename T, typename E>
+inline bool set_contains(const T& s, const E& e)
+{
+    return s.find(e) != s.end();
+}
+
+inline bool set_contains(const KmerSet& s, HashIntoType e)
+{
+    return s.contains(e);
+}
+
+}
+
+#endif // KMER_SET_HH
@@ -0,0 +1,164 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#include <stdio.h>
+
+#include "label_writer.hh"
+
+using namespace khmer;
+using namespace khmer:: read_parsers;
+
+LabelSweepWriter::LabelSweepWriter(
+    const std::string&	prefix,
+    const std::string&	extension,
+    size_t		buffer_size,
+    size_t		max_reads,
+    size_t		max_buffers,
+    size_t		max_open_files)
+    : _prefix(prefix), _extension(extension), _buffer_size(buffer_size),
+      _max_reads(max_reads), _max_buffers(max_buffers),
+      _max_open_files(max_open_files ? max_open_files : 1),
+      _n_buffered(0), _n_buffers(0), _n_file_errors(0), _n_write_errors(0)
+{
+}
+
+LabelSweepWriter::~LabelSweepWriter()
+{
+    flush();
+}
+
+// As sweep-reads.py formats them: the name is followed by a tab and the
+// labels, tab-separated.
+
+static void _format_record(const Read& read, const LabelSet& labels,
+                           std::string& output)
+{
+    output += read.quality.empty() ? '>' : '@';
+    output += read.name;
+    output += '\t';
+    for (LabelSet::const_iterator li = labels.begin(); li != labels.end();
+            ++li) {
+        char label_s[24];
+        snprintf(label_s, sizeof(label_s), "%llu", (unsigned long long) *li);
+        if (li != labels.begin()) {
+            output += '\t';
+        }
+        output += label_s;
+    }
+    output += '\n';
+    output += read.sequence;
+    output += '\n';
+    if (!read.quality.empty()) {
+        output += "+\n";
+        output += read.quality;
+        output += '\n';
+    }
+}
+
+void LabelSweepWriter::write(const Read& read, const LabelSet& labels)
+{
+    std::string key;
+    if (labels.empty()) {
+        key = "orphaned";
+    } else if (labels.size() > 1) {
+        key = "multi";
+    } else {
+        char label_s[24];
+        snprintf(label_s, sizeof(label_s), "%llu",
+                 (unsigned long long) *labels.begin());
+        key = label_s;
+    }
+
+    Sink& sink = _sinks[key];
+    if (sink.filename.empty()) {
+        sink.key = key;
+        sink.n_records = 0;
+        sink.fp = NULL;
+        sink.filename = _prefix + "_" + key + "." + _extension;
+    }
+
+    if (sink.n_records == 0) {
+        _n_buffers++;
+    }
+    _format_record(read, labels, sink.records);
+    sink.n_records++;
+    sink.label_dist[labels.size()]++;
+    _n_buffered++;
+
+    if (sink.n_records >= _buffer_size) {
+        _flush(sink);
+    }
+    if (_n_buffered > _max_reads || _n_buffers > _max_buffers) {
+        std::map<std::string, Sink>::iterator si;
+        for (si = _sinks.begin(); si != _sinks.end(); ++si) {
+            _flush(si->second);
+        }
+    }
+}
+
+void LabelSweepWriter::_flush(Sink& sink)
+{
+    if (sink.n_records == 0) {
+        return;
+    }
+
+    if (sink.fp == NULL) {
+        if (_open_sinks.size() >= _max_open_files) {
+            _close(*_open_sinks.back());
+        }
+        sink.fp = fopen(sink.filename.c_str(), "ab");
+        if (sink.fp == NULL) {
+            _n_file_errors++;
+            _n_write_errors += sink.n_records;
+        } else {
+            _open_sinks.push_front(&sink);
+            sink.lru = _open_sinks.begin();
+        }
+    } else {
+        _open_sinks.splice(_open_sinks.begin(), _open_sinks, sink.lru);
+    }
+
+    if (sink.fp != NULL) {
+        if (fwrite(sink.records.data(), 1, sink.records.size(), sink.fp) !=
+                sink.records.size()) {
+            _n_write_errors += sink.n_records;
+        } else {
+            // only reads that made it to their file count as written.
+            _counts[sink.key] += sink.n_records;
+            std::map<size_t, unsigned long long>::const_iterator di;
+            for (di = sink.label_dist.begin(); di != sink.label_dist.end();
+                    ++di) {
+                _label_dist[di->first] += di->second;
+            }
+        }
+    }
+
+    _n_buffered -= sink.n_records;
+    _n_buffers--;
+    sink.n_records = 0;
+    sink.records.clear();
+    sink.label_dist.clear();
+}
+
+void LabelSweepWriter::_close(Sink& sink)
+{
+    if (sink.fp == NULL) {
+        return;
+    }
+    fclose(sink.fp);
+    sink.fp = NULL;
+    _open_sinks.erase(sink.lru);
+}
+
+void LabelSweepWriter::flush()
+{
+    std::map<std::string, Sink>::iterator si;
+    for (si = _sinks.begin(); si != _sinks.end(); ++si) {
+        _flush(si->second);
+        _close(si->second);
+    }
+}
@@ -0,0 +1,107 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef LABEL_WRITER_HH
+#define LABEL_WRITER_HH
+
+#include <stddef.h>
+#include <stdio.h>
+#include <list>
+#include <map>
+#include <string>
+
+#include "khmer.hh"
+#include "read_parsers.hh"
+
+// label files a LabelSweepWriter keeps open at once by default.
+#define DEFAULT_LABEL_WRITER_OPEN_FILES 128
+
+namespace khmer
+{
+
+// LabelSweepWriter sorts reads into files by the labels swept up around
+// them, as sandbox/sweep-reads.py does: a read with one label goes to
+// <prefix>_<label>.<extension>, a read with several to
+// <prefix>_multi.<extension> and a read with none to
+// <prefix>_orphaned.<extension>, with its labels appended to its name.
+// Files are appended to, never truncated.
+//
+// Reads are buffered per file. A buffer is written out once it holds
+// buffer_size reads, and every buffer once max_reads reads or max_buffers
+// non-empty buffers are held. At most max_open_files files are kept open,
+// closing the least recently written when another is needed.
+//
+// As there may be a great many files, errors opening or writing to one are
+// counted rather than thrown, and the reads concerned are dropped.
+
+class LabelSweepWriter
+{
+public:
+    LabelSweepWriter(const std::string& prefix, const std::string& extension,
+                     size_t buffer_size, size_t max_reads, size_t max_buffers,
+                     size_t max_open_files = DEFAULT_LABEL_WRITER_OPEN_FILES);
+    ~LabelSweepWriter();
+
+    void write(const read_parsers::Read& read, const LabelSet& labels);
+
+    // Write out every buffer, and close every file.
+    void flush();
+
+    // Reads written so far to each file, by its label, "multi" or
+    // "orphaned".
+    const std::map<std::string, unsigned long long>& counts() const
+    {
+        return _counts;
+    }
+    // Reads written so far, by their number of labels.
+    const std::map<size_t, unsigned long long>& label_dist() const
+    {
+        return _label_dist;
+    }
+    unsigned long long n_file_errors() const
+    {
+        return _n_file_errors;
+    }
+    unsigned long long n_write_errors() const	// reads dropped
+    {
+        return _n_write_errors;
+    }
+
+protected:
+    struct Sink {
+        std::string key;
+        std::string records;
+        size_t n_records;
+        std::map<size_t, unsigned long long> label_dist;	// of records
+        FILE * fp;
+        std::list<Sink *>::iterator lru;	// in _open_sinks, if fp is open
+        std::string filename;
+    };
+
+    std::string _prefix;
+    std::string _extension;
+    size_t _buffer_size;
+    size_t _max_reads;
+    size_t _max_buffers;
+    size_t _max_open_files;
+
+    std::map<std::string, Sink> _sinks;
+    std::list<Sink *> _open_sinks;	// most recently written first
+    size_t _n_buffered;			// reads in all buffers
+    size_t _n_buffers;			// non-empty buffers
+
+    std::map<std::string, unsigned long long> _counts;
+    std::map<size_t, unsigned long long> _label_dist;
+    unsigned long long _n_file_errors;
+    unsigned long long _n_write_errors;
+
+    void _flush(Sink& sink);
+    void _close(Sink& sink);
+};
+}
+
+#endif // LABEL_WRITER_HH
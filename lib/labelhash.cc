@@ -10,10 +10,13 @@
 #include <iostream>
 #include <sstream> // IWYU pragma: keep
 #include <set>
+#include <vector>
 
 #include "hashbits.hh"
 #include "hashtable.hh"
 #include "khmer_exception.hh"
+#include "kmer_hash.hh"
+#include "label_writer.hh"
 #include "labelhash.hh"
 #include "read_parsers.hh"
 #include "subset.hh"
@@ -27,6 +30,207 @@ using namespace std;
 using namespace khmer;
 using namespace khmer:: read_parsers;
 
+TagLabelIndex::TagLabelIndex() : _labels_spin_lock(0)
+{
+    for (unsigned int i = 0; i < TAG_LABELS_N_SHARDS; i++) {
+        _shards[i].n_entries = 0;
+        _shards[i].capacity = 0;
+        _shards[i].tags = NULL;
+        _shards[i].labels = NULL;
+        _shards[i].spin_lock = 0;
+    }
+}
+
+TagLabelIndex::~TagLabelIndex()
+{
+    for (unsigned int i = 0; i < TAG_LABELS_N_SHARDS; i++) {
+        delete[] _shards[i].tags;
+        delete[] _shards[i].labels;
+    }
+}
+
+void TagLabelIndex::_reserve_one(Shard& shard)
+{
+    // keep the load factor at or below four fifths.
+    if (5 * (shard.n_entries + 1) <= 4 * shard.capacity) {
+        return;
+    }
+
+    size_t old_capacity = shard.capacity;
+    HashIntoType * old_tags = shard.tags;
+    uint32_t * old_labels = shard.labels;
+
+    shard.capacity = old_capacity ? 2 * old_capacity : 16;
+    shard.tags = new HashIntoType[shard.capacity];
+    shard.labels = new uint32_t[shard.capacity];
+    memset(shard.labels, 0, shard.capacity * sizeof(uint32_t));
+
+    size_t mask = shard.capacity - 1;
+    for (size_t i = 0; i < old_capacity; i++) {
+        if (old_labels[i] != 0) {
+            size_t j = _mix_hash(old_tags[i]) & mask;
+            while (shard.labels[j] != 0) {
+                j = (j + 1) & mask;
+            }
+            shard.tags[j] = old_tags[i];
+            shard.labels[j] = old_labels[i];
+        }
+    }
+    delete[] old_tags;
+    delete[] old_labels;
+}
+
+size_t TagLabelIndex::_find_label_slot(Label label) const
+{
+    size_t mask = _label_slots.size() - 1;
+    size_t i = _mix_hash(label) & mask;
+    while (_label_slots[i] != 0 && _labels[_label_slots[i] - 1] != label) {
+        i = (i + 1) & mask;
+    }
+    return i;
+}
+
+uint32_t TagLabelIndex::add_label(Label label)
+{
+    _lock(_labels_spin_lock);
+    if (2 * (_labels.size() + 1) > _label_slots.size()) {
+        size_t n_slots = _label_slots.empty() ? 16 : 2 * _label_slots.size();
+        std::vector<uint32_t>(n_slots, 0).swap(_label_slots);
+        for (size_t n = 0; n < _labels.size(); n++) {
+            _label_slots[_find_label_slot(_labels[n])] = n + 1;
+        }
+    }
+
+    size_t i = _find_label_slot(label);
+    if (_label_slots[i] == 0) {
+        _labels.push_back(label);
+        _label_slots[i] = _labels.size();
+    }
+    uint32_t label_n = _label_slots[i] - 1;
+    _unlock(_labels_spin_lock);
+
+    return label_n;
+}
+
+bool TagLabelIndex::link(HashIntoType tag, uint32_t label_n)
+{
+    HashIntoType mixed = _mix_hash(tag);
+    Shard& shard = _get_shard(mixed);
+    bool added = false;
+
+    _lock(shard.spin_lock);
+    _reserve_one(shard);
+    size_t mask = shard.capacity - 1;
+    size_t i = mixed & mask;
+    while (shard.labels[i] != 0 &&
+            !(shard.tags[i] == tag && shard.labels[i] == label_n + 1)) {
+        i = (i + 1) & mask;
+    }
+    if (shard.labels[i] == 0) {
+        shard.tags[i] = tag;
+        shard.labels[i] = label_n + 1;
+        shard.n_entries++;
+        added = true;
+    }
+    _unlock(shard.spin_lock);
+
+    return added;
+}
+
+bool TagLabelIndex::contains(HashIntoType tag, uint32_t label_n) const
+{
+    HashIntoType mixed = _mix_hash(tag);
+    Shard& shard = _get_shard(mixed);
+    bool found = false;
+
+    _lock(shard.spin_lock);
+    if (shard.capacity) {
+        size_t mask = shard.capacity - 1;
+        for (size_t i = mixed & mask; shard.labels[i] != 0;
+                i = (i + 1) & mask) {
+            if (shard.tags[i] == tag && shard.labels[i] == label_n + 1) {
+                found = true;
+                break;
+            }
+        }
+    }
+    _unlock(shard.spin_lock);
+
+    return found;
+}
+
+unsigned int TagLabelIndex::get_labels(HashIntoType tag,
+                                       LabelSet& found_labels) const
+{
+    HashIntoType mixed = _mix_hash(tag);
+    Shard& shard = _get_shard(mixed);
+    std::vector<uint32_t> found;
+
+    _lock(shard.spin_lock);
+    if (shard.capacity) {
+        size_t mask = shard.capacity - 1;
+        for (size_t i = mixed & mask; shard.labels[i] != 0;
+                i = (i + 1) & mask) {
+            if (shard.tags[i] == tag) {
+                found.push_back(shard.labels[i] - 1);
+            }
+        }
+    }
+    _unlock(shard.spin_lock);
+
+    if (!found.empty()) {
+        _lock(_labels_spin_lock);
+        for (size_t i = 0; i < found.size(); i++) {
+            found_labels.insert(_labels[found[i]]);
+        }
+        _unlock(_labels_spin_lock);
+    }
+    return found.size();
+}
+
+void TagLabelIndex::get_pairs(unsigned int shard_n,
+                              std::vector<TagLabelPair>& pairs) const
+{
+    Shard& shard = _shards[shard_n];
+
+    _lock(shard.spin_lock);
+    _lock(_labels_spin_lock);
+    for (size_t i = 0; i < shard.capacity; i++) {
+        if (shard.labels[i] != 0) {
+            pairs.push_back(TagLabelPair(shard.tags[i],
+                                         _labels[shard.labels[i] - 1]));
+        }
+    }
+    _unlock(_labels_spin_lock);
+    _unlock(shard.spin_lock);
+}
+
+void TagLabelIndex::get_all_labels(std::vector<Label>& labels) const
+{
+    _lock(_labels_spin_lock);
+    labels = _labels;
+    _unlock(_labels_spin_lock);
+}
+
+size_t TagLabelIndex::n_labels() const
+{
+    _lock(_labels_spin_lock);
+    size_t n = _labels.size();
+    _unlock(_labels_spin_lock);
+    return n;
+}
+
+size_t TagLabelIndex::size() const
+{
+    size_t n = 0;
+    for (unsigned int i = 0; i < TAG_LABELS_N_SHARDS; i++) {
+        _lock(_shards[i].spin_lock);
+        n += _shards[i].n_entries;
+        _unlock(_shards[i].spin_lock);
+    }
+    return n;
+}
+
 /*
  * @camillescott
  * Might be time for a refactor: could do a general consume_fasta
@@ -37,17 +241,24 @@ void
 LabelHash::consume_fasta_and_tag_with_labels(
     std:: string const  &filename,
     unsigned int	      &total_reads, unsigned long long	&n_consumed,
+    unsigned int	      n_threads,
     CallbackFn	      callback,	    void *		callback_data
 )
 {
     IParser *	  parser =
         IParser::get_parser( filename );
 
-    consume_fasta_and_tag_with_labels(
-        parser,
-        total_reads, n_consumed,
-        callback, callback_data
-    );
+    try {
+        consume_fasta_and_tag_with_labels(
+            parser,
+            total_reads, n_consumed,
+            n_threads,
+            callback, callback_data
+        );
+    } catch (...) {
+        delete parser;
+        throw;
+    }
 
     delete parser;
 }
@@ -56,65 +267,93 @@ void
 LabelHash::consume_fasta_and_tag_with_labels(
     read_parsers:: IParser *  parser,
     unsigned int		    &total_reads,   unsigned long long	&n_consumed,
+    unsigned int		    n_threads,
     CallbackFn		    callback,	    void *		callback_data
 )
 {
-#if (0) // Note: Used with callback - currently disabled.
-    unsigned long long int  n_consumed_LOCAL	= 0;
-#endif
-    Read			  read;
-
-    // TODO? Delete the following assignments.
     total_reads = 0;
     n_consumed = 0;
 
-    Label _tag_label = 0;
+    Label next_label = 0;
+    bool done = false;
+    DeferredException error;
 
-    Label * the_label;
-    // Iterate through the reads and consume their k-mers.
-    while (!parser->is_complete( )) {
-        try {
-            read = parser->get_next_read( );
-        } catch (NoMoreReadsAvailable &exc) {
-            break;
-        }
+    #pragma omp parallel num_threads(n_threads)
+    {
+        std::vector<Read> reads;
+        std::vector<char> is_valid;
+        Label first_label = 0;
 
-        if (graph->check_and_normalize_read( read.sequence )) {
-            // TODO: make threadsafe!
-            unsigned long long this_n_consumed = 0;
-            the_label = check_and_allocate_label(_tag_label);
-            consume_sequence_and_tag_with_labels( read.sequence,
-                                                  this_n_consumed,
-                                                  *the_label );
-            _tag_label++;
-
-#if (0) // Note: Used with callback - currently disabled.
-            n_consumed_LOCAL  = __sync_add_and_fetch( &n_consumed, this_n_consumed );
-#else
-            __sync_add_and_fetch( &n_consumed, this_n_consumed );
-#endif
-            __sync_add_and_fetch( &total_reads, 1 );
-        }
+        while (!error.is_set()) {
+            size_t n_reads = 0;
 
-        // TODO: Figure out alternative to callback into Python VM
-        //       Cannot use in multi-threaded operation.
-#if (0)
-        // run callback, if specified
-        if (total_reads_TL % CALLBACK_PERIOD == 0 && callback) {
-            std::cout << "n tags: " << graph->all_tags.size() << "\n";
             try {
-                callback("consume_fasta_and_tag_with_labels", callback_data,
-                         total_reads_TL,
-                         n_consumed);
+                // Reads are fetched and numbered in one go, so that they
+                // are labeled in file order however many threads there are.
+                // Exceptions may not leave the critical section, so they
+                // are captured here and stop all threads from reading on.
+                #pragma omp critical (label_reads)
+                {
+                    try {
+                        if (!done) {
+                            n_reads = parser->imprint_next_read_batch(reads);
+                            done = (n_reads == 0);
+                        }
+
+                        is_valid.resize(n_reads);
+                        first_label = next_label;
+                        for (size_t i = 0; i < n_reads; i++) {
+                            is_valid[i] = graph->check_and_normalize_read(
+                                              reads[i].sequence);
+                            if (is_valid[i]) {
+                                next_label++;
+                            }
+                        }
+                    } catch (...) {
+                        error.capture();
+                        done = true;
+                        n_reads = 0;
+                    }
+                }
+                if (n_reads == 0) {
+                    break;
+                }
+
+                unsigned long long this_n_consumed = 0;
+                unsigned int this_n_reads = 0;
+                Label label = first_label;
+                for (size_t i = 0; i < n_reads; i++) {
+                    if (is_valid[i]) {
+                        consume_sequence_and_tag_with_labels(
+                            reads[i].sequence, this_n_consumed, label++);
+                        this_n_reads++;
+                    }
+                }
+                unsigned long long n_consumed_now =
+                    __sync_add_and_fetch( &n_consumed, this_n_consumed );
+                unsigned int total_reads_now =
+                    __sync_add_and_fetch( &total_reads, this_n_reads );
+
+                // run callback, if specified, each CALLBACK_PERIOD reads.
+                if (callback && total_reads_now / CALLBACK_PERIOD !=
+                        (total_reads_now - this_n_reads) / CALLBACK_PERIOD) {
+                    #pragma omp critical (label_callback)
+                    {
+                        try {
+                            callback("consume_fasta_and_tag_with_labels",
+                                     callback_data, total_reads_now,
+                                     n_consumed_now);
+                        } catch (...) {
+                            error.capture();
+                        }
+                    }
+                }
             } catch (...) {
-                delete parser;
-                throw;
+                error.capture();
             }
         }
-#endif // 0
-
-    } // while reads left for parser
-
+    }
+    error.rethrow();
 }
 
 void LabelHash::consume_partitioned_fasta_and_tag_with_labels(
@@ -139,7 +378,6 @@ void LabelHash::consume_partitioned_fasta_and_tag_with_labels(
     //
     // iterate through the FASTA file & consume the reads.
     //
-    Label * c;
     PartitionID p;
     while(!parser->is_complete())  {
         read = parser->get_next_read();
@@ -150,13 +388,10 @@ void LabelHash::consume_partitioned_fasta_and_tag_with_labels(
             // save that.
             printdbg(parsing partition id)
             p = _parse_partition_id(read.name);
-            printdbg(checking label and allocating if necessary) {
-                c = check_and_allocate_label(p);
-            }
             printdbg(consuming sequence and tagging)
             consume_sequence_and_tag_with_labels( seq,
                                                   n_consumed,
-                                                  *c );
+                                                  p );
             printdbg(back in consume_partitioned)
         }
 
@@ -176,31 +411,27 @@ void LabelHash::consume_partitioned_fasta_and_tag_with_labels(
     }
     printdbg(done with while loop in consume_partitioned)
 
-        // @cswelcher TODO: check that deallocate LabelPtrMap is correct
-    {
-        delete parser;
-    }
+    delete parser;
     printdbg(deleted parser and exiting)
 }
 
-// @cswelcher: double-check -- is it valid to pull the address from a reference?
-void LabelHash::link_tag_and_label(HashIntoType& kmer, Label& kmer_label)
+void LabelHash::link_tag_and_label(HashIntoType kmer, Label kmer_label)
 {
-    printdbg(linking tag and label)
-    tag_labels.insert(TagLabelPtrPair(kmer, &kmer_label));
-    label_tag_ptrs.insert(LabelTagPair(kmer_label, kmer));
-    printdbg(done linking tag and label)
+    tag_labels.link(kmer, tag_labels.add_label(kmer_label));
 }
 
 void LabelHash::consume_sequence_and_tag_with_labels(const std::string& seq,
         unsigned long long& n_consumed,
-        Label& current_label,
+        Label current_label,
         SeenSet * found_tags)
 {
 
     printdbg(inside low-level labelhash consume sequence function)
 
     bool kmer_tagged;
+    uint32_t label_n = tag_labels.add_label(current_label);
+    // the ALL_TAGS_SPIN_LOCK macros refer to the graph's lock by this name.
+    uint32_t& _all_tags_spin_lock = graph->_all_tags_spin_lock;
 
     KMerIterator kmers(seq.c_str(), graph->_ksize);
     HashIntoType kmer;
@@ -216,29 +447,21 @@ void LabelHash::consume_sequence_and_tag_with_labels(const std::string& seq,
                 ++n_consumed;
                 printdbg(test_and_set_bits)
             }
-#if (1)
+
             if (is_new_kmer) {
                 printdbg(new kmer...)
                 ++since;
             } else {
                 printdbg(entering tag spin lock)
-                //ACQUIRE_ALL_TAGS_SPIN_LOCK
+                ACQUIRE_ALL_TAGS_SPIN_LOCK
                 kmer_tagged = set_contains(graph->all_tags, kmer);
-                //RELEASE_ALL_TAGS_SPIN_LOCK
+                RELEASE_ALL_TAGS_SPIN_LOCK
                 printdbg(released tag spin lock)
                 if (kmer_tagged) {
                     since = 1;
                     printdbg(kmer already in all_tags)
                     // Labeling code
-                    // TODO: MAKE THREADSAFE!
-
-                    if (!_cmap_contains_label(tag_labels, kmer, current_label)) {
-                        printdbg(tag was not labeled: adding to labels...)
-                        //ACQUIRE_TAG_COLORS_SPIN_LOCK
-                        link_tag_and_label(kmer, current_label);
-                        //RELEASE_TAG_COLORS_SPIN_LOCK
-                        printdbg(released label spin lock)
-                    }
+                    tag_labels.link(kmer, label_n);
                     if (found_tags) {
                         found_tags->insert(kmer);
                     }
@@ -247,31 +470,16 @@ void LabelHash::consume_sequence_and_tag_with_labels(const std::string& seq,
                     ++since;
                 }
             }
-#else
-            if (!is_new_kmer && set_contains(graph->all_tags, kmer)) {
-                since = 1;
-                if (found_tags) {
-                    found_tags->insert(kmer);
-                }
-            } else {
-                since++;
-            }
-#endif
             //
             if (since >= graph->_tag_density) {
                 printdbg(exceeded tag density: drop a tag and label --
                          getting tag lock)
-                //ACQUIRE_ALL_TAGS_SPIN_LOCK
-                printdbg(in tag spin lock)
+                ACQUIRE_ALL_TAGS_SPIN_LOCK
                 graph->all_tags.insert(kmer);
-                //RELEASE_ALL_TAGS_SPIN_LOCK
-                printdbg(released tag spin lock)
+                RELEASE_ALL_TAGS_SPIN_LOCK
 
                 // Labeling code
-                // TODO: MAKE THREADSAFE!
-                //ACQUIRE_TAG_COLORS_SPIN_LOCK
-                link_tag_and_label(kmer, current_label);
-                //RELEASE_TAG_COLORS_SPIN_LOCK
+                tag_labels.link(kmer, label_n);
 
                 if (found_tags) {
                     found_tags->insert(kmer);
@@ -282,12 +490,11 @@ void LabelHash::consume_sequence_and_tag_with_labels(const std::string& seq,
         } // iteration over kmers
     printdbg(finished iteration: dropping last tag)
     if (since >= graph->_tag_density/2 - 1) {
-        //ACQUIRE_ALL_TAGS_SPIN_LOCK
+        ACQUIRE_ALL_TAGS_SPIN_LOCK
         graph->all_tags.insert(kmer);	// insert the last k-mer, too.
-        //RELEASE_ALL_TAGS_SPIN_LOCK
+        RELEASE_ALL_TAGS_SPIN_LOCK
 
-        // Label code: TODO: MAKE THREADSAFE!
-        link_tag_and_label(kmer, current_label);
+        tag_labels.link(kmer, label_n);
 
         if (found_tags) {
             found_tags->insert(kmer);
@@ -297,7 +504,7 @@ void LabelHash::consume_sequence_and_tag_with_labels(const std::string& seq,
 }
 
 unsigned int LabelHash::sweep_label_neighborhood(const std::string& seq,
-        LabelPtrSet& found_labels,
+        LabelSet& found_labels,
         unsigned int range,
         bool break_on_stoptags,
         bool stop_big_traversals)
@@ -319,23 +526,22 @@ unsigned int LabelHash::sweep_label_neighborhood(const std::string& seq,
     return num_traversed;
 }
 
-LabelPtrSet LabelHash::get_tag_labels(const HashIntoType& tag)
+LabelSet LabelHash::get_tag_labels(const HashIntoType& tag)
 {
-    LabelPtrSet labels;
-    //unsigned int num_labels;
-    _get_tag_labels(tag, tag_labels, labels);
+    LabelSet labels;
+    tag_labels.get_labels(tag, labels);
     return labels;
 }
 
 void LabelHash::traverse_labels_and_resolve(const SeenSet& tagged_kmers,
-        LabelPtrSet& found_labels)
+        LabelSet& found_labels)
 {
 
     SeenSet::const_iterator si;
     for (si=tagged_kmers.begin(); si!=tagged_kmers.end(); ++si) {
         HashIntoType tag = *si;
         // get the labels associated with this tag
-        unsigned int num_labels = _get_tag_labels(tag, tag_labels, found_labels);
+        unsigned int num_labels = tag_labels.get_labels(tag, found_labels);
         if (num_labels > 1) {
             // reconcile labels
             // for now do nothing ha
@@ -343,14 +549,72 @@ void LabelHash::traverse_labels_and_resolve(const SeenSet& tagged_kmers,
     }
 }
 
-LabelHash::~LabelHash()
+size_t LabelHash::sweep_read_batch(
+    IParser *			parser,
+    std::vector<Read>&		reads,
+    std::vector<LabelSet>&	labels,
+    unsigned int		range,
+    bool			break_on_stoptags,
+    bool			stop_big_traversals,
+    unsigned int		n_threads)
 {
-    for (LabelPtrMap::iterator itr=label_ptrs.begin();
-            itr!=label_ptrs.end(); ++itr) {
-        delete itr->second;
+    size_t n_reads = parser->imprint_next_read_batch(reads,
+                     SWEEP_READS_BATCH_SIZE);
+    if (labels.size() < n_reads) {
+        labels.resize(n_reads);
     }
+
+    long n = n_reads;
+    WordLength ksize = graph->ksize();
+    DeferredException error;
+
+    #pragma omp parallel for num_threads(n_threads) schedule(dynamic, 64)
+    for (long i = 0; i < n; ++i) {
+        if (error.is_set()) {
+            continue;
+        }
+        try {
+            labels[i].clear();
+            if (reads[i].sequence.length() < ksize) {
+                continue;
+            }
+            sweep_label_neighborhood(reads[i].sequence, labels[i], range,
+                                     break_on_stoptags, stop_big_traversals);
+        } catch (...) {
+            error.capture();
+        }
+    }
+
+    error.rethrow();
+    return n_reads;
 }
 
+unsigned long long LabelHash::sweep_reads(
+    IParser *		parser,
+    LabelSweepWriter&	writer,
+    unsigned int	range,
+    bool		break_on_stoptags,
+    bool		stop_big_traversals,
+    unsigned int	n_threads)
+{
+    std::vector<Read> reads;
+    std::vector<LabelSet> labels;
+    unsigned long long n_written = 0;
+    WordLength ksize = graph->ksize();
+
+    size_t n_reads;
+    while ((n_reads = sweep_read_batch(parser, reads, labels, range,
+                                       break_on_stoptags, stop_big_traversals,
+                                       n_threads)) > 0) {
+        for (size_t i = 0; i < n_reads; ++i) {
+            if (reads[i].sequence.length() >= ksize) {
+                writer.write(reads[i], labels[i]);
+                n_written++;
+            }
+        }
+    }
+    return n_written;
+}
 
 // Save a partition map to disk.
 
@@ -378,22 +642,28 @@ void LabelHash::save_labels_and_tags(std::string filename)
     unsigned int n_bytes = 0;
 
     // For each tag in the partition map, save the tag and the associated
-    // partition ID.
-
-    TagLabelPtrMap::const_iterator pi = tag_labels.begin();
-    for (; pi != tag_labels.end(); ++pi) {
-        HashIntoType *k_p = (HashIntoType *) (buf + n_bytes);
-        *k_p = pi->first;
-        n_bytes += sizeof(HashIntoType);
-
-        Label * l_p = (Label *) (buf + n_bytes);
-        *l_p = *(pi->second);
-        n_bytes += sizeof(Label);
-
-        // flush to disk
-        if (n_bytes >= IO_BUF_SIZE - sizeof(HashIntoType) - sizeof(Label)) {
-            outfile.write(buf, n_bytes);
-            n_bytes = 0;
+    // partition ID, a shard of the index at a time.
+
+    std::vector<TagLabelPair> pairs;
+    for (unsigned int shard = 0; shard < TAG_LABELS_N_SHARDS; ++shard) {
+        pairs.clear();
+        tag_labels.get_pairs(shard, pairs);
+
+        std::vector<TagLabelPair>::const_iterator pi = pairs.begin();
+        for (; pi != pairs.end(); ++pi) {
+            HashIntoType *k_p = (HashIntoType *) (buf + n_bytes);
+            *k_p = pi->first;
+            n_bytes += sizeof(HashIntoType);
+
+            Label * l_p = (Label *) (buf + n_bytes);
+            *l_p = pi->second;
+            n_bytes += sizeof(Label);
+
+            // flush to disk
+            if (n_bytes >= IO_BUF_SIZE - sizeof(HashIntoType) - sizeof(Label)) {
+                outfile.write(buf, n_bytes);
+                n_bytes = 0;
+            }
         }
     }
     // save remainder.
@@ -518,11 +788,8 @@ void LabelHash::load_labels_and_tags(std::string filename)
             labelp = (Label *) (buf + i);
             i += sizeof(Label);
 
-            Label * labelp2;
-
             graph->all_tags.insert(*kmer_p);
-            labelp2 = check_and_allocate_label(*labelp);
-            link_tag_and_label(*kmer_p, *labelp2);
+            link_tag_and_label(*kmer_p, *labelp);
 
             loaded++;
         }
@@ -10,18 +10,22 @@
 
 #include <stddef.h>
 #include <stdint.h>
-#include <map>
 #include <string>
 #include <utility>
+#include <vector>
 
 #include "hashbits.hh"
 #include "hashtable.hh"
 #include "khmer.hh"
 #include "read_parsers.hh"
 
+// reads swept for labels at a time by LabelHash::sweep_reads().
+#define SWEEP_READS_BATCH_SIZE 10000
+
 namespace khmer
 {
 class Hashtable;
+class LabelSweepWriter;
 
 namespace read_parsers
 {
@@ -32,105 +36,105 @@ struct IParser;
 namespace khmer
 {
 
-class LabelHash
+//
+// Index from tags to the labels on them, safe to add to from many threads.
+// Each (tag, label) pair takes one twelve-byte slot: the tag, and the
+// number of the label in a table of the distinct labels. Slots are kept in
+// open-addressing tables with linear probing, so that every pair for a tag
+// lies in the probe run from the tag's home slot. The tags are spread over
+// TAG_LABELS_N_SHARDS tables, each behind its own spin lock.
+//
+class TagLabelIndex
 {
 protected:
-    // Does the given tag already have the given label?
-    bool _cmap_contains_label(const TagLabelPtrMap& cmap,
-                              HashIntoType& kmer,
-                              Label& the_label)
+    // padded to a cache line so that the locks do not share one.
+    struct Shard {
+        size_t n_entries;
+        size_t capacity;        // zero, or a power of two
+        HashIntoType * tags;
+        uint32_t * labels;      // label number + 1, or 0 for a free slot
+        uint32_t spin_lock;
+        char _pad[64 - 2 * sizeof(size_t) - sizeof(HashIntoType *)
+                  - sizeof(uint32_t *) - sizeof(uint32_t)];
+    };
+
+    mutable Shard _shards[TAG_LABELS_N_SHARDS];
+
+    std::vector<Label> _labels;             // by label number
+    std::vector<uint32_t> _label_slots;     // label number + 1, or 0
+    mutable uint32_t _labels_spin_lock;
+
+    Shard& _get_shard(HashIntoType mixed) const
     {
-        std::pair<TagLabelPtrMap::const_iterator, TagLabelPtrMap::const_iterator> ret;
-        ret = cmap.equal_range(kmer);
-        for (TagLabelPtrMap::const_iterator it=ret.first; it!=ret.second; ++it) {
-            if (*(it->second) == the_label) {
-                return true;
-            }
-        }
-        return false;
+        return _shards[mixed >> (64 - TAG_LABELS_SHARD_BITS)];
     }
 
-    // Does the given label already have a tag associated with it?
-    bool _cmap_contains_tag(const LabelTagMap& cmap,
-                            Label& the_label,
-                            HashIntoType& kmer)
+    static void _lock(uint32_t& spin_lock)
     {
-        std::pair<LabelTagMap::const_iterator, LabelTagMap::const_iterator> ret;
-        ret = cmap.equal_range(the_label);
-        for (LabelTagMap::const_iterator it=ret.first; it!=ret.second; ++it) {
-            if(it->second == kmer) {
-                return true;
-            }
-        }
-        return false;
+        while (!__sync_bool_compare_and_swap(&spin_lock, 0, 1));
     }
 
-    unsigned int _get_tag_labels(const HashIntoType& tag,
-                                 const TagLabelPtrMap& cmap,
-                                 LabelPtrSet& found_labels)
+    static void _unlock(uint32_t& spin_lock)
     {
-        unsigned int num_labels = 0;
-        std::pair<TagLabelPtrMap::const_iterator, TagLabelPtrMap::const_iterator> ret;
-        ret = cmap.equal_range(tag);
-        for (TagLabelPtrMap::const_iterator it=ret.first; it!=ret.second; ++it) {
-            found_labels.insert(it->second);
-            ++num_labels;
-        }
-        return num_labels;
+        __sync_bool_compare_and_swap(&spin_lock, 1, 0);
     }
 
-    unsigned int _get_tags_from_label(const Label& label,
-                                      const LabelTagMap& cmap,
-                                      TagSet& labeled_tags)
-    {
-        unsigned int num_tags = 0;
-        std::pair<LabelTagMap::const_iterator, LabelTagMap::const_iterator> ret;
-        ret = cmap.equal_range(label);
-        for (LabelTagMap::const_iterator it=ret.first; it!=ret.second; ++it) {
-            labeled_tags.insert(it->second);
-            ++num_tags;
-        }
-        return num_tags;
-    }
+    // Make room for one more pair. The shard must be locked.
+    static void _reserve_one(Shard& shard);
 
-    uint32_t _tag_labels_spin_lock;
+    // Slot of label in _label_slots, or the free slot where it belongs.
+    // The labels must be locked.
+    size_t _find_label_slot(Label label) const;
 
 public:
-    khmer::Hashtable * graph;
+    TagLabelIndex();
+    ~TagLabelIndex();
 
-    explicit LabelHash(Hashtable * ht) : graph(ht)
-    {
-        _tag_labels_spin_lock = 0;
+    // Number of label, which is added if it is new.
+    uint32_t add_label(Label label);
 
-    }
+    // Label the tag with the label numbered label_n; returns false if it
+    // already was.
+    bool link(HashIntoType tag, uint32_t label_n);
 
-    ~LabelHash();
+    bool contains(HashIntoType tag, uint32_t label_n) const;
 
-    TagLabelPtrMap tag_labels;
-    LabelTagMap label_tag_ptrs;
-    LabelPtrMap label_ptrs;
+    // Add the labels on tag to found_labels; returns how many there were.
+    unsigned int get_labels(HashIntoType tag, LabelSet& found_labels) const;
 
-    size_t n_labels() const
-    {
-        return label_ptrs.size();
-    }
+    // Append the (tag, label) pairs of the given shard to pairs.
+    void get_pairs(unsigned int shard, std::vector<TagLabelPair>& pairs)
+    const;
 
+    // The distinct labels, in the order they were added.
+    void get_all_labels(std::vector<Label>& labels) const;
 
-    Label * check_and_allocate_label(Label new_label)
+    size_t n_labels() const;
+    size_t size() const;        // number of (tag, label) pairs
+};
+
+class LabelHash
+{
+public:
+    khmer::Hashtable * graph;
+
+    explicit LabelHash(Hashtable * ht) : graph(ht) { }
+
+    TagLabelIndex tag_labels;
+
+    size_t n_labels() const
     {
-        Label * c;
-        if (label_ptrs.count(new_label)) {
-            c = label_ptrs[new_label];
-        } else {
-            c = new Label(new_label);
-            label_ptrs[*c] = c;
-        }
-        return c;
+        return tag_labels.n_labels();
     }
+
+    // Reads are labeled 0, 1, 2, ... in the order they come from the
+    // parser, skipping reads with non-ACGT bases; n_threads threads share
+    // the parser.
     void consume_fasta_and_tag_with_labels(
         std::string const	  &filename,
         unsigned int	  &total_reads,
         unsigned long long  &n_consumed,
+        unsigned int	  n_threads	  = 1,
         CallbackFn	  callback	  = NULL,
         void *		  callback_data	  = NULL);
 
@@ -138,6 +142,7 @@ public:
         read_parsers:: IParser *	    parser,
         unsigned int	    &total_reads,
         unsigned long long  &n_consumed,
+        unsigned int	    n_threads	    = 1,
         CallbackFn	    callback	    = NULL,
         void *		    callback_data   = NULL);
 
@@ -147,23 +152,45 @@ public:
             CallbackFn callback = NULL,
             void * callback_datac = NULL);
 
+    // Safe to call from several threads at once.
     void consume_sequence_and_tag_with_labels(const std::string& seq,
             unsigned long long& n_consumed,
-            Label& current_label,
+            Label current_label,
             SeenSet * new_tags = 0);
 
-    LabelPtrSet get_tag_labels(const HashIntoType& tag);
+    LabelSet get_tag_labels(const HashIntoType& tag);
 
-    void link_tag_and_label(HashIntoType& kmer, Label& label);
+    void link_tag_and_label(HashIntoType kmer, Label label);
 
     unsigned int sweep_label_neighborhood(const std::string & seq,
-                                          LabelPtrSet& found_labels,
+                                          LabelSet& found_labels,
                                           unsigned int range,
                                           bool break_on_stoptags,
                                           bool stop_big_traversals);
 
     void traverse_labels_and_resolve(const SeenSet& tagged_kmers,
-                                     LabelPtrSet& found_labels);
+                                     LabelSet& found_labels);
+
+    // Read a batch of reads from parser and sweep each for labels as
+    // sweep_label_neighborhood() does, on n_threads threads. Reads shorter
+    // than k are not swept, and keep no labels. Returns the number of
+    // reads, which is 0 at the end.
+    size_t sweep_read_batch(read_parsers::IParser * parser,
+                            std::vector<read_parsers::Read>& reads,
+                            std::vector<LabelSet>& labels,
+                            unsigned int range,
+                            bool break_on_stoptags,
+                            bool stop_big_traversals,
+                            unsigned int n_threads);
+
+    // Sweep every read from parser, writing each read at least k long to
+    // writer with its labels. Returns the number of reads written.
+    unsigned long long sweep_reads(read_parsers::IParser * parser,
+                                   LabelSweepWriter& writer,
+                                   unsigned int range,
+                                   bool break_on_stoptags,
+                                   bool stop_big_traversals,
+                                   unsigned int n_threads);
 
     void save_labels_and_tags(std::string);
     void load_labels_and_tags(std::string);
@@ -171,10 +198,4 @@ public:
 };
 };
 
-#define ACQUIRE_TAG_COLORS_SPIN_LOCK \
-  while(!__sync_bool_compare_and_swap( &_tag_labels_spin_lock, 0, 1));
-
-#define RELEASE_TAG_COLORS_SPIN_LOCK \
-  __sync_bool_compare_and_swap( &_tag_labels_spin_lock, 1, 0);
-
 #endif
@@ -0,0 +1,540 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#include <errno.h>
+#include <string.h>
+#include <functional>
+#include <queue>
+#include <sstream> // IWYU pragma: keep
+
+#include "khmer_exception.hh"
+#include "pmap_file.hh"
+#include "varint.hh"
+#include "zlib.h"
+
+// a varint-encoded tag takes at most 10 bytes, and a partition ID 5.
+#define PMAP_MAX_RECORD_SIZE 15
+#define PMAP_FLAT_RECORD_SIZE (sizeof(HashIntoType) + sizeof(PartitionID))
+
+using namespace khmer;
+using namespace std;
+
+template <typename T>
+static void _write_value(std::ofstream& outfile, T value)
+{
+    outfile.write((const char *) &value, sizeof(value));
+}
+
+template <typename T>
+static void _read_value(std::ifstream& infile, T& value)
+{
+    infile.read((char *) &value, sizeof(value));
+}
+
+PmapWriter::PmapWriter(
+    const std::string&	filename,
+    WordLength		ksize,
+    unsigned long long	n_records)
+    : _filename(filename), _n_records(n_records), _n_written(0),
+      _block_records(0), _last_tag(0)
+{
+    _outfile.open(filename.c_str(), ios::binary);
+    if (!_outfile.is_open()) {
+        throw khmer_file_exception("Cannot open pmap file for writing: " +
+                                   filename);
+    }
+
+    unsigned char version = SAVED_FORMAT_VERSION;
+    _outfile.write(SAVED_SIGNATURE, 4);
+    _outfile.write((const char *) &version, 1);
+
+    unsigned char ht_type = SAVED_PACKED_SUBSET;
+    _outfile.write((const char *) &ht_type, 1);
+
+    _write_value(_outfile, (unsigned int) ksize);
+    _write_value(_outfile, n_records);
+
+    uint64_t n_blocks = (n_records + PMAP_BLOCK_RECORDS - 1) /
+                        PMAP_BLOCK_RECORDS;
+    _write_value(_outfile, (uint32_t) PMAP_BLOCK_RECORDS);
+    _write_value(_outfile, n_blocks);
+
+    // leave room for the index; close() fills it in.
+    _index_pos = _outfile.tellp();
+    PmapBlockInfo empty = { 0, 0, 0, 0, 0 };
+    for (uint64_t i = 0; i < n_blocks; i++) {
+        _write_value(_outfile, empty.first_tag);
+        _write_value(_outfile, empty.offset);
+        _write_value(_outfile, empty.n_records);
+        _write_value(_outfile, empty.raw_size);
+        _write_value(_outfile, empty.packed_size);
+    }
+    _index.reserve(n_blocks);
+    _check_stream();
+}
+
+PmapWriter::~PmapWriter()
+{
+    if (_outfile.is_open()) {
+        _outfile.close();
+    }
+}
+
+void PmapWriter::_check_stream()
+{
+    if (_outfile.fail()) {
+        throw khmer_file_exception(strerror(errno));
+    }
+}
+
+void PmapWriter::append(HashIntoType tag, PartitionID p)
+{
+    if (_n_written == _n_records) {
+        throw khmer_exception("too many records for pmap file " + _filename);
+    }
+    if (_n_written && tag <= _last_tag) {
+        throw khmer_exception("pmap records must be saved in tag order");
+    }
+
+    if (_block_records == 0) {
+        PmapBlockInfo info = { tag, 0, 0, 0, 0 };
+        _index.push_back(info);
+        _last_tag = tag;
+    }
+    put_varint(_block, tag - _last_tag);
+    put_varint(_block, p);
+
+    _last_tag = tag;
+    _block_records++;
+    _n_written++;
+
+    if (_block_records == PMAP_BLOCK_RECORDS) {
+        _flush_block();
+    }
+}
+
+void PmapWriter::_flush_block()
+{
+    if (_block_records == 0) {
+        return;
+    }
+
+    uLongf packed_size = compressBound(_block.size());
+    std::vector<unsigned char> packed(packed_size);
+    int ret = compress2(&packed[0], &packed_size,
+                        (const Bytef *) _block.data(), _block.size(),
+                        Z_BEST_SPEED);
+    if (ret != Z_OK) {
+        throw khmer_exception("error compressing pmap block");
+    }
+
+    PmapBlockInfo &info = _index.back();
+    info.offset = _outfile.tellp();
+    info.n_records = _block_records;
+    info.raw_size = _block.size();
+    info.packed_size = packed_size;
+
+    _outfile.write((const char *) &packed[0], packed_size);
+    _check_stream();
+
+    _block.clear();
+    _block_records = 0;
+}
+
+void PmapWriter::close()
+{
+    if (_n_written != _n_records) {
+        throw khmer_exception("too few records for pmap file " + _filename);
+    }
+    _flush_block();
+
+    _outfile.seekp(_index_pos);
+    for (size_t i = 0; i < _index.size(); i++) {
+        _write_value(_outfile, _index[i].first_tag);
+        _write_value(_outfile, _index[i].offset);
+        _write_value(_outfile, _index[i].n_records);
+        _write_value(_outfile, _index[i].raw_size);
+        _write_value(_outfile, _index[i].packed_size);
+    }
+    _check_stream();
+    _outfile.close();
+    _check_stream();
+}
+
+PmapReader::PmapReader(const std::string& filename, WordLength ksize)
+    : _filename(filename), _packed(false), _n_records(0), _n_read(0),
+      _next_block(0), _block_pos(0), _block_left(0), _last_tag(0)
+{
+    // configure ifstream to raise exceptions for everything.
+    _infile.exceptions(std::ifstream::failbit | std::ifstream::badbit);
+
+    try {
+        _infile.open(filename.c_str(), ios::binary);
+    }  catch (std::ifstream::failure &e) {
+        std::string err;
+        if (!_infile.is_open()) {
+            err = "Cannot open subset pmap file: " + filename;
+        } else {
+            err = "Unknown error in opening file: " + filename;
+        }
+        throw khmer_file_exception(err);
+    }
+
+    try {
+        _read_header(ksize);
+    } catch (std::ifstream::failure &e) {
+        std::string err;
+        err = "Unknown error reading header info from: " + filename;
+        throw khmer_file_exception(err);
+    }
+}
+
+void PmapReader::_read_header(WordLength ksize)
+{
+    unsigned int save_ksize = 0;
+    char signature[4];
+    unsigned char version, ht_type;
+
+    _infile.read(signature, 4);
+    _infile.read((char *) &version, 1);
+    _infile.read((char *) &ht_type, 1);
+    if (!(std::string(signature, 4) == SAVED_SIGNATURE)) {
+        std::ostringstream err;
+        err << "Incorrect file signature 0x";
+        for(size_t i=0; i < 4; ++i) {
+            err << std::hex << (int) signature[i];
+        }
+        err << " while reading subset pmap from " << _filename
+            << " Should be: " << SAVED_SIGNATURE;
+        throw khmer_file_exception(err.str());
+    } else if (!(version == SAVED_FORMAT_VERSION)) {
+        std::ostringstream err;
+        err << "Incorrect file format version " << (int) version
+            << " while reading subset pmap from " << _filename;
+        throw khmer_file_exception(err.str());
+    } else if (!(ht_type == SAVED_SUBSET || ht_type == SAVED_PACKED_SUBSET)) {
+        std::ostringstream err;
+        err << "Incorrect file format type " << (int) ht_type
+            << " while reading subset pmap from " << _filename;
+        throw khmer_file_exception(err.str());
+    }
+    _packed = (ht_type == SAVED_PACKED_SUBSET);
+
+    _read_value(_infile, save_ksize);
+    if (!(save_ksize == ksize)) {
+        std::ostringstream err;
+        err << "Incorrect k-mer size " << save_ksize
+            << " while reading subset pmap from " << _filename;
+        throw khmer_file_exception(err.str());
+    }
+
+    _read_value(_infile, _n_records);
+
+    if (!_packed) {
+        return;
+    }
+
+    uint32_t block_records = 0;
+    uint64_t n_blocks = 0;
+    _read_value(_infile, block_records);
+    _read_value(_infile, n_blocks);
+    if (block_records == 0 ||
+            n_blocks != (_n_records + block_records - 1) / block_records) {
+        throw khmer_file_exception("corrupt block index in pmap file " +
+                                   _filename);
+    }
+
+    _index.resize(n_blocks);
+    for (uint64_t i = 0; i < n_blocks; i++) {
+        PmapBlockInfo &info = _index[i];
+        _read_value(_infile, info.first_tag);
+        _read_value(_infile, info.offset);
+        _read_value(_infile, info.n_records);
+        _read_value(_infile, info.raw_size);
+        _read_value(_infile, info.packed_size);
+
+        if (info.n_records == 0 || info.n_records > block_records ||
+                info.raw_size > (uint64_t) info.n_records *
+                PMAP_MAX_RECORD_SIZE ||
+                info.packed_size > compressBound(info.raw_size)) {
+            throw khmer_file_exception("corrupt block index in pmap file " +
+                                       _filename);
+        }
+    }
+}
+
+bool PmapReader::_load_flat_block()
+{
+    _block.resize(PMAP_BLOCK_RECORDS * PMAP_FLAT_RECORD_SIZE);
+    try {
+        _infile.read(&_block[0], _block.size());
+    } catch (std::ifstream::failure &e) {
+        // We may get an exception here if we fail to read all the
+        // expected bytes due to EOF -- only pass it up if we hit
+        // something other than EOF.
+        if (!_infile.eof()) {
+            throw khmer_file_exception("Unknown error reading data from: " +
+                                       _filename);
+        }
+    }
+
+    _block.resize(_infile.gcount() - _infile.gcount() % PMAP_FLAT_RECORD_SIZE);
+    _block_left = _block.size() / PMAP_FLAT_RECORD_SIZE;
+    _block_pos = 0;
+
+    return _block_left > 0;
+}
+
+bool PmapReader::_load_block()
+{
+    if (!_packed) {
+        return _load_flat_block();
+    }
+    if (_next_block == _index.size()) {
+        return false;
+    }
+
+    const PmapBlockInfo &info = _index[_next_block++];
+    std::vector<char> packed(info.packed_size);
+    try {
+        _infile.seekg(info.offset);
+        _infile.read(&packed[0], info.packed_size);
+    } catch (std::ifstream::failure &e) {
+        throw khmer_file_exception("Unknown error reading data from: " +
+                                   _filename);
+    }
+
+    _block.resize(info.raw_size);
+    uLongf raw_size = info.raw_size;
+    int ret = uncompress((Bytef *) &_block[0], &raw_size,
+                         (const Bytef *) &packed[0], info.packed_size);
+    if (ret != Z_OK || raw_size != info.raw_size) {
+        throw khmer_file_exception("corrupt block in pmap file " + _filename);
+    }
+
+    _block_left = info.n_records;
+    _block_pos = 0;
+    _last_tag = info.first_tag;
+
+    return true;
+}
+
+bool PmapReader::next(HashIntoType& tag, PartitionID& p)
+{
+    if (_block_left == 0 && !_load_block()) {
+        if (_n_read != _n_records) {
+            throw khmer_file_exception("error loading partitionmap - "
+                                       "invalid # of items");
+        }
+        return false;
+    }
+
+    if (_packed) {
+        uint64_t delta, value;
+        if (!get_varint(_block, _block_pos, delta) ||
+                !get_varint(_block, _block_pos, value) ||
+                (_block_left == 1 && _block_pos != _block.size())) {
+            throw khmer_file_exception("corrupt block in pmap file " +
+                                       _filename);
+        }
+        _last_tag += delta;
+        tag = _last_tag;
+        p = value;
+    } else {
+        memcpy(&tag, _block.data() + _block_pos, sizeof(HashIntoType));
+        _block_pos += sizeof(HashIntoType);
+        memcpy(&p, _block.data() + _block_pos, sizeof(PartitionID));
+        _block_pos += sizeof(PartitionID);
+    }
+
+    _block_left--;
+    _n_read++;
+
+    return true;
+}
+
+namespace
+{
+
+struct PmapRecord {
+    HashIntoType tag;
+    size_t file;
+    PartitionID p;
+
+    bool operator>(const PmapRecord& other) const
+    {
+        return tag > other.tag || (tag == other.tag && file > other.file);
+    }
+};
+
+// PmapMergeQueue hands out the records of several sorted partition map
+// files in tag order.
+
+class PmapMergeQueue
+{
+public:
+    PmapMergeQueue(const std::vector<std::string>& infiles, WordLength ksize)
+    {
+        try {
+            for (size_t i = 0; i < infiles.size(); i++) {
+                _readers.push_back(new PmapReader(infiles[i], ksize));
+                _refill(i);
+            }
+        } catch (...) {
+            _delete_readers();
+            throw;
+        }
+    }
+
+    ~PmapMergeQueue()
+    {
+        _delete_readers();
+    }
+
+    bool next(PmapRecord& record)
+    {
+        if (_heap.empty()) {
+            return false;
+        }
+        record = _heap.top();
+        _heap.pop();
+        _refill(record.file);
+
+        return true;
+    }
+
+protected:
+    std::vector<PmapReader *> _readers;
+    std::vector<HashIntoType> _last_tags;
+    std::priority_queue<PmapRecord, std::vector<PmapRecord>,
+        std::greater<PmapRecord> > _heap;
+
+    void _refill(size_t file)
+    {
+        PmapRecord record;
+        record.file = file;
+        if (!_readers[file]->next(record.tag, record.p)) {
+            return;
+        }
+
+        if (_last_tags.size() <= file) {
+            _last_tags.resize(file + 1);
+        } else if (record.tag <= _last_tags[file]) {
+            throw khmer_file_exception("pmap file " +
+                                       _readers[file]->filename() +
+                                       " is not sorted by tag");
+        }
+        _last_tags[file] = record.tag;
+        _heap.push(record);
+    }
+
+    void _delete_readers()
+    {
+        for (size_t i = 0; i < _readers.size(); i++) {
+            delete _readers[i];
+        }
+        _readers.clear();
+    }
+};
+
+// The union-find used to join partitions across files: one node for each
+// (file, partition ID) pair.
+
+uint32_t _pmap_node(std::vector<PartitionNodeMap>& file_nodes,
+                    std::vector<uint32_t>& parent, const PmapRecord& record)
+{
+    PartitionNodeMap& nodes = file_nodes[record.file];
+    PartitionNodeMap::iterator ni = nodes.find(record.p);
+    if (ni != nodes.end()) {
+        return ni->second;
+    }
+
+    uint32_t node = parent.size();
+    if (node == 0xffffffff) {
+        throw khmer_exception("too many partitions to merge");
+    }
+    parent.push_back(node);
+    nodes[record.p] = node;
+
+    return node;
+}
+
+uint32_t _pmap_find_root(std::vector<uint32_t>& parent, uint32_t node)
+{
+    while (parent[node] != node) {
+        parent[node] = parent[parent[node]];
+        node = parent[node];
+    }
+    return node;
+}
+
+}
+
+void khmer::merge_pmap_files(
+    const std::vector<std::string>&	infiles,
+    const std::string&			outfile,
+    WordLength				ksize,
+    const KmerSet&			stop_tags)
+{
+    std::vector<PartitionNodeMap> file_nodes(infiles.size());
+    std::vector<uint32_t> parent;
+    unsigned long long n_tags = 0;
+    PmapRecord record;
+
+    // First pass: join the partitions that share each tag, and count tags.
+    {
+        PmapMergeQueue queue(infiles, ksize);
+        bool more = queue.next(record);
+        while (more) {
+            HashIntoType tag = record.tag;
+            bool skip = stop_tags.contains(tag);
+            uint32_t root = 0;
+
+            if (!skip) {
+                root = _pmap_find_root(parent,
+                                       _pmap_node(file_nodes, parent, record));
+                n_tags++;
+            }
+            while ((more = queue.next(record)) && record.tag == tag) {
+                if (skip) {
+                    continue;
+                }
+                uint32_t other = _pmap_find_root(parent,
+                                                 _pmap_node(file_nodes, parent,
+                                                         record));
+                if (other < root) {
+                    std::swap(root, other);
+                }
+                parent[other] = root;
+            }
+        }
+    }
+
+    // Second pass: write each tag out once, numbering the joined partitions
+    // in tag order.
+    std::vector<PartitionID> root_partition(parent.size(), 0);
+    PartitionID next_partition_id = 1;
+
+    PmapWriter writer(outfile, ksize, n_tags);
+    {
+        PmapMergeQueue queue(infiles, ksize);
+        bool more = queue.next(record);
+        while (more) {
+            HashIntoType tag = record.tag;
+            if (!stop_tags.contains(tag)) {
+                uint32_t root = _pmap_find_root(parent,
+                                                file_nodes[record.file][record.p]);
+                if (root_partition[root] == 0) {
+                    root_partition[root] = next_partition_id++;
+                }
+                writer.append(tag, root_partition[root]);
+            }
+            while ((more = queue.next(record)) && record.tag == tag) ;
+        }
+    }
+    writer.close();
+}
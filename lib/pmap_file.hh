@@ -0,0 +1,119 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef PMAP_FILE_HH
+#define PMAP_FILE_HH
+
+#include <stddef.h>
+#include <stdint.h>
+#include <fstream>
+#include <string>
+#include <vector>
+
+#include "khmer.hh"
+#include "kmer_set.hh"
+
+// records per compressed block in a packed partition map.
+#define PMAP_BLOCK_RECORDS 65536
+
+namespace khmer
+{
+
+// One entry in the block index of a packed partition map.
+struct PmapBlockInfo {
+    HashIntoType first_tag;
+    uint64_t offset;		// where the compressed block starts
+    uint32_t n_records;
+    uint32_t raw_size;		// size of the block before compression
+    uint32_t packed_size;
+};
+
+// PmapWriter saves (tag, partition ID) records, in increasing tag order,
+// as a packed partition map.  After the usual header comes an index of the
+// blocks; each block holds up to PMAP_BLOCK_RECORDS records, with the tags
+// stored as varint deltas from the previous tag and the partition IDs as
+// varints, and is then deflated.  The number of records has to be known up
+// front so that the index can be laid out ahead of the blocks.
+
+class PmapWriter
+{
+public:
+    PmapWriter(const std::string& filename, WordLength ksize,
+               unsigned long long n_records);
+    ~PmapWriter();
+
+    void append(HashIntoType tag, PartitionID p);
+    void close();
+
+protected:
+    std::string _filename;
+    std::ofstream _outfile;
+    unsigned long long _n_records;
+    unsigned long long _n_written;
+    std::streampos _index_pos;
+    std::vector<PmapBlockInfo> _index;
+
+    std::string _block;		// the encoded records of the current block
+    uint32_t _block_records;
+    HashIntoType _last_tag;
+
+    void _flush_block();
+    void _check_stream();
+};
+
+// PmapReader reads the records of a partition map back one at a time, from
+// either a packed partition map or the flat format written by earlier
+// versions of khmer.  Only one block of records is held in memory.
+
+class PmapReader
+{
+public:
+    PmapReader(const std::string& filename, WordLength ksize);
+
+    // Returns false once every record has been read.
+    bool next(HashIntoType& tag, PartitionID& p);
+
+    const std::string& filename() const
+    {
+        return _filename;
+    }
+    unsigned long long n_records() const
+    {
+        return _n_records;
+    }
+
+protected:
+    std::string _filename;
+    std::ifstream _infile;
+    bool _packed;
+    unsigned long long _n_records;
+    unsigned long long _n_read;
+
+    std::vector<PmapBlockInfo> _index;
+    size_t _next_block;
+
+    std::string _block;		// the records of the current block
+    size_t _block_pos;
+    uint32_t _block_left;	// records not yet read from the block
+    HashIntoType _last_tag;
+
+    void _read_header(WordLength ksize);
+    bool _load_block();
+    bool _load_flat_block();
+};
+
+// Merge partition map files, each sorted by tag, into one packed partition
+// map, joining partitions that share a tag.  Tags in 'stop_tags' are left
+// out, as SubsetPartition::merge_from_disk() leaves them out.  The inputs
+// are streamed twice, and memory use scales with the number of partitions
+// rather than the number of tags.
+void merge_pmap_files(const std::vector<std::string>& infiles,
+                      const std::string& outfile, WordLength ksize,
+                      const KmerSet& stop_tags);
+}
+
+#endif // PMAP_FILE_HH
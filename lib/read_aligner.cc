@@ -6,7 +6,6 @@
 #include <ctype.h>
 #include <algorithm>
 #include <limits>
-#include <map>
 #include <memory>
 #include <set>
 #include <utility>
@@ -51,17 +50,97 @@ static Nucl _ch_to_nucl(char base)
     return e;
 }
 
-struct del_alignment_node_t {
-    del_alignment_node_t& operator()(AlignmentNode* p)
-    {
-        delete p;
-        return *this;
+AlignmentNodeArena::~AlignmentNodeArena()
+{
+    for (size_t i = 0; i < _blocks.size(); i++) {
+        ::operator delete(_blocks[i]);
     }
-};
+}
+
+AlignmentNode* AlignmentNodeArena::alloc(const AlignmentNode& node)
+{
+    size_t block = _n_used / ALIGNMENT_ARENA_BLOCK_SIZE;
+    if (block == _blocks.size()) {
+        _blocks.push_back(static_cast<AlignmentNode*>(::operator new(
+                              sizeof(AlignmentNode) *
+                              ALIGNMENT_ARENA_BLOCK_SIZE)));
+    }
+    // nodes are plain data, so they are never destroyed.
+    AlignmentNode* p = _blocks[block] + _n_used % ALIGNMENT_ARENA_BLOCK_SIZE;
+    _n_used++;
+    return new (p) AlignmentNode(node);
+}
+
+static size_t _closed_slot(HashIntoType kmer, size_t seq_idx, State state,
+                           size_t mask)
+{
+    return _mix_hash(kmer ^ ((HashIntoType) seq_idx << 3 | state)) & mask;
+}
+
+AlignmentClosedSet::Entry& AlignmentClosedSet::get(const AlignmentNode& node)
+{
+    if (2 * (_n_entries + 1) > _slots.size()) {
+        _grow();
+    }
+
+    HashIntoType kmer = uniqify_rc(node.fwd_hash, node.rc_hash);
+    size_t mask = _slots.size() - 1;
+    size_t i = _closed_slot(kmer, node.seq_idx, node.state, mask);
+    while (_slots[i].generation == _generation) {
+        Entry& entry = _slots[i];
+        if (entry.kmer == kmer && entry.seq_idx == node.seq_idx &&
+                entry.state == node.state) {
+            return entry;
+        }
+        i = (i + 1) & mask;
+    }
+
+    Entry& entry = _slots[i];
+    entry.kmer = kmer;
+    entry.seq_idx = node.seq_idx;
+    entry.state = node.state;
+    entry.closed = false;
+    entry.times_closed = 0;
+    entry.generation = _generation;
+    entry.score = 0;
+    _n_entries++;
+    return entry;
+}
 
-del_alignment_node_t del_alignment_node()
+void AlignmentClosedSet::_grow()
 {
-    return del_alignment_node_t();
+    std::vector<Entry> old_slots;
+    old_slots.swap(_slots);
+
+    Entry free_slot;
+    free_slot.generation = 0;
+    _slots.resize(old_slots.empty() ? 1024 : 2 * old_slots.size(), free_slot);
+
+    size_t mask = _slots.size() - 1;
+    for (size_t j = 0; j < old_slots.size(); j++) {
+        const Entry& entry = old_slots[j];
+        if (entry.generation != _generation) {
+            continue;
+        }
+        size_t i = _closed_slot(entry.kmer, entry.seq_idx, entry.state, mask);
+        while (_slots[i].generation == _generation) {
+            i = (i + 1) & mask;
+        }
+        _slots[i] = entry;
+    }
+}
+
+void AlignmentClosedSet::clear()
+{
+    _n_entries = 0;
+    _generation++;
+    if (_generation == 0) {
+        // the generation has wrapped around; free every slot for real.
+        for (size_t i = 0; i < _slots.size(); i++) {
+            _slots[i].generation = 0;
+        }
+        _generation = 1;
+    }
 }
 
 /*
@@ -74,6 +153,14 @@ double GetNull(size_t length)
 }
 
 
+double AlignmentWorkspace::null_score(size_t length)
+{
+    while (null_scores.size() <= length) {
+        null_scores.push_back(GetNull(null_scores.size()));
+    }
+    return null_scores[length];
+}
+
 /*
   Turn two states in to a transition, or disallowed if the
   transition isn't modelled
@@ -154,8 +241,7 @@ Transition get_trans(State s1, State s2)
 }
 
 void ReadAligner::Enumerate(
-    NodeHeap& open,
-    std::vector<AlignmentNode*>& all_nodes,
+    AlignmentWorkspace& workspace,
     AlignmentNode* curr,
     bool forward,
     const std::string& seq
@@ -170,8 +256,6 @@ void ReadAligner::Enumerate(
     HashIntoType rc = curr->rc_hash;
     HashIntoType next_fwd, next_rc;
 
-    AlignmentNode* next;
-
     if (forward) {
         next_seq_idx = curr->seq_idx + 1;
         remaining = seq.size() - next_seq_idx;
@@ -244,37 +328,34 @@ void ReadAligner::Enumerate(
                 sc = background_prob;
             }
 
+            AlignmentNode next(curr, (Nucl)i, next_seq_idx,
+                               (State)next_state, trans, next_fwd, next_rc,
+                               curr->length + 1);
             if(next_state == MATCH || next_state == MATCH_UNTRUSTED) {
-                next = new AlignmentNode(curr, (Nucl)i,
-                                         next_seq_idx, (State)next_state, trans,
-                                         next_fwd, next_rc, curr->length + 1);
-                next->num_indels = curr->num_indels;
+                next.num_indels = curr->num_indels;
             } else if(next_state == INSERT_READ || next_state == INSERT_READ_UNTRUSTED) {
-                next = new AlignmentNode(curr, (Nucl)i,
-                                         next_seq_idx, (State)next_state, trans,
-                                         curr->fwd_hash, curr->rc_hash,
-                                         curr->length + 1);
-                next->num_indels = curr->num_indels + 1;
+                next.fwd_hash = curr->fwd_hash;
+                next.rc_hash = curr->rc_hash;
+                next.num_indels = curr->num_indels + 1;
             } else if(next_state == INSERT_GRAPH || next_state == INSERT_GRAPH_UNTRUSTED) {
-                next = new AlignmentNode(curr, (Nucl)i,
-                                         curr->seq_idx, (State)next_state, trans,
-                                         next_fwd, next_rc, curr->length);
-                next->num_indels = curr->num_indels + 1;
+                next.seq_idx = curr->seq_idx;
+                next.length = curr->length;
+                next.num_indels = curr->num_indels + 1;
             }
 
-            next->score = curr->score + sc + m_sm.tsc[trans];
-            next->trusted = (kmerCov >= m_trusted_cutoff);
-            next->cov = kmerCov;
-            next->h_score = hcost;
-            next->f_score = next->score + next->h_score;
+            next.score = curr->score + sc + m_sm.tsc[trans];
+            next.trusted = (kmerCov >= m_trusted_cutoff);
+            next.cov = kmerCov;
+            next.h_score = hcost;
+            next.f_score = next.score + next.h_score;
 
             // TODO(fishjord) make max indels tunable)
-            if (next->num_indels < 3
-                    && next->score - GetNull(next->length) > next->length * m_bits_theta) {
-                open.push(next);
-                all_nodes.push_back(next);
-            } else {
-                delete next;
+            if (next.num_indels < 3
+                    && next.score - workspace.null_score(next.length) >
+                    next.length * m_bits_theta) {
+                workspace.open.push_back(workspace.nodes.alloc(next));
+                std::push_heap(workspace.open.begin(), workspace.open.end(),
+                               AlignmentNodeCompare());
             }
         }
     }
@@ -298,24 +379,25 @@ void ReadAligner::WriteNode(AlignmentNode* curr)
 }
 #endif
 
-Alignment* ReadAligner::Subalign(AlignmentNode* start_vert,
+Alignment* ReadAligner::Subalign(AlignmentWorkspace& workspace,
+                                 AlignmentNode* start_vert,
                                  size_t seqLen,
                                  bool forward,
                                  const std::string& seq)
 {
-    std::vector<AlignmentNode*> all_nodes;
-    NodeHeap open;
-    std::map<AlignmentNode, unsigned int> closed;
-    open.push(start_vert);
+    std::vector<AlignmentNode*>& open = workspace.open;
+    workspace.nodes.clear();
+    workspace.closed.clear();
+    open.clear();
+    open.push_back(start_vert);
 
     AlignmentNode* curr = NULL;
     AlignmentNode* best = NULL;
-    std::map<AlignmentNode, unsigned int>::iterator tmp;
 
     unsigned int times_closed = 0;
 
     while (!open.empty()) {
-        curr = open.top();
+        curr = open.front();
 
 #if READ_ALIGNER_DEBUG
         WriteNode(curr);
@@ -326,11 +408,12 @@ Alignment* ReadAligner::Subalign(AlignmentNode* start_vert,
             WriteNode(curr->prev);
         }
 #endif
-        open.pop();
+        std::pop_heap(open.begin(), open.end(), AlignmentNodeCompare());
+        open.pop_back();
 
         if(best == NULL ||
-                (best->score - GetNull(best->length) <
-                 curr->score - GetNull(curr->length))) {
+                (best->score - workspace.null_score(best->length) <
+                 curr->score - workspace.null_score(curr->length))) {
             best = curr;
         }
 
@@ -340,16 +423,16 @@ Alignment* ReadAligner::Subalign(AlignmentNode* start_vert,
             break;
         }
 
-        tmp = closed.find(*curr);
-        if(tmp == closed.end()) {  //Hasn't been closed yet
+        AlignmentClosedSet::Entry& closed = workspace.closed.get(*curr);
+        if(!closed.closed) {  //Hasn't been closed yet
             //do nothing
             times_closed = 0;
-        } else if (tmp->first.score > curr->score) { //Better than what we've closed
-            times_closed = tmp->second;
-            closed.erase(tmp);
-        } else if (tmp->first.score == curr->score) { //Same as what we've closed
-            times_closed = tmp->second;
-            closed.erase(tmp);
+        } else if (closed.score > curr->score) { //Better than what we've closed
+            times_closed = closed.times_closed;
+            closed.closed = false;
+        } else if (closed.score == curr->score) { //Same as what we've closed
+            times_closed = closed.times_closed;
+            closed.closed = false;
         } else {
             continue;
         }
@@ -358,15 +441,14 @@ Alignment* ReadAligner::Subalign(AlignmentNode* start_vert,
             continue;
         }
 
-        closed[*curr] = times_closed + 1;
+        closed.closed = true;
+        closed.score = curr->score;
+        closed.times_closed = times_closed + 1;
 
-        Enumerate(open, all_nodes, curr, forward, seq);
+        Enumerate(workspace, curr, forward, seq);
     }
 
-    Alignment* ret = ExtractAlignment(best, forward, seq);
-    std::for_each(all_nodes.begin(), all_nodes.end(), del_alignment_node());
-
-    return ret;
+    return ExtractAlignment(best, forward, seq);
 }
 
 Alignment* ReadAligner::ExtractAlignment(AlignmentNode* node,
@@ -476,6 +558,52 @@ struct SearchStart {
 };
 
 Alignment* ReadAligner::Align(const std::string& read)
+{
+    return Align(read, m_workspace);
+}
+
+Alignment* ReadAligner::AlignForward(const std::string& read)
+{
+    return AlignForward(read, m_workspace);
+}
+
+void ReadAligner::AlignMany(const std::vector<std::string>& reads,
+                            std::vector<Alignment*>& alignments,
+                            unsigned int n_threads)
+{
+    long n_reads = reads.size();
+    alignments.assign(n_reads, NULL);
+    DeferredException error;
+
+    #pragma omp parallel num_threads(n_threads)
+    {
+        AlignmentWorkspace workspace;
+
+        #pragma omp for schedule(dynamic, 16)
+        for (long i = 0; i < n_reads; ++i) {
+            if (error.is_set()) {
+                continue;
+            }
+            try {
+                alignments[i] = Align(reads[i], workspace);
+            } catch (...) {
+                error.capture();
+            }
+        }
+    }
+
+    if (error.is_set()) {
+        // don't hand back a partial result.
+        for (long i = 0; i < n_reads; ++i) {
+            delete alignments[i];
+        }
+        alignments.clear();
+        error.rethrow();
+    }
+}
+
+Alignment* ReadAligner::Align(const std::string& read,
+                              AlignmentWorkspace& workspace)
 {
     WordLength k = m_ch->ksize();
     size_t num_kmers = read.length() - k + 1;
@@ -527,11 +655,11 @@ Alignment* ReadAligner::Align(const std::string& read)
         startingNode.score = k * m_sm.untrusted_match + k * m_sm.tsc[MM];
     }
 
-    forward = Subalign(&startingNode, read.length(), true, read);
+    forward = Subalign(workspace, &startingNode, read.length(), true, read);
     final_length = forward->read_alignment.length() + k;
 
     startingNode.seq_idx = start.kmer_idx;
-    reverse = Subalign(&startingNode, read.length(), false, read);
+    reverse = Subalign(workspace, &startingNode, read.length(), false, read);
     final_length += reverse->read_alignment.length();
 
     Alignment* ret = new Alignment;
@@ -563,7 +691,8 @@ Alignment* ReadAligner::Align(const std::string& read)
     return ret;
 }
 
-Alignment* ReadAligner::AlignForward(const std::string& read)
+Alignment* ReadAligner::AlignForward(const std::string& read,
+                                     AlignmentWorkspace& workspace)
 {
     WordLength k = m_ch->ksize();
 
@@ -604,7 +733,7 @@ Alignment* ReadAligner::AlignForward(const std::string& read)
         startingNode.score = k * m_sm.untrusted_match + k * m_sm.tsc[MM];
     }
 
-    forward = Subalign(&startingNode, read.length(), true, read);
+    forward = Subalign(workspace, &startingNode, read.length(), true, read);
     final_length = forward->read_alignment.length() + k;
 
     Alignment* ret = new Alignment;
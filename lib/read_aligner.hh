@@ -12,6 +12,7 @@
 #include <algorithm>
 #include <limits>
 #include <memory>
+#include <new>
 #include <queue>
 #include <set>
 #include <string>
@@ -23,6 +24,9 @@
 
 #define READ_ALIGNER_DEBUG 0
 
+// nodes allocated at a time by an AlignmentNodeArena.
+#define ALIGNMENT_ARENA_BLOCK_SIZE 4096
+
 namespace khmer
 {
 
@@ -148,6 +152,73 @@ typedef std::priority_queue<AlignmentNode*,
         std::vector<AlignmentNode*>,
         AlignmentNodeCompare> NodeHeap;
 
+// Nodes for the searches of a ReadAligner, allocated a block at a time.
+// clear() frees every node at once, but keeps the blocks for the next
+// search to reuse.
+class AlignmentNodeArena
+{
+public:
+    AlignmentNodeArena() : _n_used(0) { }
+    ~AlignmentNodeArena();
+
+    AlignmentNode* alloc(const AlignmentNode& node);
+
+    void clear()
+    {
+        _n_used = 0;
+    }
+
+protected:
+    std::vector<AlignmentNode*> _blocks;
+    size_t _n_used;		// nodes handed out from _blocks
+
+private:
+    AlignmentNodeArena(const AlignmentNodeArena&);
+    AlignmentNodeArena& operator=(const AlignmentNodeArena&);
+};
+
+// The closed set of a search: for each (seq_idx, state, k-mer) closed, the
+// score it was last closed with and how many times it has been. This is an
+// open-addressing hash table; clear() empties it by moving on to a new
+// generation, without touching the slots.
+class AlignmentClosedSet
+{
+public:
+    struct Entry {
+        HashIntoType kmer;	// canonical hash
+        size_t seq_idx;
+        State state;
+        bool closed;
+        unsigned int times_closed;
+        unsigned int generation;	// the slot is free if not current
+        double score;
+    };
+
+    AlignmentClosedSet() : _n_entries(0), _generation(1) { }
+
+    // The entry for node, added unclosed if there was none.
+    Entry& get(const AlignmentNode& node);
+
+    void clear();
+
+protected:
+    std::vector<Entry> _slots;	// empty, or a power of two in size
+    size_t _n_entries;
+    unsigned int _generation;
+
+    void _grow();
+};
+
+// Scratch space for one alignment at a time, reused from read to read.
+struct AlignmentWorkspace {
+    AlignmentNodeArena nodes;
+    std::vector<AlignmentNode*> open;	// a heap, as NodeHeap keeps it
+    AlignmentClosedSet closed;
+    std::vector<double> null_scores;	// GetNull() of each length so far
+
+    double null_score(size_t length);
+};
+
 struct ScoringMatrix {
     const double trusted_match;
     const double trusted_mismatch;
@@ -182,9 +253,10 @@ private:
     Alignment* ExtractAlignment(AlignmentNode*,
                                 bool forward, const std::string&);
 
-    void Enumerate(NodeHeap&, std::vector<AlignmentNode*>& all_nodes,
-                   AlignmentNode*, bool, const std::string&);
-    Alignment* Subalign(AlignmentNode*, size_t, bool, const std::string&);
+    void Enumerate(AlignmentWorkspace&, AlignmentNode*, bool,
+                   const std::string&);
+    Alignment* Subalign(AlignmentWorkspace&, AlignmentNode*, size_t, bool,
+                        const std::string&);
 
 #if READ_ALIGNER_DEBUG
     void WriteNode(AlignmentNode* curr);
@@ -201,6 +273,8 @@ private:
     size_t m_trusted_cutoff;
     double m_bits_theta;
 
+    AlignmentWorkspace m_workspace;	// for Align() and AlignForward()
+
     HashIntoType comp_bitmask(WordLength k)
     {
         HashIntoType ret = 0;
@@ -213,6 +287,17 @@ public:
     Alignment* Align(const std::string&);
     Alignment* AlignForward(const std::string&);
 
+    // As above, with the scratch space given, so that a ReadAligner can
+    // align reads on several threads at once, with a workspace each.
+    Alignment* Align(const std::string&, AlignmentWorkspace&);
+    Alignment* AlignForward(const std::string&, AlignmentWorkspace&);
+
+    // Align each of reads on n_threads threads; alignments[i] is the
+    // alignment of reads[i], for the caller to delete.
+    void AlignMany(const std::vector<std::string>& reads,
+                   std::vector<Alignment*>& alignments,
+                   unsigned int n_threads);
+
     ReadAligner(khmer::CountingHash* ch,
                 BoundedCounterType trusted_cutoff, double bits_theta)
         : bitmask(comp_bitmask(ch->ksize())),
@@ -247,6 +332,16 @@ public:
 
     ScoringMatrix getScoringMatrix();
 
+    WordLength ksize() const
+    {
+        return m_ch->ksize();
+    }
+
+    khmer::CountingHash* graph() const
+    {
+        return m_ch;
+    }
+
 };
 }
 #endif // READ_ALIGNER_HH
@@ -0,0 +1,252 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#include <errno.h>
+#include <stdio.h>
+#include <string.h>
+
+#include "khmer_exception.hh"
+#include "read_buffer.hh"
+#include "varint.hh"
+
+using namespace khmer;
+using namespace khmer::read_parsers;
+
+ReadBuffer::ReadBuffer(size_t memory_limit, const std::string& spill_filename)
+    : _memory_limit(memory_limit), _spill_filename(spill_filename),
+      _n_reads(0), _n_spilled(0), _reading(false), _next_block(0),
+      _current(NULL), _pos(0)
+{
+}
+
+ReadBuffer::~ReadBuffer()
+{
+    if (_spill_out.is_open()) {
+        _spill_out.close();
+        _spill_in.close();
+        remove(_spill_filename.c_str());
+    }
+}
+
+// Each read is encoded as: group, name length, name, sequence length, a
+// flag byte (1 if the read has a quality string), the packed bases, the
+// number of exceptions and, for each, its offset from the previous one and
+// the character, then the quality string.  All numbers are varints.
+
+void ReadBuffer::append(const Read& read, bool has_quality, unsigned int group)
+{
+    if (_reading) {
+        throw khmer_exception("Cannot add reads to a ReadBuffer while it is "
+                              "being read");
+    }
+
+    const std::string& seq = read.sequence;
+    size_t length = seq.length();
+    if (has_quality && read.quality.length() != length) {
+        throw khmer_value_exception("Read " + read.name + " has a quality "
+                                    "string of the wrong length");
+    }
+
+    put_varint(_records, group);
+    put_varint(_records, read.name.length());
+    _records.append(read.name);
+    put_varint(_records, length);
+    _records.push_back((char) has_quality);
+
+    size_t packed_at = _records.size();
+    size_t n_exceptions = 0;
+    _records.resize(packed_at + (length + 3) / 4, '\0');
+    for (size_t i = 0; i < length; ++i) {
+        unsigned char code;
+        switch (seq[i]) {
+        case 'A':
+            code = 0;
+            break;
+        case 'C':
+            code = 1;
+            break;
+        case 'G':
+            code = 2;
+            break;
+        case 'T':
+            code = 3;
+            break;
+        default:
+            code = 0;
+            n_exceptions++;
+        }
+        _records[packed_at + (i >> 2)] |= code << ((i & 3) * 2);
+    }
+
+    put_varint(_records, n_exceptions);
+    size_t last = 0;
+    for (size_t i = 0; n_exceptions > 0 && i < length; ++i) {
+        char c = seq[i];
+        if (c != 'A' && c != 'C' && c != 'G' && c != 'T') {
+            put_varint(_records, i - last);
+            _records.push_back(c);
+            last = i;
+            n_exceptions--;
+        }
+    }
+
+    if (has_quality) {
+        _records.append(read.quality);
+    }
+
+    _n_reads++;
+    if (_records.size() >= _memory_limit) {
+        _spill();
+    }
+}
+
+void ReadBuffer::_spill()
+{
+    if (!_spill_out.is_open()) {
+        _spill_out.open(_spill_filename.c_str(),
+                        std::ios::binary | std::ios::trunc);
+        if (!_spill_out.is_open()) {
+            throw khmer_file_exception("Cannot open spill file " +
+                                       _spill_filename + ": " +
+                                       strerror(errno));
+        }
+    }
+
+    _spill_out.write(_records.data(), _records.size());
+    if (_spill_out.fail()) {
+        throw khmer_file_exception("Cannot write to spill file " +
+                                   _spill_filename + ": " + strerror(errno));
+    }
+    _spilled_blocks.push_back(_records.size());
+    // every read not yet spilled is in this block.
+    _n_spilled = _n_reads;
+    _records.clear();
+}
+
+void ReadBuffer::rewind()
+{
+    if (!_spilled_blocks.empty()) {
+        _spill_out.flush();
+        _spill_in.close();
+        _spill_in.clear();
+        _spill_in.open(_spill_filename.c_str(), std::ios::binary);
+        if (!_spill_in.is_open()) {
+            throw khmer_file_exception("Cannot open spill file " +
+                                       _spill_filename + ": " +
+                                       strerror(errno));
+        }
+    }
+
+    _reading = true;
+    _next_block = 0;
+    _current = NULL;
+    _pos = 0;
+}
+
+bool ReadBuffer::_load_block()
+{
+    if (_next_block >= _spilled_blocks.size()) {
+        return false;
+    }
+
+    _block.resize(_spilled_blocks[_next_block++]);
+    _spill_in.read(&_block[0], _block.size());
+    if (_spill_in.fail()) {
+        throw khmer_file_exception("Cannot read spill file " +
+                                   _spill_filename);
+    }
+    _current = &_block;
+    _pos = 0;
+    return true;
+}
+
+void ReadBuffer::_corrupt() const
+{
+    throw khmer_file_exception("Corrupt read in spill file " +
+                               _spill_filename);
+}
+
+bool ReadBuffer::next(Read& read, bool& has_quality, unsigned int& group)
+{
+    if (!_reading) {
+        return false;
+    }
+
+    while (_current == NULL || _pos >= _current->size()) {
+        if (_current == &_records) {
+            _reading = false;
+            _spill_in.close();
+            std::string().swap(_block);
+            return false;
+        }
+        if (!_load_block()) {
+            _current = &_records;
+            _pos = 0;
+        }
+    }
+
+    _decode(*_current, read, has_quality, group);
+    return true;
+}
+
+void ReadBuffer::_decode(const std::string& buf, Read& read,
+                         bool& has_quality, unsigned int& group)
+{
+    uint64_t value, length, n_exceptions;
+
+    if (!get_varint(buf, _pos, value)) {
+        _corrupt();
+    }
+    group = (unsigned int) value;
+
+    if (!get_varint(buf, _pos, length) || length > buf.size() - _pos) {
+        _corrupt();
+    }
+    read.name.assign(buf, _pos, length);
+    _pos += length;
+
+    if (!get_varint(buf, _pos, length) || length / 4 > buf.size() ||
+            _pos >= buf.size()) {
+        _corrupt();
+    }
+    has_quality = buf[_pos++];
+
+    size_t n_packed = (length + 3) / 4;
+    if (n_packed > buf.size() - _pos) {
+        _corrupt();
+    }
+    static const char bases[] = "ACGT";
+    const unsigned char * packed = (const unsigned char *) buf.data() + _pos;
+    read.sequence.resize(length);
+    for (size_t i = 0; i < length; ++i) {
+        read.sequence[i] = bases[(packed[i >> 2] >> ((i & 3) * 2)) & 3];
+    }
+    _pos += n_packed;
+
+    if (!get_varint(buf, _pos, n_exceptions)) {
+        _corrupt();
+    }
+    size_t last = 0;
+    for (uint64_t i = 0; i < n_exceptions; ++i) {
+        if (!get_varint(buf, _pos, value) || _pos >= buf.size() ||
+                last + value >= length) {
+            _corrupt();
+        }
+        last += value;
+        read.sequence[last] = buf[_pos++];
+    }
+
+    if (has_quality) {
+        if (length > buf.size() - _pos) {
+            _corrupt();
+        }
+        read.quality.assign(buf, _pos, length);
+        _pos += length;
+    } else {
+        read.quality.clear();
+    }
+}
@@ -0,0 +1,88 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef READ_BUFFER_HH
+#define READ_BUFFER_HH
+
+#include <stddef.h>
+#include <stdint.h>
+#include <fstream>
+#include <string>
+#include <vector>
+
+#include "read_parsers.hh"
+
+// bytes of encoded reads a ReadBuffer keeps in memory by default.
+#define DEFAULT_READ_BUFFER_MEMORY 1000000000
+
+namespace khmer
+{
+
+// ReadBuffer holds reads set aside for a later pass, in the order they were
+// added, along with a small group number (e.g. the input file a read came
+// from).  Bases are packed four to a byte, with any character other than
+// A, C, G or T kept in a list of exceptions, and quality strings are kept
+// as they are.  Once the encoded reads take up more than the memory limit
+// they are appended to a spill file as one block, so that at most about
+// twice the limit is held in memory while the reads are read back.
+//
+// Reads are read back with rewind() and next(); reads can't be added
+// while the buffer is being read.
+
+class ReadBuffer
+{
+public:
+    ReadBuffer(size_t memory_limit, const std::string& spill_filename);
+    ~ReadBuffer();
+
+    void append(const read_parsers::Read& read, bool has_quality,
+                unsigned int group = 0);
+
+    void rewind();
+    // Returns false, and ends the read, once every read has been returned.
+    bool next(read_parsers::Read& read, bool& has_quality,
+              unsigned int& group);
+
+    unsigned long long size() const
+    {
+        return _n_reads;
+    }
+    unsigned long long n_spilled() const
+    {
+        return _n_spilled;
+    }
+    size_t memory_used() const
+    {
+        return _records.size();
+    }
+
+protected:
+    size_t _memory_limit;
+    std::string _spill_filename;
+    std::ofstream _spill_out;
+    std::ifstream _spill_in;
+    std::vector<size_t> _spilled_blocks;	// sizes of the spilled blocks
+    unsigned long long _n_reads;
+    unsigned long long _n_spilled;
+
+    std::string _records;		// encoded reads not yet spilled
+
+    bool _reading;
+    size_t _next_block;
+    std::string _block;			// the spilled block being read
+    const std::string * _current;	// _block, or _records after the last
+    size_t _pos;			// position in *_current
+
+    void _spill();
+    bool _load_block();
+    void _corrupt() const;
+    void _decode(const std::string& buf, read_parsers::Read& read,
+                 bool& has_quality, unsigned int& group);
+};
+}
+
+#endif // READ_BUFFER_HH
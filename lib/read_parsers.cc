@@ -8,10 +8,26 @@
 #include <seqan/seq_io.h> // IWYU pragma: keep
 #include <seqan/sequence.h> // IWYU pragma: keep
 #include <seqan/stream.h> // IWYU pragma: keep
+#include <pthread.h>
+#include <stdio.h>
+#include <string.h>
 #include <fstream>
+#include <streambuf>
 
+#include "bzlib.h"
 #include "khmer_exception.hh"
 #include "read_parsers.hh"
+#include "zlib.h"
+
+// Decompressed input is passed from the read-ahead thread to the parser in
+// a ring of READ_AHEAD_N_BUFFERS buffers of READ_AHEAD_BUFFER_SIZE bytes.
+#define READ_AHEAD_BUFFER_SIZE (4 * 1024 * 1024)
+#define READ_AHEAD_N_BUFFERS 4
+
+// A BGZF block holds at most 64 KiB of data, so a buffer always has room for
+// this many blocks.
+#define BGZF_MAX_BLOCK_SIZE 65536
+#define BGZF_BLOCKS_PER_BUFFER (READ_AHEAD_BUFFER_SIZE / BGZF_MAX_BLOCK_SIZE)
 
 namespace khmer
 {
@@ -20,31 +36,641 @@ namespace khmer
 namespace read_parsers
 {
 
+//
+// ReadAheadBuffer: a std::streambuf over a gzip or bzip2 file, which is
+// decompressed on a thread of its own into a ring of large buffers while
+// the parser works through the previous ones. BGZF files (block gzip, as
+// written by bgzip and samtools) are inflated a buffer's worth of blocks at
+// a time, with the blocks inflated in parallel.
+//
+
+class ReadAheadBuffer : public std::streambuf
+{
+public:
+    enum Compression {
+        GZIP,
+        BGZF,
+        BZIP2
+    };
+
+    ReadAheadBuffer(const std::string &filename, Compression compression);
+    ~ReadAheadBuffer();
+
+    // Is filename compressed, and how? Plain files are left to SeqAn.
+    static bool detect(const std::string &filename, Compression &compression);
+
+    // Error met by the read-ahead thread, if any; set once the data runs out.
+    std::string error();
+
+protected:
+    int_type underflow();
+    pos_type seekoff(off_type off, std::ios_base::seekdir dir,
+                     std::ios_base::openmode which);
+
+private:
+    struct Slot {
+        std::vector<char> data;
+        size_t length;
+    };
+
+    std::string _filename;
+    Compression _compression;
+
+    Slot _slots[READ_AHEAD_N_BUFFERS];
+    size_t _n_full;         // includes the slot being read, if any
+    size_t _next_fill;
+    size_t _next_read;
+    bool _reading;
+    unsigned long long _consumed;
+
+    bool _done;
+    bool _cancel;
+    std::string _error;
+
+    pthread_mutex_t _lock;
+    pthread_cond_t _filled;
+    pthread_cond_t _emptied;
+    pthread_t _thread;
+
+    static void * _run(void * self);
+
+    // Producer side: wait for an empty slot, NULL if cancelled; hand it over
+    // once filled; and say that there's no more.
+    Slot * _get_empty_slot();
+    void _put_full_slot(size_t length);
+    void _finish(const std::string &error);
+
+    void _decompress_gzip();
+    void _decompress_bgzf();
+    void _decompress_bzip2();
+};
+
+ReadAheadBuffer::ReadAheadBuffer(const std::string &filename,
+                                 Compression compression)
+    : _filename(filename), _compression(compression), _n_full(0),
+      _next_fill(0), _next_read(0), _reading(false), _consumed(0),
+      _done(false), _cancel(false)
+{
+    for (size_t i = 0; i < READ_AHEAD_N_BUFFERS; i++) {
+        _slots[i].data.resize(READ_AHEAD_BUFFER_SIZE);
+        _slots[i].length = 0;
+    }
+    setg(NULL, NULL, NULL);
+
+    pthread_mutex_init(&_lock, NULL);
+    pthread_cond_init(&_filled, NULL);
+    pthread_cond_init(&_emptied, NULL);
+    if (pthread_create(&_thread, NULL, _run, this)) {
+        throw khmer_exception("Could not start read-ahead thread");
+    }
+}
+
+ReadAheadBuffer::~ReadAheadBuffer()
+{
+    pthread_mutex_lock(&_lock);
+    _cancel = true;
+    pthread_cond_broadcast(&_emptied);
+    pthread_mutex_unlock(&_lock);
+
+    pthread_join(_thread, NULL);
+
+    pthread_cond_destroy(&_emptied);
+    pthread_cond_destroy(&_filled);
+    pthread_mutex_destroy(&_lock);
+}
+
+bool ReadAheadBuffer::detect(const std::string &filename,
+                             Compression &compression)
+{
+    if (filename == "-") {
+        return false;
+    }
+
+    FILE * fp = fopen(filename.c_str(), "rb");
+    if (fp == NULL) {
+        return false;
+    }
+    unsigned char magic[14];
+    size_t n = fread(magic, 1, sizeof(magic), fp);
+    fclose(fp);
+
+    if (n >= 3 && magic[0] == 0x1f && magic[1] == 0x8b && magic[2] == 8) {
+        // FEXTRA set, with a 'BC' subfield first: BGZF.
+        if (n == sizeof(magic) && (magic[3] & 4) &&
+                magic[12] == 'B' && magic[13] == 'C') {
+            compression = BGZF;
+        } else {
+            compression = GZIP;
+        }
+        return true;
+    } else if (n >= 3 && magic[0] == 'B' && magic[1] == 'Z' &&
+               magic[2] == 'h') {
+        compression = BZIP2;
+        return true;
+    }
+    return false;
+}
+
+std::string ReadAheadBuffer::error()
+{
+    pthread_mutex_lock(&_lock);
+    std::string error = _error;
+    pthread_mutex_unlock(&_lock);
+    return error;
+}
+
+ReadAheadBuffer::int_type ReadAheadBuffer::underflow()
+{
+    pthread_mutex_lock(&_lock);
+    if (_reading) {
+        _consumed += _slots[_next_read].length;
+        _next_read = (_next_read + 1) % READ_AHEAD_N_BUFFERS;
+        _n_full--;
+        _reading = false;
+        pthread_cond_signal(&_emptied);
+    }
+    while (_n_full == 0 && !_done) {
+        pthread_cond_wait(&_filled, &_lock);
+    }
+    if (_n_full == 0) {
+        pthread_mutex_unlock(&_lock);
+        setg(NULL, NULL, NULL);
+        return traits_type::eof();
+    }
+    Slot &slot = _slots[_next_read];
+    _reading = true;
+    pthread_mutex_unlock(&_lock);
+
+    setg(&slot.data[0], &slot.data[0], &slot.data[0] + slot.length);
+    return traits_type::to_int_type(*gptr());
+}
+
+ReadAheadBuffer::pos_type ReadAheadBuffer::seekoff(
+    off_type off, std::ios_base::seekdir dir, std::ios_base::openmode which)
+{
+    // only telling the position is supported.
+    if (off != 0 || dir != std::ios_base::cur) {
+        return pos_type(off_type(-1));
+    }
+    return pos_type(off_type(_consumed + (gptr() - eback())));
+}
+
+void * ReadAheadBuffer::_run(void * self)
+{
+    ReadAheadBuffer * buf = (ReadAheadBuffer *) self;
+
+    switch (buf->_compression) {
+    case GZIP:
+        buf->_decompress_gzip();
+        break;
+    case BGZF:
+        buf->_decompress_bgzf();
+        break;
+    case BZIP2:
+        buf->_decompress_bzip2();
+        break;
+    }
+    return NULL;
+}
+
+ReadAheadBuffer::Slot * ReadAheadBuffer::_get_empty_slot()
+{
+    pthread_mutex_lock(&_lock);
+    while (_n_full == READ_AHEAD_N_BUFFERS && !_cancel) {
+        pthread_cond_wait(&_emptied, &_lock);
+    }
+    Slot * slot = _cancel ? NULL : &_slots[_next_fill];
+    pthread_mutex_unlock(&_lock);
+    return slot;
+}
+
+void ReadAheadBuffer::_put_full_slot(size_t length)
+{
+    if (length == 0) {
+        return;
+    }
+    pthread_mutex_lock(&_lock);
+    _slots[_next_fill].length = length;
+    _next_fill = (_next_fill + 1) % READ_AHEAD_N_BUFFERS;
+    _n_full++;
+    pthread_cond_signal(&_filled);
+    pthread_mutex_unlock(&_lock);
+}
+
+void ReadAheadBuffer::_finish(const std::string &error)
+{
+    pthread_mutex_lock(&_lock);
+    _done = true;
+    _error = error;
+    pthread_cond_broadcast(&_filled);
+    pthread_mutex_unlock(&_lock);
+}
+
+void ReadAheadBuffer::_decompress_gzip()
+{
+    gzFile infile = gzopen(_filename.c_str(), "rb");
+    if (infile == Z_NULL) {
+        _finish("Could not open " + _filename + " for reading.");
+        return;
+    }
+    gzbuffer(infile, 256 * 1024);
+
+    std::string error;
+    bool at_end = false;
+    Slot * slot;
+    while (!at_end && (slot = _get_empty_slot()) != NULL) {
+        size_t length = 0;
+        while (length < READ_AHEAD_BUFFER_SIZE) {
+            int n = gzread(infile, &slot->data[length],
+                           READ_AHEAD_BUFFER_SIZE - length);
+            if (n <= 0) {
+                int errnum = Z_OK;
+                const char * msg = gzerror(infile, &errnum);
+                if (n < 0 || errnum != Z_OK) {
+                    error = "Error decompressing " + _filename + ": " + msg;
+                }
+                at_end = true;
+                break;
+            }
+            length += n;
+        }
+        _put_full_slot(length);
+    }
+
+    gzclose(infile);
+    _finish(error);
+}
+
+// Read the BGZF block at the current position of fp into block, holding
+// its deflated data followed by the CRC32 and size trailer. Returns 1 for a
+// block, 0 at the end of the file, and -1 for anything else.
+static int read_bgzf_block(FILE * fp, std::vector<unsigned char> &block)
+{
+    unsigned char header[12];
+    size_t n = fread(header, 1, sizeof(header), fp);
+    if (n == 0 && feof(fp)) {
+        return 0;
+    }
+    if (n != sizeof(header) || header[0] != 0x1f || header[1] != 0x8b ||
+            header[2] != 8 || !(header[3] & 4)) {
+        return -1;
+    }
+
+    size_t xlen = header[10] | (header[11] << 8);
+    std::vector<unsigned char> extra(xlen);
+    if (fread(&extra[0], 1, xlen, fp) != xlen) {
+        return -1;
+    }
+
+    // find the 'BC' subfield, which holds the total block size - 1.
+    size_t block_size = 0;
+    for (size_t i = 0; i + 4 <= xlen; ) {
+        size_t slen = extra[i + 2] | (extra[i + 3] << 8);
+        if (extra[i] == 'B' && extra[i + 1] == 'C' && slen == 2 &&
+                i + 6 <= xlen) {
+            block_size = (extra[i + 4] | (extra[i + 5] << 8)) + 1;
+            break;
+        }
+        i += 4 + slen;
+    }
+    if (block_size < sizeof(header) + xlen + 8) {
+        return -1;
+    }
+
+    block.resize(block_size - sizeof(header) - xlen);
+    if (fread(&block[0], 1, block.size(), fp) != block.size()) {
+        return -1;
+    }
+    return 1;
+}
+
+static uint32_t read_le32(const unsigned char * p)
+{
+    return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t) p[3] << 24);
+}
+
+// Inflate a block read by read_bgzf_block() into out, which has room for
+// its uncompressed size. Returns false if the block is corrupt.
+static bool inflate_bgzf_block(std::vector<unsigned char> &block,
+                               unsigned char * out)
+{
+    size_t cdata_len = block.size() - 8;
+    uint32_t crc = read_le32(&block[cdata_len]);
+    uint32_t isize = read_le32(&block[cdata_len + 4]);
+
+    z_stream zs;
+    memset(&zs, 0, sizeof(zs));
+    if (inflateInit2(&zs, -MAX_WBITS) != Z_OK) {
+        return false;
+    }
+    zs.next_in = &block[0];
+    zs.avail_in = cdata_len;
+    zs.next_out = out;
+    zs.avail_out = isize;
+    int ret = inflate(&zs, Z_FINISH);
+    bool ok = (ret == Z_STREAM_END && zs.total_out == isize);
+    inflateEnd(&zs);
+
+    return ok && crc32(crc32(0L, Z_NULL, 0), out, isize) == crc;
+}
+
+void ReadAheadBuffer::_decompress_bgzf()
+{
+    FILE * fp = fopen(_filename.c_str(), "rb");
+    if (fp == NULL) {
+        _finish("Could not open " + _filename + " for reading.");
+        return;
+    }
+
+    std::vector< std::vector<unsigned char> > blocks(BGZF_BLOCKS_PER_BUFFER);
+    std::vector<size_t> offsets(BGZF_BLOCKS_PER_BUFFER + 1);
+    std::string error;
+    bool at_end = false;
+    Slot * slot;
+    while (!at_end && (slot = _get_empty_slot()) != NULL) {
+        int n_blocks = 0;
+        offsets[0] = 0;
+        while (n_blocks < BGZF_BLOCKS_PER_BUFFER) {
+            int ret = read_bgzf_block(fp, blocks[n_blocks]);
+            if (ret <= 0) {
+                if (ret < 0) {
+                    error = "Error reading BGZF block from " + _filename;
+                }
+                at_end = true;
+                break;
+            }
+            std::vector<unsigned char> &block = blocks[n_blocks];
+            uint32_t isize = read_le32(&block[block.size() - 4]);
+            if (isize > BGZF_MAX_BLOCK_SIZE) {
+                error = "Oversized BGZF block in " + _filename;
+                at_end = true;
+                break;
+            }
+            offsets[n_blocks + 1] = offsets[n_blocks] + isize;
+            n_blocks++;
+        }
+
+        bool corrupt = false;
+        unsigned char * out = (unsigned char *) &slot->data[0];
+        #pragma omp parallel for schedule(dynamic)
+        for (int i = 0; i < n_blocks; i++) {
+            if (!inflate_bgzf_block(blocks[i], out + offsets[i])) {
+                corrupt = true;
+            }
+        }
+        if (corrupt) {
+            error = "Error decompressing BGZF block from " + _filename;
+            break;
+        }
+        _put_full_slot(offsets[n_blocks]);
+    }
+
+    fclose(fp);
+    _finish(error);
+}
+
+void ReadAheadBuffer::_decompress_bzip2()
+{
+    FILE * fp = fopen(_filename.c_str(), "rb");
+    if (fp == NULL) {
+        _finish("Could not open " + _filename + " for reading.");
+        return;
+    }
+
+    int bzerror = BZ_OK;
+    BZFILE * bzfile = BZ2_bzReadOpen(&bzerror, fp, 0, 0, NULL, 0);
+    std::string error;
+    bool at_end = (bzerror != BZ_OK);
+    if (at_end) {
+        error = "Could not open " + _filename + " for reading.";
+    }
+
+    Slot * slot;
+    while (!at_end && (slot = _get_empty_slot()) != NULL) {
+        size_t length = 0;
+        while (length < READ_AHEAD_BUFFER_SIZE) {
+            int n = BZ2_bzRead(&bzerror, bzfile, &slot->data[length],
+                               READ_AHEAD_BUFFER_SIZE - length);
+            if (bzerror == BZ_OK) {
+                length += n;
+                continue;
+            } else if (bzerror != BZ_STREAM_END) {
+                error = "Error decompressing " + _filename;
+                at_end = true;
+                break;
+            }
+            length += n;
+
+            // bzip2 files may hold several concatenated streams.
+            void * unused = NULL;
+            int n_unused = 0;
+            BZ2_bzReadGetUnused(&bzerror, bzfile, &unused, &n_unused);
+            std::vector<char> leftover((char *) unused,
+                                       (char *) unused + n_unused);
+            BZ2_bzReadClose(&bzerror, bzfile);
+            bzfile = NULL;
+
+            int c = (n_unused == 0) ? getc(fp) : EOF;
+            if (n_unused == 0 && c == EOF) {
+                at_end = true;
+                break;
+            }
+            if (c != EOF) {
+                leftover.push_back((char) c);
+                n_unused = 1;
+            }
+            bzfile = BZ2_bzReadOpen(&bzerror, fp, 0, 0,
+                                    leftover.empty() ? NULL : &leftover[0],
+                                    leftover.size());
+            if (bzerror != BZ_OK) {
+                error = "Error decompressing " + _filename;
+                at_end = true;
+                break;
+            }
+        }
+        _put_full_slot(length);
+    }
+
+    if (bzfile != NULL) {
+        BZ2_bzReadClose(&bzerror, bzfile);
+    }
+    fclose(fp);
+    _finish(error);
+}
+
 struct SeqAnParser::Handle {
     seqan::SequenceStream stream;
+
+    // Compressed files are decompressed ahead of the parser by read_ahead
+    // and parsed through reader, rather than by the SequenceStream.
+    ReadAheadBuffer * read_ahead;
+    std::istream * read_ahead_stream;
+    seqan::RecordReader<std::istream, seqan::SinglePass<> > * reader;
+    bool is_fastq;
+    int reader_result;
+
     uint32_t seqan_spin_lock;
+    // Reads handed back by unread(), handed out before anything else.
+    std::deque<Read> unread;
+    // Error met while filling a batch, deferred to the next call so that
+    // the valid reads preceding it are not lost.
+    const char * pending_invalid_read;
+    bool pending_stream_error;
+
+    Handle() : read_ahead(NULL), read_ahead_stream(NULL), reader(NULL),
+        is_fastq(false), reader_result(0) {}
+
+    ~Handle()
+    {
+        if (read_ahead) {
+            delete reader;
+            delete read_ahead_stream;
+            delete read_ahead;
+        } else {
+            seqan::close(stream);
+        }
+    }
+
+    void open_read_ahead(const char * filename,
+                         ReadAheadBuffer::Compression compression)
+    {
+        read_ahead = new ReadAheadBuffer(filename, compression);
+        read_ahead_stream = new std::istream(read_ahead);
+        reader = new seqan::RecordReader<std::istream, seqan::SinglePass<> >(
+            *read_ahead_stream);
+
+        seqan::AutoSeqStreamFormat format;
+        if (!seqan::guessStreamFormat(*reader, format)) {
+            reader_result = 1;
+        } else if (format.tagId ==
+                   seqan::Find<seqan::AutoSeqStreamFormat,
+                   seqan::Fastq>::VALUE) {
+            is_fastq = true;
+        } else if (format.tagId !=
+                   seqan::Find<seqan::AutoSeqStreamFormat,
+                   seqan::Fasta>::VALUE) {
+            reader_result = 1;
+        }
+    }
+
+    bool is_good()
+    {
+        if (read_ahead) {
+            return reader_result == 0;
+        }
+        return seqan::isGood(stream);
+    }
+
+    bool at_end()
+    {
+        if (read_ahead) {
+            // a decompression error is reported as a failed read.
+            return seqan::atEnd(*reader) && read_ahead->error().empty();
+        }
+        return seqan::atEnd(stream);
+    }
+
+    int read_record(Read &the_read)
+    {
+        if (!read_ahead) {
+            return seqan::readRecord(the_read.name, the_read.sequence,
+                                     the_read.quality, stream);
+        }
+
+        if (seqan::atEnd(*reader)) {
+            reader_result = 1;
+        } else if (is_fastq) {
+            reader_result = seqan::readRecord(the_read.name, the_read.sequence,
+                                              the_read.quality, *reader,
+                                              seqan::Fastq());
+        } else {
+            reader_result = seqan::readRecord(the_read.name, the_read.sequence,
+                                              the_read.quality, *reader,
+                                              seqan::Fasta());
+        }
+        return reader_result;
+    }
+
+    void throw_stream_error()
+    {
+        if (read_ahead && !read_ahead->error().empty()) {
+            throw StreamReadError(read_ahead->error());
+        }
+        throw StreamReadError();
+    }
 };
 
 SeqAnParser::SeqAnParser( char const * filename ) : IParser( )
 {
     _private = new SeqAnParser::Handle();
-    seqan::open(_private->stream, filename);
-    if (!seqan::isGood(_private->stream)) {
-        std::string message = "Could not open ";
-        message = message + filename + " for reading.";
-        throw InvalidStream(message);
-    } else if (seqan::atEnd(_private->stream)) {
-        std::string message = "File ";
-        message = message + filename + " does not contain any sequences!";
-        throw InvalidStream(message);
+
+    // the destructor does not run if the constructor throws.
+    try {
+        ReadAheadBuffer::Compression compression;
+        if (ReadAheadBuffer::detect(filename, compression)) {
+            _private->open_read_ahead(filename, compression);
+        } else {
+            seqan::open(_private->stream, filename);
+        }
+
+        if (!_private->is_good()) {
+            std::string message = "Could not open ";
+            message = message + filename + " for reading.";
+            throw InvalidStream(message);
+        } else if (_private->at_end()) {
+            std::string message = "File ";
+            message = message + filename + " does not contain any sequences!";
+            throw InvalidStream(message);
+        }
+    } catch (...) {
+        delete _private;
+        throw;
     }
+    _private->pending_invalid_read = NULL;
+    _private->pending_stream_error = false;
     __asm__ __volatile__ ("" ::: "memory");
     _private->seqan_spin_lock = 0;
 }
 
 bool SeqAnParser::is_complete()
 {
-    return !seqan::isGood(_private->stream) || seqan::atEnd(_private->stream);
+    if (!_private->unread.empty() ||
+            _private->pending_invalid_read != NULL ||
+            _private->pending_stream_error) {
+        return false;
+    }
+    return !_private->is_good() || _private->at_end();
+}
+
+const char * SeqAnParser::_imprint_locked(Read &the_read, int &ret)
+{
+    the_read.reset();
+    ret = _private->read_record(the_read);
+    if (ret != 0) {
+        return NULL;
+    }
+    // A record cut short by a truncated or corrupt compressed file is a
+    // stream error rather than an invalid read.
+    if (_private->read_ahead && seqan::atEnd(*_private->reader) &&
+            !_private->read_ahead->error().empty()) {
+        ret = 1;
+        return NULL;
+    }
+    // Detect if we're parsing something w/ qualities on the first read
+    // only
+    if (_num_reads == 0 && the_read.quality.length() != 0) {
+        _have_qualities = true;
+    }
+
+    // Handle error cases, or increment number of reads on success
+    if (the_read.sequence.length() == 0) {
+        return "Sequence is empty";
+    } else if (_have_qualities && (the_read.sequence.length() != \
+                                   the_read.quality.length())) {
+        return "Sequence and quality lengths differ";
+    }
+    _num_reads++;
+    return NULL;
 }
 
 void SeqAnParser::imprint_next_read(Read &the_read)
@@ -52,27 +678,21 @@ void SeqAnParser::imprint_next_read(Read &the_read)
     the_read.reset();
     int ret = -1;
     const char *invalid_read_exc = NULL;
+    bool atEnd = false;
     while (!__sync_bool_compare_and_swap(& _private->seqan_spin_lock, 0, 1));
-    bool atEnd = seqan::atEnd(_private->stream);
-    if (!atEnd) {
-        ret = seqan::readRecord(the_read.name, the_read.sequence,
-                                the_read.quality, _private->stream);
-        if (ret == 0) {
-            // Detect if we're parsing something w/ qualities on the first read
-            // only
-            if (_num_reads == 0 && the_read.quality.length() != 0) {
-                _have_qualities = true;
-            }
-
-            // Handle error cases, or increment number of reads on success
-            if (the_read.sequence.length() == 0) {
-                invalid_read_exc = "Sequence is empty";
-            } else if (_have_qualities && (the_read.sequence.length() != \
-                                           the_read.quality.length())) {
-                invalid_read_exc = "Sequence and quality lengths differ";
-            } else {
-                _num_reads++;
-            }
+    if (!_private->unread.empty()) {
+        std::swap(the_read, _private->unread.front());
+        _private->unread.pop_front();
+        ret = 0;
+    } else if (_private->pending_invalid_read != NULL) {
+        invalid_read_exc = _private->pending_invalid_read;
+        _private->pending_invalid_read = NULL;
+    } else if (_private->pending_stream_error) {
+        _private->pending_stream_error = false;
+    } else {
+        atEnd = _private->at_end();
+        if (!atEnd) {
+            invalid_read_exc = _imprint_locked(the_read, ret);
         }
     }
     __asm__ __volatile__ ("" ::: "memory");
@@ -88,13 +708,84 @@ void SeqAnParser::imprint_next_read(Read &the_read)
     }
     // Catch-all error in readRecord that isn't one of the above
     if (ret != 0) {
-        throw StreamReadError();
+        _private->throw_stream_error();
+    }
+}
+
+size_t SeqAnParser::imprint_next_read_batch(std::vector<Read> &reads,
+        size_t n)
+{
+    if (reads.size() < n) {
+        reads.resize(n);
     }
+
+    size_t n_imprinted = 0;
+    int ret = 0;
+    const char *invalid_read_exc = NULL;
+    bool stream_error = false;
+    while (!__sync_bool_compare_and_swap(& _private->seqan_spin_lock, 0, 1));
+    if (!_private->unread.empty()) {
+        while (n_imprinted < n && !_private->unread.empty()) {
+            std::swap(reads[n_imprinted], _private->unread.front());
+            _private->unread.pop_front();
+            n_imprinted++;
+        }
+    } else if (_private->pending_invalid_read != NULL) {
+        invalid_read_exc = _private->pending_invalid_read;
+        _private->pending_invalid_read = NULL;
+    } else if (_private->pending_stream_error) {
+        _private->pending_stream_error = false;
+        stream_error = true;
+    } else {
+        while (n_imprinted < n && !_private->at_end()) {
+            invalid_read_exc = _imprint_locked(reads[n_imprinted], ret);
+            if (invalid_read_exc != NULL || ret != 0) {
+                stream_error = (invalid_read_exc == NULL);
+                break;
+            }
+            n_imprinted++;
+        }
+        // Hand out the good reads now and report the error next time.
+        if (n_imprinted > 0) {
+            _private->pending_invalid_read = invalid_read_exc;
+            _private->pending_stream_error = stream_error;
+            invalid_read_exc = NULL;
+            stream_error = false;
+        }
+    }
+    __asm__ __volatile__ ("" ::: "memory");
+    _private->seqan_spin_lock = 0;
+
+    if (invalid_read_exc != NULL) {
+        throw InvalidRead(invalid_read_exc);
+    }
+    if (stream_error) {
+        _private->throw_stream_error();
+    }
+    return n_imprinted;
+}
+
+void SeqAnParser::unread(std::deque<Read> &reads)
+{
+    while (!__sync_bool_compare_and_swap(& _private->seqan_spin_lock, 0, 1));
+    try {
+        if (_private->unread.empty()) {
+            _private->unread.swap(reads);
+        } else {
+            _private->unread.insert(_private->unread.begin(), reads.begin(),
+                                    reads.end());
+            reads.clear();
+        }
+    } catch (std::bad_alloc &e) {
+        _private->seqan_spin_lock = 0;
+        throw;
+    }
+    __asm__ __volatile__ ("" ::: "memory");
+    _private->seqan_spin_lock = 0;
 }
 
 SeqAnParser::~SeqAnParser()
 {
-    seqan::close(_private->stream);
     delete _private;
 }
 
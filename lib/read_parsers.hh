@@ -12,13 +12,18 @@
 #include <stddef.h>
 #include <stdint.h>
 #include <cstdlib>
+#include <deque>
 #include <iostream>
 #include <string>
 #include <utility>
+#include <vector>
 
 #include "khmer.hh"
 #include "khmer_exception.hh"
 
+// Number of reads handed out per parser lock acquisition by the batch API.
+#define DEFAULT_READ_BATCH_SIZE 256
+
 namespace khmer
 {
 
@@ -104,11 +109,26 @@ struct IParser {
     }
     virtual void	imprint_next_read( Read &the_read ) = 0;
 
+    // Fill up to 'n' reads into 'reads' (growing it as needed) under a
+    // single acquisition of the parser lock and return the number imprinted.
+    // Returns 0 once the stream is exhausted. If an invalid read is met
+    // after some valid reads were imprinted, the valid reads are returned
+    // and the error is raised by the following call.
+    virtual size_t	imprint_next_read_batch(
+        std:: vector< Read > &reads,
+        size_t n = DEFAULT_READ_BATCH_SIZE
+    ) = 0;
+
     virtual void	imprint_next_read_pair(
         ReadPair &the_read_pair,
         uint8_t mode = PAIR_MODE_ERROR_ON_UNPAIRED
     );
 
+    // Put 'reads', already parsed but not used, back at the front of the
+    // stream, to be handed out again before any further reads; 'reads' is
+    // left empty.
+    virtual void	unread( std:: deque< Read > &reads ) = 0;
+
     size_t		    get_num_reads()
     {
         return _num_reads;
@@ -149,12 +169,19 @@ public:
 
     bool is_complete( );
     void imprint_next_read(Read &the_read);
+    size_t imprint_next_read_batch(std::vector<Read> &reads,
+                                   size_t n = DEFAULT_READ_BATCH_SIZE);
+    void unread(std::deque<Read> &reads);
 
 private:
     struct Handle;
 
     Handle* _private;
 
+    // Parse one record into 'the_read'; the caller must hold the lock.
+    // Returns an error message for an invalid read, or NULL.
+    const char * _imprint_locked(Read &the_read, int &ret);
+
 };
 
 inline PartitionID _parse_partition_id(std::string name)
@@ -0,0 +1,253 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#include <string.h>
+
+#include "khmer_exception.hh"
+#include "record_writer.hh"
+
+// compressed output is produced this many bytes at a time.
+#define RECORD_WRITER_CHUNK_SIZE 65536
+
+// how the compressor is to flush once it has compressed its input.
+#define RECORD_WRITER_RUN 0
+#define RECORD_WRITER_FLUSH 1
+#define RECORD_WRITER_FINISH 2
+
+using namespace khmer;
+using namespace khmer::read_parsers;
+
+void khmer::format_record(const Read& read, bool has_quality,
+                          std::string& output)
+{
+    if (!has_quality) {
+        output += '>';
+        output += read.name;
+        output += '\n';
+        output += read.sequence;
+        output += '\n';
+    } else {
+        output += '@';
+        output += read.name;
+        output += '\n';
+        output += read.sequence;
+        output += "\n+\n";
+        output += read.quality;
+        output += '\n';
+    }
+}
+
+RecordWriter::RecordWriter(Compression compression, size_t buffer_size)
+    : _compression(compression), _buffer_size(buffer_size), _busy(false),
+      _flush(RECORD_WRITER_RUN), _finished(false), _cancel(false)
+{
+    _buffer.reserve(buffer_size);
+    if (compression == NONE) {
+        return;
+    }
+
+    // gzip as gzip(1) writes it, and bzip2 with 900k blocks.
+    memset(&_gzip, 0, sizeof(_gzip));
+    memset(&_bzip2, 0, sizeof(_bzip2));
+    if (compression == GZIP) {
+        if (deflateInit2(&_gzip, Z_DEFAULT_COMPRESSION, Z_DEFLATED, 15 + 16,
+                         8, Z_DEFAULT_STRATEGY) != Z_OK) {
+            throw khmer_exception("Could not start gzip compression");
+        }
+    } else if (BZ2_bzCompressInit(&_bzip2, 9, 0, 0) != BZ_OK) {
+        throw khmer_exception("Could not start bzip2 compression");
+    }
+
+    pthread_mutex_init(&_lock, NULL);
+    pthread_cond_init(&_work, NULL);
+    pthread_cond_init(&_done, NULL);
+    if (pthread_create(&_thread, NULL, _run, this)) {
+        pthread_cond_destroy(&_done);
+        pthread_cond_destroy(&_work);
+        pthread_mutex_destroy(&_lock);
+        if (compression == GZIP) {
+            deflateEnd(&_gzip);
+        } else {
+            BZ2_bzCompressEnd(&_bzip2);
+        }
+        throw khmer_exception("Could not start compression thread");
+    }
+}
+
+RecordWriter::~RecordWriter()
+{
+    if (_compression == NONE) {
+        return;
+    }
+
+    pthread_mutex_lock(&_lock);
+    _cancel = true;
+    pthread_cond_broadcast(&_work);
+    pthread_mutex_unlock(&_lock);
+
+    pthread_join(_thread, NULL);
+
+    pthread_cond_destroy(&_done);
+    pthread_cond_destroy(&_work);
+    pthread_mutex_destroy(&_lock);
+    if (_compression == GZIP) {
+        deflateEnd(&_gzip);
+    } else {
+        BZ2_bzCompressEnd(&_bzip2);
+    }
+}
+
+void * RecordWriter::_run(void * self)
+{
+    RecordWriter * writer = (RecordWriter *) self;
+
+    pthread_mutex_lock(&writer->_lock);
+    while (true) {
+        while (!writer->_busy && !writer->_cancel) {
+            pthread_cond_wait(&writer->_work, &writer->_lock);
+        }
+        if (writer->_cancel) {
+            break;
+        }
+        int flush = writer->_flush;
+        pthread_mutex_unlock(&writer->_lock);
+
+        // _pending and _compressed are left alone while _busy.
+        std::string error;
+        try {
+            writer->_compress(writer->_pending, writer->_compressed, flush);
+        } catch (khmer_exception &e) {
+            error = e.what();
+        } catch (std::bad_alloc &e) {
+            error = "Out of memory compressing output";
+        }
+
+        pthread_mutex_lock(&writer->_lock);
+        if (writer->_error.empty()) {
+            writer->_error = error;
+        }
+        writer->_busy = false;
+        pthread_cond_signal(&writer->_done);
+    }
+    pthread_mutex_unlock(&writer->_lock);
+
+    return NULL;
+}
+
+void RecordWriter::_compress(const std::string& input, std::string& output,
+                             int flush)
+{
+    static const int gzip_flush[] = { Z_NO_FLUSH, Z_SYNC_FLUSH, Z_FINISH };
+    static const int bzip2_flush[] = { BZ_RUN, BZ_FLUSH, BZ_FINISH };
+
+    _gzip.next_in = (Bytef *) input.data();
+    _gzip.avail_in = input.size();
+    _bzip2.next_in = (char *) input.data();
+    _bzip2.avail_in = input.size();
+
+    bool done = false;
+    while (!done) {
+        size_t have = output.size();
+        output.resize(have + RECORD_WRITER_CHUNK_SIZE);
+
+        unsigned int avail_out;
+        if (_compression == GZIP) {
+            _gzip.next_out = (Bytef *) &output[have];
+            _gzip.avail_out = RECORD_WRITER_CHUNK_SIZE;
+            int ret = deflate(&_gzip, gzip_flush[flush]);
+            if (ret == Z_STREAM_ERROR) {
+                throw khmer_exception("Error compressing gzip output");
+            }
+            avail_out = _gzip.avail_out;
+            // all input is taken once there is output space to spare.
+            done = (flush == RECORD_WRITER_FINISH) ? (ret == Z_STREAM_END) :
+                   (avail_out != 0);
+        } else {
+            _bzip2.next_out = &output[have];
+            _bzip2.avail_out = RECORD_WRITER_CHUNK_SIZE;
+            int ret = BZ2_bzCompress(&_bzip2, bzip2_flush[flush]);
+            if (ret < 0) {
+                throw khmer_exception("Error compressing bzip2 output");
+            }
+            avail_out = _bzip2.avail_out;
+            if (flush == RECORD_WRITER_FINISH) {
+                done = (ret == BZ_STREAM_END);
+            } else if (flush == RECORD_WRITER_FLUSH) {
+                done = (ret == BZ_RUN_OK);
+            } else {
+                done = (_bzip2.avail_in == 0);
+            }
+        }
+        output.resize(have + RECORD_WRITER_CHUNK_SIZE - avail_out);
+    }
+}
+
+void RecordWriter::_start(int flush)
+{
+    pthread_mutex_lock(&_lock);
+    _pending.swap(_buffer);
+    _buffer.clear();
+    _flush = flush;
+    _busy = true;
+    pthread_cond_signal(&_work);
+    pthread_mutex_unlock(&_lock);
+}
+
+void RecordWriter::_wait(std::string& output)
+{
+    pthread_mutex_lock(&_lock);
+    while (_busy) {
+        pthread_cond_wait(&_done, &_lock);
+    }
+    std::string error = _error;
+    pthread_mutex_unlock(&_lock);
+
+    if (!error.empty()) {
+        throw khmer_exception(error);
+    }
+    output.clear();
+    output.swap(_compressed);
+}
+
+void RecordWriter::hand_over(std::string& output)
+{
+    if (_compression == NONE) {
+        output.clear();
+        output.swap(_buffer);
+        return;
+    }
+    if (_finished) {
+        throw khmer_exception("Cannot write to a finished RecordWriter");
+    }
+
+    _wait(output);
+    _start(RECORD_WRITER_RUN);
+}
+
+void RecordWriter::drain(std::string& output, bool finish)
+{
+    if (_compression == NONE) {
+        output.clear();
+        output.swap(_buffer);
+        return;
+    }
+    if (_finished) {
+        if (!_buffer.empty()) {
+            throw khmer_exception("Cannot write to a finished RecordWriter");
+        }
+        output.clear();
+        return;
+    }
+
+    _wait(output);
+
+    std::string rest;
+    _start(finish ? RECORD_WRITER_FINISH : RECORD_WRITER_FLUSH);
+    _wait(rest);
+    output.append(rest);
+    _finished = finish;
+}
@@ -0,0 +1,103 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef RECORD_WRITER_HH
+#define RECORD_WRITER_HH
+
+#include <pthread.h>
+#include <stddef.h>
+#include <string>
+
+#include "bzlib.h"
+#include "read_parsers.hh"
+#include "zlib.h"
+
+// bytes of records a RecordWriter gathers before handing them on.
+#define DEFAULT_RECORD_WRITER_BUFFER_SIZE (1024 * 1024)
+
+namespace khmer
+{
+
+// Append read to output as a FASTQ record if has_quality, and as a FASTA
+// record if not, as khmer.utils.write_record() writes them.  The flag is
+// separate from the quality string so that an empty FASTQ read stays FASTQ.
+void format_record(const read_parsers::Read& read, bool has_quality,
+                   std::string& output);
+
+// RecordWriter gathers FASTA and FASTQ records into large buffers, for the
+// caller to write out a buffer at a time, gzip or bzip2 compressed if
+// asked.  Compression runs on a thread of its own: each full buffer is
+// compressed while the next one is being filled.
+
+class RecordWriter
+{
+public:
+    enum Compression {
+        NONE,
+        GZIP,
+        BZIP2
+    };
+
+    RecordWriter(Compression compression,
+                 size_t buffer_size = DEFAULT_RECORD_WRITER_BUFFER_SIZE);
+    ~RecordWriter();
+
+    void write(const read_parsers::Read& read, bool has_quality)
+    {
+        format_record(read, has_quality, _buffer);
+    }
+    void write(const char * data, size_t length)
+    {
+        _buffer.append(data, length);
+    }
+
+    // Is the buffer full enough to be handed on?
+    bool full() const
+    {
+        return _buffer.size() >= _buffer_size;
+    }
+
+    // Hand the buffer on, and set output to what's ready to be written:
+    // the buffer itself, or when compressing, the compressed form of the
+    // buffer handed on before, if any.
+    void hand_over(std::string& output);
+
+    // Set output to everything written so far, flushed through the
+    // compressor if there is one.  With finish, the compressed stream is
+    // ended, and nothing more may be written.
+    void drain(std::string& output, bool finish);
+
+protected:
+    Compression _compression;
+    size_t _buffer_size;
+    std::string _buffer;
+
+    // The compressing thread takes _pending and sets _compressed.
+    std::string _pending;
+    std::string _compressed;
+    bool _busy;			// _pending is being compressed
+    int _flush;			// how to flush once _pending is done
+    bool _finished;
+    bool _cancel;
+    std::string _error;
+
+    z_stream _gzip;
+    bz_stream _bzip2;
+
+    pthread_mutex_t _lock;
+    pthread_cond_t _work;
+    pthread_cond_t _done;
+    pthread_t _thread;
+
+    static void * _run(void * self);
+    void _compress(const std::string& input, std::string& output, int flush);
+    void _start(int flush);
+    void _wait(std::string& output);
+};
+}
+
+#endif // RECORD_WRITER_HH
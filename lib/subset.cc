@@ -6,8 +6,7 @@
 //
 
 #include <assert.h>
-#include <errno.h>
-#include <string.h>
+#include <algorithm>
 #include <iostream>
 #include <sstream> // IWYU pragma: keep
 #include <map>
@@ -18,11 +17,16 @@
 #include "hashtable.hh"
 #include "khmer_exception.hh"
 #include "kmer_hash.hh"
+#include "pmap_file.hh"
 #include "read_parsers.hh"
 #include "subset.hh"
 
-#define IO_BUF_SIZE 250*1000*1000
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 #define BIG_TRAVERSALS_ARE 200
+#define PARTITION_GRAPH_CHUNK 64
 
 // #define VALIDATE_PARTITIONS
 
@@ -52,6 +56,73 @@ static void print_tag_set(SeenSet& p)
 
 #endif //0
 
+const uint32_t TagPartitionMap::EMPTY_SLOT;
+const uint32_t TagPartitionMap::NO_PARTITION;
+
+void TagPartitionMap::_grow()
+{
+    std::vector<HashIntoType> old_tags;
+    std::vector<uint32_t> old_nodes;
+    old_tags.swap(_tags);
+    old_nodes.swap(_nodes);
+
+    size_t n_slots = old_tags.empty() ? 1024 : 2 * old_tags.size();
+    _tags.resize(n_slots);
+    _nodes.assign(n_slots, EMPTY_SLOT);
+
+    for (size_t i = 0; i < old_tags.size(); i++) {
+        if (old_nodes[i] != EMPTY_SLOT) {
+            size_t j = _find(old_tags[i]);
+            _tags[j] = old_tags[i];
+            _nodes[j] = old_nodes[i];
+        }
+    }
+}
+
+bool TagPartitionMap::erase(HashIntoType tag)
+{
+    if (_n_entries == 0) {
+        return false;
+    }
+    size_t i = _find(tag);
+    if (_nodes[i] == EMPTY_SLOT) {
+        return false;
+    }
+
+    // Close the gap by moving back any later entry of the probe run that
+    // may live in it, so that lookups never need tombstones.
+    size_t mask = _tags.size() - 1;
+    size_t j = i;
+    while (true) {
+        _nodes[i] = EMPTY_SLOT;
+        size_t home;
+        do {
+            j = (j + 1) & mask;
+            if (_nodes[j] == EMPTY_SLOT) {
+                _n_entries--;
+                return true;
+            }
+            home = _mix_hash(_tags[j]) & mask;
+        } while (i <= j ? (i < home && home <= j) : (i < home || home <= j));
+
+        _tags[i] = _tags[j];
+        _nodes[i] = _nodes[j];
+        i = j;
+    }
+}
+
+void TagPartitionMap::get_sorted_tags(std::vector<HashIntoType> &tags) const
+{
+    tags.clear();
+    tags.reserve(_n_entries);
+    for (size_t i = 0; i < _tags.size(); i++) {
+        if (_nodes[i] != EMPTY_SLOT) {
+            tags.push_back(_tags[i]);
+        }
+    }
+    std::sort(tags.begin(), tags.end());
+}
+
 void SubsetPartition::count_partitions(
     size_t& n_partitions,
     size_t& n_unassigned)
@@ -65,11 +136,12 @@ void SubsetPartition::count_partitions(
     // go through all the tagged kmers and count partitions/orphan.
     //
 
-    for (SeenSet::iterator ti = _ht->all_tags.begin();
+    for (KmerSet::const_iterator ti = _ht->all_tags.begin();
             ti != _ht->all_tags.end(); ++ti) {
-        PartitionID * partition_p = partition_map[*ti];
-        if (partition_p) {
-            partitions.insert(*partition_p);
+        PartitionID partition_id =
+            _node_partition_id(_tag_nodes.get_or_add(*ti));
+        if (partition_id) {
+            partitions.insert(partition_id);
         } else {
             n_unassigned++;
         }
@@ -119,11 +191,13 @@ size_t SubsetPartition::output_partitioned_file(
             const char * kmer_s = seq.c_str();
 
             bool found_tag = false;
+            uint32_t node = TagPartitionMap::EMPTY_SLOT;
             for (unsigned int i = 0; i < seq.length() - ksize + 1; i++) {
                 kmer = _hash(kmer_s + i, ksize);
 
                 // is this a known tag?
-                if (set_contains(partition_map, kmer)) {
+                node = _tag_nodes.get(kmer);
+                if (node != TagPartitionMap::EMPTY_SLOT) {
                     found_tag = true;
                     break;
                 }
@@ -135,12 +209,10 @@ size_t SubsetPartition::output_partitioned_file(
 
             PartitionID partition_id = 0;
             if (found_tag) {
-                PartitionID * partition_p = partition_map[kmer];
-                if (partition_p == NULL ) {
-                    partition_id = 0;
+                partition_id = _node_partition_id(node);
+                if (partition_id == 0) {
                     n_singletons++;
                 } else {
-                    partition_id = *partition_p;
                     partitions.insert(partition_id);
                 }
             }
@@ -235,11 +307,8 @@ unsigned int SubsetPartition::find_unpart(
 
             for (SeenSet::iterator si = found_tags.begin();
                     si != found_tags.end(); ++si) {
-                PartitionMap::iterator pi = partition_map.find(*si);
-                PartitionID partition_id = 0;
-                if (pi != partition_map.end() && pi->second != NULL) {
-                    partition_id = *(pi->second);
-                }
+                PartitionID partition_id =
+                    _node_partition_id(_tag_nodes.get(*si));
                 if (partition_id == 0) {
                     found_zero = true;
                 } else {
@@ -340,7 +409,7 @@ void SubsetPartition::queue_neighbors(
     HashIntoType		kmer_f,
     HashIntoType		kmer_r,
     unsigned int		breadth,
-    SeenSet&			traversed_kmers,
+    KmerSet&			traversed_kmers,
     NodeQueue&			node_q,
     std::queue<unsigned int>&	breadth_q)
 {
@@ -432,7 +501,7 @@ void SubsetPartition::find_all_tags(
     HashIntoType	kmer_f,
     HashIntoType	kmer_r,
     SeenSet&		tagged_kmers,
-    const SeenSet&	all_tags,
+    const KmerSet&	all_tags,
     bool		break_on_stop_tags,
     bool		stop_big_traversals)
 {
@@ -448,7 +517,7 @@ void SubsetPartition::find_all_tags(
     const unsigned int rc_left_shift = _ht->ksize()*2 - 2;
     unsigned int total = 0;
 
-    SeenSet keeper;		// keep track of traversed kmers
+    KmerSet keeper;		// keep track of traversed kmers
 
     // start breadth-first search.
 
@@ -596,13 +665,13 @@ void SubsetPartition::find_all_tags(
 unsigned int SubsetPartition::sweep_for_tags(
     const std::string&	seq,
     SeenSet&		tagged_kmers,
-    const SeenSet&	all_tags,
+    const KmerSet&	all_tags,
     unsigned int	range,
     bool		break_on_stop_tags,
     bool		stop_big_traversals)
 {
 
-    SeenSet traversed_kmers;
+    KmerSet traversed_kmers;
     NodeQueue node_q;
     std::queue<unsigned int> breadth_q;
     //unsigned int cur_breadth = 0;
@@ -713,7 +782,7 @@ void SubsetPartition::find_all_tags_truncate_on_abundance(
     HashIntoType	kmer_f,
     HashIntoType	kmer_r,
     SeenSet&		tagged_kmers,
-    const SeenSet&	all_tags,
+    const KmerSet&	all_tags,
     BoundedCounterType	min_count,
     BoundedCounterType	max_count,
     bool		break_on_stop_tags,
@@ -731,7 +800,7 @@ void SubsetPartition::find_all_tags_truncate_on_abundance(
     const unsigned int rc_left_shift = _ht->ksize()*2 - 2;
     unsigned int total = 0;
 
-    SeenSet keeper;		// keep track of traversed kmers
+    KmerSet keeper;		// keep track of traversed kmers
 
     // start breadth-first search.
 
@@ -894,7 +963,7 @@ void SubsetPartition::do_partition(
     SeenSet tagged_kmers;
     const unsigned char ksize = _ht->ksize();
 
-    SeenSet::const_iterator si, end;
+    KmerSet::const_iterator si, end;
 
     if (first_kmer) {
         si = _ht->all_tags.find(first_kmer);
@@ -938,6 +1007,156 @@ void SubsetPartition::do_partition(
     }
 }
 
+// A lock-free union-find over tag indices, used by partition_graph.  Roots
+// are always linked under the root with the lower index, so concurrent
+// unions can't make a cycle; finds halve paths with compare-and-swap.
+
+static uint32_t _find_tag_root(volatile uint32_t * parent, uint32_t i)
+{
+    while (true) {
+        uint32_t p = parent[i];
+        if (p == i) {
+            return i;
+        }
+        uint32_t gp = parent[p];
+        if (gp != p) {
+            __sync_bool_compare_and_swap(&parent[i], p, gp);
+        }
+        i = p;
+    }
+}
+
+static void _union_tags(volatile uint32_t * parent, uint32_t a, uint32_t b)
+{
+    while (true) {
+        a = _find_tag_root(parent, a);
+        b = _find_tag_root(parent, b);
+        if (a == b) {
+            return;
+        }
+        if (a < b) {
+            std::swap(a, b);
+        }
+        if (__sync_bool_compare_and_swap(&parent[a], a, b)) {
+            return;
+        }
+    }
+}
+
+// partition_graph does the work of do_partition over all of the tags, on
+// 'n_threads' threads, and merges the result into this partition as merge()
+// would.  Each thread traverses from its own tags, connecting the tags it
+// finds in a shared union-find; threads pick up chunks of tags as they
+// finish, so a few big traversals don't hold up the rest.  A tag ends up
+// assigned exactly when do_partition would leave it assigned: if its own
+// traversal found other tags, or a traversal from a later tag found it.
+
+void SubsetPartition::partition_graph(
+    unsigned int	n_threads,
+    bool		break_on_stop_tags,
+    bool		stop_big_traversals)
+{
+    const KmerSet& all_tags = _ht->all_tags;
+    const KmerSet::const_iterator tags_begin = all_tags.begin();
+    const KmerSet::const_iterator tags_end = all_tags.end();
+    const long long n_tags = tags_end - tags_begin;
+
+    if (2 * n_tags >= (long long) TagPartitionMap::NO_PARTITION) {
+        throw khmer_exception("too many tags to partition");
+    }
+    if (n_threads == 0) {
+        n_threads = 1;
+    }
+
+    std::vector<uint32_t> parent(n_tags);
+    for (long long i = 0; i < n_tags; i++) {
+        parent[i] = i;
+    }
+
+    // found[i] & 1: the traversal from tag i found other tags.
+    // found[i] & 2: tag i was found by the traversal from a later tag.
+    std::vector<unsigned char> found(n_tags, 0);
+
+    // Tags found by the traversal from an earlier tag. do_partition drops a
+    // tag whose own traversal comes up empty, keeping the joins made through
+    // it until then, so these can only be placed once every traversal has
+    // finished.
+    std::vector< std::vector<uint32_t> > later_tags(n_tags);
+
+    volatile uint32_t * parent_p = n_tags ? &parent[0] : NULL;
+    unsigned char * found_p = n_tags ? &found[0] : NULL;
+    const unsigned char ksize = _ht->ksize();
+
+    DeferredException error;
+
+    #pragma omp parallel for schedule(dynamic, PARTITION_GRAPH_CHUNK) \
+    num_threads(n_threads)
+    for (long long i = 0; i < n_tags; i++) {
+        if (error.is_set()) {
+            continue;
+        }
+
+        try {
+            HashIntoType kmer_f, kmer_r;
+            SeenSet tagged_kmers;
+
+            std::string kmer_s = _revhash(tags_begin[i], ksize);
+            _hash(kmer_s.c_str(), ksize, kmer_f, kmer_r);
+
+            find_all_tags(kmer_f, kmer_r, tagged_kmers, all_tags,
+                          break_on_stop_tags, stop_big_traversals);
+
+            if (tagged_kmers.empty()) {
+                continue;
+            }
+            __sync_fetch_and_or(&found_p[i], 1);
+
+            for (SeenSet::const_iterator ti = tagged_kmers.begin();
+                    ti != tagged_kmers.end(); ++ti) {
+                long long j = std::lower_bound(tags_begin, tags_end, *ti)
+                              - tags_begin;
+                if (j < i) {
+                    __sync_fetch_and_or(&found_p[j], 2);
+                    _union_tags(parent_p, i, j);
+                } else if (j > i) {
+                    later_tags[i].push_back(j);
+                }
+            }
+        } catch (...) {
+            error.capture();
+        }
+    }
+    error.rethrow();
+
+    // A dropped tag j stands in as node n_tags + j for the earlier joins.
+    parent.resize(2 * n_tags);
+    for (long long i = n_tags; i < 2 * n_tags; i++) {
+        parent[i] = i;
+    }
+    parent_p = n_tags ? &parent[0] : NULL;
+
+    for (long long i = 0; i < n_tags; i++) {
+        for (std::vector<uint32_t>::const_iterator ji = later_tags[i].begin();
+                ji != later_tags[i].end(); ++ji) {
+            if (found[*ji] & 1) {
+                _union_tags(parent_p, i, *ji);
+            } else {
+                _union_tags(parent_p, i, n_tags + *ji);
+            }
+        }
+    }
+
+    // Root indices stand in for the partition IDs of a subset; merge them
+    // in tag order so that partition IDs come out the same every run.
+    PartitionNodeMap root_to_node;
+    for (long long i = 0; i < n_tags; i++) {
+        if (found[i]) {
+            PartitionID root = _find_tag_root(parent_p, i);
+            _merge_other(tags_begin[i], root + 1, root_to_node);
+        }
+    }
+}
+
 void SubsetPartition::do_partition_with_abundance(
     HashIntoType	first_kmer,
     HashIntoType	last_kmer,
@@ -955,7 +1174,7 @@ void SubsetPartition::do_partition_with_abundance(
     SeenSet tagged_kmers;
     const unsigned char ksize = _ht->ksize();
 
-    SeenSet::const_iterator si, end;
+    KmerSet::const_iterator si, end;
 
     if (first_kmer) {
         si = _ht->all_tags.find(first_kmer);
@@ -1021,17 +1240,14 @@ void SubsetPartition::set_partition_id(
     HashIntoType	kmer,
     PartitionID		p)
 {
-    PartitionPtrSet * s = reverse_pmap[p];
-    PartitionID * pp = NULL;
-    if (s == NULL) {
-        s = new PartitionPtrSet();
-        pp = new unsigned int(p);
-        s->insert(pp);
-        reverse_pmap[p] = s;
+    uint32_t node;
+    PartitionNodeMap::const_iterator pi = _partition_nodes.find(p);
+    if (pi == _partition_nodes.end()) {
+        node = _new_partition_node(p);
     } else {
-        pp = *(s->begin());
+        node = pi->second;
     }
-    partition_map[kmer] = pp;
+    _tag_nodes.set(kmer, node);
 
     if (next_partition_id <= p) {
         next_partition_id = p + 1;
@@ -1047,107 +1263,103 @@ PartitionID SubsetPartition::assign_partition_id(
 
     // did we find a tagged kmer?
     if (!tagged_kmers.empty()) {
-        PartitionID * pp = _join_partitions_by_tags(tagged_kmers, kmer);
-        return_val = *pp;
+        uint32_t root = _join_partitions_by_tags(tagged_kmers, kmer);
+        return_val = _node_partition[root];
     } else {
-        partition_map.erase(kmer);
+        _tag_nodes.erase(kmer);
         return_val = 0;
     }
 
     return return_val;
 }
 
+// Start a new partition, in a set of its own, and return its node.
+
+uint32_t SubsetPartition::_new_partition_node(PartitionID p)
+{
+    uint32_t node = _parent.size();
+    if (node >= TagPartitionMap::NO_PARTITION) {
+        throw khmer_exception("too many partitions");
+    }
+    _parent.push_back(node);
+    _node_partition.push_back(p);
+    _set_size.push_back(1);
+    _partition_nodes[p] = node;
+
+    return node;
+}
+
 // _join_partitions_by_tags combines the tags in 'tagged_kmers' into a single
-// partition, creating or reassigning partitions as necessary.  Low level
-// function!
+// partition, creating or reassigning partitions as necessary, and returns
+// the root of its set.  Low level function!
 
-PartitionID * SubsetPartition::_join_partitions_by_tags(
+uint32_t SubsetPartition::_join_partitions_by_tags(
     const SeenSet&	tagged_kmers,
     const HashIntoType	kmer)
 {
     SeenSet::const_iterator it = tagged_kmers.begin();
-    unsigned int * this_partition_p = NULL;
+    uint32_t this_root = TagPartitionMap::NO_PARTITION;
 
     // find first assigned partition ID in tagged set
     while (it != tagged_kmers.end()) {
-        this_partition_p = partition_map[*it];
-        if (this_partition_p != NULL) {
+        uint32_t node = _tag_nodes.get(*it);
+        if (node < TagPartitionMap::NO_PARTITION) {
+            this_root = _find_root(node);
             break;
         }
         ++it;
     }
 
     // no partition ID? allocate new!
-    if (this_partition_p == NULL) {
-        this_partition_p = new PartitionID(next_partition_id);
+    if (this_root == TagPartitionMap::NO_PARTITION) {
+        this_root = _new_partition_node(next_partition_id);
         next_partition_id++;
-
-        PartitionPtrSet * s = new PartitionPtrSet();
-        s->insert(this_partition_p);
-        reverse_pmap[*this_partition_p] = s;
     }
 
     // reassign all partitions individually.
     it = tagged_kmers.begin();
     for (; it != tagged_kmers.end(); ++it) {
-        PartitionMap::iterator pi = partition_map.find(*it);
+        uint32_t node = _tag_nodes.get(*it);
 
-        if (pi == partition_map.end()) { // no entry? insert.
-            partition_map[*it] = this_partition_p;
+        if (node >= TagPartitionMap::NO_PARTITION) {
+            // no entry, or no partition? set.
+            _tag_nodes.set(*it, this_root);
         } else {
-            PartitionID * pp_id = pi->second;
-
-            if (pp_id == NULL) {	// entry is null? set;
-                pi->second = this_partition_p;
-            } else if (*pp_id != *this_partition_p) {
-                // != entry? join partitions.
-                _merge_two_partitions(this_partition_p, pp_id);
+            uint32_t root = _find_root(node);
+            if (root != this_root) {
+                // different partition? join partitions.
+                this_root = _merge_two_partitions(this_root, root);
             }
         }
     }
 
-    partition_map[kmer] = this_partition_p;
+    _tag_nodes.set(kmer, this_root);
 
-    return this_partition_p;
+    return this_root;
 }
 
-// _merge_two_partitions merges the 'merge_pp' partition into the
-// 'the_pp' partition.  It does this by joining the reverse pointer
-// map structures for two partitions and resetting each partition
-// pointer individually.
+// _merge_two_partitions merges the sets rooted at 'the_root' and
+// 'merge_root', keeping the PartitionID of the one that has absorbed more
+// partitions (or of 'the_root', on a tie), and returns the new root.
 
-PartitionID * SubsetPartition::_merge_two_partitions(
-    PartitionID *the_pp,
-    PartitionID *merge_pp)
+uint32_t SubsetPartition::_merge_two_partitions(
+    uint32_t the_root,
+    uint32_t merge_root)
 {
-    PartitionPtrSet * s = reverse_pmap[*the_pp];
-    PartitionPtrSet * t = reverse_pmap[*merge_pp];
-
-    // Choose the smaller of two sets to loop over.
-    if (s->size() < t->size()) {
-        PartitionPtrSet * tmp = s;
-        s = t;
-        t = tmp;
-        PartitionID * tmp2 = the_pp;
-        the_pp = merge_pp;
-        merge_pp = tmp2;
+    // Link the smaller set under the larger.
+    if (_set_size[the_root] < _set_size[merge_root]) {
+        uint32_t tmp = the_root;
+        the_root = merge_root;
+        merge_root = tmp;
     }
 
-    // Get rid of the reverse pointer for the old partition.
-    reverse_pmap.erase(*merge_pp);
+    // Get rid of the old partition.
+    _partition_nodes.erase(_node_partition[merge_root]);
 
-    // Merge all of the elements in the to-be-replaced PartitionPtrSet
-    // into the merged partition.
-    for (PartitionPtrSet::iterator pi = t->begin(); pi != t->end(); ++pi) {
-        PartitionID * iter_pp;
-        iter_pp = *pi;
+    _parent[merge_root] = the_root;
+    _set_size[the_root] += _set_size[merge_root];
 
-        *iter_pp = *the_pp;	// reset the partition ID to the new one.
-        s->insert(iter_pp);
-    }
-    delete t;
-
-    return the_pp;
+    return the_root;
 }
 
 PartitionID SubsetPartition::join_partitions(
@@ -1161,17 +1373,15 @@ PartitionID SubsetPartition::join_partitions(
         return 0;
     }
 
-    if (reverse_pmap.find(orig) == reverse_pmap.end() ||
-            reverse_pmap.find(join) == reverse_pmap.end() ||
-            reverse_pmap[orig] == NULL ||
-            reverse_pmap[join] == NULL) {
+    PartitionNodeMap::const_iterator orig_i = _partition_nodes.find(orig);
+    PartitionNodeMap::const_iterator join_i = _partition_nodes.find(join);
+    if (orig_i == _partition_nodes.end() ||
+            join_i == _partition_nodes.end()) {
         return 0;
     }
 
-    PartitionID * orig_pp = *(reverse_pmap[orig]->begin());
-    PartitionID * join_pp = *(reverse_pmap[join]->begin());
-
-    _merge_two_partitions(orig_pp, join_pp);
+    _merge_two_partitions(_find_root(orig_i->second),
+                          _find_root(join_i->second));
 
     return orig;
 }
@@ -1189,14 +1399,7 @@ PartitionID SubsetPartition::get_partition_id(std::string kmer_s)
 
 PartitionID SubsetPartition::get_partition_id(HashIntoType kmer)
 {
-    if (partition_map.find(kmer) != partition_map.end()) {
-        PartitionID * pp = partition_map[kmer];
-        if (pp == NULL) {
-            return 0;
-        }
-        return *pp;
-    }
-    return 0;
+    return _node_partition_id(_tag_nodes.get(kmer));
 }
 
 void SubsetPartition::merge(SubsetPartition * other)
@@ -1205,12 +1408,18 @@ void SubsetPartition::merge(SubsetPartition * other)
         return;
     }
 
-    PartitionPtrMap other_to_this;
+    PartitionNodeMap other_to_this;
+
+    // Go through the tags in order, so that partitions are numbered just
+    // as they would be when merging the other partition map from disk.
+    std::vector<HashIntoType> tags;
+    other->_tag_nodes.get_sorted_tags(tags);
 
-    PartitionMap::const_iterator pi = other->partition_map.begin();
-    for (; pi != other->partition_map.end(); ++pi) {
-        if (pi->second) {
-            _merge_other(pi->first, *(pi->second), other_to_this);
+    std::vector<HashIntoType>::const_iterator ti = tags.begin();
+    for (; ti != tags.end(); ++ti) {
+        uint32_t node = other->_tag_nodes.get(*ti);
+        if (node < TagPartitionMap::NO_PARTITION) {
+            _merge_other(*ti, other->_node_partition_id(node), other_to_this);
         }
     }
 }
@@ -1221,49 +1430,38 @@ void SubsetPartition::merge(SubsetPartition * other)
 void SubsetPartition::_merge_other(
     HashIntoType	tag,
     PartitionID		other_partition,
-    PartitionPtrMap&	diskp_to_pp)
+    PartitionNodeMap&	diskp_to_node)
 {
     if (set_contains(_ht->stop_tags, tag)) { // don't merge if it's a stop_tag
         return;
     }
 
     // OK.  Does our current partitionmap have this?
-    PartitionID * pp_0;
-    pp_0 = partition_map[tag];
+    uint32_t node = _tag_nodes.get(tag);
+    PartitionNodeMap::iterator di = diskp_to_node.find(other_partition);
 
-    if (pp_0 == NULL) {	// No!  OK, map to new 'un.
-        PartitionID * existing_pp_0 = diskp_to_pp[other_partition];
-
-        if (existing_pp_0) {	// already seen this other_partition
-            partition_map[tag] = existing_pp_0;
+    if (node >= TagPartitionMap::NO_PARTITION) {  // No!  OK, map to new 'un.
+        if (di != diskp_to_node.end()) {    // already seen this other_partition
+            _tag_nodes.set(tag, di->second);
         } else {		// new other_partition! create a new partition.
-            pp_0 = get_new_partition();
-
-            PartitionPtrSet * pp_set = new PartitionPtrSet();
-            pp_set->insert(pp_0);
-            reverse_pmap[*pp_0] = pp_set;
-            partition_map[tag] = pp_0;
+            node = _new_partition_node(next_partition_id);
+            next_partition_id++;
 
-            diskp_to_pp[other_partition] = pp_0;
+            _tag_nodes.set(tag, node);
+            diskp_to_node[other_partition] = node;
         }
     } else {			// yes, we've seen this tag before...
-        PartitionID * existing_pp_0 = diskp_to_pp[other_partition];
-
-        if (existing_pp_0) {	// mapping exists.  copacetic?
-            if (*pp_0 == *existing_pp_0) {
-                ;			// yep! nothing to do, yay!
-            } else {
+        if (di != diskp_to_node.end()) {    // mapping exists.  copacetic?
+            uint32_t root = _find_root(node);
+            uint32_t existing_root = _find_root(di->second);
+            if (root != existing_root) {
                 // remapping must be done... we need to merge!
-                // the two partitions to merge are *pp_0 and *existing_pp_0.
-                // we also need to reset existing_pp_0 in diskp_to_pp to pp_0.
-
-                pp_0 = _merge_two_partitions(pp_0, existing_pp_0);
-                diskp_to_pp[other_partition] = pp_0;
+                di->second = _merge_two_partitions(root, existing_root);
             }
         } else {
             // no, does not exist in our mapping yet.  but that's ok,
             // we can fix that.
-            diskp_to_pp[other_partition] = pp_0;
+            diskp_to_node[other_partition] = node;
         }
     }
 }
@@ -1272,197 +1470,47 @@ void SubsetPartition::_merge_other(
 
 void SubsetPartition::merge_from_disk(string other_filename)
 {
-    ifstream infile;
-    unsigned long long expected_pmap_size;
-
-    // configure ifstream to raise exceptions for everything.
-    infile.exceptions(std::ifstream::failbit | std::ifstream::badbit);
-
-    try {
-        infile.open(other_filename.c_str(), ios::binary);
-    }  catch (std::ifstream::failure &e) {
-        std::string err;
-        if (!infile.is_open()) {
-            err = "Cannot open subset pmap file: " + other_filename;
-        } else {
-            err = "Unknown error in opening file: " + other_filename;
-        }
-        throw khmer_file_exception(err);
-    }
-
-    try {
-        unsigned int save_ksize = 0;
-        char signature[4];
-        unsigned char version, ht_type;
-
-        infile.read(signature, 4);
-        infile.read((char *) &version, 1);
-        infile.read((char *) &ht_type, 1);
-        if (!(std::string(signature, 4) == SAVED_SIGNATURE)) {
-            std::ostringstream err;
-            err << "Incorrect file signature 0x";
-            for(size_t i=0; i < 4; ++i) {
-                err << std::hex << (int) signature[i];
-            }
-            err << " while reading subset pmap from " << other_filename
-                << " Should be: " << SAVED_SIGNATURE;
-            throw khmer_file_exception(err.str());
-        } else if (!(version == SAVED_FORMAT_VERSION)) {
-            std::ostringstream err;
-            err << "Incorrect file format version " << (int) version
-                << " while reading subset pmap from " << other_filename;
-            throw khmer_file_exception(err.str());
-        } else if (!(ht_type == SAVED_SUBSET)) {
-            std::ostringstream err;
-            err << "Incorrect file format type " << (int) ht_type
-                << " while reading subset pmap from " << other_filename;
-            throw khmer_file_exception(err.str());
-        }
-
-        infile.read((char *) &save_ksize, sizeof(save_ksize));
-        if (!(save_ksize == _ht->ksize())) {
-            std::ostringstream err;
-            err << "Incorrect k-mer size " << save_ksize
-                << " while reading subset pmap from " << other_filename;
-            throw khmer_file_exception(err.str());
-        }
-
-        infile.read((char *) &expected_pmap_size, sizeof(expected_pmap_size));
-    } catch (std::ifstream::failure &e) {
-        std::string err;
-        err = "Unknown error reading header info from: " + other_filename;
-        throw khmer_file_exception(err);
-    }
-
-    char * buf = new char[IO_BUF_SIZE];
+    PmapReader reader(other_filename, _ht->ksize());
 
-    unsigned int loaded = 0;
-    long remainder;
-
-
-    PartitionPtrMap diskp_to_pp;
-
-    HashIntoType * kmer_p = NULL;
-    PartitionID * diskp = NULL;
-
-    //
-    // Run through the entire partitionmap file, figuring out what partition
-    // IDs are present.
-    //
-
-    remainder = 0;
-    unsigned int iteration = 0;
-    while (!infile.eof()) {
-        unsigned int i;
-
-        try {
-            infile.read(buf + remainder, IO_BUF_SIZE - remainder);
-        } catch (std::ifstream::failure &e) {
-
-            // We may get an exception here if we fail to read all the
-            // expected bytes due to EOF -- only pass it up if we read
-            // _nothing_.  Note that the while loop exits on EOF.
-
-            if (infile.gcount() == 0) {
-                delete[] buf;
-                std::string err;
-                err = "Unknown error reading data from: " + other_filename;
-                throw khmer_file_exception(err);
-            }
-        }
-
-        long n_bytes = infile.gcount() + remainder;
-        remainder = n_bytes % (sizeof(PartitionID) + sizeof(HashIntoType));
-        n_bytes -= remainder;
-
-        iteration++;
-
-        for (i = 0; i < n_bytes;) {
-            kmer_p = (HashIntoType *) (buf + i);
-            i += sizeof(HashIntoType);
-            diskp = (PartitionID *) (buf + i);
-            i += sizeof(PartitionID);
-
-            assert((*diskp != 0)); // sanity check!
+    PartitionNodeMap diskp_to_node;
+    HashIntoType kmer;
+    PartitionID diskp;
 
-            _merge_other(*kmer_p, *diskp, diskp_to_pp);
+    while (reader.next(kmer, diskp)) {
+        assert((diskp != 0)); // sanity check!
 
-            loaded++;
-        }
-        assert(i == n_bytes);
-        memcpy(buf, buf + n_bytes, remainder);
-    }
-    delete[] buf;
-
-    if (loaded != expected_pmap_size) {
-        throw khmer_file_exception("error loading partitionmap - "
-                                   "invalid # of items");
+        _merge_other(kmer, diskp, diskp_to_node);
     }
 }
 
-// Save a partition map to disk.
+// Save a partition map to disk, as a packed partition map.
 
 void SubsetPartition::save_partitionmap(string pmap_filename)
 {
-    ofstream outfile(pmap_filename.c_str(), ios::binary);
-
-    unsigned char version = SAVED_FORMAT_VERSION;
-    outfile.write(SAVED_SIGNATURE, 4);
-    outfile.write((const char *) &version, 1);
+    // Only tags with a partition are saved.
+    std::vector<HashIntoType> tags;
+    _tag_nodes.get_sorted_tags(tags);
 
-    unsigned char ht_type = SAVED_SUBSET;
-    outfile.write((const char *) &ht_type, 1);
-
-    unsigned int save_ksize = _ht->ksize();
-    outfile.write((const char *) &save_ksize, sizeof(save_ksize));
-
-    unsigned long long pmap_size = partition_map.size();
-    outfile.write((const char *) &pmap_size, sizeof(pmap_size));
-
-    ///
+    unsigned long long pmap_size = 0;
+    for (size_t i = 0; i < tags.size(); i++) {
+        if (_tag_nodes.get(tags[i]) < TagPartitionMap::NO_PARTITION) {
+            pmap_size++;
+        }
+    }
 
-    char * buf = NULL;
-    buf = new char[IO_BUF_SIZE];
-    unsigned int n_bytes = 0;
+    PmapWriter writer(pmap_filename, _ht->ksize(), pmap_size);
 
     // For each tag in the partition map, save the tag and the associated
     // partition ID.
 
-    PartitionMap::const_iterator pi = partition_map.begin();
-    for (; pi != partition_map.end(); ++pi) {
-        HashIntoType kmer = pi->first;
-        if (pi->second != NULL) {	// if a partition ID has been
-            /// assigned... save.
-            PartitionID p_id = *(pi->second);
-
-            // each record consists of one tag followed by one PartitionID.
-            HashIntoType * kmer_p = (HashIntoType *) (buf + n_bytes);
-            *kmer_p = kmer;
-            n_bytes += sizeof(HashIntoType);
-
-            PartitionID * pp = (PartitionID *) (buf + n_bytes);
-            *pp = p_id;
-            n_bytes += sizeof(PartitionID);
-
-            // flush to disk
-            if (n_bytes >= IO_BUF_SIZE - sizeof(HashIntoType) -
-                    sizeof(PartitionID)) {
-                outfile.write(buf, n_bytes);
-                n_bytes = 0;
-            }
+    std::vector<HashIntoType>::const_iterator ti = tags.begin();
+    for (; ti != tags.end(); ++ti) {
+        uint32_t node = _tag_nodes.get(*ti);
+        if (node < TagPartitionMap::NO_PARTITION) {
+            writer.append(*ti, _node_partition_id(node));
         }
     }
-    // save remainder.
-    if (n_bytes) {
-        outfile.write(buf, n_bytes);
-    }
-    if (outfile.fail()) {
-        delete[] buf;
-        throw khmer_file_exception(strerror(errno));
-    }
-    outfile.close();
-
-    delete[] buf;
+    writer.close();
 }
 
 // Load a partition map from disk.
@@ -1476,36 +1524,24 @@ void SubsetPartition::load_partitionmap(string infilename)
 
 void SubsetPartition::_validate_pmap()
 {
-    for (PartitionMap::const_iterator pi = partition_map.begin();
-            pi != partition_map.end(); ++pi) {
-        //HashIntoType kmer = (*pi).first;
-        PartitionID * pp_id = (*pi).second;
+    for (size_t i = 0; i < _tag_nodes.n_slots(); i++) {
+        uint32_t node = _tag_nodes.slot_node(i);
 
-        if (pp_id != NULL) {
-            if (!(*pp_id >= 1) || !(*pp_id < next_partition_id)) {
+        if (_tag_nodes.slot_used(i) && node != TagPartitionMap::NO_PARTITION) {
+            PartitionID p = _node_partition_id(node);
+            if (!(p >= 1) || !(p < next_partition_id)) {
                 throw khmer_exception();
             }
         }
     }
 
-    for (ReversePartitionMap::const_iterator ri = reverse_pmap.begin();
-            ri != reverse_pmap.end(); ++ri) {
-        PartitionID p = (*ri).first;
-        PartitionPtrSet *s = (*ri).second;
+    for (PartitionNodeMap::const_iterator pi = _partition_nodes.begin();
+            pi != _partition_nodes.end(); ++pi) {
+        PartitionID p = (*pi).first;
 
-        if (!(s != NULL)) {
+        if (!(p == _node_partition[_find_root(pi->second)])) {
             throw khmer_exception();
         }
-
-        for (PartitionPtrSet::const_iterator si = s->begin(); si != s->end();
-                ++si) {
-            PartitionID * pp;
-            pp = *si;
-
-            if (!(p == *pp)) {
-                throw khmer_exception();
-            }
-        }
     }
 }
 
@@ -1513,21 +1549,14 @@ void SubsetPartition::_validate_pmap()
 
 void SubsetPartition::_clear_all_partitions()
 {
-    for (ReversePartitionMap::iterator ri = reverse_pmap.begin();
-            ri != reverse_pmap.end(); ++ri) {
-        PartitionPtrSet * s = (*ri).second;
-
-        for (PartitionPtrSet::iterator pi = s->begin(); pi != s->end(); ++pi) {
-            PartitionID * pp = (*pi);
-            delete pp;
-        }
-        delete s;
-    }
-    partition_map.clear();
+    _tag_nodes.clear();
+    _parent.clear();
+    _node_partition.clear();
+    _set_size.clear();
+    _partition_nodes.clear();
     next_partition_id = 1;
 }
 
-
 bool SubsetPartition::is_single_partition(std::string seq)
 {
     if (!_ht->check_and_normalize_read(seq)) {
@@ -1535,17 +1564,14 @@ bool SubsetPartition::is_single_partition(std::string seq)
     }
 
     PartitionSet partitions;
-    PartitionID *pp;
 
     KMerIterator kmers(seq.c_str(), _ht->ksize());
     while (!kmers.done()) {
         HashIntoType kmer = kmers.next();
 
-        if (partition_map.find(kmer) != partition_map.end()) {
-            pp = partition_map[kmer];
-            if (pp) {
-                partitions.insert(*pp);
-            }
+        uint32_t node = _tag_nodes.get(kmer);
+        if (node < TagPartitionMap::NO_PARTITION) {
+            partitions.insert(_node_partition_id(node));
         }
     }
 
@@ -1564,7 +1590,7 @@ void SubsetPartition::join_partitions_by_path(std::string seq)
 
     while(!kmers.done()) {
         HashIntoType kmer = kmers.next();
-        if (_ht->all_tags.find(kmer) != _ht->all_tags.end()) {
+        if (set_contains(_ht->all_tags, kmer)) {
             tagged_kmers.insert(kmer);
         }
     }
@@ -1596,10 +1622,13 @@ const
     n_unassigned = 0;
 
     // @CTB: should this be all_tags? See count_partitions.
-    for (PartitionMap::const_iterator pi = partition_map.begin();
-            pi != partition_map.end(); ++pi) {
-        if (pi->second) {
-            cm[*(pi->second)]++;
+    for (size_t i = 0; i < _tag_nodes.n_slots(); i++) {
+        if (!_tag_nodes.slot_used(i)) {
+            continue;
+        }
+        uint32_t node = _tag_nodes.slot_node(i);
+        if (node != TagPartitionMap::NO_PARTITION) {
+            cm[_node_partition_id(node)]++;
         } else {
             n_unassigned++;
         }
@@ -1614,12 +1643,13 @@ void SubsetPartition::partition_average_coverages(
     PartitionCountMap cN;
 
     // CTB: should *only* be members of this partition, so *not* all_tags.
-    for (PartitionMap::const_iterator pi = partition_map.begin();
-            pi != partition_map.end(); ++pi) {
-        if (pi->second) {
-            BoundedCounterType count = ht->get_count(pi->first);
-            csum[*(pi->second)] += count;
-            cN[*(pi->second)]++;
+    for (size_t i = 0; i < _tag_nodes.n_slots(); i++) {
+        uint32_t node = _tag_nodes.slot_node(i);
+        if (_tag_nodes.slot_used(i) && node != TagPartitionMap::NO_PARTITION) {
+            PartitionID p = _node_partition_id(node);
+            BoundedCounterType count = ht->get_count(_tag_nodes.slot_tag(i));
+            csum[p] += count;
+            cN[p]++;
         }
     }
 
@@ -1645,14 +1675,7 @@ unsigned long long SubsetPartition::repartition_largest_partition(
 #endif // 0
 
     // first, count the number of members in each partition.
-    for (PartitionMap::const_iterator pi = partition_map.begin();
-            pi != partition_map.end(); ++pi) {
-        if (pi->second) {
-            cm[*(pi->second)]++;
-        } else {
-            n_unassigned++;
-        }
-    }
+    partition_sizes(cm, n_unassigned);
 
     // then, build the distribution.
     PartitionCountDistribution d;
@@ -1710,7 +1733,7 @@ unsigned long long SubsetPartition::repartition_largest_partition(
     unsigned int n = 0;
     unsigned int count;
     unsigned int n_big = 0;
-    SeenSet keeper;
+    KmerSet keeper;
 
     SeenSet::const_iterator si = bigtags.begin();
 
@@ -1728,7 +1751,7 @@ unsigned long long SubsetPartition::repartition_largest_partition(
         if (count >= threshold) {
             n_big++;
 
-            SeenSet::const_iterator ti;
+            KmerSet::const_iterator ti;
             for (ti = keeper.begin(); ti != keeper.end(); ++ti) {
                 if (counting.get_count(*ti) > frequency) {
                     _ht->stop_tags.insert(*ti);
@@ -1817,40 +1840,34 @@ void SubsetPartition::_clear_partition(
 {
     partition_tags.clear();
 
-    for (PartitionMap::iterator pi = partition_map.begin();
-            pi != partition_map.end(); ++pi) {
-        if (pi->second && *(pi->second) == the_partition) {
-            partition_tags.insert(pi->first);
+    for (size_t i = 0; i < _tag_nodes.n_slots(); i++) {
+        uint32_t node = _tag_nodes.slot_node(i);
+        if (_tag_nodes.slot_used(i) && node != TagPartitionMap::NO_PARTITION &&
+                _node_partition_id(node) == the_partition) {
+            partition_tags.insert(_tag_nodes.slot_tag(i));
         }
     }
 
     for (SeenSet::const_iterator si = partition_tags.begin();
             si != partition_tags.end(); ++si) {
-        partition_map.erase(*si);
-    }
-
-    // clear out the reverse partition mapping, too.
-    PartitionPtrSet * ps = reverse_pmap[the_partition];
-    for (PartitionPtrSet::iterator psi = ps->begin(); psi != ps->end();
-            ++psi) {
-        delete *psi;
+        _tag_nodes.erase(*si);
     }
-    delete ps;
 
-    reverse_pmap.erase(the_partition);
+    // forget the partition itself, too; its nodes are left unreferenced.
+    _partition_nodes.erase(the_partition);
 }
 
 void SubsetPartition::report_on_partitions()
 {
     std::cout << _ht->all_tags.size() << " tags total\n";
-    std::cout << reverse_pmap.size() << " partitions total\n";
+    std::cout << _partition_nodes.size() << " partitions total\n";
 
-    for (SeenSet::iterator ti = _ht->all_tags.begin();
+    for (KmerSet::const_iterator ti = _ht->all_tags.begin();
             ti != _ht->all_tags.end(); ++ti) {
         std::cout << "TAG: " << _revhash(*ti, _ht->ksize()) << "\n";
-        PartitionID *pid = partition_map[*ti];
-        if (pid) {
-            std::cout << "partition: " << *(partition_map[*ti]) << "\n";
+        uint32_t node = _tag_nodes.get_or_add(*ti);
+        if (node != TagPartitionMap::NO_PARTITION) {
+            std::cout << "partition: " << _node_partition_id(node) << "\n";
         } else {
             std::cout << "NULL.\n";
         }
@@ -1868,12 +1885,15 @@ void SubsetPartition::compare_to_partition(
 {
     SubsetPartition * p1 = this;
 
-    for (PartitionMap::iterator pi = p1->partition_map.begin();
-            pi != p1->partition_map.end(); ++pi) {
-        PartitionID * pid = pi->second;
-        if (pid && *pid == pid1) {
-            PartitionID * pp2 = p2->partition_map[pi->first];
-            if (pp2 && *pp2 == pid2) {
+    for (size_t i = 0; i < p1->_tag_nodes.n_slots(); i++) {
+        uint32_t node = p1->_tag_nodes.slot_node(i);
+        if (p1->_tag_nodes.slot_used(i) &&
+                node != TagPartitionMap::NO_PARTITION &&
+                p1->_node_partition_id(node) == pid1) {
+            uint32_t node2 =
+                p2->_tag_nodes.get_or_add(p1->_tag_nodes.slot_tag(i));
+            if (node2 < TagPartitionMap::NO_PARTITION &&
+                    p2->_node_partition_id(node2) == pid2) {
                 n_shared++;
             } else {
                 n_only1++;
@@ -1881,10 +1901,11 @@ void SubsetPartition::compare_to_partition(
         }
     }
 
-    for (PartitionMap::iterator pi = p2->partition_map.begin();
-            pi != p2->partition_map.end(); ++pi) {
-        PartitionID * pid = pi->second;
-        if (pid && *pid == pid2) {
+    for (size_t i = 0; i < p2->_tag_nodes.n_slots(); i++) {
+        uint32_t node = p2->_tag_nodes.slot_node(i);
+        if (p2->_tag_nodes.slot_used(i) &&
+                node != TagPartitionMap::NO_PARTITION &&
+                p2->_node_partition_id(node) == pid2) {
             n_only2++;
         }
     }
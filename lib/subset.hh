@@ -9,10 +9,14 @@
 #define SUBSET_HH
 
 #include <stddef.h>
+#include <stdint.h>
 #include <queue>
 #include <string>
+#include <vector>
 
 #include "khmer.hh"
+#include "kmer_hash.hh"
+#include "kmer_set.hh"
 
 namespace khmer
 {
@@ -27,21 +31,149 @@ struct pre_partition_info {
     explicit pre_partition_info(HashIntoType _kmer) : kmer(_kmer) {};
 };
 
+// Flat open-addressing table, with linear probing, from each tag to the
+// node of the partition forest that holds its partition. A tag can also be
+// present without a partition, which is how the partitioning code marks
+// tags it has looked at but not yet assigned.
+class TagPartitionMap
+{
+protected:
+    std::vector<HashIntoType> _tags;
+    std::vector<uint32_t> _nodes;   // EMPTY_SLOT marks a free slot
+    size_t _n_entries;
+
+    size_t _find(HashIntoType tag) const
+    {
+        size_t mask = _tags.size() - 1;
+        size_t i = _mix_hash(tag) & mask;
+        while (_nodes[i] != EMPTY_SLOT && _tags[i] != tag) {
+            i = (i + 1) & mask;
+        }
+        return i;
+    }
+
+    void _grow();
+
+public:
+    static const uint32_t EMPTY_SLOT = 0xffffffff;
+    static const uint32_t NO_PARTITION = 0xfffffffe;
+
+    TagPartitionMap() : _n_entries(0) {}
+
+    size_t size() const
+    {
+        return _n_entries;
+    }
+
+    // Node for tag; NO_PARTITION if it has none, EMPTY_SLOT if absent.
+    uint32_t get(HashIntoType tag) const
+    {
+        if (_n_entries == 0) {
+            return EMPTY_SLOT;
+        }
+        return _nodes[_find(tag)];
+    }
+
+    // Node for tag, adding the tag without a partition if it is absent.
+    uint32_t get_or_add(HashIntoType tag)
+    {
+        uint32_t node = get(tag);
+        if (node == EMPTY_SLOT) {
+            set(tag, NO_PARTITION);
+            node = NO_PARTITION;
+        }
+        return node;
+    }
+
+    void set(HashIntoType tag, uint32_t node)
+    {
+        if ((_n_entries + 1) * 4 > _tags.size() * 3) {
+            _grow();
+        }
+        size_t i = _find(tag);
+        if (_nodes[i] == EMPTY_SLOT) {
+            _tags[i] = tag;
+            _n_entries++;
+        }
+        _nodes[i] = node;
+    }
+
+    bool erase(HashIntoType tag);
+
+    void clear()
+    {
+        _tags.clear();
+        _nodes.clear();
+        _n_entries = 0;
+    }
+
+    // Raw slot access, for walking over every entry.
+    size_t n_slots() const
+    {
+        return _tags.size();
+    }
+    bool slot_used(size_t i) const
+    {
+        return _nodes[i] != EMPTY_SLOT;
+    }
+    HashIntoType slot_tag(size_t i) const
+    {
+        return _tags[i];
+    }
+    uint32_t slot_node(size_t i) const
+    {
+        return _nodes[i];
+    }
+
+    // All of the tags, in sorted order.
+    void get_sorted_tags(std::vector<HashIntoType> &tags) const;
+};
+
 class SubsetPartition
 {
     friend class Hashtable;
 protected:
     unsigned int next_partition_id;
     Hashtable * _ht;
-    PartitionMap partition_map;
-    ReversePartitionMap reverse_pmap;
+
+    // Partitions are kept as a disjoint-set forest: every partition ever
+    // created gets a node, merging two partitions links the root of the
+    // smaller set under the root of the larger, and the PartitionID of a
+    // set is the one held by its root.
+    TagPartitionMap _tag_nodes;
+    mutable std::vector<uint32_t> _parent;
+    std::vector<PartitionID> _node_partition;
+    std::vector<uint32_t> _set_size;    // number of nodes, at roots
+
+    // A node of each live partition.
+    PartitionNodeMap _partition_nodes;
 
     void _clear_all_partitions();
 
-    PartitionID * _merge_two_partitions(PartitionID *orig_pp,
-                                        PartitionID *new_pp);
-    PartitionID * _join_partitions_by_tags(const SeenSet& tagged_kmers,
-                                           const HashIntoType kmer);
+    uint32_t _new_partition_node(PartitionID p);
+
+    uint32_t _find_root(uint32_t node) const
+    {
+        while (_parent[node] != node) {
+            _parent[node] = _parent[_parent[node]];     // path halving
+            node = _parent[node];
+        }
+        return node;
+    }
+
+    // PartitionID of the set holding node, or 0 for NO_PARTITION and
+    // EMPTY_SLOT.
+    PartitionID _node_partition_id(uint32_t node) const
+    {
+        if (node >= TagPartitionMap::NO_PARTITION) {
+            return 0;
+        }
+        return _node_partition[_find_root(node)];
+    }
+
+    uint32_t _merge_two_partitions(uint32_t orig_node, uint32_t new_node);
+    uint32_t _join_partitions_by_tags(const SeenSet& tagged_kmers,
+                                      const HashIntoType kmer);
 
 public:
     explicit SubsetPartition(Hashtable * ht) : next_partition_id(2), _ht(ht)
@@ -62,16 +194,8 @@ public:
     PartitionID get_partition_id(std::string kmer_s);
     PartitionID get_partition_id(HashIntoType kmer);
 
-    PartitionID * get_new_partition()
-    {
-        PartitionID* pp = new PartitionID(next_partition_id);
-        next_partition_id++;
-        return pp;
-    }
-
     void merge(SubsetPartition *);
     void merge_from_disk(std::string);
-    void _merge_from_disk_consolidate(PartitionPtrMap&);
 
     void save_partitionmap(std::string outfile);
     void load_partitionmap(std::string infile);
@@ -80,19 +204,19 @@ public:
     void queue_neighbors(HashIntoType kmer_f,
                          HashIntoType kmer_r,
                          unsigned int breadth,
-                         SeenSet& traversed_kmers,
+                         KmerSet& traversed_kmers,
                          NodeQueue& node_q,
                          std::queue<unsigned int>& breadth_q);
 
     void find_all_tags(HashIntoType kmer_f, HashIntoType kmer_r,
                        SeenSet& tagged_kmers,
-                       const SeenSet& all_tags,
+                       const KmerSet& all_tags,
                        bool break_on_stop_tags=false,
                        bool stop_big_traversals=false);
 
     unsigned int sweep_for_tags(const std::string& seq,
                                 SeenSet& tagged_kmers,
-                                const SeenSet& all_tags,
+                                const KmerSet& all_tags,
                                 unsigned int range,
                                 bool break_on_stop_tags,
                                 bool stop_big_traversals);
@@ -100,7 +224,7 @@ public:
     void find_all_tags_truncate_on_abundance(HashIntoType kmer_f,
             HashIntoType kmer_r,
             SeenSet& tagged_kmers,
-            const SeenSet& all_tags,
+            const KmerSet& all_tags,
             BoundedCounterType min_count,
             BoundedCounterType max_count,
             bool break_on_stop_tags=false,
@@ -113,6 +237,10 @@ public:
                       CallbackFn callback=0,
                       void * callback_data=0);
 
+    void partition_graph(unsigned int n_threads,
+                         bool break_on_stop_tags=false,
+                         bool stop_big_traversals=false);
+
     void do_partition_with_abundance(HashIntoType first_kmer,
                                      HashIntoType last_kmer,
                                      BoundedCounterType min_count,
@@ -158,7 +286,7 @@ public:
 
     void _merge_other(HashIntoType tag,
                       PartitionID other_partition,
-                      PartitionPtrMap& diskp_to_pp);
+                      PartitionNodeMap& diskp_to_node);
 
     void report_on_partitions();
 
@@ -0,0 +1,525 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#include <ctype.h>
+#include <string.h>
+#include <algorithm>
+
+#include "counting.hh"
+#include "read_buffer.hh"
+#include "record_writer.hh"
+#include "trimming.hh"
+
+using namespace khmer;
+using namespace khmer::read_parsers;
+
+BrokenPairedReader::BrokenPairedReader(
+    IParser *	parser,
+    size_t	min_length,
+    bool	force_single)
+    : _parser(parser), _min_length(min_length), _force_single(force_single),
+      _n_parsed(0), _pos(0), _done(false), _have_prev(false)
+{
+}
+
+// Split a read name at the first run of whitespace, as Python's
+// name.split(None, 1) does.
+static void _split_left_right(const std::string& name, std::string& lhs,
+                              std::string& rhs)
+{
+    size_t i = 0, n = name.length();
+    while (i < n && isspace((unsigned char) name[i])) {
+        i++;
+    }
+    size_t start = i;
+    while (i < n && !isspace((unsigned char) name[i])) {
+        i++;
+    }
+    lhs.assign(name, start, i - start);
+    while (i < n && isspace((unsigned char) name[i])) {
+        i++;
+    }
+    rhs.assign(name, i, n - i);
+}
+
+static bool _ends_with(const std::string& s, const char * suffix)
+{
+    size_t n = strlen(suffix);
+    return s.length() >= n && s.compare(s.length() - n, n, suffix) == 0;
+}
+
+static bool _same_before_slash(const std::string& s1, const std::string& s2)
+{
+    std::string sub1 = s1.substr(0, s1.find('/'));
+    return !sub1.empty() && sub1 == s2.substr(0, s2.find('/'));
+}
+
+// Handles 'name/1' and 'name/2', Casava's 'name 1:...' and 'name 2:...',
+// and fastq-dump's 'accession name/1' and 'accession name/2'.
+
+bool BrokenPairedReader::is_pair(const Read& read1, const Read& read2)
+{
+    std::string lhs1, rhs1, lhs2, rhs2;
+    _split_left_right(read1.name, lhs1, rhs1);
+    _split_left_right(read2.name, lhs2, rhs2);
+
+    if (_ends_with(lhs1, "/1") && _ends_with(lhs2, "/2")) {
+        return _same_before_slash(lhs1, lhs2);
+    } else if (lhs1 == lhs2 && rhs1.compare(0, 2, "1:") == 0 &&
+               rhs2.compare(0, 2, "2:") == 0) {
+        return true;
+    } else if (lhs1 == lhs2 && _ends_with(rhs1, "/1") &&
+               _ends_with(rhs2, "/2")) {
+        return _same_before_slash(rhs1, rhs2);
+    }
+    return false;
+}
+
+static void _take_read(std::vector<Read>& reads, size_t& n_reads, Read& read)
+{
+    if (reads.size() <= n_reads) {
+        reads.resize(n_reads + 1);
+    }
+    std::swap(reads[n_reads++], read);
+}
+
+size_t BrokenPairedReader::next_batch(
+    std::vector<Read>&	reads,
+    std::vector<size_t>&	starts,
+    size_t		n_fragments)
+{
+    size_t n_reads = 0;
+    starts.clear();
+
+    while (starts.size() < n_fragments) {
+        if (_pos == _n_parsed) {
+            if (!_done) {
+                _n_parsed = _parser->imprint_next_read_batch(_parsed);
+                _pos = 0;
+                _done = (_n_parsed == 0);
+            }
+            if (!_done) {
+                continue;
+            }
+            // the last read, if it wasn't paired.
+            if (_have_prev) {
+                starts.push_back(n_reads);
+                _take_read(reads, n_reads, _prev);
+                _have_prev = false;
+            }
+            break;
+        }
+
+        Read& read = _parsed[_pos++];
+        if (read.sequence.length() < _min_length) {
+            continue;
+        }
+        if (!_have_prev) {
+            std::swap(_prev, read);
+            _have_prev = true;
+            continue;
+        }
+
+        starts.push_back(n_reads);
+        _take_read(reads, n_reads, _prev);
+        if (!_force_single && is_pair(reads[n_reads - 1], read)) {
+            _take_read(reads, n_reads, read);
+            _have_prev = false;
+        } else {
+            std::swap(_prev, read);
+        }
+    }
+
+    size_t n = starts.size();
+    starts.push_back(n_reads);
+    return n;
+}
+
+void TrimStats::add(const TrimStats& other)
+{
+    n_reads += other.n_reads;
+    n_bp += other.n_bp;
+    set_aside_reads += other.set_aside_reads;
+    written_reads += other.written_reads;
+    written_bp += other.written_bp;
+    trimmed_reads += other.trimmed_reads;
+    corrected_reads += other.corrected_reads;
+    skipped_reads += other.skipped_reads;
+    skipped_bp += other.skipped_bp;
+}
+
+StreamingTrimmer::StreamingTrimmer(
+    CountingHash *	graph,
+    BoundedCounterType	cutoff,
+    BoundedCounterType	normalize_limit,
+    bool		variable_coverage)
+    : _graph(graph), _cutoff(cutoff), _normalize_limit(normalize_limit),
+      _variable_coverage(variable_coverage)
+{
+}
+
+// The median k-mer abundance of a read, with 'N' already read as 'A', and
+// the point to trim it at, as trim-low-abund.py finds them: the median is
+// taken over the k-mers of the read as consume() counts them, and the trim
+// point over those of the normalized read, as with trim_on_abundance().
+
+void StreamingTrimmer::_median_and_trim(
+    const std::string&	seq,
+    std::vector<BoundedCounterType>&	counts,
+    BoundedCounterType&	median,
+    unsigned long&	trim_at)
+{
+    WordLength ksize = _graph->ksize();
+    median = 0;
+    trim_at = 0;
+
+    if (seq.length() < ksize) {
+        return;
+    }
+
+    counts.clear();
+    _graph->get_kmer_counts(seq, counts);
+
+    std::string normalized(seq);
+    if (_graph->check_and_normalize_read(normalized)) {
+        if (normalized != seq) {
+            trim_at = _graph->trim_on_abundance(normalized, _cutoff);
+        } else if (counts.size() > 1 && counts[0] >= _cutoff) {
+            // a lone k-mer trims to nothing.
+            size_t i = 1;
+            while (i < counts.size() && counts[i] >= _cutoff) {
+                i++;
+            }
+            trim_at = (i == counts.size()) ? seq.length() : i + ksize - 1;
+        }
+    }
+
+    std::nth_element(counts.begin(), counts.begin() + counts.size() / 2,
+                     counts.end());
+    median = counts[counts.size() / 2];
+}
+
+// The median alone, as get_median_count() finds it.
+BoundedCounterType StreamingTrimmer::_median(
+    const std::string&	seq,
+    std::vector<BoundedCounterType>&	counts)
+{
+    if (seq.length() < _graph->ksize()) {
+        return 0;
+    }
+
+    counts.clear();
+    _graph->get_kmer_counts(seq, counts);
+    std::nth_element(counts.begin(), counts.begin() + counts.size() / 2,
+                     counts.end());
+    return counts[counts.size() / 2];
+}
+
+bool StreamingTrimmer::trim_first_pass(
+    Read *		reads,
+    unsigned int	n_reads,
+    char *		write,
+    TrimStats&		stats)
+{
+    std::vector<BoundedCounterType> counts;
+    std::string seqs[2];
+    unsigned long trim_at[2];
+    bool set_aside = false;
+
+    for (unsigned int i = 0; i < n_reads; ++i) {
+        BoundedCounterType median;
+
+        seqs[i] = reads[i].sequence;
+        std::replace(seqs[i].begin(), seqs[i].end(), 'N', 'A');
+        _median_and_trim(seqs[i], counts, median, trim_at[i]);
+        if (median < _normalize_limit) {
+            set_aside = true;
+        }
+        stats.n_reads++;
+        stats.n_bp += seqs[i].length();
+    }
+
+    // has this portion of the graph saturated? if not, count the reads and
+    // keep them for the second pass.
+    if (set_aside) {
+        for (unsigned int i = 0; i < n_reads; ++i) {
+            _graph->consume_string(seqs[i]);
+            write[i] = 0;
+        }
+        stats.set_aside_reads += n_reads;
+        return true;
+    }
+
+    WordLength ksize = _graph->ksize();
+    for (unsigned int i = 0; i < n_reads; ++i) {
+        size_t length = reads[i].sequence.length();
+
+        write[i] = (n_reads > 1 || trim_at[i] >= ksize);
+        if (!write[i]) {
+            continue;
+        }
+        if (trim_at[i] >= ksize) {
+            reads[i].sequence.resize(trim_at[i]);
+            if (!reads[i].quality.empty()) {
+                reads[i].quality.resize(trim_at[i]);
+            }
+        }
+        stats.written_reads++;
+        stats.written_bp += trim_at[i];
+        if (trim_at[i] != length) {
+            stats.trimmed_reads++;
+        }
+    }
+    return false;
+}
+
+// Set aside or write out the reads of a first-pass batch, in input order.
+static void _finish_first_pass(
+    const std::vector<Read>&	reads,
+    const std::vector<size_t>&	starts,
+    const std::vector<char>&	set_aside,
+    const std::vector<char>&	write,
+    ReadBuffer&			pass2,
+    unsigned int		group,
+    std::string&		output)
+{
+    for (size_t i = 0; i + 1 < starts.size(); ++i) {
+        for (size_t j = starts[i]; j < starts[i + 1]; ++j) {
+            if (set_aside[i]) {
+                pass2.append(reads[j], !reads[j].quality.empty(), group);
+            } else if (write[j]) {
+                format_record(reads[j], !reads[j].quality.empty(), output);
+            }
+        }
+    }
+}
+
+void StreamingTrimmer::trim_first_pass(
+    std::vector<Read>&		reads,
+    const std::vector<size_t>&	starts,
+    ReadBuffer&			pass2,
+    unsigned int		group,
+    std::string&		output,
+    unsigned int		n_threads)
+{
+    long n_fragments = starts.size() - 1;
+    std::vector<char> set_aside(n_fragments);
+    std::vector<char> write(starts.back());
+    DeferredException error;
+
+    #pragma omp parallel num_threads(n_threads)
+    {
+        TrimStats stats;
+
+        #pragma omp for schedule(dynamic, 64)
+        for (long i = 0; i < n_fragments; ++i) {
+            if (error.is_set()) {
+                continue;
+            }
+            try {
+                set_aside[i] = trim_first_pass(&reads[starts[i]],
+                                               starts[i + 1] - starts[i],
+                                               &write[starts[i]], stats);
+            } catch (...) {
+                error.capture();
+            }
+        }
+
+        #pragma omp critical (trim_stats)
+        _stats.add(stats);
+    }
+    error.rethrow();
+
+    _finish_first_pass(reads, starts, set_aside, write, pass2, group, output);
+}
+
+bool StreamingTrimmer::trim_second_pass(Read& read, bool has_quality)
+{
+    BoundedCounterType median;
+    unsigned long trim_at;
+    size_t length = read.sequence.length();
+
+    std::string seq(read.sequence);
+    std::replace(seq.begin(), seq.end(), 'N', 'A');
+    _median_and_trim(seq, _counts, median, trim_at);
+
+    // do we retain low-abundance components unchanged?
+    if (median < _normalize_limit && _variable_coverage) {
+        _stats.written_reads++;
+        _stats.written_bp += length;
+        _stats.skipped_reads++;
+        _stats.skipped_bp += length;
+        return true;
+    }
+
+    if (trim_at < _graph->ksize()) {
+        return false;
+    }
+
+    read.sequence.resize(trim_at);
+    if (has_quality) {
+        read.quality.resize(trim_at);
+    }
+    _stats.written_reads++;
+    _stats.written_bp += trim_at;
+    if (trim_at != length) {
+        _stats.trimmed_reads++;
+    }
+    return true;
+}
+
+// The aligner has a trusted cutoff of its own, so the trimmer's is unused.
+StreamingCorrector::StreamingCorrector(
+    CountingHash *	graph,
+    ReadAligner *	aligner,
+    BoundedCounterType	normalize_limit,
+    bool		variable_coverage)
+    : StreamingTrimmer(graph, 0, normalize_limit, variable_coverage),
+      _aligner(aligner)
+{
+}
+
+// Correct read, given seq, its sequence with 'N' read as 'A'; returns false,
+// leaving read as it was, if the alignment was truncated.
+
+bool StreamingCorrector::_correct(
+    Read&		read,
+    const std::string&	seq,
+    AlignmentWorkspace&	workspace,
+    TrimStats&		stats)
+{
+    Alignment * aln = _aligner->Align(seq, workspace);
+    if (aln->truncated) {
+        delete aln;
+        return false;
+    }
+
+    std::string corrected;
+    corrected.reserve(aln->graph_alignment.length());
+    for (size_t i = 0; i < aln->graph_alignment.length(); ++i) {
+        if (aln->graph_alignment[i] != '-') {
+            corrected += aln->graph_alignment[i];
+        }
+    }
+    delete aln;
+
+    if (corrected != read.sequence) {
+        stats.corrected_reads++;
+    }
+    read.sequence.swap(corrected);
+    if (!read.quality.empty()) {
+        read.quality.resize(read.sequence.length(), 'I');
+    }
+    return true;
+}
+
+bool StreamingCorrector::correct_first_pass(
+    Read *		reads,
+    unsigned int	n_reads,
+    char *		write,
+    TrimStats&		stats,
+    AlignmentWorkspace&	workspace)
+{
+    std::vector<BoundedCounterType> counts;
+    std::string seqs[2];
+    bool set_aside = false;
+
+    for (unsigned int i = 0; i < n_reads; ++i) {
+        seqs[i] = reads[i].sequence;
+        std::replace(seqs[i].begin(), seqs[i].end(), 'N', 'A');
+        if (_median(seqs[i], counts) < _normalize_limit) {
+            set_aside = true;
+        }
+        stats.n_reads++;
+        stats.n_bp += seqs[i].length();
+    }
+
+    if (set_aside) {
+        for (unsigned int i = 0; i < n_reads; ++i) {
+            _graph->consume_string(seqs[i]);
+            write[i] = 0;
+        }
+        stats.set_aside_reads += n_reads;
+        return true;
+    }
+
+    for (unsigned int i = 0; i < n_reads; ++i) {
+        bool aligned = _correct(reads[i], seqs[i], workspace, stats);
+
+        write[i] = (n_reads > 1 || aligned);
+        if (write[i]) {
+            stats.written_reads++;
+            stats.written_bp += reads[i].sequence.length();
+        }
+    }
+    return false;
+}
+
+void StreamingCorrector::correct_first_pass(
+    std::vector<Read>&		reads,
+    const std::vector<size_t>&	starts,
+    ReadBuffer&			pass2,
+    unsigned int		group,
+    std::string&		output,
+    unsigned int		n_threads)
+{
+    long n_fragments = starts.size() - 1;
+    std::vector<char> set_aside(n_fragments);
+    std::vector<char> write(starts.back());
+    DeferredException error;
+
+    #pragma omp parallel num_threads(n_threads)
+    {
+        TrimStats stats;
+        AlignmentWorkspace workspace;
+
+        #pragma omp for schedule(dynamic, 16)
+        for (long i = 0; i < n_fragments; ++i) {
+            if (error.is_set()) {
+                continue;
+            }
+            try {
+                set_aside[i] = correct_first_pass(&reads[starts[i]],
+                                                  starts[i + 1] - starts[i],
+                                                  &write[starts[i]], stats,
+                                                  workspace);
+            } catch (...) {
+                error.capture();
+            }
+        }
+
+        #pragma omp critical (trim_stats)
+        _stats.add(stats);
+    }
+    error.rethrow();
+
+    _finish_first_pass(reads, starts, set_aside, write, pass2, group, output);
+}
+
+bool StreamingCorrector::correct_second_pass(Read& read, bool has_quality)
+{
+    size_t length = read.sequence.length();
+
+    std::string seq(read.sequence);
+    std::replace(seq.begin(), seq.end(), 'N', 'A');
+
+    // do we retain low-abundance components unchanged?
+    if (_median(seq, _counts) < _normalize_limit && _variable_coverage) {
+        _stats.written_reads++;
+        _stats.written_bp += length;
+        _stats.skipped_reads++;
+        _stats.skipped_bp += length;
+        return true;
+    }
+
+    if (!_correct(read, seq, _workspace, _stats)) {
+        return false;
+    }
+    _stats.written_reads++;
+    _stats.written_bp += read.sequence.length();
+    return true;
+}
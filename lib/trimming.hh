@@ -0,0 +1,200 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef TRIMMING_HH
+#define TRIMMING_HH
+
+#include <string>
+#include <vector>
+
+#include "khmer.hh"
+#include "read_aligner.hh"
+#include "read_parsers.hh"
+
+// fragments (reads or pairs) given to the first-pass threads at a time.
+#define TRIM_FIRST_PASS_BATCH_SIZE 10000
+
+namespace khmer
+{
+class CountingHash;
+class ReadBuffer;
+
+// BrokenPairedReader reads fragments from a parser as
+// khmer.utils.broken_paired_reader() does: reads shorter than min_length
+// are dropped, and a read is paired with the next one if their names say
+// they are the two halves of a pair (see khmer.utils.check_is_pair()),
+// unless force_single is set.
+
+class BrokenPairedReader
+{
+public:
+    BrokenPairedReader(read_parsers::IParser * parser, size_t min_length,
+                       bool force_single);
+
+    // Reads up to n_fragments fragments into reads, and sets starts to the
+    // index in reads of the first read of each, followed by the number of
+    // reads.  Returns the number of fragments, which is 0 at the end.
+    size_t next_batch(std::vector<read_parsers::Read>& reads,
+                      std::vector<size_t>& starts, size_t n_fragments);
+
+    static bool is_pair(const read_parsers::Read& read1,
+                        const read_parsers::Read& read2);
+
+protected:
+    read_parsers::IParser * _parser;
+    size_t _min_length;
+    bool _force_single;
+    std::vector<read_parsers::Read> _parsed;
+    size_t _n_parsed;
+    size_t _pos;			// next read in _parsed
+    bool _done;
+    read_parsers::Read _prev;
+    bool _have_prev;
+};
+
+// Counts kept by a StreamingTrimmer, as reported by trim-low-abund.py.
+struct TrimStats {
+    unsigned long long n_reads;		// read by the first pass
+    unsigned long long n_bp;
+    unsigned long long set_aside_reads;	// kept for the second pass
+    unsigned long long written_reads;
+    unsigned long long written_bp;
+    unsigned long long trimmed_reads;	// written, but trimmed
+    unsigned long long corrected_reads;	// written, but corrected
+    unsigned long long skipped_reads;	// written untrimmed, low coverage
+    unsigned long long skipped_bp;
+
+    TrimStats()
+        : n_reads(0), n_bp(0), set_aside_reads(0), written_reads(0),
+          written_bp(0), trimmed_reads(0), corrected_reads(0),
+          skipped_reads(0), skipped_bp(0)
+    { }
+
+    void add(const TrimStats& other);
+};
+
+// StreamingTrimmer makes the trimming decisions of the streaming
+// low-abundance trimming algorithm (trim-low-abund.py) against a
+// countgraph: reads whose median k-mer abundance is below normalize_limit
+// are set aside for a second pass, and other reads are trimmed at the
+// first k-mer below cutoff, and dropped if less than a k-mer is left.
+// With variable_coverage, reads still below normalize_limit on the second
+// pass are kept untrimmed.
+
+class StreamingTrimmer
+{
+public:
+    StreamingTrimmer(CountingHash * graph, BoundedCounterType cutoff,
+                     BoundedCounterType normalize_limit,
+                     bool variable_coverage);
+    virtual ~StreamingTrimmer() { }
+
+    // First pass over a fragment of n_reads reads (a read, or a pair): if
+    // either read is below normalize_limit the reads are counted into the
+    // graph and true is returned, to set them aside for the second pass.
+    // Otherwise the reads are trimmed in place, and write[i] is set if read
+    // i is to be written.  As trim-low-abund.py always has, both reads of
+    // a pair are written, untrimmed if less than a k-mer would be left.
+    bool trim_first_pass(read_parsers::Read * reads, unsigned int n_reads,
+                         char * write, TrimStats& stats);
+
+    // First pass over a batch of fragments from a BrokenPairedReader, on
+    // n_threads threads sharing the graph.  Reads set aside are appended to
+    // pass2 with the given group, and reads to be written are appended to
+    // output as FASTA or FASTQ records, both in input order.
+    void trim_first_pass(std::vector<read_parsers::Read>& reads,
+                         const std::vector<size_t>& starts,
+                         ReadBuffer& pass2, unsigned int group,
+                         std::string& output, unsigned int n_threads);
+
+    // Second pass over a read set aside by the first: returns false if the
+    // read is to be dropped, and otherwise trims it in place.
+    bool trim_second_pass(read_parsers::Read& read, bool has_quality);
+
+    // The passes the Python bindings run: trim_first_pass() and
+    // trim_second_pass() here, and their counterparts in subclasses.
+    virtual void first_pass(std::vector<read_parsers::Read>& reads,
+                            const std::vector<size_t>& starts,
+                            ReadBuffer& pass2, unsigned int group,
+                            std::string& output, unsigned int n_threads)
+    {
+        trim_first_pass(reads, starts, pass2, group, output, n_threads);
+    }
+    virtual bool second_pass(read_parsers::Read& read, bool has_quality)
+    {
+        return trim_second_pass(read, has_quality);
+    }
+
+    const TrimStats& stats() const
+    {
+        return _stats;
+    }
+
+protected:
+    CountingHash * _graph;
+    BoundedCounterType _cutoff;
+    BoundedCounterType _normalize_limit;
+    bool _variable_coverage;
+    TrimStats _stats;
+    std::vector<BoundedCounterType> _counts;	// for the second pass
+
+    void _median_and_trim(const std::string& seq,
+                          std::vector<BoundedCounterType>& counts,
+                          BoundedCounterType& median, unsigned long& trim_at);
+    BoundedCounterType _median(const std::string& seq,
+                               std::vector<BoundedCounterType>& counts);
+};
+
+// StreamingCorrector runs the same two passes as a StreamingTrimmer, but
+// corrects reads against the graph with a ReadAligner, as
+// sandbox/correct-reads.py does, rather than trimming them: a read whose
+// alignment isn't truncated is replaced by the graph side of it, with its
+// quality string cut or padded with 'I' to match.  Reads that don't align
+// are dropped, except that both reads of a pair from the first pass are
+// always written.  In the first pass the threads share the aligner, each
+// with a workspace of its own.  corrected_reads counts the reads corrected.
+
+class StreamingCorrector : public StreamingTrimmer
+{
+public:
+    StreamingCorrector(CountingHash * graph, ReadAligner * aligner,
+                       BoundedCounterType normalize_limit,
+                       bool variable_coverage);
+
+    // As trim_first_pass(), correcting rather than trimming.
+    bool correct_first_pass(read_parsers::Read * reads, unsigned int n_reads,
+                            char * write, TrimStats& stats,
+                            AlignmentWorkspace& workspace);
+
+    void correct_first_pass(std::vector<read_parsers::Read>& reads,
+                            const std::vector<size_t>& starts,
+                            ReadBuffer& pass2, unsigned int group,
+                            std::string& output, unsigned int n_threads);
+    bool correct_second_pass(read_parsers::Read& read, bool has_quality);
+
+    virtual void first_pass(std::vector<read_parsers::Read>& reads,
+                            const std::vector<size_t>& starts,
+                            ReadBuffer& pass2, unsigned int group,
+                            std::string& output, unsigned int n_threads)
+    {
+        correct_first_pass(reads, starts, pass2, group, output, n_threads);
+    }
+    virtual bool second_pass(read_parsers::Read& read, bool has_quality)
+    {
+        return correct_second_pass(read, has_quality);
+    }
+
+protected:
+    ReadAligner * _aligner;
+    AlignmentWorkspace _workspace;	// for the second pass
+
+    bool _correct(read_parsers::Read& read, const std::string& seq,
+                  AlignmentWorkspace& workspace, TrimStats& stats);
+};
+}
+
+#endif // TRIMMING_HH
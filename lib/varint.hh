@@ -0,0 +1,50 @@
+//
+// This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+// Copyright (C) Michigan State University, 2009-2015. It is licensed under
+// the three-clause BSD license; see LICENSE.
+// Contact: khmer-project@idyll.org
+//
+
+#ifndef VARINT_HH
+#define VARINT_HH
+
+#include <stddef.h>
+#include <stdint.h>
+#include <string>
+
+namespace khmer
+{
+
+//
+// Variable-length integers, as the partition map files and the read buffer
+// spill files store them: seven bits a byte, least significant first, with
+// the high bit set on every byte but the last.
+//
+
+inline void put_varint(std::string& buf, uint64_t value)
+{
+    while (value >= 0x80) {
+        buf.push_back((char) ((value & 0x7f) | 0x80));
+        value >>= 7;
+    }
+    buf.push_back((char) value);
+}
+
+// Reads the varint at pos in buf, and moves pos past it. Returns false if
+// buf ends before the varint does, or it is longer than 64 bits.
+inline bool get_varint(const std::string& buf, size_t& pos, uint64_t& value)
+{
+    value = 0;
+    for (unsigned int shift = 0; shift < 64 && pos < buf.size(); shift += 7) {
+        unsigned char c = buf[pos++];
+        value |= (uint64_t) (c & 0x7f) << shift;
+        if (!(c & 0x80)) {
+            return true;
+        }
+    }
+    return false;
+}
+
+}
+
+#endif // VARINT_HH
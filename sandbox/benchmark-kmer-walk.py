@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+#
+# This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+# Copyright (C) Michigan State University, 2009-2015. It is licensed under
+# the three-clause BSD license; see LICENSE.
+# Contact: khmer-project@idyll.org
+#
+"""
+Micro-benchmark the k-mer walking code paths of a countgraph.
+
+Reports bases per second for consume, get_kmer_counts, median_at_least and
+trim_on_abundance on random sequence. Long sequences are used so that the
+time is spent in the C++ k-mer walk rather than in Python call overhead.
+
+% python sandbox/benchmark-kmer-walk.py [ -k 20 ] [ --length 100000 ]
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+import khmer
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Report bases/second for the k-mer walking functions.")
+    parser.add_argument('-k', '--ksize', type=int, default=20)
+    parser.add_argument('--length', type=int, default=100000,
+                        help='length of each random sequence')
+    parser.add_argument('--n-seqs', type=int, default=100,
+                        help='number of random sequences')
+    parser.add_argument('--tablesize', type=float, default=1e5,
+                        help='countgraph table size; the small default keeps '
+                        'the tables in cache so the k-mer walk dominates')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser
+
+
+def timed(fn, seqs):
+    start = time.time()
+    for seq in seqs:
+        fn(seq)
+    return time.time() - start
+
+
+def main():
+    args = get_parser().parse_args()
+    random.seed(args.seed)
+
+    seqs = [''.join(random.choice('ACGT') for _ in range(args.length))
+            for _ in range(args.n_seqs)]
+    n_bases = float(args.length * args.n_seqs)
+
+    countgraph = khmer.Countgraph(args.ksize, args.tablesize, 4)
+
+    # counts never reach 256, so median_at_least walks every k-mer.
+    benchmarks = [
+        ('consume', countgraph.consume),
+        ('get_kmer_counts', countgraph.get_kmer_counts),
+        ('median_at_least', lambda seq: countgraph.median_at_least(seq, 256)),
+        ('trim_on_abundance',
+         lambda seq: countgraph.trim_on_abundance(seq, 0)),
+    ]
+
+    for name, fn in benchmarks:
+        elapsed = timed(fn, seqs)
+        print('{name:20} {rate:12.3e} bases/s'.format(
+            name=name, rate=n_bases / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-#! /usr/bin/env python2
+#! /usr/bin/env python
 #
 # This file is part of khmer, http://github.com/ged-lab/khmer/, and is
 # Copyright (C) Michigan State University, 2009-2015. It is licensed under
@@ -16,8 +16,8 @@ Use -h for parameter help.
 
 TODO: add to sandbox/README.
 """
+from __future__ import print_function
 import sys
-import screed
 import os
 import khmer
 import tempfile
@@ -25,36 +25,19 @@ import shutil
 import textwrap
 import argparse
 
+from screed import Record
+from khmer import khmer_args
+
 from khmer.khmer_args import (build_counting_args, info, add_loadgraph_args,
-                              report_on_config)
-from khmer.utils import write_record, write_record_pair, broken_paired_reader
+                              report_on_config, calculate_graphsize,
+                              DEFAULT_N_THREADS)
+from khmer.utils import write_record
 from khmer.kfile import (check_space, check_space_for_graph,
                          check_valid_file_exists)
 
 DEFAULT_NORMALIZE_LIMIT = 20
 DEFAULT_CUTOFF = 2
-
-
-def correct_sequence(aligner, sequence):
-    # align to graph.
-    score, graph_alignment, read_alignment, truncated = \
-           aligner.align(sequence)
-
-    # next, decide whether or to keep it.
-    output_corrected = False
-    if not truncated:
-        graph_seq = graph_alignment.replace("-", "")
-        return True, graph_seq
-
-    return False, sequence
-
-
-def fix_quality(record):
-    if len(record.sequence) < len(record.quality):
-        record.quality = record.quality[:len(record.sequence)]
-
-    while len(record.sequence) > len(record.quality):
-        record.quality += 'I' # @CTB hack
+DEFAULT_PASS2_MEMORY = 1e9
 
 
 def get_parser():
@@ -63,6 +46,15 @@ def get_parser():
     in the current directory.  This output contains the input sequences,
     corrected at low-abundance k-mers.
 
+    With ``--threads`` the first pass, which reads the input and counts and
+    corrects reads, runs on that many threads sharing the countgraph; which
+    reads are set aside for the second pass then depends on timing, so
+    results vary slightly from run to run.
+
+    Reads set aside for the second pass are held in memory, packed; past
+    ``--pass2-memory`` bytes they are spilled to a file in the ``-T/--tempdir``
+    directory.
+
     Note that the output reads will not necessarily be in the same
     order as the reads in the input files. However, read pairs will be
     kept together, in "broken-paired" format; you can use
@@ -88,7 +80,7 @@ def get_parser():
                         default=DEFAULT_NORMALIZE_LIMIT)
 
     parser.add_argument('-o', '--out', metavar="filename",
-                        type=argparse.FileType('w'),
+                        type=argparse.FileType('wb'),
                         default=None, help='only output a single file with '
                         'the specified filename; use a single dash "-" to '
                         'specify that output should go to STDOUT (the '
@@ -108,6 +100,12 @@ def get_parser():
     parser.add_argument('--ignore-pairs', default=False, action='store_true')
     parser.add_argument('--tempdir', '-T', type=str, default='./')
     parser.add_argument("--theta", dest="bits_theta", type=float, default=1.0)
+    parser.add_argument('--threads', type=int, default=DEFAULT_N_THREADS,
+                        help='number of threads to run the first pass on')
+    parser.add_argument('--pass2-memory', type=float,
+                        default=DEFAULT_PASS2_MEMORY,
+                        help='bytes of memory to hold reads for the second '
+                        'pass in before spilling them to the temp directory')
 
     return parser
 
@@ -120,8 +118,8 @@ def main():
     ###
 
     if len(set(args.input_filenames)) != len(args.input_filenames):
-        print >>sys.stderr, \
-            "Error: Cannot input the same filename multiple times."
+        print("Error: Cannot input the same filename multiple times.",
+              file=sys.stderr)
         sys.exit(1)
 
     ###
@@ -130,183 +128,96 @@ def main():
     check_valid_file_exists(args.input_filenames)
     check_space(args.input_filenames, args.force)
     if args.savegraph:
-        check_space_for_graph(
-            args.n_tables * args.min_tablesize, args.force)
-
-    K = args.ksize
+        graphsize = calculate_graphsize(args, 'countgraph')
+        check_space_for_graph(args.savegraph, graphsize, args.force)
 
     CUTOFF = args.cutoff
     NORMALIZE_LIMIT = args.normalize_to
 
     if args.loadgraph:
-        print >>sys.stderr, 'loading k-mer countgraph from', args.loadgraph
+        print('loading k-mer countgraph from', args.loadgraph,
+              file=sys.stderr)
         ct = khmer.load_countgraph(args.loadgraph)
     else:
-        print >>sys.stderr, 'making k-mer countgraph'
-        ct = khmer.new_countgraph(K, args.min_tablesize, args.n_tables)
+        print('making k-mer countgraph', file=sys.stderr)
+        ct = khmer_args.create_countgraph(args)
 
     tempdir = tempfile.mkdtemp('khmer', 'tmp', args.tempdir)
-    print >>sys.stderr, 'created temporary directory %s; ' \
-                        'use -T to change location' % tempdir
+    print('created temporary directory %s; '
+          'use -T to change location' % tempdir, file=sys.stderr)
 
-    aligner = khmer.ReadAligner(ct, args.cutoff, args.bits_theta)
+    aligner = khmer.ReadAligner(ct, CUTOFF, args.bits_theta)
 
     # ### FIRST PASS ###
 
-    save_pass2_total = 0
-
-    n_bp = 0
-    n_reads = 0
-    written_bp = 0
-    written_reads = 0
-    corrected_reads = 0
+    pass2buf = khmer.ReadBuffer(int(args.pass2_memory),
+                                os.path.join(tempdir, 'pass2.spill'))
+    corrector = khmer.StreamingCorrector(ct, aligner, NORMALIZE_LIMIT,
+                                         args.variable_coverage)
 
     pass2list = []
-    for filename in args.input_filenames:
-        pass2filename = os.path.basename(filename) + '.pass2'
-        pass2filename = os.path.join(tempdir, pass2filename)
+    for index, filename in enumerate(args.input_filenames):
         if args.out is None:
-            corrfp = open(os.path.basename(filename) + '.corr', 'w')
-        else:
-            corrfp = args.out
-
-        pass2list.append((filename, pass2filename, corrfp))
-
-        screed_iter = screed.open(filename, parse_description=False)
-        pass2fp = open(pass2filename, 'w')
-
-        save_pass2 = 0
-        n = 0
-
-        paired_iter = broken_paired_reader(screed_iter, min_length=K,
-                                           force_single=args.ignore_pairs)
-        for n, is_pair, read1, read2 in paired_iter:
-            if n % 10000 == 0:
-                print >>sys.stderr, '...', n, filename, save_pass2, \
-                    n_reads, n_bp, written_reads, written_bp
-
-            # we want to track paired reads here, to make sure that pairs
-            # are not split between first pass and second pass.
-
-            if is_pair:
-                n_reads += 2
-                n_bp += len(read1.sequence) + len(read2.sequence)
-
-                seq1 = read1.sequence.replace('N', 'A')
-                seq2 = read2.sequence.replace('N', 'A')
-
-                med1, _, _ = ct.get_median_count(seq1)
-                med2, _, _ = ct.get_median_count(seq2)
-
-                if med1 < NORMALIZE_LIMIT or med2 < NORMALIZE_LIMIT:
-                    ct.consume(seq1)
-                    ct.consume(seq2)
-                    write_record_pair(read1, read2, pass2fp)
-                    save_pass2 += 2
-                else:
-                    is_aligned, new_seq1 = correct_sequence(aligner, seq1)
-                    if is_aligned:
-                        if new_seq1 != read1.sequence:
-                            corrected_reads += 1
-                        read1.sequence = new_seq1
-                        if hasattr(read1, 'quality'):
-                            fix_quality(read1)
-
-                    is_aligned, new_seq2 = correct_sequence(aligner, seq2)
-                    if is_aligned:
-                        if new_seq2 != read2.sequence:
-                            corrected_reads += 1
-                        read2.sequence = new_seq2
-                        if hasattr(read2, 'quality'):
-                            fix_quality(read2)
-
-                    write_record_pair(read1, read2, corrfp)
-                    written_reads += 2
-                    written_bp += len(read1)
-                    written_bp += len(read2)
-            else:
-                n_reads += 1
-                n_bp += len(read1.sequence)
-
-                seq = read1.sequence.replace('N', 'A')
-
-                med, _, _ = ct.get_median_count(seq)
-
-                # has this portion of the graph saturated? if not,
-                # consume & save => pass2.
-                if med < NORMALIZE_LIMIT:
-                    ct.consume(seq)
-                    write_record(read1, pass2fp)
-                    save_pass2 += 1
-                else:                       # trim!!
-                    is_aligned, new_seq = correct_sequence(aligner, seq)
-                    if is_aligned:
-                        if new_seq != read1.sequence:
-                            corrected_reads += 1
-                        read1.sequence = new_seq
-                        if hasattr(read1, 'quality'):
-                            fix_quality(read1)
-
-                        write_record(read1, corrfp)
-
-                        written_reads += 1
-                        written_bp += len(new_seq)
-
-        pass2fp.close()
-
-        print >>sys.stderr, '%s: kept aside %d of %d from first pass, in %s' \
-            % (filename, save_pass2, n, filename)
-        save_pass2_total += save_pass2
+            corrfp = khmer.RecordWriter(open(os.path.basename(filename) +
+                                             '.corr', 'wb'))
+        elif index == 0:
+            corrfp = khmer.RecordWriter(args.out)
+
+        pass2list.append((filename, corrfp))
+
+        # we want to track paired reads here, to make sure that pairs
+        # are not split between first pass and second pass.
+        start = corrector.get_stats()
+        for chunk in corrector.correct_first_pass(khmer.ReadParser(filename),
+                                                  pass2buf, index,
+                                                  args.threads,
+                                                  args.ignore_pairs):
+            corrfp.write(chunk)
+
+            stats = corrector.get_stats()
+            print('...', stats['n_reads'] - start['n_reads'], filename,
+                  stats['set_aside_reads'] - start['set_aside_reads'],
+                  stats['n_reads'], stats['n_bp'], stats['written_reads'],
+                  stats['written_bp'], file=sys.stderr)
+
+        stats = corrector.get_stats()
+        print('%s: kept aside %d of %d from first pass' %
+              (filename, stats['set_aside_reads'] - start['set_aside_reads'],
+               stats['n_reads'] - start['n_reads']), file=sys.stderr)
 
     # ### SECOND PASS. ###
 
-    skipped_n = 0
-    skipped_bp = 0
-    for _, pass2filename, corrfp in pass2list:
-        print >>sys.stderr, ('second pass: looking at sequences kept aside '
-                             'in %s') % pass2filename
-
-        # note that for this second pass, we don't care about paired
-        # reads - they will be output in the same order they're read in,
-        # so pairs will stay together if not orphaned.  This is in contrast
-        # to the first loop.
-
-        for n, read in enumerate(screed.open(pass2filename,
-                                             parse_description=False)):
-            if n % 10000 == 0:
-                print >>sys.stderr, '... x 2', n, pass2filename, \
-                    written_reads, written_bp
-
-            seq = read.sequence.replace('N', 'A')
-            med, _, _ = ct.get_median_count(seq)
-
-            # do we retain low-abundance components unchanged?
-            if med < NORMALIZE_LIMIT and args.variable_coverage:
-                write_record(read, corrfp)
-
-                written_reads += 1
-                written_bp += len(read.sequence)
-                skipped_n += 1
-                skipped_bp += len(read.sequence)
-
-            # otherwise, examine/correct.
-            else:    # med >= NORMALIZE LIMIT or not args.variable_coverage
-                is_aligned, new_seq = correct_sequence(aligner, seq)
-                if is_aligned:
-                    if new_seq != read.sequence:
-                        corrected_reads += 1
-                    read.sequence = new_seq
-                    if hasattr(read, 'quality'):
-                        fix_quality(read)
-                    write_record(read, corrfp)
-
-                    written_reads += 1
-                    written_bp += len(new_seq)
-
-        print >>sys.stderr, 'removing %s' % pass2filename
-        os.unlink(pass2filename)
-
-    print >>sys.stderr, 'removing temp directory & contents (%s)' % tempdir
+    print('second pass: looking at %d sequences kept aside, %d of them '
+          'spilled to disk' % (pass2buf.n_reads, pass2buf.n_spilled),
+          file=sys.stderr)
+
+    # note that for this second pass, we don't care about paired
+    # reads - they will be output in the same order they're read in,
+    # so pairs will stay together if not orphaned.  This is in contrast
+    # to the first loop.
+
+    for n, (index, name, sequence, quality) in \
+            enumerate(corrector.correct_buffered(pass2buf)):
+        if n % 10000 == 0:
+            print('... x 2', n, pass2list[index][0], file=sys.stderr)
+
+        read = Record(name=name, sequence=sequence)
+        if quality is not None:
+            read.quality = quality
+        write_record(read, pass2list[index][1])
+
+    stats = corrector.get_stats()
+    n_reads = stats['n_reads']
+    n_bp = stats['n_bp']
+    save_pass2_total = stats['set_aside_reads']
+    written_reads = stats['written_reads']
+    written_bp = stats['written_bp']
+    corrected_reads = stats['corrected_reads']
+    skipped_n = stats['skipped_reads']
+    skipped_bp = stats['skipped_bp']
+    del pass2buf
+
+    print('removing temp directory & contents (%s)' % tempdir, file=sys.stderr)
     shutil.rmtree(tempdir)
 
     n_passes = 1.0 + (float(save_pass2_total) / n_reads)
@@ -314,32 +225,35 @@ def main():
                                     (n_reads - written_reads)) /\
         n_reads * 100.0
 
-    print >>sys.stderr, 'read %d reads, %d bp' % (n_reads, n_bp,)
-    print >>sys.stderr, 'wrote %d reads, %d bp' % (written_reads, written_bp,)
-    print >>sys.stderr, 'looked at %d reads twice (%.2f passes)' % \
-        (save_pass2_total, n_passes)
-    print >>sys.stderr, 'removed %d reads and corrected %d reads (%.2f%%)' % \
-        (n_reads - written_reads, corrected_reads, percent_reads_corrected)
-    print >>sys.stderr, 'removed %.2f%% of bases (%d total)' % \
-        ((1 - (written_bp / float(n_bp))) * 100.0, n_bp - written_bp)
+    print('read %d reads, %d bp' % (n_reads, n_bp,), file=sys.stderr)
+    print('wrote %d reads, %d bp' % (written_reads, written_bp,),
+          file=sys.stderr)
+    print('looked at %d reads twice (%.2f passes)' %
+          (save_pass2_total, n_passes), file=sys.stderr)
+    print('removed %d reads and corrected %d reads (%.2f%%)' %
+          (n_reads - written_reads, corrected_reads, percent_reads_corrected),
+          file=sys.stderr)
+    print('removed %.2f%% of bases (%d total)' %
+          ((1 - (written_bp / float(n_bp))) * 100.0, n_bp - written_bp),
+          file=sys.stderr)
 
     if args.variable_coverage:
         percent_reads_hicov = 100.0 * float(n_reads - skipped_n) / n_reads
-        print >>sys.stderr, '%d reads were high coverage (%.2f%%);' % \
-            (n_reads - skipped_n, percent_reads_hicov)
-        print >>sys.stderr, ('skipped %d reads/%d bases because of low'
-                             'coverage') % (skipped_n, skipped_bp)
+        print('%d reads were high coverage (%.2f%%);' %
+              (n_reads - skipped_n, percent_reads_hicov), file=sys.stderr)
+        print('skipped %d reads/%d bases because of low coverage' %
+              (skipped_n, skipped_bp), file=sys.stderr)
 
     fp_rate = \
         khmer.calc_expected_collisions(ct, args.force, max_false_pos=.8)
     # for max_false_pos see Zhang et al., http://arxiv.org/abs/1309.2975
-    print >>sys.stderr, \
-        'fp rate estimated to be {fpr:1.3f}'.format(fpr=fp_rate)
+    print('fp rate estimated to be {fpr:1.3f}'.format(fpr=fp_rate),
+          file=sys.stderr)
 
-    print >>sys.stderr, 'output in *.corr'
+    print('output in *.corr', file=sys.stderr)
 
     if args.savegraph:
-        print >>sys.stderr, "Saving k-mer countgraph to", args.savegraph
+        print("Saving k-mer countgraph to", args.savegraph, file=sys.stderr)
         ct.save(args.savegraph)
 
 
@@ -34,17 +34,18 @@ opening.
 
 import screed
 import sys
-from collections import defaultdict
 import os
 import time
 import khmer
-from khmer.khmer_args import (build_nodegraph_args, report_on_config, info)
+from khmer.khmer_args import (build_nodegraph_args, report_on_config, info,
+                              add_threading_args)
 from khmer.kfile import (check_input_files, check_valid_file_exists,
                          check_space)
 
 from khmer.utils import write_record
 
 DEFAULT_NUM_BUFFERS = 50000
+DEFAULT_MAX_OPEN_FILES = 128
 DEFAULT_MAX_READS = 1000000
 DEFAULT_BUFFER_SIZE = 10
 DEFAULT_OUT_PREF = 'reads'
@@ -54,112 +55,6 @@ MAX_HSIZE = 4e7
 MIN_KSIZE = 21
 
 
-def fmt_fasta(name, seq, labels=[]):
-    return '>{name}\t{labels}\n{seq}\n'.format(
-        name=name, labels='\t'.join([str(l) for l in labels]), seq=seq)
-
-
-def fmt_fastq(name, seq, quality, labels=[]):
-    return '@{name}\t{labels}\n{seq}\n+\n{acc}\n'.format(
-        name=name, labels='\t'.join([str(l) for l in labels]), seq=seq,
-        acc=quality)
-
-
-class ReadBuffer(object):
-
-    def __init__(self):
-        self.buf = []
-
-    def push(self, seq_str):
-        self.buf.append(seq_str)
-
-    def flush(self):
-        return ''.join(self.buf)
-
-    def is_full(self, full):
-        if len(self.buf) >= full:
-            return True
-        else:
-            return False
-
-    def __len__(self):
-        return len(self.buf)
-
-
-class ReadBufferManager(object):
-
-    def __init__(self, max_buffers, max_reads, max_size, output_pref, outdir,
-                 extension):
-        self.buffers = {}
-        self.buffer_counts = {}
-        self.max_buffers = max_buffers
-        self.max_reads = max_reads
-        self.extension = extension
-
-        self.output_pref = output_pref
-        self.outdir = outdir
-        self.buffer_flush = max_size
-
-        self.cur_reads = 0
-        self.cur_files = 0
-
-        self.num_write_errors = 0
-        self.num_file_errors = 0
-
-        print('''Init new ReadBuffer [
-        Max Buffers: {num_bufs}
-        Max Reads: {max_reads}
-        Buffer flush: {buf_flush}
-        ]'''.format(num_bufs=self.max_buffers, max_reads=self.max_reads,
-                    buf_flush=self.buffer_flush), file=sys.stderr)
-
-    def flush_buffer(self, buf_id):
-        fn = '{prefix}_{buffer_id}.{ext}'.format(prefix=self.output_pref,
-                                                 buffer_id=buf_id,
-                                                 ext=self.extension)
-        fpath = os.path.join(self.outdir, fn)
-        buf = self.buffers[buf_id]
-        try:
-            outfp = open(fpath, 'a')
-        except (IOError, OSError) as _:
-            print('!! ERROR: {_} !!'.format(_=_), file=sys.stderr)
-            print('*** Failed to open {fn} for \
-                                buffer flush'.format(fn=fpath), file=sys.stderr)
-            self.num_file_errors += 1
-        else:
-            outfp.write(buf.flush())
-            outfp.close()
-        finally:
-            self.cur_reads -= len(buf)
-            del self.buffers[buf_id]
-
-    def queue(self, seq_str, buf_id):
-        if buf_id in self.buffers:
-            self.buffers[buf_id].push(seq_str)
-            if self.buffers[buf_id].is_full(self.buffer_flush):
-                self.flush_buffer(buf_id)
-        else:
-            new_buf = ReadBuffer()
-            new_buf.push(seq_str)
-            self.buffers[buf_id] = new_buf
-
-        self.cur_reads += 1
-        if self.cur_reads > self.max_reads:
-            print('** Reached max num reads...', file=sys.stderr)
-            self.flush_all()
-        if len(self.buffers) > self.max_buffers:
-            # self.clean_buffers(2)
-            print('** Reached max num buffers...', file=sys.stderr)
-            self.flush_all()
-
-    def flush_all(self):
-        print('*** Flushing all to files...', file=sys.stderr)
-        buf_ids = list(self.buffers.keys())
-        for buf_id in buf_ids:
-            self.flush_buffer(buf_id)
-        assert self.cur_reads == 0
-
-
 def get_parser():
     parser = build_nodegraph_args('Takes a partitioned reference file \
                                   and a list of reads, and sorts reads \
@@ -185,6 +80,9 @@ def get_parser():
     parser.add_argument('-m', '--max_buffers', dest='max_buffers', type=int,
                         default=DEFAULT_NUM_BUFFERS,
                         help='Max individual label buffers before flushing')
+    parser.add_argument('--max-open-files', dest='max_open_files',
+                        type=int, default=DEFAULT_MAX_OPEN_FILES,
+                        help='Max label files to keep open at once')
     labeling = parser.add_mutually_exclusive_group(required=True)
     labeling.add_argument('--label-by-pid', dest='label_by_pid',
                           action='store_true', help='separate reads by\
@@ -200,6 +98,7 @@ def get_parser():
                         help='Reads to be swept and sorted')
     parser.add_argument('-f', '--force', default=False, action='store_true',
                         help='Overwrite output file if it exists')
+    add_threading_args(parser)
     return parser
 
 
@@ -249,8 +148,15 @@ def main():
     if hasattr(record, 'quality'):      # fastq!
         extension = 'fq'
 
-    output_buffer = ReadBufferManager(
-        max_buffers, max_reads, buf_size, output_pref, outdir, extension)
+    print('''Init new LabelSweepWriter [
+        Max Buffers: {num_bufs}
+        Max Reads: {max_reads}
+        Buffer flush: {buf_flush}
+        ]'''.format(num_bufs=max_buffers, max_reads=max_reads,
+                    buf_flush=buf_size), file=sys.stderr)
+    output_buffer = khmer.LabelSweepWriter(
+        os.path.join(outdir, output_pref), extension, buf_size, max_reads,
+        max_buffers, args.max_open_files)
 
     # consume the partitioned fasta with which to label the graph
     ht = khmer.GraphLabels(K, HT_SIZE, N_HT)
@@ -271,24 +177,26 @@ def main():
             label = -1
             g = 0
             try:
-                outfp = open('{pref}_base_{g}.{ext}'.format(pref=output_pref,
-                                                            g=g,
-                                                            ext=extension
-                                                            ), 'wb')
+                outfp = khmer.RecordWriter(open(
+                    '{pref}_base_{g}.{ext}'.format(pref=output_pref, g=g,
+                                                   ext=extension), 'wb'))
                 for n, record in enumerate(screed.open(input_fastp)):
                     if n % args.group_size == 0:
                         label += 1
                         if label > g:
                             g = label
-                            outfp = open('{pref}_base_{g}.{ext}'.format(
-                                pref=output_pref, g=g,
-                                ext=extension), 'wb')
+                            outfp.close()
+                            outfp = khmer.RecordWriter(open(
+                                '{pref}_base_{g}.{ext}'.format(
+                                    pref=output_pref, g=g,
+                                    ext=extension), 'wb'))
                     if n % 50000 == 0:
                         print('...consumed {n} sequences...'.format(n=n), file=sys.stderr)
                     ht.consume_sequence_and_tag_with_labels(record.sequence,
                                                             label)
 
                     write_record(record, outfp)
+                outfp.close()
 
             except (IOError, OSError) as e:
                 print('!! ERROR !!', e, file=sys.stderr)
@@ -304,78 +212,41 @@ def main():
                         labels...'.format(t=ht.graph.n_tags(),
                                           l=ht.n_labels()))
 
-    label_dict = defaultdict(int)
-    label_number_dist = []
-
-    n_orphaned = 0
-    n_labeled = 0
-    n_mlabeled = 0
-
-    total_t = time.clock()
-    start_t = time.clock()
+    total_t = time.time()
     for read_file in args.input_files:
         print('** sweeping {read_file} for labels...'.format(
             read_file=read_file), file=sys.stderr)
-        file_t = 0.0
+        start_t = time.time()
         try:
-            read_fp = screed.open(read_file)
+            read_parser = khmer.ReadParser(read_file)
         except (IOError, OSError) as error:
             print('!! ERROR: !!', error, file=sys.stderr)
             print('*** Could not open {fn}, skipping...'.format(
                 fn=read_file), file=sys.stderr)
         else:
-            for _, record in enumerate(read_fp):
-                if _ % 50000 == 0:
-                    end_t = time.clock()
-                    batch_t = end_t - start_t
-                    file_t += batch_t
-                    print('\tswept {n} reads [{nc} labeled, \
-                                         {no} orphaned] \
-                                        ** {sec}s ({sect}s total)' \
-                                        .format(n=_, nc=n_labeled,
-                                                no=n_orphaned,
-                                                sec=batch_t, sect=file_t), file=sys.stderr)
-                    start_t = time.clock()
-                seq = record.sequence
-                name = record.name
-                try:
-                    labels = ht.sweep_label_neighborhood(seq, traversal_range)
-                except ValueError as e:
-                    pass
-                else:
-                    if hasattr(record, 'quality'):
-                        seq_str = fmt_fastq(name, seq, record.quality, labels)
-                    else:
-                        seq_str = fmt_fasta(name, seq, labels)
-                    label_number_dist.append(len(labels))
-                    if labels:
-                        n_labeled += 1
-                        if len(labels) > 1:
-                            output_buffer.queue(seq_str, 'multi')
-                            n_mlabeled += 1
-                            label_dict['multi'] += 1
-                        else:
-                            output_buffer.queue(seq_str, labels[0])
-                            label_dict[labels[0]] += 1
-                    else:
-                        n_orphaned += 1
-                        output_buffer.queue(seq_str, 'orphaned')
-                        label_dict['orphaned'] += 1
+            n_swept = ht.sweep_reads(read_parser, traversal_range,
+                                     args.threads, output_buffer)
+            print('\tswept {n} reads ** {sec}s'.format(
+                n=n_swept, sec=time.time() - start_t), file=sys.stderr)
             print('** End of file {fn}...'.format(fn=read_file), file=sys.stderr)
-            output_buffer.flush_all()
-            read_fp.close()
+            output_buffer.flush()
 
     # gotta output anything left in the buffers at the end!
     print('** End of run...', file=sys.stderr)
-    output_buffer.flush_all()
-    total_t = time.clock() - total_t
+    output_buffer.flush()
+    total_t = time.time() - total_t
+
+    label_dict = output_buffer.counts
+    n_orphaned = label_dict.get('orphaned', 0)
+    n_mlabeled = label_dict.get('multi', 0)
+    n_labeled = sum(label_dict.values()) - n_orphaned
 
-    if output_buffer.num_write_errors > 0 or output_buffer.num_file_errors > 0:
+    if output_buffer.n_write_errors > 0 or output_buffer.n_file_errors > 0:
         print('! WARNING: Sweep finished with errors !', file=sys.stderr)
         print('** {writee} reads not written'.format(
-            writee=output_buffer.num_write_errors), file=sys.stderr)
+            writee=output_buffer.n_write_errors), file=sys.stderr)
         print('** {filee} errors opening files'.format(
-            filee=output_buffer.num_file_errors), file=sys.stderr)
+            filee=output_buffer.n_file_errors), file=sys.stderr)
 
     print('swept {n_reads} for labels...'.format(
         n_reads=n_labeled + n_orphaned), file=sys.stderr)
@@ -386,8 +257,8 @@ def main():
     print('** outputting label number distribution...', file=sys.stderr)
     fn = os.path.join(outdir, '{pref}.dist.txt'.format(pref=output_pref))
     with open(fn, 'w', encoding='utf-8') as outfp:
-        for nc in label_number_dist:
-            outfp.write('{nc}\n'.format(nc=nc))
+        for nc, count in sorted(output_buffer.label_dist.items()):
+            outfp.write('{nc},{c}\n'.format(nc=nc, c=count))
 
     fn = os.path.join(outdir, '{pref}.counts.csv'.format(pref=output_pref))
     print('** outputting label read counts...', file=sys.stderr)
@@ -59,6 +59,10 @@ def get_parser():
     parser.add_argument('output', metavar='output_summary_filename',
                         help='output summary filename',
                         type=argparse.FileType('w'))
+    parser.add_argument('--mmap', default=False, action='store_true',
+                        help='Map the countgraph file into memory instead '
+                        'of reading it; jobs sharing a countgraph then share '
+                        'its pages. Ignored for gzipped countgraphs.')
     parser.add_argument('--version', action='version', version='%(prog)s ' +
                         khmer.__version__)
     parser.add_argument('-f', '--force', default=False, action='store_true',
@@ -82,7 +86,7 @@ def main():
     check_space(infiles, args.force)
 
     print('loading k-mer countgraph from', htfile, file=sys.stderr)
-    countgraph = khmer.load_countgraph(htfile)
+    countgraph = khmer.load_countgraph(htfile, mmap=args.mmap)
     ksize = countgraph.ksize()
     print('writing to', output_filename, file=sys.stderr)
 
@@ -17,56 +17,20 @@ from __future__ import print_function
 
 import khmer
 import sys
-import threading
-import gc
 import os.path
 import os
 import textwrap
 from khmer import khmer_args
 from khmer.khmer_args import (build_nodegraph_args, report_on_config, info,
                               add_threading_args)
-import glob
 from khmer.kfile import check_input_files, check_space
 import re
 import platform
 
-# stdlib queue module was renamed on Python 3
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
-DEFAULT_SUBSET_SIZE = int(1e5)
 DEFAULT_N_THREADS = 4
 DEFAULT_K = 32
 
 
-def worker(queue, basename, stop_big_traversals):
-    while True:
-        try:
-            (nodegraph, index, start, stop) = queue.get(False)
-        except queue.Empty:
-            print('exiting', file=sys.stderr)
-            return
-
-        outfile = basename + '.subset.%d.pmap' % (index,)
-        if os.path.exists(outfile):
-            print('SKIPPING', outfile, ' -- already exists', file=sys.stderr)
-            continue
-
-        print('starting:', basename, index, file=sys.stderr)
-
-        # pay attention to stoptags when partitioning; take command line
-        # direction on whether or not to exhaustively traverse.
-        subset = nodegraph.do_subset_partition(start, stop, True,
-                                               stop_big_traversals)
-
-        print('saving:', basename, index, file=sys.stderr)
-        nodegraph.save_subset_partitionmap(subset, outfile)
-        del subset
-        gc.collect()
-
-
 def get_parser():
     epilog = """
     Load in a set of sequences, partition them, merge the partitions, and
@@ -82,15 +46,17 @@ def get_parser():
         descr='Load, partition, and annotate FAST[AQ] sequences',
         epilog=textwrap.dedent(epilog))
     add_threading_args(parser)
-    parser.add_argument('--subset-size', '-s', default=DEFAULT_SUBSET_SIZE,
+    parser.add_argument('--subset-size', '-s', default=None,
                         dest='subset_size', type=float,
-                        help='Set subset size (usually 1e5-1e6 is good)')
+                        help='Ignored, with a warning; the graph is '
+                        'partitioned in one pass')
     parser.add_argument('--no-big-traverse', dest='no_big_traverse',
                         action='store_true', default=False,
                         help='Truncate graph joins at big traversals')
     parser.add_argument('--keep-subsets', dest='remove_subsets',
                         default=True, action='store_false',
-                        help='Keep individual subsets (default: False)')
+                        help='Keep the partition map, as the single subset '
+                        '<graphbase>.subset.0.pmap (default: False)')
     parser.add_argument('graphbase', help="base name for output files")
     parser.add_argument('input_filenames', metavar='input_sequence_filename',
                         nargs='+', help='input FAST[AQ] sequence filenames')
@@ -116,9 +82,11 @@ def main():  # pylint: disable=too-many-locals,too-many-statements
     print('Loading kmers from sequences in %s' %
           repr(args.input_filenames), file=sys.stderr)
     print('--', file=sys.stderr)
-    print('SUBSET SIZE', args.subset_size, file=sys.stderr)
     print('N THREADS', args.threads, file=sys.stderr)
     print('--', file=sys.stderr)
+    if args.subset_size is not None:
+        print('WARNING: --subset-size is ignored; the graph is partitioned '
+              'in one pass', file=sys.stderr)
 
     # load-graph
 
@@ -150,68 +118,18 @@ def main():  # pylint: disable=too-many-locals,too-many-statements
     # now, partition!
     #
 
-    # divide the tags up into subsets
-    divvy = nodegraph.divide_tags_into_subsets(int(args.subset_size))
-    n_subsets = len(divvy)
-    divvy.append(0)
-
-    # build a queue of tasks:
-    worker_q = queue.Queue()
-
-    # break up the subsets into a list of worker tasks
-    for _ in range(0, n_subsets):
-        start = divvy[_]
-        end = divvy[_ + 1]
-        worker_q.put((nodegraph, _, start, end))
-
-    print('enqueued %d subset tasks' % n_subsets, file=sys.stderr)
-    open('%s.info' % args.graphbase, 'w').write('%d subsets total\n'
-                                                % (n_subsets))
-
-    if n_subsets < args.threads:
-        args.threads = n_subsets
-
-    # start threads!
-    print('starting %d threads' % args.threads, file=sys.stderr)
-    print('---', file=sys.stderr)
-
-    threads = []
-    for _ in range(args.threads):
-        cur_thread = threading.Thread(target=worker,
-                                      args=(worker_q, args.graphbase,
-                                            stop_big_traversals))
-        threads.append(cur_thread)
-        cur_thread.start()
-
-    assert threading.active_count() == args.threads + 1
-
-    print('done starting threads', file=sys.stderr)
-
-    # wait for threads
-    for _ in threads:
-        _.join()
-
-    print('---', file=sys.stderr)
-    print('done making subsets! see %s.subset.*.pmap' %
-          (args.graphbase,), file=sys.stderr)
-
-    # merge-partitions
-
-    pmap_files = glob.glob(args.graphbase + '.subset.*.pmap')
-
-    print('loading %d pmap files (first one: %s)' %
-          (len(pmap_files), pmap_files[0]), file=sys.stderr)
-
-    nodegraph = khmer.Nodegraph(args.ksize, 1, 1)
-
-    for pmap_file in pmap_files:
-        print('merging', pmap_file, file=sys.stderr)
-        nodegraph.merge_subset_from_disk(pmap_file)
-
-    if args.remove_subsets:
-        print('removing pmap files', file=sys.stderr)
-        for pmap_file in pmap_files:
-            os.unlink(pmap_file)
+    # pay attention to stoptags when partitioning; take command line
+    # direction on whether or not to exhaustively traverse.
+    print('partitioning on %d threads' % args.threads, file=sys.stderr)
+    nodegraph.partition_graph(args.threads, True, stop_big_traversals)
+    print('done partitioning', file=sys.stderr)
+
+    # the whole graph is partitioned as one subset.
+    open('%s.info' % args.graphbase, 'w').write('1 subsets total\n')
+    if not args.remove_subsets:
+        pmap_file = args.graphbase + '.subset.0.pmap'
+        print('saving partition map to', pmap_file, file=sys.stderr)
+        nodegraph.save_partitionmap(pmap_file)
 
     # annotate-partitions
 
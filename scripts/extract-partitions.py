@@ -21,7 +21,6 @@ by output_unassigned...
 from __future__ import print_function
 
 import sys
-import screed
 import argparse
 import textwrap
 import khmer
@@ -29,18 +28,72 @@ from khmer.kfile import (check_input_files, check_space,
                          add_output_compression_type,
                          get_file_writer)
 from khmer.khmer_args import info
-from khmer.utils import write_record
 
 DEFAULT_MAX_SIZE = int(1e6)
 DEFAULT_THRESHOLD = 5
+DEFAULT_BUFFER_SIZE = int(16e6)
 
 
 def read_partition_file(filename):
-    for record_index, record in enumerate(screed.open(filename)):
+    for record_index, record in enumerate(khmer.ReadParser(filename)):
         _, partition_id = record.name.rsplit('\t', 1)
         yield record_index, record, int(partition_id)
 
 
+def format_record(read, is_fastq):
+    if is_fastq:
+        return '@%s\n%s\n+\n%s\n' % (read.name, read.sequence, read.quality)
+    return '>%s\n%s\n' % (read.name, read.sequence)
+
+
+class GroupWriters(object):
+    """Buffer records bound for many group files in bounded memory.
+
+    Whenever more than max_buffered characters are held, the largest buffer
+    is appended to its file, so at most one group file is open at a time.
+    """
+
+    def __init__(self, filenames, do_gzip, do_bzip,
+                 max_buffered=DEFAULT_BUFFER_SIZE):
+        self.filenames = filenames
+        self.do_gzip = do_gzip
+        self.do_bzip = do_bzip
+        self.max_buffered = max_buffered
+
+        self.buffers = [[] for _ in filenames]
+        self.sizes = [0] * len(filenames)
+        self.started = [False] * len(filenames)
+        self.n_buffered = 0
+
+    def write(self, group_n, recstr):
+        self.buffers[group_n].append(recstr)
+        self.sizes[group_n] += len(recstr)
+        self.n_buffered += len(recstr)
+
+        if self.n_buffered > self.max_buffered:
+            largest = max(range(len(self.sizes)), key=self.sizes.__getitem__)
+            self._flush(largest)
+
+    def _flush(self, group_n):
+        mode = 'ab' if self.started[group_n] else 'wb'
+        file_handle = open(self.filenames[group_n], mode)
+        outfp = get_file_writer(file_handle, self.do_gzip, self.do_bzip)
+        outfp.write(''.join(self.buffers[group_n]).encode('utf-8'))
+        if outfp is not file_handle:
+            outfp.close()
+        file_handle.close()
+
+        self.started[group_n] = True
+        self.n_buffered -= self.sizes[group_n]
+        self.buffers[group_n] = []
+        self.sizes[group_n] = 0
+
+    def close(self):
+        for group_n in range(len(self.filenames)):
+            if self.sizes[group_n] or not self.started[group_n]:
+                self._flush(group_n)
+
+
 def get_parser():
     epilog = """
     Example (results will be in ``example.group0000.fa``)::
@@ -122,7 +175,7 @@ def main():  # pylint: disable=too-many-locals,too-many-branches
     is_fastq = False
 
     for index, read, pid in read_partition_file(args.part_filenames[0]):
-        if hasattr(read, 'quality'):
+        if read.quality:
             suffix = 'fq'
             is_fastq = True
         break
@@ -130,14 +183,16 @@ def main():  # pylint: disable=too-many-locals,too-many-branches
     for filename in args.part_filenames:
         for index, read, pid in read_partition_file(filename):
             if is_fastq:
-                assert hasattr(read, 'quality'), \
+                assert read.quality, \
                     "all input files must be FASTQ if the first one is"
             else:
-                assert not hasattr(read, 'quality'), \
+                assert not read.quality, \
                     "all input files must be FASTA if the first one is"
 
             break
 
+    # first pass: count the reads in each partition.
+
     if args.output_unassigned:
         ofile = open('%s.unassigned.%s' % (args.prefix, suffix), 'wb')
         unassigned_fp = get_file_writer(ofile, args.gzip, args.bzip)
@@ -152,10 +207,13 @@ def main():  # pylint: disable=too-many-locals,too-many-branches
             if pid == 0:
                 n_unassigned += 1
                 if args.output_unassigned:
-                    write_record(read, unassigned_fp)
+                    unassigned_fp.write(
+                        format_record(read, is_fastq).encode('utf-8'))
 
     if args.output_unassigned:
         unassigned_fp.close()
+        if unassigned_fp is not ofile:
+            ofile.close()
 
     if 0 in count:                          # eliminate unpartitioned sequences
         del count[0]
@@ -213,15 +271,10 @@ def main():  # pylint: disable=too-many-locals,too-many-branches
         print('nothing to output; exiting!', file=sys.stderr)
         return
 
-    # open a bunch of output files for the different groups
-    group_fps = {}
-    for index in range(group_n):
-        fname = '%s.group%04d.%s' % (args.prefix, index, suffix)
-        group_fp = get_file_writer(open(fname, 'wb'), args.gzip,
-                                   args.bzip)
-        group_fps[index] = group_fp
-
-    # write 'em all out!
+    # second pass: write 'em all out, through buffers for the groups.
+    group_fps = GroupWriters(['%s.group%04d.%s' % (args.prefix, index, suffix)
+                              for index in range(group_n)],
+                             args.gzip, args.bzip)
 
     total_seqs = 0
     part_seqs = 0
@@ -242,11 +295,11 @@ def main():  # pylint: disable=too-many-locals,too-many-branches
                 toosmall_parts += 1
                 continue
 
-            outfp = group_fps[group_n]
-
-            write_record(read, outfp)
+            group_fps.write(group_n, format_record(read, is_fastq))
             part_seqs += 1
 
+    group_fps.close()
+
     print('---', file=sys.stderr)
     print('Of %d total seqs,' % total_seqs, file=sys.stderr)
     print('extracted %d partitioned seqs into group files,' %
@@ -257,7 +310,7 @@ def main():  # pylint: disable=too-many-locals,too-many-branches
           n_unassigned, file=sys.stderr)
     print('', file=sys.stderr)
     print('Created %d group files named %s.groupXXXX.%s' %
-          (len(group_fps),
+          (len(group_fps.filenames),
            args.prefix,
            suffix), file=sys.stderr)
 
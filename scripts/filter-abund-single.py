@@ -23,7 +23,7 @@ import sys
 import khmer
 import threading
 import textwrap
-from khmer.thread_utils import ThreadedSequenceProcessor, verbose_loader
+from khmer.thread_utils import BatchSequenceProcessor, verbose_loader
 from khmer import khmer_args
 from khmer.khmer_args import (build_counting_args, report_on_config,
                               add_threading_args, info, calculate_graphsize)
@@ -81,6 +81,7 @@ def main():
 
     print('making countgraph', file=sys.stderr)
     graph = khmer_args.create_countgraph(args)
+    khmer_args.check_small_count_cutoff(graph, args.cutoff)
 
     # first, load reads into graph
     rparser = khmer.ReadParser(args.datafile)
@@ -106,20 +107,21 @@ def main():
 
     # now, trim.
 
-    # the filtering function.
-    def process_fn(record):
-        name = record.name
-        seq = record.sequence
-        seqN = seq.replace('N', 'A')
+    # the filtering function, applied to a group of reads at a time so that
+    # the work happens in one call that releases the GIL.
+    def process_fn(records):
+        _, trim_ats = graph.median_and_trim_many(
+            [record.sequence for record in records], args.cutoff)
 
-        _, trim_at = graph.trim_on_abundance(seqN, args.cutoff)
+        results = []
+        for record, trim_at in zip(records, trim_ats):
+            if trim_at >= args.ksize:
+                # 'N's are read as 'A' for counting, but kept in the output.
+                results.append((record.name, record.sequence[:trim_at]))
+            else:
+                results.append((None, None))
 
-        if trim_at >= args.ksize:
-            # be sure to not to change the 'N's in the trimmed sequence -
-            # so, return 'seq' and not 'seqN'.
-            return name, seq[:trim_at]
-
-        return None, None
+        return results
 
     # the filtering loop
     print('filtering', args.datafile, file=sys.stderr)
@@ -127,7 +129,7 @@ def main():
     outfile = open(outfile, 'wb')
     outfp = get_file_writer(outfile, args.gzip, args.bzip)
 
-    tsp = ThreadedSequenceProcessor(process_fn)
+    tsp = BatchSequenceProcessor(process_fn)
     tsp.start(verbose_loader(args.datafile), outfp)
 
     print('output in', outfile, file=sys.stderr)
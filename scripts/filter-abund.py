@@ -22,10 +22,12 @@ import khmer
 import textwrap
 import argparse
 import sys
-from khmer.thread_utils import ThreadedSequenceProcessor, verbose_loader
-from khmer.khmer_args import (ComboFormatter, add_threading_args, info)
+from khmer.thread_utils import BatchSequenceProcessor, verbose_loader
+from khmer.khmer_args import (ComboFormatter, add_threading_args, info,
+                              check_small_count_cutoff)
 from khmer.kfile import (check_input_files, check_space,
-                         add_output_compression_type, get_file_writer)
+                         add_output_compression_type, get_file_writer,
+                         is_block)
 from khmer import __version__
 
 DEFAULT_NORMALIZE_LIMIT = 20
@@ -69,6 +71,10 @@ def get_parser():
                         help='Output the trimmed sequences into a single file '
                         'with the given filename instead of creating a new '
                         'file for each input file.')
+    parser.add_argument('--mmap', default=False, action='store_true',
+                        help='Map the countgraph file into memory instead '
+                        'of reading it; jobs sharing a countgraph then share '
+                        'its pages. Ignored for gzipped countgraphs.')
     parser.add_argument('--version', action='version',
                         version='khmer {v}'.format(v=__version__))
     parser.add_argument('-f', '--force', default=False, action='store_true',
@@ -96,52 +102,61 @@ def main():
 
     print('loading countgraph:', args.input_graph,
           file=sys.stderr)
-    countgraph = khmer.load_countgraph(args.input_graph)
+    countgraph = khmer.load_countgraph(args.input_graph, mmap=args.mmap)
+    check_small_count_cutoff(countgraph, args.cutoff)
     ksize = countgraph.ksize()
 
     print("K:", ksize, file=sys.stderr)
 
-    # the filtering function.
-    def process_fn(record):
-        name = record.name
-        seq = record.sequence
-        seqN = seq.replace('N', 'A')
-
-        if args.variable_coverage:  # only trim when sequence has high enough C
-            med, _, _ = countgraph.get_median_count(seqN)
-            if med < args.normalize_to:
-                return name, seq
-
-        _, trim_at = countgraph.trim_on_abundance(seqN, args.cutoff)
-
-        if trim_at >= ksize:
-            # be sure to not to change the 'N's in the trimmed sequence -
-            # so, return 'seq' and not 'seqN'.
-            return name, seq[:trim_at]
-
-        return None, None
-
+    # the filtering function, applied to a group of reads at a time so that
+    # the work happens in one call that releases the GIL.
+    def process_fn(records):
+        medians, trim_ats = countgraph.median_and_trim_many(
+            [record.sequence for record in records], args.cutoff)
+
+        results = []
+        for record, med, trim_at in zip(records, medians, trim_ats):
+            # only trim when sequence has high enough C
+            if args.variable_coverage and len(record.sequence) < ksize:
+                raise ValueError("string length must >= the hashtable "
+                                 "k-mer size")
+            if args.variable_coverage and med < args.normalize_to:
+                results.append((record.name, record.sequence))
+            elif trim_at >= ksize:
+                # 'N's are read as 'A' for counting, but kept in the output.
+                results.append((record.name, record.sequence[:trim_at]))
+            else:
+                results.append((None, None))
+
+        return results
+
+    # all of the input goes through one writer for a single output file.
     if args.single_output_file:
         outfile = args.single_output_file.name
-        outfp = get_file_writer(outfile, args.gzip, args.bzip)
+        outfp = get_file_writer(args.single_output_file, args.gzip,
+                                args.bzip)
 
     # the filtering loop
     for infile in infiles:
         print('filtering', infile, file=sys.stderr)
-        if args.single_output_file:
-            outfile = args.single_output_file.name
-            outfp = get_file_writer(args.single_output_file, args.gzip,
-                                    args.bzip)
-        else:
+        if not args.single_output_file:
             outfile = os.path.basename(infile) + '.abundfilt'
             outfp = open(outfile, 'wb')
             outfp = get_file_writer(outfp, args.gzip, args.bzip)
 
-        tsp = ThreadedSequenceProcessor(process_fn, n_workers=args.threads)
+        tsp = BatchSequenceProcessor(process_fn, n_workers=args.threads)
         tsp.start(verbose_loader(infile), outfp)
 
+        if not args.single_output_file:
+            outfp.close()
         print('output in', outfile, file=sys.stderr)
 
+    if args.single_output_file:
+        if is_block(outfp):
+            outfp.flush()
+        else:
+            outfp.close()
+
 
 if __name__ == '__main__':
     main()
@@ -68,12 +68,9 @@ def main():
 
     check_space(pmap_files, args.force)
 
-    for pmap_file in pmap_files:
-        print('merging', pmap_file, file=sys.stderr)
-        nodegraph.merge_subset_from_disk(pmap_file)
-
-    print('saving merged to', output_file, file=sys.stderr)
-    nodegraph.save_partitionmap(output_file)
+    print('merging %d pmap files into %s' % (len(pmap_files), output_file),
+          file=sys.stderr)
+    nodegraph.merge_partitionmap_files(pmap_files, output_file)
 
     if args.remove_subsets:
         print('removing pmap files', file=sys.stderr)
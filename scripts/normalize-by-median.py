@@ -24,16 +24,23 @@ import screed
 import os
 import khmer
 import textwrap
+import threading
 from khmer import khmer_args
 from contextlib import contextmanager
 from khmer.khmer_args import (build_counting_args, add_loadgraph_args,
-                              report_on_config, info, calculate_graphsize)
+                              report_on_config, info, calculate_graphsize,
+                              add_threading_args)
 import argparse
 from khmer.kfile import (check_space, check_space_for_graph,
                          check_valid_file_exists, add_output_compression_type,
                          get_file_writer, is_block, describe_file_handle)
 from khmer.utils import write_record, broken_paired_reader
 from khmer.khmer_logger import (configure_logging, log_info, log_error)
+# stdlib queue module was renamed on Python 3
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 
 DEFAULT_DESIRED_COVERAGE = 20
@@ -68,14 +75,14 @@ class WithDiagnostics(object):
         kept = self.kept
 
         try:
-            for _, is_paired, read0, read1 in reader:
+            for is_paired, kept_records in norm.filter(reader):
                 if is_paired:
                     total += 2
                 else:
                     total += 1
 
                 # do diginorm
-                for record in norm(is_paired, read0, read1):
+                for record in kept_records:
                     kept += 1
                     yield record
 
@@ -160,6 +167,141 @@ class Normalizer(object):
                 self.countgraph.consume(seq)
                 yield record
 
+    def filter(self, reader):
+        """Yield (is_paired, kept records) for each fragment from reader."""
+        for _, is_paired, read0, read1 in reader:
+            yield is_paired, list(self(is_paired, read0, read1))
+
+
+class ThreadedNormalizer(Normalizer):
+
+    """
+    Digital normalization spread over several worker threads.
+
+    A reader thread hands batches of fragments to the workers; each worker
+    normalizes a whole batch with a single countgraph call that releases
+    the GIL. Fragments (and so pairs) are never split. Unless ordered is
+    False, fragments come back out in input order.
+    """
+
+    BATCH_SIZE = 1000
+    QUEUESIZE = 50
+
+    def __init__(self, desired_coverage, countgraph, n_threads, ordered=True):
+        Normalizer.__init__(self, desired_coverage, countgraph)
+        self.n_threads = n_threads
+        self.ordered = ordered
+
+    def _put(self, inqueue, item, stop):
+        """Put item on inqueue unless asked to stop; returns False if so."""
+        while not stop.is_set():
+            try:
+                inqueue.put(item, True, 1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_batches(self, reader, inqueue, outqueue, stop):
+        n_batches = 0
+        error = None
+        try:
+            batch = []
+            for _, is_paired, read0, read1 in reader:
+                batch.append((is_paired, read0, read1))
+                if len(batch) >= self.BATCH_SIZE:
+                    if not self._put(inqueue, (n_batches, batch), stop):
+                        break
+                    n_batches += 1
+                    batch = []
+            if batch and self._put(inqueue, (n_batches, batch), stop):
+                n_batches += 1
+        except Exception as err:  # pylint: disable=broad-except
+            error = err
+        finally:
+            for _ in range(self.n_threads):
+                inqueue.put(None)
+            # the end-of-input marker carries any reader error.
+            outqueue.put((n_batches, None, error))
+
+    def _normalize_batches(self, inqueue, outqueue):
+        while True:
+            item = inqueue.get()
+            if item is None:
+                break
+            batch_n, batch = item
+
+            # any error goes back to filter() to be raised there, so that
+            # it never waits on a batch that will not come.
+            try:
+                fragments = []
+                for _, read0, read1 in batch:
+                    if read1 is None:
+                        fragments.append((read0.sequence,))
+                    else:
+                        fragments.append((read0.sequence, read1.sequence))
+
+                keep = self.countgraph.normalize_fragments(
+                    fragments, self.desired_coverage)
+            except Exception as err:  # pylint: disable=broad-except
+                keep = err
+            outqueue.put((batch_n, batch, keep))
+
+    def filter(self, reader):
+        """Yield (is_paired, kept records) for each fragment from reader."""
+        inqueue = queue.Queue(self.QUEUESIZE)
+        outqueue = queue.Queue()
+        stop = threading.Event()
+
+        threads = [threading.Thread(target=self._read_batches,
+                                    args=(reader, inqueue, outqueue, stop))]
+        for _ in range(self.n_threads):
+            threads.append(threading.Thread(target=self._normalize_batches,
+                                            args=(inqueue, outqueue)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        pending = {}
+        next_batch = 0
+        n_batches = None
+        error = None
+        try:
+            while n_batches is None or next_batch < n_batches:
+                batch_n, batch, keep = outqueue.get()
+                if batch is None:
+                    n_batches = batch_n
+                    error = keep
+                    continue
+                if isinstance(keep, Exception):
+                    raise keep
+
+                if self.ordered:
+                    pending[batch_n] = (batch, keep)
+                    ready = []
+                    while next_batch in pending:
+                        ready.append(pending.pop(next_batch))
+                        next_batch += 1
+                else:
+                    ready = [(batch, keep)]
+                    next_batch += 1
+
+                for batch, keep in ready:
+                    for (is_paired, read0, read1), kept in zip(batch, keep):
+                        if not kept:
+                            yield is_paired, []
+                        elif read1 is None:
+                            yield is_paired, [read0]
+                        else:
+                            yield is_paired, [read0, read1]
+
+            if error is not None:
+                raise error
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
 
 @contextmanager
 def catch_io_errors(ifile, out, single_out, force, corrupt_files):
@@ -198,6 +340,13 @@ def get_parser():
     :option:`--force-single` will ignore all pairing information and treat
     reads individually.
 
+    With :option:`-T`/:option:`--threads` greater than 1, the k-mer work is
+    spread over that many worker threads sharing one countgraph. Kept reads
+    are written in input order and pairs are always kept together; add
+    :option:`--unordered` to let batches of reads be written as soon as they
+    are done. Because reads are processed concurrently, which reads are kept
+    may differ slightly between runs.
+
     With :option:`-s`/:option:`--savegraph`, the k-mer countgraph
     will be saved to the specified file after all sequences have been
     processed. :option:`-l`/:option:`--loadgraph` will load the
@@ -268,7 +417,12 @@ def get_parser():
                         'terminal)')
     parser.add_argument('input_filenames', metavar='input_sequence_filename',
                         help='Input FAST[AQ] sequence filename.', nargs='+')
+    parser.add_argument('--unordered', dest='ordered', default=True,
+                        action='store_false',
+                        help='with --threads, allow kept reads to be written '
+                        'out of input order (pairs are still kept together)')
     add_loadgraph_args(parser)
+    add_threading_args(parser)
     add_output_compression_type(parser)
     return parser
 
@@ -316,9 +470,14 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
     else:
         log_info('making countgraph')
         countgraph = khmer_args.create_countgraph(args)
+    khmer_args.check_small_count_cutoff(countgraph, args.cutoff)
 
     # create an object to handle diginorm of all files
-    norm = Normalizer(args.cutoff, countgraph)
+    if args.threads > 1:
+        norm = ThreadedNormalizer(args.cutoff, countgraph, args.threads,
+                                  ordered=args.ordered)
+    else:
+        norm = Normalizer(args.cutoff, countgraph)
     with_diagnostics = WithDiagnostics(norm, report_fp, args.report_frequency)
 
     # make a list of all filenames and if they're paired or not;
@@ -367,9 +526,13 @@ def main():  # pylint: disable=too-many-branches,too-many-statements
                     write_record(record, outfp)
 
             log_info('output in {name}', name=describe_file_handle(outfp))
-            if not is_block(outfp):
+            if not args.single_output_file:
                 outfp.close()
 
+    # the single output file is written through one writer for all inputs.
+    if args.single_output_file and not is_block(outfp):
+        outfp.close()
+
     # finished - print out some diagnostics.
 
     log_info('Total number of unique k-mers: {umers}',
@@ -11,14 +11,12 @@ Partition a graph.
 
 % python scripts/partition-graph.py <base>
 
-This will output many <base>.subset.N.pmap files.
+This will output a <base>.subset.0.pmap file.
 
 Use '-h' for parameter help.
 """
 from __future__ import print_function
 
-import threading
-import gc
 import os.path
 import argparse
 import khmer
@@ -26,46 +24,14 @@ import sys
 from khmer.khmer_args import (add_threading_args, info)
 from khmer.kfile import check_input_files
 
-# stdlib queue module was renamed on Python 3
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
-DEFAULT_SUBSET_SIZE = int(1e5)
 DEFAULT_N_THREADS = 4
 
 
-def worker(queue, basename, stop_big_traversals):
-    while True:
-        try:
-            (nodegraph, index, start, stop) = queue.get(False)
-        except queue.Empty:
-            print('exiting', file=sys.stderr)
-            return
-
-        outfile = basename + '.subset.%d.pmap' % (index,)
-        if os.path.exists(outfile):
-            print('SKIPPING', outfile, ' -- already exists', file=sys.stderr)
-            continue
-
-        print('starting:', basename, index, file=sys.stderr)
-
-        # pay attention to stoptags when partitioning; take command line
-        # direction on whether or not to exhaustively traverse.
-        subset = nodegraph.do_subset_partition(start, stop, True,
-                                               stop_big_traversals)
-
-        print('saving:', basename, index, file=sys.stderr)
-        nodegraph.save_subset_partitionmap(subset, outfile)
-        del subset
-        gc.collect()
-
-
 def get_parser():
     epilog = """
-    The resulting partition maps are saved as '${basename}.subset.#.pmap'
-    files.
+    The graph is partitioned in one pass, on ``--threads`` threads, and the
+    resulting partition map is saved as '${basename}.subset.0.pmap', to be
+    merged by :program:`merge-partitions.py`.
     """
     parser = argparse.ArgumentParser(
         description="Partition a sequence graph based upon waypoint "
@@ -76,9 +42,9 @@ def get_parser():
                         "nodegraph  + tagset files")
     parser.add_argument('--stoptags', '-S', metavar='filename', default='',
                         help="Use stoptags in this file during partitioning")
-    parser.add_argument('--subset-size', '-s', default=DEFAULT_SUBSET_SIZE,
-                        type=float, help='Set subset size (usually 1e5-1e6 is '
-                        'good)')
+    parser.add_argument('--subset-size', '-s', default=None,
+                        type=float, help='Ignored, with a warning; the graph '
+                        'is partitioned in one pass')
     parser.add_argument('--no-big-traverse', action='store_true',
                         default=False, help='Truncate graph joins at big '
                         'traversals')
@@ -100,11 +66,13 @@ def main():
         check_input_files(_, args.force)
 
     print('--', file=sys.stderr)
-    print('SUBSET SIZE', args.subset_size, file=sys.stderr)
     print('N THREADS', args.threads, file=sys.stderr)
     if args.stoptags:
         print('stoptag file:', args.stoptags, file=sys.stderr)
     print('--', file=sys.stderr)
+    if args.subset_size is not None:
+        print('WARNING: --subset-size is ignored; the graph is partitioned '
+              'in one pass', file=sys.stderr)
 
     print('loading nodegraph %s' % basename, file=sys.stderr)
     nodegraph = khmer.load_nodegraph(basename)
@@ -128,47 +96,23 @@ def main():
     # now, partition!
     #
 
-    # divide the tags up into subsets
-    divvy = nodegraph.divide_tags_into_subsets(int(args.subset_size))
-    n_subsets = len(divvy)
-    divvy.append(0)
-
-    # build a queue of tasks:
-    worker_q = queue.Queue()
-
-    # break up the subsets into a list of worker tasks
-    for _ in range(0, n_subsets):
-        start = divvy[_]
-        end = divvy[_ + 1]
-        worker_q.put((nodegraph, _, start, end))
-
-    print('enqueued %d subset tasks' % n_subsets, file=sys.stderr)
-    open('%s.info' % basename, 'w').write('%d subsets total\n' % (n_subsets))
-
-    n_threads = args.threads
-    if n_subsets < n_threads:
-        n_threads = n_subsets
-
-    # start threads!
-    print('starting %d threads' % n_threads, file=sys.stderr)
-    print('---', file=sys.stderr)
+    outfile = basename + '.subset.0.pmap'
+    if os.path.exists(outfile):
+        print('SKIPPING', outfile, ' -- already exists', file=sys.stderr)
+        return
 
-    threads = []
-    for _ in range(n_threads):
-        cur_thrd = threading.Thread(target=worker, args=(worker_q, basename,
-                                                         stop_big_traversals))
-        threads.append(cur_thrd)
-        cur_thrd.start()
+    open('%s.info' % basename, 'w').write('1 subsets total\n')
 
-    print('done starting threads', file=sys.stderr)
+    # pay attention to stoptags when partitioning; take command line
+    # direction on whether or not to exhaustively traverse.
+    print('partitioning on %d threads' % args.threads, file=sys.stderr)
+    nodegraph.partition_graph(args.threads, True, stop_big_traversals)
 
-    # wait for threads
-    for _ in threads:
-        _.join()
+    print('saving:', outfile, file=sys.stderr)
+    nodegraph.save_partitionmap(outfile)
 
     print('---', file=sys.stderr)
-    print('done making subsets! see %s.subset.*.pmap' %
-          (basename,), file=sys.stderr)
+    print('done partitioning! see %s' % (outfile,), file=sys.stderr)
 
 if __name__ == '__main__':
     main()
@@ -16,7 +16,6 @@ Use -h for parameter help.
 """
 from __future__ import print_function
 import sys
-import screed
 import os
 import khmer
 import tempfile
@@ -28,24 +27,16 @@ from screed import Record
 from khmer import khmer_args
 
 from khmer.khmer_args import (build_counting_args, info, add_loadgraph_args,
-                              report_on_config, calculate_graphsize)
-from khmer.utils import write_record, write_record_pair, broken_paired_reader
+                              report_on_config, calculate_graphsize,
+                              DEFAULT_N_THREADS)
+from khmer.utils import write_record
 from khmer.kfile import (check_space, check_space_for_graph,
                          check_valid_file_exists, add_output_compression_type,
-                         get_file_writer)
+                         get_file_writer, is_block)
 
 DEFAULT_NORMALIZE_LIMIT = 20
 DEFAULT_CUTOFF = 2
-
-
-def trim_record(read, trim_at):
-    new_read = Record()
-    new_read.name = read.name
-    new_read.sequence = read.sequence[:trim_at]
-    if hasattr(read, 'quality'):
-        new_read.quality = read.quality[:trim_at]
-
-    return new_read
+DEFAULT_PASS2_MEMORY = 1e9
 
 
 def get_parser():
@@ -59,6 +50,15 @@ def get_parser():
     low-abundance k-mers from high-abundance reads; use this for
     non-genomic data sets that may have variable coverage.
 
+    With ``--threads`` the first pass, which reads the input and counts and
+    trims reads, runs on that many threads sharing the countgraph; which
+    reads are set aside for the second pass then depends on timing, so
+    results vary slightly from run to run.
+
+    Reads set aside for the second pass are held in memory, packed; past
+    ``--pass2-memory`` bytes they are spilled to a file in the ``-T/--tempdir``
+    directory.
+
     Note that the output reads will not necessarily be in the same order
     as the reads in the input files; if this is an important consideration,
     use ``load-into-counting.py`` and ``filter-abund.py``.  However, read
@@ -105,6 +105,12 @@ def get_parser():
     parser.add_argument('--force', default=False, action='store_true')
     parser.add_argument('--ignore-pairs', default=False, action='store_true')
     parser.add_argument('--tempdir', '-T', type=str, default='./')
+    parser.add_argument('--threads', type=int, default=DEFAULT_N_THREADS,
+                        help='number of threads to run the first pass on')
+    parser.add_argument('--pass2-memory', type=float,
+                        default=DEFAULT_PASS2_MEMORY,
+                        help='bytes of memory to hold reads for the second '
+                        'pass in before spilling them to the temp directory')
     add_output_compression_type(parser)
 
     return parser
@@ -143,8 +149,10 @@ def main():
     else:
         print('making countgraph', file=sys.stderr)
         ct = khmer_args.create_countgraph(args)
+    khmer_args.check_small_count_cutoff(ct, args.cutoff)
+    if args.variable_coverage:
+        khmer_args.check_small_count_cutoff(ct, args.normalize_to)
 
-    K = ct.ksize()
     CUTOFF = args.cutoff
     NORMALIZE_LIMIT = args.normalize_to
 
@@ -154,155 +162,89 @@ def main():
 
     # ### FIRST PASS ###
 
-    save_pass2_total = 0
+    pass2buf = khmer.ReadBuffer(int(args.pass2_memory),
+                                os.path.join(tempdir, 'pass2.spill'))
+    trimmer = khmer.StreamingTrimmer(ct, CUTOFF, NORMALIZE_LIMIT,
+                                     args.variable_coverage)
 
-    n_bp = 0
-    n_reads = 0
-    written_bp = 0
-    written_reads = 0
-    trimmed_reads = 0
+    # with -o, every input is written through the same writer.
+    if args.output is not None:
+        outfp = get_file_writer(args.output, args.gzip, args.bzip)
 
     pass2list = []
-    for filename in args.input_filenames:
-        pass2filename = os.path.basename(filename) + '.pass2'
-        pass2filename = os.path.join(tempdir, pass2filename)
+    for index, filename in enumerate(args.input_filenames):
         if args.output is None:
             trimfp = get_file_writer(open(os.path.basename(filename) +
                                           '.abundtrim', 'wb'),
                                      args.gzip, args.bzip)
         else:
-            trimfp = get_file_writer(args.output, args.gzip, args.bzip)
-
-        pass2list.append((filename, pass2filename, trimfp))
-
-        screed_iter = screed.open(filename)
-        pass2fp = open(pass2filename, 'w')
-
-        save_pass2 = 0
-        n = 0
-
-        paired_iter = broken_paired_reader(screed_iter, min_length=K,
-                                           force_single=args.ignore_pairs)
-        for n, is_pair, read1, read2 in paired_iter:
-            if n % 10000 == 0:
-                print('...', n, filename, save_pass2, n_reads, n_bp,
-                      written_reads, written_bp, file=sys.stderr)
-
-            # we want to track paired reads here, to make sure that pairs
-            # are not split between first pass and second pass.
-
-            if is_pair:
-                n_reads += 2
-                n_bp += len(read1.sequence) + len(read2.sequence)
-
-                seq1 = read1.sequence.replace('N', 'A')
-                seq2 = read2.sequence.replace('N', 'A')
-
-                med1, _, _ = ct.get_median_count(seq1)
-                med2, _, _ = ct.get_median_count(seq2)
-
-                if med1 < NORMALIZE_LIMIT or med2 < NORMALIZE_LIMIT:
-                    ct.consume(seq1)
-                    ct.consume(seq2)
-                    write_record_pair(read1, read2, pass2fp)
-                    save_pass2 += 2
-                else:
-                    _, trim_at1 = ct.trim_on_abundance(seq1, CUTOFF)
-                    _, trim_at2 = ct.trim_on_abundance(seq2, CUTOFF)
-
-                    if trim_at1 >= K:
-                        read1 = trim_record(read1, trim_at1)
-
-                    if trim_at2 >= K:
-                        read2 = trim_record(read2, trim_at2)
-
-                    if trim_at1 != len(seq1):
-                        trimmed_reads += 1
-                    if trim_at2 != len(seq2):
-                        trimmed_reads += 1
-
-                    write_record_pair(read1, read2, trimfp)
-                    written_reads += 2
-                    written_bp += trim_at1 + trim_at2
-            else:
-                n_reads += 1
-                n_bp += len(read1.sequence)
-
-                seq = read1.sequence.replace('N', 'A')
-
-                med, _, _ = ct.get_median_count(seq)
-
-                # has this portion of the graph saturated? if not,
-                # consume & save => pass2.
-                if med < NORMALIZE_LIMIT:
-                    ct.consume(seq)
-                    write_record(read1, pass2fp)
-                    save_pass2 += 1
-                else:                       # trim!!
-                    _, trim_at = ct.trim_on_abundance(seq, CUTOFF)
-                    if trim_at >= K:
-                        new_read = trim_record(read1, trim_at)
-                        write_record(new_read, trimfp)
-
-                        written_reads += 1
-                        written_bp += trim_at
-
-                        if trim_at != len(read1.sequence):
-                            trimmed_reads += 1
-
-        pass2fp.close()
-
-        print('%s: kept aside %d of %d from first pass, in %s' %
-              (filename, save_pass2, n, filename),
+            trimfp = outfp
+
+        pass2list.append((filename, trimfp))
+
+        if filename == '/dev/stdin':
+            filename = '-'
+        parser = khmer.ReadParser(filename)
+
+        # pairs are never split between the first and second pass.
+        start = trimmer.get_stats()
+        for chunk in trimmer.trim_first_pass(parser, pass2buf, index,
+                                             args.threads,
+                                             args.ignore_pairs):
+            trimfp.write(chunk)
+
+            stats = trimmer.get_stats()
+            print('...', stats['n_reads'] - start['n_reads'], filename,
+                  stats['set_aside_reads'] - start['set_aside_reads'],
+                  stats['n_reads'], stats['n_bp'], stats['written_reads'],
+                  stats['written_bp'], file=sys.stderr)
+
+        stats = trimmer.get_stats()
+        print('%s: kept aside %d of %d from first pass' %
+              (pass2list[index][0],
+               stats['set_aside_reads'] - start['set_aside_reads'],
+               stats['n_reads'] - start['n_reads']),
               file=sys.stderr)
-        save_pass2_total += save_pass2
 
     # ### SECOND PASS. ###
 
-    skipped_n = 0
-    skipped_bp = 0
-    for _, pass2filename, trimfp in pass2list:
-        print('second pass: looking at sequences kept aside in %s' %
-              pass2filename,
-              file=sys.stderr)
-
-        # note that for this second pass, we don't care about paired
-        # reads - they will be output in the same order they're read in,
-        # so pairs will stay together if not orphaned.  This is in contrast
-        # to the first loop.
-
-        for n, read in enumerate(screed.open(pass2filename)):
-            if n % 10000 == 0:
-                print('... x 2', n, pass2filename,
-                      written_reads, written_bp, file=sys.stderr)
-
-            seq = read.sequence.replace('N', 'A')
-            med, _, _ = ct.get_median_count(seq)
-
-            # do we retain low-abundance components unchanged?
-            if med < NORMALIZE_LIMIT and args.variable_coverage:
-                write_record(read, trimfp)
-
-                written_reads += 1
-                written_bp += len(read.sequence)
-                skipped_n += 1
-                skipped_bp += len(read.sequence)
-
-            # otherwise, examine/trim/truncate.
-            else:    # med >= NORMALIZE LIMIT or not args.variable_coverage
-                _, trim_at = ct.trim_on_abundance(seq, CUTOFF)
-                if trim_at >= K:
-                    new_read = trim_record(read, trim_at)
-                    write_record(new_read, trimfp)
-
-                    written_reads += 1
-                    written_bp += trim_at
-
-                    if trim_at != len(read.sequence):
-                        trimmed_reads += 1
+    print('second pass: looking at %d sequences kept aside, %d of them '
+          'spilled to disk' % (pass2buf.n_reads, pass2buf.n_spilled),
+          file=sys.stderr)
 
-        print('removing %s' % pass2filename, file=sys.stderr)
-        os.unlink(pass2filename)
+    # note that for this second pass, we don't care about paired
+    # reads - they will be output in the same order they're read in,
+    # so pairs will stay together if not orphaned.  This is in contrast
+    # to the first loop.
+
+    for n, (index, name, sequence, quality) in \
+            enumerate(trimmer.trim_buffered(pass2buf)):
+        if n % 10000 == 0:
+            print('... x 2', n, pass2list[index][0], file=sys.stderr)
+
+        read = Record(name=name, sequence=sequence)
+        if quality is not None:
+            read.quality = quality
+        write_record(read, pass2list[index][1])
+
+    if args.output is None:
+        for _, trimfp in pass2list:
+            trimfp.close()
+    elif is_block(outfp):
+        outfp.flush()
+    else:
+        outfp.close()
+
+    stats = trimmer.get_stats()
+    n_reads = stats['n_reads']
+    n_bp = stats['n_bp']
+    save_pass2_total = stats['set_aside_reads']
+    written_reads = stats['written_reads']
+    written_bp = stats['written_bp']
+    trimmed_reads = stats['trimmed_reads']
+    skipped_n = stats['skipped_reads']
+    skipped_bp = stats['skipped_bp']
+    del pass2buf
 
     print('removing temp directory & contents (%s)' % tempdir, file=sys.stderr)
     shutil.rmtree(tempdir)
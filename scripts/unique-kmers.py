@@ -53,6 +53,13 @@ def get_parser():
     and memory limitations for various false positive rates. This is useful for
     configuring other khmer scripts. This will be written to STDERR.
 
+    :option:`--save-hll` will save the combined counter to a file, and
+    :option:`--merge-hll` will read saved counters in place of sequence
+    files. Counters for separate files can be built in parallel, on separate
+    machines if need be, and then merged to estimate the total without
+    reading any sequences again. The k-mer size, error rate and hash of a
+    merge come from the saved counters, which must all agree.
+
     Example::
 
         unique-kmers.py -k 17 tests/test-data/test-abund-read{,-2,-3}.fa
@@ -69,7 +76,13 @@ def get_parser():
     Example::
 
         unique-kmers.py -R unique_count -k 30 \\
-        tests/test-data/test-abund-read-paired.fa""")  # noqa
+        tests/test-data/test-abund-read-paired.fa
+
+    Example::
+
+        unique-kmers.py -k 20 --save-hll lane1.hll lane1.fq.gz
+        unique-kmers.py -k 20 --save-hll lane2.hll lane2.fq.gz
+        unique-kmers.py --merge-hll lane1.hll lane2.hll""")  # noqa
     parser = argparse.ArgumentParser(
         description=descr, epilog=textwrap.dedent(epilog),
         formatter_class=ComboFormatter)
@@ -88,6 +101,12 @@ def get_parser():
     parser.add_argument('--error-rate', '-e', type=float, default=0.01,
                         help='Acceptable error rate')
 
+    parser.add_argument('--rolling-hash', default=False,
+                        action='store_true',
+                        help='hash k-mers (k <= 32) with a faster rolling '
+                        'hash; estimates differ slightly from the default '
+                        'MurmurHash3 ones')
+
     parser.add_argument('--report', '-R',
                         metavar='filename', type=argparse.FileType('w'),
                         help='generate informational report and write to'
@@ -101,49 +120,99 @@ def get_parser():
                         help='print out recommended tablesize arguments and '
                              'restrictions')
 
+    parser.add_argument('--save-hll', metavar='filename', default=None,
+                        help='save the combined HLL counter to filename')
+
+    parser.add_argument('--merge-hll', default=False, action='store_true',
+                        help='the inputs are HLL counters saved with '
+                        '--save-hll rather than sequence files')
+
     parser.add_argument('input_filenames', metavar='input_sequence_filename',
-                        help='Input FAST[AQ] sequence filename(s).', nargs='+')
+                        help='Input FAST[AQ] sequence filename(s), or saved '
+                        'HLL counters with --merge-hll.', nargs='+')
 
     return parser
 
 
+def load_hll(filename):
+    try:
+        return khmer.load_hllcounter(filename)
+    except OSError as err:
+        print('** ERROR: cannot load HLL counter from {0}: {1}'.format(
+              filename, err), file=sys.stderr)
+        sys.exit(1)
+
+
 def main():
     info('unique-kmers.py', ['SeqAn', 'hll'])
     args = get_parser().parse_args()
 
-    total_hll = khmer.HLLCounter(args.error_rate, args.ksize)
+    if args.merge_hll and args.stream_out:
+        print('** ERROR: --stream-out needs sequence files, so it cannot be '
+              'used with --merge-hll', file=sys.stderr)
+        sys.exit(1)
+
+    total_hll = None
 
     report_fp = args.report
     input_filename = None
+    if args.stream_out:
+        outfp = khmer.RecordWriter(sys.stdout)
     for index, input_filename in enumerate(args.input_filenames):
-        hllcpp = khmer.HLLCounter(args.error_rate, args.ksize)
-        for record in screed.open(input_filename):
-            seq = record.sequence.upper().replace('N', 'A')
-            hllcpp.consume_string(seq)
+        if args.merge_hll:
+            hllcpp = load_hll(input_filename)
+        else:
+            hllcpp = khmer.HLLCounter(args.error_rate, args.ksize)
+            hllcpp.rolling_hash = args.rolling_hash
+            for record in screed.open(input_filename):
+                seq = record.sequence.upper().replace('N', 'A')
+                hllcpp.consume_string(seq)
+                if args.stream_out:
+                    write_record(record, outfp)
             if args.stream_out:
-                write_record(record, sys.stdout)
+                outfp.flush()
 
         cardinality = hllcpp.estimate_cardinality()
         print('Estimated number of unique {0}-mers in {1}: {2}'.format(
-              args.ksize, input_filename, cardinality),
+              hllcpp.ksize, input_filename, cardinality),
               file=sys.stderr)
 
         if report_fp:
-            print(cardinality, args.ksize, '(total)', file=report_fp)
+            print(cardinality, hllcpp.ksize, '(total)', file=report_fp)
             report_fp.flush()
-        total_hll.merge(hllcpp)
+
+        if total_hll is None:
+            total_hll = hllcpp
+        else:
+            try:
+                total_hll.merge(hllcpp)
+            except ValueError:
+                print('** ERROR: {0} was not counted with the same k-mer '
+                      'size, error rate and hash as {1}'.format(
+                          input_filename, args.input_filenames[0]),
+                      file=sys.stderr)
+                sys.exit(1)
 
     cardinality = total_hll.estimate_cardinality()
     print('Total estimated number of unique {0}-mers: {1}'.format(
-          args.ksize, cardinality),
+          total_hll.ksize, cardinality),
           file=sys.stderr)
 
-    to_print = graphsize_args_report(cardinality, args.error_rate)
+    if args.save_hll:
+        try:
+            total_hll.save(args.save_hll)
+        except OSError as err:
+            print('** ERROR: cannot save HLL counter to {0}: {1}'.format(
+                  args.save_hll, err), file=sys.stderr)
+            sys.exit(1)
+
+    # saved counters have their own error rate, whatever --error-rate is.
+    to_print = graphsize_args_report(cardinality, total_hll.error_rate)
     if args.diagnostics:
         print(to_print, file=sys.stderr)
 
     if report_fp:
-        print(cardinality, args.ksize, 'total', file=report_fp)
+        print(cardinality, total_hll.ksize, 'total', file=report_fp)
         print(to_print, file=report_fp)
         report_fp.flush()
 
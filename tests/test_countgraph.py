@@ -7,7 +7,9 @@ from __future__ import absolute_import, unicode_literals
 # Contact: khmer-project@idyll.org
 #
 # pylint: disable=missing-docstring,protected-access
+import array
 import gzip
+import random
 
 import os
 import shutil
@@ -259,6 +261,35 @@ def test_median_at_least():
     assert hi.median_at_least("AAAAAA", 6) is False
 
 
+def test_normalize_fragments():
+    hi = khmer.Countgraph(6, 1e6, 2)
+
+    keep = hi.normalize_fragments([("AAAAAA",), ("AAAAAA",)], 1)
+    assert keep == [True, False], keep
+    assert hi.get("AAAAAA") == 1
+
+    # the pair is kept as a unit once either read is below the cutoff.
+    keep = hi.normalize_fragments([("AAAAAA", "CCCCCC")], 2)
+    assert keep == [True], keep
+    assert hi.get("AAAAAA") == 2
+    assert hi.get("CCCCCC") == 1
+
+    # Ns are treated as As.
+    keep = hi.normalize_fragments([("NNNNNN",)], 3)
+    assert keep == [True], keep
+    assert hi.get("AAAAAA") == 3
+
+
+def test_normalize_fragments_too_short():
+    hi = khmer.Countgraph(6, 1e6, 2)
+
+    try:
+        hi.normalize_fragments([("AAAAAA", "A")], 1)
+        assert 0, "this should fail"
+    except ValueError:
+        pass
+
+
 def test_median_at_least_single_gt():
     K = 20
     hi = khmer.Countgraph(K, 1e6, 2)
@@ -427,6 +458,57 @@ def test_get_kmer_counts():
     assert counts[1] == 3
 
 
+def test_get_kmer_counts_array():
+    hi = khmer.Countgraph(6, 1e6, 2)
+    hi.consume("AAAAAAT")
+    hi.consume("AAAAAT")
+
+    counts = hi.get_kmer_counts_array("AAAAAAT")
+    assert counts.typecode == 'H'
+    assert list(counts) == hi.get_kmer_counts("AAAAAAT") == [1, 2]
+
+    assert len(hi.get_kmer_counts_array("A")) == 0
+
+    # a preallocated buffer is filled in place and returned.
+    out = array.array('H', [7] * 4)
+    assert hi.get_kmer_counts_array("AAAAAAT", out) is out
+    assert list(out) == [1, 2, 7, 7]
+
+
+def test_get_kmer_counts_array_bad_buffer():
+    hi = khmer.Countgraph(6, 1e6, 2)
+
+    for out in (array.array('H', [0]), array.array('b', [0] * 10),
+                bytearray(10), b'\x00' * 10, [0, 0]):
+        try:
+            hi.get_kmer_counts_array("AAAAAAT", out)
+            assert 0, "should fail for %r" % (out,)
+        except (BufferError, TypeError, ValueError) as err:
+            print(str(err))
+
+
+def test_get_counts_for_hashes():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        hi = khmer.Countgraph(12, 1e4, 3, blocked=blocked)
+        hi.consume_fasta(inpath)
+
+        for record in screed.open(inpath):
+            hashes = hi.get_kmer_hashes_array(record.sequence)
+            assert list(hashes) == hi.get_kmer_hashes(record.sequence)
+
+            counts = hi.get_counts_for_hashes(hashes)
+            assert list(counts) == hi.get_kmer_counts(record.sequence)
+            assert counts == hi.get_kmer_counts_array(record.sequence)
+
+    try:
+        hi.get_counts_for_hashes(array.array('H', [0] * 4))
+        assert 0, "16-bit hashes should be refused"
+    except ValueError as err:
+        print(str(err))
+
+
 def test_get_kmer_hashes():
     hi = khmer.Countgraph(6, 1e6, 2)
 
@@ -569,6 +651,84 @@ def test_load_truncated():
             print(str(err))
 
 
+def test_save_load_mmap():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        for small_count in (False, True):
+            savepath = utils.get_temp_filename('mmap.ct')
+
+            hi = khmer.Countgraph(12, 1e6, 3, blocked=blocked,
+                                  small_count=small_count)
+            hi.set_use_bigcount(True)
+            hi.consume_fasta(inpath)
+            for _ in range(300):
+                hi.count('GGTTGACGGGGC')
+            hi.save(savepath)
+
+            ht = khmer.load_countgraph(savepath, mmap=True)
+            assert ht.is_mapped()
+            assert ht.is_blocked() == blocked
+            assert ht.is_small_count() == small_count
+            assert ht.hashsizes() == hi.hashsizes()
+            assert ht.get('GGTTGACGGGGC') == hi.get('GGTTGACGGGGC')
+
+            tracking = khmer._Nodegraph(12, PRIMES_1m)
+            x = hi.abundance_distribution(inpath, tracking)
+            tracking = khmer._Nodegraph(12, PRIMES_1m)
+            y = ht.abundance_distribution(inpath, tracking)
+            assert x == y, (x, y)
+
+
+def test_mmap_copy_on_write():
+    # counting into a mapped countgraph must not change the file.
+    inpath = utils.get_test_data('random-20-a.fa')
+    savepath = utils.get_temp_filename('mmap.ct')
+
+    hi = khmer.Countgraph(12, 1e4, 3)
+    hi.consume_fasta(inpath)
+    hi.save(savepath)
+    data = open(savepath, 'rb').read()
+
+    ht = khmer.load_countgraph(savepath, mmap=True)
+    before = ht.get('AAAAAAAAAAAA')
+    ht.count('AAAAAAAAAAAA')
+    assert ht.get('AAAAAAAAAAAA') == before + 1
+    assert open(savepath, 'rb').read() == data
+
+    copypath = utils.get_temp_filename('copy.ct')
+    ht.save(copypath)
+    assert khmer.load_countgraph(copypath).get('AAAAAAAAAAAA') == before + 1
+
+    try:
+        ht.save(savepath)
+        assert 0, "saving over the mapped file should fail"
+    except OSError as err:
+        print(str(err))
+
+
+def test_load_truncated_mmap():
+    inpath = utils.get_test_data('random-20-a.fa')
+    savepath = utils.get_temp_filename('save.ct')
+    truncpath = utils.get_temp_filename('trunc.ct')
+
+    hi = khmer.Countgraph(12, 200, 3)
+    hi.consume_fasta(inpath)
+    hi.save(savepath)
+
+    data = open(savepath, 'rb').read()
+    for i in range(len(data)):
+        fp = open(truncpath, 'wb')
+        fp.write(data[:i])
+        fp.close()
+
+        try:
+            ht = khmer.load_countgraph(truncpath, mmap=True)
+            assert 0, "this should not be reached!"
+        except OSError as err:
+            print(str(err))
+
+
 def test_load_gz():
     inpath = utils.get_test_data('random-20-a.fa')
 
@@ -634,6 +794,194 @@ def test_save_load_gz():
     assert x == y, (x, y)
 
 
+def test_blocked_get_raw_tables():
+    ht = khmer.Countgraph(20, 1e5, 4, blocked=True)
+    assert ht.is_blocked()
+
+    # the tables are interleaved in one array of 64-byte blocks.
+    tables = ht.get_raw_tables()
+    assert len(tables) == 1
+    assert len(tables[0]) == 4 * ht.hashsizes()[0]
+    assert len(tables[0]) % 64 == 0
+
+    ht.consume('AAAATTTTCCCCGGGGAAAA')
+    assert sum(tables[0].tolist()) == 4
+
+
+def test_blocked_count():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    hi = khmer.Countgraph(12, 1e6, 4)
+    hi.consume_fasta(inpath)
+    hb = khmer.Countgraph(12, 1e6, 4, blocked=True)
+    hb.consume_fasta(inpath)
+
+    assert not hi.is_blocked()
+    assert hb.n_unique_kmers() == hi.n_unique_kmers()
+
+    tracking = khmer._Nodegraph(12, PRIMES_1m)
+    x = hi.abundance_distribution(inpath, tracking)
+    tracking = khmer._Nodegraph(12, PRIMES_1m)
+    y = hb.abundance_distribution(inpath, tracking)
+    assert x == y, (x, y)
+
+
+def test_blocked_too_many_tables():
+    try:
+        khmer.Countgraph(12, 1e4, 65, blocked=True)
+        assert 0, "should fail"
+    except ValueError as err:
+        print(str(err))
+
+
+def test_blocked_save_load():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for savename in ('blocked.ct', 'blocked.ct.gz'):
+        savepath = utils.get_temp_filename(savename)
+
+        hi = khmer.Countgraph(12, 1e6, 3, blocked=True)
+        hi.consume_fasta(inpath)
+        hi.save(savepath)
+
+        ht = khmer.load_countgraph(savepath)
+        assert ht.is_blocked()
+        assert ht.hashsizes() == hi.hashsizes()
+        assert ht.n_occupied() == hi.n_occupied()
+
+        tracking = khmer._Nodegraph(12, PRIMES_1m)
+        x = hi.abundance_distribution(inpath, tracking)
+        tracking = khmer._Nodegraph(12, PRIMES_1m)
+        y = ht.abundance_distribution(inpath, tracking)
+
+        assert sum(x) == 3966, sum(x)
+        assert x == y, (x, y)
+
+        # the blocks start on a 64-byte boundary in the file.
+        if savename == 'blocked.ct':
+            data = open(savepath, 'rb').read()
+            blocks = hi.get_raw_tables()[0].tobytes()
+            assert data[28:64] == b'\0' * 36
+            assert data[64:64 + len(blocks)] == blocks
+
+        # loading a plain countgraph over a blocked one, and vice versa.
+        plainpath = utils.get_temp_filename('plain.ct')
+        khmer.Countgraph(12, 1e4, 3).save(plainpath)
+        ht.load(plainpath)
+        assert not ht.is_blocked()
+        ht.load(savepath)
+        assert ht.is_blocked()
+
+
+def test_blocked_load_truncated():
+    inpath = utils.get_test_data('random-20-a.fa')
+    savepath = utils.get_temp_filename('save.ct')
+    truncpath = utils.get_temp_filename('trunc.ct')
+
+    hi = khmer.Countgraph(12, 200, 3, blocked=True)
+    hi.consume_fasta(inpath)
+    hi.save(savepath)
+
+    data = open(savepath, 'rb').read()
+    for i in range(len(data)):
+        fp = open(truncpath, 'wb')
+        fp.write(data[:i])
+        fp.close()
+
+        try:
+            ht = khmer.load_countgraph(truncpath)
+            assert 0, "this should not be reached!"
+        except OSError as err:
+            print(str(err))
+
+
+def test_blocked_expected_collisions():
+    hi = khmer.Countgraph(12, 1e3, 4)
+    hb = khmer.Countgraph(12, 1e3, 4, blocked=True)
+    random.seed(1)
+    for i in range(200):
+        kmer = ''.join(random.choice('ACGT') for _ in range(12))
+        hi.count(kmer)
+        hb.count(kmer)
+
+    # all of a k-mer's counters share a block, so the false positive rate
+    # is higher than for independent tables at the same occupancy.
+    fp_indep = khmer.calc_expected_collisions(hi, force=True)
+    fp_blocked = khmer.calc_expected_collisions(hb, force=True)
+    assert 0 < fp_indep < fp_blocked < 1, (fp_indep, fp_blocked)
+
+
+def test_small_count():
+    ht = khmer.Countgraph(4, 100, 3, small_count=True)
+    assert ht.is_small_count()
+    assert not khmer.Countgraph(4, 100, 3).is_small_count()
+
+    # two 4-bit counters per byte.
+    for size, table in zip(ht.hashsizes(), ht.get_raw_tables()):
+        assert len(table) == (size + 1) // 2
+
+    for _ in range(20):
+        ht.count('AAAA')
+    ht.count('AACC')
+
+    assert ht.get('AAAA') == 15
+    assert ht.get('AACC') == 1
+    assert ht.get('ACGT') == 0
+
+
+def test_small_count_no_spill():
+    # with a single bin pair, both k-mers share one byte.
+    ht = khmer._Countgraph(4, [2], False, True)
+    hashes = {}
+    for kmer in ('AAAA', 'AAAC', 'AAAG', 'AACA', 'AACC'):
+        hashes.setdefault(khmer.forward_hash(kmer, 4) % 2, kmer)
+    even, odd = hashes[0], hashes[1]
+
+    for _ in range(40):
+        ht.count(even)
+    assert ht.get(even) == 15
+    assert ht.get(odd) == 0
+
+    for _ in range(3):
+        ht.count(odd)
+    assert ht.get(even) == 15
+    assert ht.get(odd) == 3
+
+
+def test_small_count_bigcount():
+    ht = khmer.Countgraph(4, 100, 3, small_count=True)
+    ht.set_use_bigcount(True)
+    for _ in range(40):
+        ht.count('AAAA')
+    assert ht.get('AAAA') == 40
+
+
+def test_small_count_save_load():
+    inpath = utils.get_test_data('random-20-a.fa')
+
+    for blocked in (False, True):
+        for savename in ('small.ct', 'small.ct.gz'):
+            savepath = utils.get_temp_filename(savename)
+
+            hi = khmer.Countgraph(12, 1e6, 3, blocked=blocked,
+                                  small_count=True)
+            hi.consume_fasta(inpath)
+            hi.save(savepath)
+
+            ht = khmer.load_countgraph(savepath)
+            assert ht.is_small_count()
+            assert ht.is_blocked() == blocked
+            assert ht.hashsizes() == hi.hashsizes()
+
+            tracking = khmer._Nodegraph(12, PRIMES_1m)
+            x = hi.abundance_distribution(inpath, tracking)
+            tracking = khmer._Nodegraph(12, PRIMES_1m)
+            y = ht.abundance_distribution(inpath, tracking)
+
+            assert sum(x) == 3966, sum(x)
+            assert x == y, (x, y)
+
+
 def test_load_empty_files():
     def do_load_ct(fname):
         with assert_raises(OSError):
@@ -667,6 +1015,44 @@ def test_trim_short():
     assert hi.get(DNA[:51][-6:]) == 1
 
 
+def test_median_and_trim_many():
+    inpath = utils.get_test_data('test-abund-read-2.fa')
+    hi = khmer.Countgraph(12, 1e6, 2)
+    hi.consume_fasta(inpath)
+
+    seqs = [record.sequence for record in screed.open(inpath)]
+    seqs += [seqs[0][:30] + 'N' + seqs[0][31:80],
+             seqs[0][:30] + 'n' + seqs[0][31:80],
+             seqs[0][:40].lower(), seqs[0][:12],
+             'ACGT', 'ACGTACGTACGTXACGT']
+
+    for cutoff in (1, 2, 5):
+        medians, trim_ats = hi.median_and_trim_many(seqs, cutoff)
+        assert len(medians) == len(trim_ats) == len(seqs)
+
+        for seq, med, trim_at in zip(seqs, medians, trim_ats):
+            seqN = seq.replace('N', 'A')
+            if len(seq) < 12:
+                assert (med, trim_at) == (0, 0)
+                continue
+            assert med == hi.get_median_count(seqN)[0]
+            assert trim_at == hi.trim_on_abundance(seqN, cutoff)[1]
+
+        # 'n' is not read as 'A': the read is invalid, and trimmed away.
+        assert trim_ats[-5] == 0
+
+
+def test_median_and_trim_many_bad_input():
+    hi = khmer.Countgraph(12, 1e6, 2)
+    assert hi.median_and_trim_many([], 2) == ([], [])
+
+    try:
+        hi.median_and_trim_many(['ACGTACGTACGTACGT', 5], 2)
+        assert 0, "should fail on non-strings"
+    except TypeError as err:
+        print(str(err))
+
+
 def test_find_spectral_error_positions_1():
     hi = khmer.Countgraph(8, 1e6, 2)
 
@@ -905,6 +1291,31 @@ def test_bigcount_overflow():
     assert kh.get('GGTTGACGGGGCTCAGGG') == MAX_BIGCOUNT
 
 
+def test_bigcount_many_kmers_save_load():
+    # enough k-mers past the counter maximum to spread over, and grow,
+    # every bigcount shard; check they all survive a save/load.
+    random.seed(1)
+    kmers = set()
+    while len(kmers) < 2000:
+        kmers.add(''.join(random.choice('ACGT') for _ in range(20)))
+    kmers = sorted(kmers)
+
+    kh = khmer.Countgraph(20, 1e5, 4, small_count=True)
+    kh.set_use_bigcount(True)
+    for i, kmer in enumerate(kmers):
+        for _ in range(16 + i % 10):
+            kh.count(kmer)
+
+    for savename in ('bigcount.ct', 'bigcount.ct.gz'):
+        savepath = utils.get_temp_filename(savename)
+        kh.save(savepath)
+
+        loaded = khmer.load_countgraph(savepath)
+        assert loaded.get_use_bigcount()
+        for i, kmer in enumerate(kmers):
+            assert loaded.get(kmer) == 16 + i % 10, kmer
+
+
 def test_get_ksize():
     kh = khmer.Countgraph(22, 1, 1)
     assert kh.ksize() == 22
@@ -10,9 +10,13 @@ import khmer
 import os
 import sys
 import collections
+import gzip
+import zlib
+import screed
+from screed import Record
 from . import khmer_tst_utils as utils
 from khmer.utils import (check_is_pair, broken_paired_reader, check_is_left,
-                         check_is_right)
+                         check_is_right, write_record, write_record_pair)
 from khmer.kfile import check_input_files, get_file_writer
 try:
     from StringIO import StringIO
@@ -40,6 +44,136 @@ def test_get_file_writer_fail():
     assert stopped, "Expected exception"
 
 
+def _writer_records(n):
+    bases = 'ACGT'
+    for i in range(n):
+        seq = ''.join(bases[(i * j) % 4] for j in range(80 + i % 20))
+        yield Record(name='read%d extra' % i, sequence=seq,
+                     quality='I' * len(seq))
+
+
+def test_record_writer_roundtrip():
+    # enough records to fill several buffers.
+    records = list(_writer_records(20000))
+
+    for gzip_, bzip in ((False, False), (True, False), (False, True)):
+        filename = utils.get_temp_filename('out.fq')
+        outfp = get_file_writer(open(filename, 'wb'), gzip_, bzip)
+        assert isinstance(outfp, khmer.RecordWriter)
+        assert outfp.name == filename
+        for i in range(0, len(records), 2):
+            if i % 4:
+                write_record_pair(records[i], records[i + 1], outfp)
+            else:
+                write_record(records[i], outfp)
+                outfp.write_record(records[i + 1])
+        outfp.close()
+        assert outfp.closed
+
+        found = [(r.name, r.sequence, r.quality)
+                 for r in screed.open(filename)]
+        assert found == [(r.name, r.sequence, r.quality) for r in records]
+
+
+def test_record_writer_fasta_and_reads():
+    filename = utils.get_temp_filename('out.fa')
+    outfp = khmer.RecordWriter(open(filename, 'wb'))
+    outfp.write_record(Record(name='seq1', sequence='ACGT'))
+    for read in khmer.ReadParser(utils.get_test_data('test-fastq-reads.fq')):
+        outfp.write_record(read)
+    assert outfp.write(b'>seq2\nGGGG\n') == 11
+    outfp.close()
+
+    lines = open(filename).read().splitlines()
+    assert lines[:2] == ['>seq1', 'ACGT']
+    assert lines[-2:] == ['>seq2', 'GGGG']
+    assert lines[2].startswith('@') and lines[4] == '+'
+
+
+def test_record_writer_text_stream():
+    fp = StringIO()
+    outfp = khmer.RecordWriter(fp)
+    write_record(Record(name='seq1', sequence='ACGT'), outfp)
+    outfp.flush()
+    assert fp.getvalue() == '>seq1\nACGT\n'
+
+
+def test_record_writer_record_attributes():
+    # fields set on a screed Record after it's made are written too.
+    read = Record(name='seq1', sequence='ACGT')
+    read.sequence = 'GGGG'
+    read.quality = '####'
+
+    fp = StringIO()
+    outfp = khmer.RecordWriter(fp)
+    outfp.write_record(read)
+    outfp.flush()
+    assert fp.getvalue() == '@seq1\nGGGG\n+\n####\n'
+
+
+def test_record_writer_empty_fastq():
+    # a zero-length FASTQ read is still written as FASTQ.
+    fp = StringIO()
+    outfp = khmer.RecordWriter(fp)
+    outfp.write_record(Record(name='seq1', sequence='', quality=''))
+    outfp.write_record_pair(Record(name='seq2', sequence='', quality=''),
+                            Record(name='seq3', sequence=''))
+    outfp.flush()
+    assert fp.getvalue() == '@seq1\n\n+\n\n@seq2\n\n+\n\n>seq3\n\n'
+
+
+def test_record_writer_gzip_flush():
+    filename = utils.get_temp_filename('out.fa.gz')
+    fp = open(filename, 'wb')
+    outfp = khmer.RecordWriter(fp, True)
+    outfp.write_record(Record(name='seq1', sequence='ACGT'))
+    outfp.flush()
+
+    # what's been flushed can be read back before the stream ends.
+    data = open(filename, 'rb').read()
+    assert zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data) == \
+        b'>seq1\nACGT\n'
+
+    # a writer deleted unclosed ends the stream, but leaves the file open.
+    outfp.write_record(Record(name='seq2', sequence='GGGG'))
+    del outfp
+    assert not fp.closed
+    fp.close()
+    assert gzip.open(filename).read() == b'>seq1\nACGT\n>seq2\nGGGG\n'
+
+
+def test_record_writer_closed():
+    outfp = khmer.RecordWriter(open(utils.get_temp_filename('out.fa'), 'wb'))
+    outfp.close()
+    outfp.close()
+    try:
+        outfp.write_record(Record(name='seq1', sequence='ACGT'))
+        assert 0, "writing to a closed writer should fail"
+    except ValueError as err:
+        print(str(err))
+
+
+def test_record_writer_both_compressions():
+    try:
+        khmer.RecordWriter(StringIO(), True, True)
+        assert 0, "gzip and bzip together should fail"
+    except ValueError as err:
+        print(str(err))
+
+
+def test_record_writer_bad_compression_flag():
+    class BadBool(object):
+        def __bool__(self):
+            raise ValueError("no truth value")
+        __nonzero__ = __bool__
+
+    try:
+        khmer.RecordWriter(StringIO(), BadBool())
+        assert 0, "a flag without a truth value should fail"
+    except ValueError as err:
+        print(str(err))
+
+
 def test_forward_hash_no_rc():
     h = khmer.forward_hash_no_rc('AAAA', 4)
     assert h == 0, h
@@ -255,6 +255,63 @@ def test_hll_change_ksize():
         hllcpp.ksize = 30
 
 
+def test_hll_consume_string_matches_add():
+    # consume_string hashes k-mers in place; the counters must come out the
+    # same as adding each k-mer on its own.
+    filename = utils.get_test_data('random-20-a.fa')
+    for rolling_hash in (False, True):
+        hll = khmer.HLLCounter(ERR_RATE, K)
+        hll.rolling_hash = rolling_hash
+        hll2 = khmer.HLLCounter(ERR_RATE, K)
+        hll2.rolling_hash = rolling_hash
+
+        for record in fasta_iter(open(filename)):
+            sequence = record['sequence']
+            hll.consume_string(sequence.lower())
+            for n in range(0, len(sequence) + 1 - K):
+                hll2.add(sequence[n:n + K])
+
+        assert hll.counters == hll2.counters
+
+
+def test_hll_rolling_hash():
+    filename = utils.get_test_data('random-20-a.fa')
+    hllcpp = khmer.HLLCounter(ERR_RATE, K)
+    assert not hllcpp.rolling_hash
+    hllcpp.rolling_hash = True
+    assert hllcpp.rolling_hash
+
+    n, n_consumed = hllcpp.consume_fasta(filename)
+    assert n == 99
+    assert n_consumed == 3960
+    assert abs(1 - float(hllcpp.estimate_cardinality()) / N_UNIQUE) < ERR_RATE
+
+    with assert_raises(AttributeError):
+        hllcpp.rolling_hash = False
+
+    # murmur and rolling counters can't be merged.
+    with assert_raises(ValueError):
+        hllcpp.merge(khmer.HLLCounter(ERR_RATE, K))
+
+    with assert_raises(ValueError):
+        hllcpp.consume_string('ACGTN' * 10)
+
+
+def test_hll_rolling_hash_ksize():
+    hllcpp = khmer.HLLCounter(ERR_RATE, 33)
+    with assert_raises(ValueError):
+        hllcpp.rolling_hash = True
+
+    hllcpp.ksize = 32
+    hllcpp.rolling_hash = True
+    with assert_raises(ValueError):
+        hllcpp.ksize = 33
+
+    # CGTA... and TACG... are reverse complements of each other.
+    hllcpp.consume_string('ACGT' * 20)
+    assert len(hllcpp) == 3
+
+
 def test_hll_get_counters():
     hll = khmer.HLLCounter(0.36, K)
     counters = hll.counters
@@ -300,3 +357,59 @@ def test_hll_merge_3():
 
     hll.merge(hll2)
     assert len(hll) == 236
+
+
+def test_hll_save_load():
+    filename = utils.get_test_data('random-20-a.fa')
+    savepath = utils.get_temp_filename('random-20-a.hll')
+
+    hll = khmer.HLLCounter(ERR_RATE, K)
+    hll.rolling_hash = True
+    hll.consume_fasta(filename)
+    hll.save(savepath)
+
+    hll2 = khmer.load_hllcounter(savepath)
+    assert isinstance(hll2, khmer.HLLCounter)
+    assert hll2.ksize == K
+    assert hll2.error_rate == hll.error_rate
+    assert hll2.rolling_hash
+    assert hll2.counters == hll.counters
+    assert len(hll2) == len(hll)
+
+    # a loaded counter can be merged with, and keep counting.
+    hll.merge(hll2)
+    hll2.consume_fasta(filename)
+    assert hll2.counters == hll.counters
+
+
+def test_hll_load_nonexistent():
+    hll = khmer.HLLCounter(ERR_RATE, K)
+    assert_raises(OSError, hll.load, utils.get_temp_filename('no.hll'))
+
+
+def test_hll_load_wrong_type():
+    savepath = utils.get_temp_filename('nodegraph')
+    khmer.Nodegraph(K, 1000, 2).save(savepath)
+
+    hll = khmer.HLLCounter(ERR_RATE, K)
+    try:
+        hll.load(savepath)
+        assert 0, "load should fail with an OSError"
+    except OSError as err:
+        assert 'Incorrect file format type' in str(err), str(err)
+
+
+def test_hll_load_truncated():
+    savepath = utils.get_temp_filename('truncated.hll')
+    khmer.HLLCounter(ERR_RATE, K).save(savepath)
+    with open(savepath, 'rb') as fp:
+        data = fp.read()
+    with open(savepath, 'wb') as fp:
+        fp.write(data[:-1])
+
+    hll = khmer.HLLCounter(0.36, 32)
+    assert_raises(OSError, hll.load, savepath)
+
+    # a failed load leaves the counter as it was.
+    assert hll.ksize == 32
+    assert hll.error_rate == khmer.HLLCounter(0.36, 32).error_rate
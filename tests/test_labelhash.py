@@ -195,6 +195,41 @@ def test_consume_fasta_and_tag_with_labels():
     assert lb.n_labels() == 3
 
 
+def _all_tag_labels(lb):
+    labels = set()
+    for tag in lb.graph.get_tagset():
+        labels.update(lb.get_tag_labels(khmer.forward_hash(tag, 20)))
+    return labels
+
+
+def test_consume_fasta_and_tag_with_labels_threads():
+    filename = utils.get_test_data('test-reads.fa')
+
+    lb = GraphLabels(20, 1e7, 4)
+    total_reads, _ = lb.consume_fasta_and_tag_with_labels(filename)
+
+    lb_threaded = GraphLabels(20, 1e7, 4)
+    total_reads_threaded, _ = lb_threaded.consume_fasta_and_tag_with_labels(
+        filename, 4)
+
+    assert total_reads_threaded == total_reads == 25000
+    assert lb_threaded.n_labels() == lb.n_labels() == 25000
+    # reads are labeled in file order however many threads there are.
+    assert _all_tag_labels(lb_threaded) == set(range(25000))
+    assert _all_tag_labels(lb) == set(range(25000))
+
+
+def test_consume_fasta_and_tag_with_labels_bad_threads():
+    lb = GraphLabels(20, 1e7, 4)
+    filename = utils.get_test_data('test-labels.fa')
+
+    try:
+        lb.consume_fasta_and_tag_with_labels(filename, 0)
+        assert 0, "should fail"
+    except ValueError as err:
+        print(str(err))
+
+
 def test_consume_partitioned_fasta_and_tag_with_labels():
     lb = GraphLabels(20, 1e7, 4)
     filename = utils.get_test_data('real-partition-small.fa')
@@ -253,6 +288,87 @@ def test_sweep_label_neighborhood():
 '''
 
 
+def test_sweep_reads():
+    lb = GraphLabels(20, 1e7, 4)
+    lb.consume_fasta_and_tag_with_labels(
+        utils.get_test_data('random-20-a.fa'))
+    filename = utils.get_test_data('random-20-X2.fa')
+
+    for traversal_range in (-1, 0, 5):
+        expected = [sorted(lb.sweep_label_neighborhood(record.sequence,
+                                                       traversal_range))
+                    for record in screed.open(filename)]
+        for n_threads in (1, 4):
+            labels = lb.sweep_reads(khmer.ReadParser(filename),
+                                    traversal_range, n_threads)
+            assert labels == expected
+
+
+def test_sweep_reads_short():
+    lb = GraphLabels(25, 1e7, 4)
+    lb.consume_partitioned_fasta_and_tag_with_labels(
+        utils.get_test_data('test-sweep-contigs.fp'))
+    filename = utils.get_temp_filename('short.fa')
+    with open(filename, 'w') as fp:
+        fp.write('>short\nACGTACGT\n')
+
+    assert lb.sweep_reads(khmer.ReadParser(filename)) == [None]
+
+
+def test_sweep_reads_writer():
+    lb = GraphLabels(25, 1e7, 4)
+    lb.consume_partitioned_fasta_and_tag_with_labels(
+        utils.get_test_data('test-sweep-contigs.fp'))
+    prefix = utils.get_temp_filename('test')
+
+    # buffer one read per label, and keep one file open at a time.
+    writer = khmer.LabelSweepWriter(prefix, 'fa', 1, 100, 100, 1)
+    n_written = lb.sweep_reads(
+        khmer.ReadParser(utils.get_test_data('test-sweep-reads.fa')),
+        -1, 2, writer)
+    writer.flush()
+
+    assert n_written == 5
+    assert writer.counts == {'0': 2, '1': 1, 'multi': 1, 'orphaned': 1}
+    assert writer.label_dist == {0: 1, 1: 3, 2: 1}
+    assert writer.n_file_errors == 0
+    assert writer.n_write_errors == 0
+
+    names = set(r.name for r in screed.open(prefix + '_0.fa'))
+    assert names == set(['read1_p0\t0', 'read2_p0\t0'])
+    names = set(r.name for r in screed.open(prefix + '_multi.fa'))
+    assert names == set(['read4_multi\t0\t1'])
+
+
+def test_sweep_reads_writer_bad_dir():
+    lb = GraphLabels(25, 1e7, 4)
+    lb.consume_partitioned_fasta_and_tag_with_labels(
+        utils.get_test_data('test-sweep-contigs.fp'))
+    prefix = os.path.join(utils.get_temp_filename('no_such_dir'), 'test')
+
+    writer = khmer.LabelSweepWriter(prefix, 'fa', 10, 100, 100)
+    lb.sweep_reads(
+        khmer.ReadParser(utils.get_test_data('test-sweep-reads.fa')),
+        -1, 1, writer)
+    writer.flush()
+
+    assert writer.n_file_errors == 4
+    assert writer.n_write_errors == 5
+    assert writer.counts == {}
+    assert writer.label_dist == {}
+
+
+def test_sweep_reads_bad_writer():
+    lb = GraphLabels(20, 1e7, 4)
+    try:
+        lb.sweep_reads(
+            khmer.ReadParser(utils.get_test_data('test-labels.fa')),
+            -1, 1, 'not a writer')
+        assert 0, "should fail"
+    except TypeError as err:
+        print(str(err))
+
+
 def test_label_tag_correctness():
     lb = GraphLabels(20, 1e7, 4)
     filename = utils.get_test_data('test-labels.fa')
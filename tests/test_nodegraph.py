@@ -9,6 +9,8 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
+import random
+
 import khmer
 from khmer import ReadParser
 
@@ -358,6 +360,29 @@ def test_save_load_tagset_noclear():
     assert len(data) == 38, len(data)
 
 
+def test_save_load_tagset_many():
+    random.seed(1)
+    kmers = set(''.join(random.choice('ACGT') for _ in range(20))
+                for _ in range(5000))
+
+    nodegraph = khmer._Nodegraph(20, [1])
+    for kmer in kmers:
+        nodegraph.add_tag(kmer)
+
+    # tags come back in order of their hash.
+    tags = nodegraph.get_tagset()
+    assert len(tags) == nodegraph.n_tags()
+    hashes = [khmer.forward_hash(tag, 20) for tag in tags]
+    assert hashes == sorted(hashes)
+
+    outfile = utils.get_temp_filename('tagset')
+    nodegraph.save_tagset(outfile)
+
+    nodegraph2 = khmer._Nodegraph(20, [1])
+    nodegraph2.load_tagset(outfile)
+    assert nodegraph2.get_tagset() == tags
+
+
 def test_stop_traverse():
     filename = utils.get_test_data('random-20-a.fa')
 
@@ -925,6 +950,37 @@ def test_n_occupied_save_load():
     assert ng2.n_unique_kmers() == 0    # this is intended behavior, sigh.
 
 
+def test_save_load_mmap():
+    filename = utils.get_test_data('random-20-a.fa')
+
+    nodegraph = khmer.Nodegraph(20, 100000, 3)
+    nodegraph.consume_fasta(filename)
+
+    savefile = utils.get_temp_filename('out')
+    nodegraph.save(savefile)
+
+    ng2 = khmer.load_nodegraph(savefile, mmap=True)
+    assert ng2.is_mapped()
+    assert ng2.n_occupied() == nodegraph.n_occupied()
+    for record in screed.open(filename):
+        assert ng2.get_kmer_counts(record.sequence) == \
+            nodegraph.get_kmer_counts(record.sequence)
+
+    # writes go to private copies of the mapped pages.
+    ng2.count('A' * 20)
+    assert ng2.get('A' * 20)
+    assert not khmer.load_nodegraph(savefile).get('A' * 20)
+
+
+def test_get_kmer_counts_array():
+    nodegraph = khmer.Nodegraph(6, 1e6, 2)
+    nodegraph.consume("AAAAAA")
+
+    assert list(nodegraph.get_kmer_counts_array("AAAAAAT")) == [1, 0]
+    hashes = nodegraph.get_kmer_hashes_array("AAAAAAT")
+    assert list(nodegraph.get_counts_for_hashes(hashes)) == [1, 0]
+
+
 def test_n_occupied_vs_countgraph():
     filename = utils.get_test_data('random-20-a.fa')
 
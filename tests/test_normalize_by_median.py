@@ -84,6 +84,38 @@ def test_normalize_by_median():
     assert "I/O Errors" not in err
 
 
+def test_normalize_by_median_small_count():
+    CUTOFF = '1'
+
+    infile = utils.get_temp_filename('test.fa')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile)
+
+    script = 'normalize-by-median.py'
+    args = ['-C', CUTOFF, '-k', '17', '--small-count', infile]
+    (status, out, err) = utils.runscript(script, args, in_dir)
+
+    outfile = infile + '.keep'
+    seqs = [r.sequence for r in screed.open(outfile)]
+    assert len(seqs) == 1, seqs
+    assert seqs[0].startswith('GGTTGACGGGGCTCAGGGGG'), seqs
+
+
+def test_normalize_by_median_small_count_cutoff_too_high():
+    infile = utils.get_temp_filename('test.fa')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile)
+
+    script = 'normalize-by-median.py'
+    args = ['-C', '20', '-k', '17', '--small-count', infile]
+    (status, out, err) = utils.runscript(script, args, in_dir, fail_ok=True)
+
+    assert status != 0
+    assert '4-bit counters' in err, err
+
+
 def test_normalize_by_median_quiet():
     CUTOFF = '1'
 
@@ -414,6 +446,25 @@ def test_normalize_by_median_overwrite():
     assert 'GACAGCgtgCCGCA' in seqs[0], seqs
 
 
+def test_normalize_by_median_single_output_many_inputs():
+    infile = utils.get_temp_filename('test.fa')
+    infile2 = utils.get_temp_filename('test2.fa')
+    outfile = utils.get_temp_filename('out.fa')
+    in_dir = os.path.dirname(infile)
+    shutil.copyfile(utils.get_test_data('random-20-a.fa'), infile)
+    shutil.copyfile(utils.get_test_data('random-20-b.fa'), infile2)
+
+    script = 'normalize-by-median.py'
+    args = ['-C', '20', '-k', '17', '-o', outfile, infile, infile2]
+    utils.runscript(script, args, in_dir)
+
+    # the output stays open for the second input.
+    names = [r.name for r in screed.open(outfile)]
+    expected = [r.name for r in screed.open(infile)] + \
+        [r.name for r in screed.open(infile2)]
+    assert names == expected
+
+
 def test_normalize_by_median_version():
     script = 'normalize-by-median.py'
     args = ['--version']
@@ -502,6 +553,73 @@ def test_normalize_by_median_paired_fq():
     assert '895:1:37:17593:9954 2::FOO' in names, names
 
 
+def test_normalize_by_median_paired_fq_threads():
+    CUTOFF = '20'
+
+    infile = utils.get_temp_filename('test.fa')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-paired.fq'), infile)
+
+    script = 'normalize-by-median.py'
+    outfile = infile + '.keep'
+
+    args = ['-C', CUTOFF, '-p', '-k', '17', infile]
+    utils.runscript(script, args, in_dir)
+    expected = [r.name for r in screed.open(outfile)]
+
+    args = ['-C', CUTOFF, '-p', '-k', '17', '-T', '4', infile]
+    _, out, err = utils.runscript(script, args, in_dir)
+    print(out)
+    print(err)
+
+    assert os.path.exists(outfile), outfile
+
+    # output order and pairing match the single-threaded run.
+    names = [r.name for r in screed.open(outfile)]
+    assert len(names) == 6, names
+    assert names == expected, (names, expected)
+
+
+def test_normalize_by_median_threads_unordered():
+    CUTOFF = ['-C', '1']
+    PAIRING = ['-p']
+
+    infile = utils.get_temp_filename('test.fa')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('dn-test-all-paired-all-keep.fa'),
+                    infile)
+
+    script = 'normalize-by-median.py'
+    args = CUTOFF + PAIRING + ['-k', '15', '-T', '2', '--unordered', infile]
+    _, out, err = utils.runscript(script, args, in_dir)
+
+    outfile = infile + '.keep'
+    assert os.path.exists(outfile), outfile
+
+    seqs = set([r.name for r in screed.open(outfile)])
+    assert seqs == set(['a/1', 'a/2',
+                        'b/1', 'b/2',
+                        'c/1', 'c/2',
+                        'd/1', 'd/2']), seqs
+
+
+def test_normalize_by_median_impaired_threads():
+    CUTOFF = '1'
+
+    infile = utils.get_temp_filename('test.fa')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-impaired.fa'), infile)
+
+    script = 'normalize-by-median.py'
+    args = ['-C', CUTOFF, '-p', '-k', '17', '-T', '2', infile]
+    status, out, err = utils.runscript(script, args, in_dir, fail_ok=True)
+    assert status != 0
+    assert 'ERROR: Unpaired reads ' in err, err
+
+
 def test_normalize_by_median_impaired():
     CUTOFF = '1'
 
@@ -0,0 +1,379 @@
+from __future__ import print_function
+from __future__ import absolute_import
+#
+# This file is part of khmer, https://github.com/dib-lab/khmer/, and is
+# Copyright (C) Michigan State University, 2009-2015. It is licensed under
+# the three-clause BSD license; see LICENSE.
+# Contact: khmer-project@idyll.org
+#
+
+# Tests for the ReadBuffer, StreamingTrimmer and StreamingCorrector classes.
+
+import os
+
+import khmer
+import screed
+from screed import Record
+from khmer.utils import broken_paired_reader
+from . import khmer_tst_utils as utils
+
+
+def teardown():
+    utils.cleanup()
+
+
+def _records():
+    records = list(screed.open(utils.get_test_data('test-fastq-reads.fq')))
+    records += list(screed.open(utils.get_test_data('random-20-a.fa')))[:20]
+    records.append(Record(name='odd bases', sequence='ACGTNNacgtRYKM'))
+    records.append(Record(name='empty', sequence=''))
+    return records
+
+
+def test_read_buffer_round_trip():
+    spill = utils.get_temp_filename('pass2.spill')
+    buf = khmer.ReadBuffer(10 ** 9, spill)
+
+    records = _records()
+    for n, record in enumerate(records):
+        buf.append(record, n % 3)
+    assert buf.n_reads == len(records)
+    assert buf.n_spilled == 0
+    assert not os.path.exists(spill)
+
+    # a buffer can be read more than once.
+    for _ in range(2):
+        found = list(buf)
+        assert len(found) == len(records)
+        for n, (record, (group, name, sequence, quality)) in \
+                enumerate(zip(records, found)):
+            assert group == n % 3
+            assert name == record.name
+            assert sequence == record.sequence
+            assert quality == getattr(record, 'quality', None)
+
+
+def test_read_buffer_spill():
+    spill = utils.get_temp_filename('pass2.spill')
+    buf = khmer.ReadBuffer(1000, spill)
+
+    records = _records()
+    for record in records:
+        buf.append(record)
+    assert 0 < buf.n_spilled < len(records)
+    assert buf.memory_used < 1000
+    assert os.path.exists(spill)
+
+    found = [(name, sequence) for _, name, sequence, _ in buf]
+    assert found == [(r.name, r.sequence) for r in records]
+
+    # reads can be added once a pass is over, and land after the others.
+    buf.append(records[0], 5)
+    found = list(buf)
+    assert len(found) == len(records) + 1
+    assert found[-1][0] == 5
+    assert found[-1][1] == records[0].name
+
+    del buf, found
+    assert not os.path.exists(spill)
+
+
+def test_read_buffer_khmer_reads():
+    buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('pass2.spill'))
+
+    filename = utils.get_test_data('test-fastq-reads.fq')
+    for read in khmer.ReadParser(filename):
+        buf.append(read)
+
+    found = [(name, sequence, quality) for _, name, sequence, quality in buf]
+    assert found == [(r.name, r.sequence, r.quality)
+                     for r in screed.open(filename)]
+
+
+def test_read_buffer_append_while_reading():
+    buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('pass2.spill'))
+    record = Record(name='read', sequence='ACGTACGT')
+    buf.append(record)
+    buf.append(record)
+
+    reads = iter(buf)
+    next(reads)
+    try:
+        buf.append(record)
+        assert 0, "append should fail while the buffer is being read"
+    except RuntimeError as err:
+        print(str(err))
+
+
+def test_read_buffer_bad_quality():
+    buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('pass2.spill'))
+    record = Record(name='read', sequence='ACGTACGT', quality='###')
+    try:
+        buf.append(record)
+        assert 0, "append should fail with a ValueError"
+    except ValueError as err:
+        print(str(err))
+    assert buf.n_reads == 0
+
+
+def test_streaming_trimmer_matches_python():
+    K = 17
+    cutoff, normalize_to = 2, 2
+    filename = utils.get_test_data('test-abund-read-2.paired.fq')
+
+    for variable_coverage in (False, True):
+        graph = khmer.Countgraph(K, 1e6, 2)
+        buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+        records = [r for r in screed.open(filename) if len(r.sequence) >= K]
+        for record in records:
+            graph.consume(record.sequence.replace('N', 'A'))
+            buf.append(record)
+
+        # the second pass of trim-low-abund.py, in Python.
+        expected = []
+        for record in records:
+            seq = record.sequence.replace('N', 'A')
+            med, _, _ = graph.get_median_count(seq)
+            if med < normalize_to and variable_coverage:
+                expected.append((record.name, record.sequence))
+                continue
+            _, trim_at = graph.trim_on_abundance(seq, cutoff)
+            if trim_at >= K:
+                expected.append((record.name, record.sequence[:trim_at]))
+
+        trimmer = khmer.StreamingTrimmer(graph, cutoff, normalize_to,
+                                         variable_coverage)
+        found = []
+        for _, name, sequence, quality in trimmer.trim_buffered(buf):
+            assert len(quality) == len(sequence)
+            found.append((name, sequence))
+        assert found == expected
+
+        stats = trimmer.get_stats()
+        assert stats['written_reads'] == len(expected)
+        assert stats['written_bp'] == sum(len(s) for _, s in expected)
+        if not variable_coverage:
+            assert stats['skipped_reads'] == 0
+
+
+def _python_first_pass(graph, filename, cutoff, normalize_to, force_single):
+    # the first pass of trim-low-abund.py, in Python.
+    K = graph.ksize()
+    output, set_aside = [], []
+    reads = broken_paired_reader(screed.open(filename), min_length=K,
+                                 force_single=force_single)
+    for _, is_pair, read1, read2 in reads:
+        fragment = [read1, read2] if is_pair else [read1]
+        seqs = [r.sequence.replace('N', 'A') for r in fragment]
+        if min(graph.get_median_count(s)[0] for s in seqs) < normalize_to:
+            for seq in seqs:
+                graph.consume(seq)
+            set_aside += [r.name for r in fragment]
+            continue
+        for read, seq in zip(fragment, seqs):
+            _, trim_at = graph.trim_on_abundance(seq, cutoff)
+            if trim_at >= K:
+                output.append((read.name, read.sequence[:trim_at]))
+            elif is_pair:
+                output.append((read.name, read.sequence))
+    return output, set_aside
+
+
+def _parse_output(chunks):
+    lines = b''.join(chunks).decode('utf-8').splitlines()
+    assert len(lines) % 4 == 0
+    return [(lines[i][1:], lines[i + 1]) for i in range(0, len(lines), 4)]
+
+
+def test_streaming_trimmer_first_pass_matches_python():
+    K = 17
+    cutoff, normalize_to = 2, 2
+    filename = utils.get_test_data('paired-mixed.fq')
+
+    for force_single in (False, True):
+        graph = khmer.Countgraph(K, 1e6, 2)
+        expected, set_aside = _python_first_pass(graph, filename, cutoff,
+                                                 normalize_to, force_single)
+        assert expected and set_aside
+
+        graph = khmer.Countgraph(K, 1e6, 2)
+        trimmer = khmer.StreamingTrimmer(graph, cutoff, normalize_to)
+        buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+        chunks = trimmer.trim_first_pass(khmer.ReadParser(filename), buf, 3,
+                                         1, force_single)
+        assert _parse_output(chunks) == expected
+        assert [(group, name) for group, name, _, _ in buf] == \
+            [(3, name) for name in set_aside]
+
+        stats = trimmer.get_stats()
+        assert stats['set_aside_reads'] == len(set_aside)
+        assert stats['written_reads'] == len(expected)
+        assert stats['n_reads'] == len(expected) + len(set_aside)
+
+
+def test_streaming_trimmer_first_pass_threads():
+    filename = utils.get_test_data('test-abund-read-2.paired.fq')
+    names = [r.name for r in screed.open(filename) if len(r.sequence) >= 17]
+
+    graph = khmer.Countgraph(17, 1e6, 2)
+    trimmer = khmer.StreamingTrimmer(graph, 2, 2)
+    buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+    found = _parse_output(trimmer.trim_first_pass(khmer.ReadParser(filename),
+                                                  buf, 0, 4))
+    found += [(name, seq) for _, name, seq, _ in buf]
+
+    assert sorted(name for name, _ in found) == sorted(names)
+    # pairs are never split.
+    for n, (name, _) in enumerate(found):
+        if name.endswith('/1') and name[:-1] + '2' in names:
+            assert found[n + 1][0] == name[:-1] + '2'
+
+
+def test_streaming_trimmer_first_pass_bad_threads():
+    graph = khmer.Countgraph(17, 1e6, 2)
+    trimmer = khmer.StreamingTrimmer(graph, 2, 2)
+    buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+    parser = khmer.ReadParser(utils.get_test_data('test-abund-read-2.fa'))
+    try:
+        trimmer.trim_first_pass(parser, buf, 0, 0)
+        assert 0, "n_threads of 0 should fail"
+    except ValueError as err:
+        print(str(err))
+
+
+class _BadBool(object):
+
+    def __bool__(self):
+        raise ValueError("no truth value")
+    __nonzero__ = __bool__
+
+
+def test_streaming_trimmer_bad_variable_coverage():
+    graph = khmer.Countgraph(17, 1e6, 2)
+    try:
+        khmer.StreamingTrimmer(graph, 2, 2, _BadBool())
+        assert 0, "a variable_coverage without a truth value should fail"
+    except ValueError as err:
+        print(str(err))
+
+
+def _python_correct(aligner, seq):
+    # correct_sequence() from sandbox/correct-reads.py.
+    _, graph_alignment, _, truncated = aligner.align(seq)
+    if truncated:
+        return None
+    return graph_alignment.replace('-', '')
+
+
+def test_streaming_corrector_matches_python():
+    K = 17
+    normalize_to = 2
+    filename = utils.get_test_data('test-abund-read-2.paired.fq')
+
+    for variable_coverage in (False, True):
+        graph = khmer.Countgraph(K, 1e6, 2)
+        aligner = khmer.ReadAligner(graph, 1, 1.0)
+        buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+        records = [r for r in screed.open(filename) if len(r.sequence) >= K]
+        for record in records:
+            graph.consume(record.sequence.replace('N', 'A'))
+            buf.append(record)
+
+        # the second pass of correct-reads.py, in Python.
+        expected = []
+        for record in records:
+            seq = record.sequence.replace('N', 'A')
+            med, _, _ = graph.get_median_count(seq)
+            if med < normalize_to and variable_coverage:
+                expected.append((record.name, record.sequence))
+                continue
+            corrected = _python_correct(aligner, seq)
+            if corrected is not None:
+                expected.append((record.name, corrected))
+        assert expected
+
+        corrector = khmer.StreamingCorrector(graph, aligner, normalize_to,
+                                             variable_coverage)
+        found = []
+        for _, name, sequence, quality in corrector.correct_buffered(buf):
+            assert len(quality) == len(sequence)
+            found.append((name, sequence))
+        assert found == expected
+
+        stats = corrector.get_stats()
+        assert stats['written_reads'] == len(expected)
+        assert stats['written_bp'] == sum(len(s) for _, s in expected)
+
+
+def test_streaming_corrector_first_pass_matches_python():
+    K = 17
+    normalize_to = 2
+    filename = utils.get_test_data('test-abund-read-2.paired.fq')
+
+    for force_single in (False, True):
+        # the first pass of correct-reads.py, in Python.
+        graph = khmer.Countgraph(K, 1e6, 2)
+        aligner = khmer.ReadAligner(graph, 1, 1.0)
+        expected, set_aside = [], []
+        reads = broken_paired_reader(screed.open(filename), min_length=K,
+                                     force_single=force_single)
+        for _, is_pair, read1, read2 in reads:
+            fragment = [read1, read2] if is_pair else [read1]
+            seqs = [r.sequence.replace('N', 'A') for r in fragment]
+            if min(graph.get_median_count(s)[0] for s in seqs) < normalize_to:
+                for seq in seqs:
+                    graph.consume(seq)
+                set_aside += [r.name for r in fragment]
+                continue
+            for read, seq in zip(fragment, seqs):
+                corrected = _python_correct(aligner, seq)
+                if corrected is not None:
+                    expected.append((read.name, corrected))
+                elif is_pair:
+                    expected.append((read.name, read.sequence))
+        assert expected and set_aside
+
+        graph = khmer.Countgraph(K, 1e6, 2)
+        aligner = khmer.ReadAligner(graph, 1, 1.0)
+        corrector = khmer.StreamingCorrector(graph, aligner, normalize_to)
+        buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+        chunks = corrector.correct_first_pass(khmer.ReadParser(filename), buf,
+                                              0, 1, force_single)
+        assert _parse_output(chunks) == expected
+        assert [name for _, name, _, _ in buf] == set_aside
+
+        stats = corrector.get_stats()
+        assert stats['set_aside_reads'] == len(set_aside)
+        assert stats['written_reads'] == len(expected)
+        assert stats['corrected_reads'] > 0
+        assert stats['trimmed_reads'] == 0
+
+
+def test_streaming_corrector_first_pass_threads():
+    filename = utils.get_test_data('test-abund-read-2.paired.fq')
+    names = [r.name for r in screed.open(filename) if len(r.sequence) >= 17]
+
+    graph = khmer.Countgraph(17, 1e6, 2)
+    aligner = khmer.ReadAligner(graph, 1, 1.0)
+    corrector = khmer.StreamingCorrector(graph, aligner, 2)
+    buf = khmer.ReadBuffer(10 ** 9, utils.get_temp_filename('spill'))
+    found = _parse_output(corrector.correct_first_pass(
+        khmer.ReadParser(filename), buf, 0, 4))
+    found += [(name, seq) for _, name, seq, _ in buf]
+
+    # every read is either written, set aside or dropped.
+    found_names = [name for name, _ in found]
+    assert set(found_names) <= set(names)
+    stats = corrector.get_stats()
+    assert stats['n_reads'] == len(names)
+    assert stats['written_reads'] + stats['set_aside_reads'] == len(found)
+
+
+def test_streaming_corrector_wrong_graph():
+    graph = khmer.Countgraph(17, 1e6, 2)
+    aligner = khmer.ReadAligner(khmer.Countgraph(17, 1e6, 2), 1, 1.0)
+    try:
+        khmer.StreamingCorrector(graph, aligner, 2)
+        assert 0, "an aligner on another graph should fail"
+    except ValueError as err:
+        print(str(err))
@@ -10,6 +10,11 @@ from __future__ import absolute_import
 # Tests for the ReadParser and Read classes.
 
 
+import bz2
+import gzip
+import struct
+import zlib
+
 import khmer
 from khmer import ReadParser
 from . import khmer_tst_utils as utils
@@ -58,6 +63,28 @@ def test_num_reads():
     assert rparser.num_reads == 100
 
 
+def test_num_reads_partial():
+    """Test ReadParser.num_reads counts only reads handed out so far"""
+    rparser = ReadParser(utils.get_test_data("100-reads.fq.gz"))
+    for n, _ in enumerate(rparser):
+        if n == 9:
+            break
+
+    assert rparser.num_reads == 10, rparser.num_reads
+    assert len(list(rparser)) == 90
+
+
+def test_partial_iteration_then_consume():
+    """Reads buffered by the iterator are not lost to C++ consumers"""
+    rparser = ReadParser(utils.get_test_data("100-reads.fq.gz"))
+    next(iter(rparser))
+
+    countgraph = khmer.Countgraph(20, 1e5, 2)
+    total_reads, _ = countgraph.consume_fasta_with_reads_parser(rparser)
+    assert total_reads == 99, total_reads
+    assert rparser.num_reads == 100, rparser.num_reads
+
+
 @attr('multithread')
 def test_num_reads_threads():
     """Test threadsaftey of ReadParser's read counting"""
@@ -162,6 +189,90 @@ def test_bzip2_decompression_truncated_pairiter():
         print(str(err))
 
 
+def _reads_in(filename):
+    return [(read.name, read.sequence, read.quality)
+            for read in ReadParser(filename)]
+
+
+def _write_bgzf(filename, data, block_size=1000):
+    # BGZF is a series of gzip members, each with a 'BC' extra field giving
+    # its compressed size, and ending in an empty block.
+    with open(filename, 'wb') as fp:
+        chunks = [data[i:i + block_size]
+                  for i in range(0, len(data), block_size)]
+        for chunk in chunks + [b'']:
+            comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+            cdata = comp.compress(chunk) + comp.flush()
+            bsize = 12 + 6 + len(cdata) + 8
+            fp.write(struct.pack('<BBBBIBBH', 0x1f, 0x8b, 8, 4, 0, 0, 255, 6))
+            fp.write(b'BC' + struct.pack('<HH', 2, bsize - 1))
+            fp.write(cdata)
+            fp.write(struct.pack('<II', zlib.crc32(chunk) & 0xffffffff,
+                                 len(chunk)))
+
+
+def test_gzip_decompression_multiple_members():
+    infile = utils.get_test_data("100-reads.fq.gz")
+    data = gzip.open(infile).read()
+
+    multifile = utils.get_temp_filename("multi.fq.gz")
+    with open(multifile, 'wb') as fp:
+        for i in range(0, len(data), 3000):
+            fp.write(gzip.compress(data[i:i + 3000]))
+
+    reads = _reads_in(multifile)
+    assert len(reads) == 100
+    assert reads == _reads_in(infile)
+
+
+def test_bzip2_decompression_multiple_streams():
+    infile = utils.get_test_data("100-reads.fq.bz2")
+    data = bz2.BZ2File(infile).read()
+
+    multifile = utils.get_temp_filename("multi.fq.bz2")
+    with open(multifile, 'wb') as fp:
+        for i in range(0, len(data), 3000):
+            fp.write(bz2.compress(data[i:i + 3000]))
+
+    reads = _reads_in(multifile)
+    assert len(reads) == 100
+    assert reads == _reads_in(infile)
+
+
+def test_bgzf_decompression():
+    infile = utils.get_test_data("100-reads.fq.gz")
+    data = gzip.open(infile).read()
+
+    bgzfile = utils.get_temp_filename("test.fq.bgz")
+    _write_bgzf(bgzfile, data)
+
+    reads = _reads_in(bgzfile)
+    assert len(reads) == 100
+    assert reads == _reads_in(infile)
+
+
+def test_bgzf_decompression_corrupt():
+    data = gzip.open(utils.get_test_data("100-reads.fq.gz")).read()
+
+    bgzfile = utils.get_temp_filename("test.fq.bgz")
+    _write_bgzf(bgzfile, data)
+
+    # flip a byte in the second block's CRC.
+    contents = bytearray(open(bgzfile, 'rb').read())
+    second = struct.unpack('<H', bytes(contents[16:18]))[0] + 1
+    second += struct.unpack('<H', bytes(contents[second + 16:
+                                                 second + 18]))[0] + 1
+    contents[second - 8] ^= 0xff
+    with open(bgzfile, 'wb') as fp:
+        fp.write(contents)
+
+    try:
+        _reads_in(bgzfile)
+        assert 0, "this should fail"
+    except OSError as err:
+        print(str(err))
+
+
 def test_badbzip2():
     try:
         rparser = ReadParser(utils.get_test_data("test-empty.fa.bz2"))
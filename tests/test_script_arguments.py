@@ -191,6 +191,22 @@ def test_create_countgraph_4_multiplier():
         sum(countgraph.hashsizes())
 
 
+def test_create_countgraph_5_small_count():
+    ksize = khmer_args.DEFAULT_K
+    n_tables = khmer_args.DEFAULT_N_TABLES
+    max_tablesize = khmer_args.DEFAULT_MAX_TABLESIZE
+    max_mem = 1e7
+
+    args = FakeArgparseObject(ksize, n_tables, max_tablesize, max_mem, 0)
+    args = argparse.Namespace(small_count=True, **args._asdict())
+
+    # 4-bit counters fit twice as many bins in the same memory.
+    countgraph = khmer_args.create_countgraph(args)
+    assert countgraph.is_small_count()
+    assert max_mem < sum(countgraph.hashsizes()) < 2 * max_mem, \
+        sum(countgraph.hashsizes())
+
+
 def test_create_nodegraph_1():
     ksize = khmer_args.DEFAULT_K
     n_tables = khmer_args.DEFAULT_N_TABLES
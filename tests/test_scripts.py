@@ -16,6 +16,7 @@ import sys
 import os
 import stat
 import shutil
+import glob
 from io import StringIO
 import traceback
 from nose.plugins.attrib import attr
@@ -23,6 +24,7 @@ import threading
 import bz2
 import gzip
 import io
+import zlib
 
 from . import khmer_tst_utils as utils
 import khmer
@@ -55,6 +57,23 @@ def test_load_into_counting():
     assert os.path.exists(outfile)
 
 
+def test_load_into_counting_blocked():
+    script = 'load-into-counting.py'
+    args = ['-x', '1e5', '-N', '2', '-k', '20', '--blocked']
+
+    outfile = utils.get_temp_filename('out.ct')
+    infile = utils.get_test_data('test-abund-read-2.fa')
+
+    args.extend([outfile, infile])
+
+    (status, out, err) = utils.runscript(script, args)
+    assert 'Total number of unique k-mers: 95' in err, err
+    assert os.path.exists(outfile)
+
+    countgraph = khmer.load_countgraph(outfile)
+    assert countgraph.is_blocked()
+
+
 def test_load_into_counting_autoargs_0():
     script = 'load-into-counting.py'
 
@@ -382,6 +401,29 @@ def test_filter_abund_2():
     assert 'GGTTGACGGGGCTCAGGG' in seqs
 
 
+def test_filter_abund_2_single_output_gzip():
+    # every input goes through the same writer, making one gzip stream.
+    infile = utils.get_temp_filename('test.fa')
+    in_dir = os.path.dirname(infile)
+    outfile = utils.get_temp_filename('out.fa.gz')
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile)
+    counting_ht = _make_counting(infile, K=17)
+
+    script = 'filter-abund.py'
+    args = ['-C', '1', '--gzip', '-o', outfile, counting_ht, infile, infile]
+    utils.runscript(script, args, in_dir)
+
+    assert not os.path.exists(infile + '.abundfilt')
+    seqs = [r.sequence for r in screed.open(outfile)]
+    assert seqs[:len(seqs) // 2] == seqs[len(seqs) // 2:], seqs
+    assert 'GGTTGACGGGGCTCAGGG' in seqs
+
+    gz = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    gz.decompress(open(outfile, 'rb').read())
+    assert gz.eof and not gz.unused_data
+
+
 def test_filter_abund_2_stdin():
     infile = utils.get_temp_filename('test.fa')
     in_dir = os.path.dirname(infile)
@@ -726,6 +768,23 @@ def test_count_median():
     assert '895:1:37:17593:9954/1,1,103.803741455,303.702941895,114' in data
 
 
+def test_count_median_mmap():
+    infile = utils.get_temp_filename('test.fa')
+    outfile = infile + '.counts'
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile)
+    counting_ht = _make_counting(infile, K=8)
+
+    script = 'count-median.py'
+    args = ['--mmap', counting_ht, infile, outfile]
+    utils.runscript(script, args)
+
+    data = [x.strip() for x in open(outfile).readlines()[1:]]
+    data = set(data)
+    assert len(data) == 2, data
+    assert 'seq,1001,1001.0,0.0,18' in data, data
+
+
 def test_count_median_fq_csv():
     infile = utils.get_temp_filename('test.fq')
     outfile = infile + '.counts'
@@ -1450,6 +1509,28 @@ def test_extract_partitions_output_unassigned():
     assert len(parts) == 1, len(parts)
 
 
+def test_extract_partitions_mixed_formats():
+    seqfile = utils.get_test_data('random-20-a.fa')
+    graphbase = _make_graph(
+        seqfile, do_partition=True, annotate_partitions=True)
+    in_dir = os.path.dirname(graphbase)
+    partfile = os.path.join(in_dir, 'random-20-a.fa.part')
+
+    fq_partfile = os.path.join(in_dir, 'random-20-a.fq.part')
+    with open(fq_partfile, 'w') as fp:
+        for record in screed.open(partfile):
+            fp.write('@%s\n%s\n+\n%s\n' % (record.name, record.sequence,
+                                            'I' * len(record.sequence)))
+
+    # the formats are checked before anything is written.
+    script = 'extract-partitions.py'
+    args = ['-U', 'extracted', partfile, fq_partfile]
+    status, out, err = utils.runscript(script, args, in_dir, fail_ok=True)
+    assert status != 0
+    assert "all input files must be FASTA if the first one is" in err, err
+    assert not os.path.exists(os.path.join(in_dir, 'extracted.unassigned.fa'))
+
+
 def test_extract_partitions_no_output_groups():
     seqfile = utils.get_test_data('random-20-a.fq')
     graphbase = _make_graph(
@@ -1518,6 +1599,34 @@ def test_extract_partitions_multi_groups():
     assert os.path.exists(groupfile3)
 
 
+def test_extract_partitions_multi_groups_gzip():
+    basefile = utils.get_test_data('random-20-a.fa.part')
+    partfile = utils.get_temp_filename('random-20-a.fa.part')
+    shutil.copyfile(basefile, partfile)
+
+    in_dir = os.path.dirname(partfile)
+
+    script = 'extract-partitions.py'
+    args = ['-m', '1', '-X', '1', '--gzip', 'extracted', partfile]
+
+    utils.runscript(script, args, in_dir)
+
+    counts = {}
+    for record in screed.open(partfile):
+        pid = int(record.name.rsplit('\t', 1)[1])
+        counts[pid] = counts.get(pid, 0) + 1
+    expected = sorted(record.name for record in screed.open(partfile)
+                      if counts[int(record.name.rsplit('\t', 1)[1])] > 1 and
+                      not record.name.endswith('\t0'))
+
+    groupfiles = glob.glob(os.path.join(in_dir, 'extracted.group*.fa'))
+    assert len(groupfiles) > 1
+    names = []
+    for groupfile in groupfiles:
+        names.extend(record.name for record in screed.open(groupfile))
+    assert sorted(names) == expected
+
+
 def test_extract_partitions_no_groups():
     empty_file = utils.get_temp_filename('empty-file')
     basefile = utils.get_test_data('empty-file')
@@ -1717,6 +1826,25 @@ def test_do_partition():
     assert len(parts) == 1
 
 
+def test_do_partition_keep_subsets():
+    seqfile = utils.get_test_data('random-20-a.fa')
+    graphbase = utils.get_temp_filename('out')
+    in_dir = os.path.dirname(graphbase)
+
+    script = 'do-partition.py'
+    args = ["-k", "21", "-s", "1e3", "--keep-subsets", graphbase, seqfile]
+
+    _, _, err = utils.runscript(script, args, in_dir)
+    assert '--subset-size is ignored' in err, err
+
+    assert open(graphbase + '.info').read() == '1 subsets total\n'
+
+    ht = khmer.Nodegraph(21, 1e6, 2)
+    ht.consume_fasta_and_tag(seqfile)
+    ht.merge_subset_from_disk(graphbase + '.subset.0.pmap')
+    assert ht.count_partitions() == (99, 0)
+
+
 def test_do_partition_2():
     # test with K=21 (no joining of sequences)
     seqfile = utils.get_test_data('random-20-a.fa')
@@ -3250,6 +3378,28 @@ def test_trim_low_abund_1():
     assert 'GGTTGACGGGGCTCAGGG' in seqs
 
 
+def test_trim_low_abund_1_single_output_gzip():
+    infile = utils.get_temp_filename('test.fa')
+    infile2 = utils.get_temp_filename('test2.fa')
+    outfile = utils.get_temp_filename('out.fa.gz')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile)
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.fa'), infile2)
+
+    args = ["-k", "17", "-x", "1e7", "-N", "2", "--gzip", "-o", outfile,
+            infile, infile2]
+    utils.runscript('trim-low-abund.py', args, in_dir)
+
+    seqs = set([r.sequence for r in screed.open(outfile)])
+    assert 'GGTTGACGGGGCTCAGGG' in seqs
+
+    # both inputs went through one writer, as a single gzip stream.
+    gz = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    gz.decompress(open(outfile, 'rb').read())
+    assert gz.eof and not gz.unused_data
+
+
 def test_trim_low_abund_1_duplicate_filename_err():
     infile = utils.get_temp_filename('test.fa')
     in_dir = os.path.dirname(infile)
@@ -3519,6 +3669,45 @@ def test_trim_low_abund_trimtest_savegraph():
             assert record.sequence == \
                 'GGTTGACGGGGCTCAGGGGGCGGCTGACTCCGAGAGACAGCA'
 
+
+def test_trim_low_abund_pass2_spill():
+    infile = utils.get_temp_filename('test.fq')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('test-abund-read-2.paired.fq'), infile)
+
+    outputs = []
+    for pass2_memory in ('1e9', '100'):
+        args = ["-k", "17", "-x", "1e7", "-N", "2", "-Z", "2", "-C", "2",
+                "-V", "--pass2-memory", pass2_memory, infile]
+        _, out, err = utils.runscript('trim-low-abund.py', args, in_dir)
+
+        with open(infile + '.abundtrim') as fp:
+            outputs.append(fp.read())
+
+    assert 'spilled to disk' in err
+    assert outputs[0] == outputs[1]
+    assert 'seqtrim/1' in outputs[1]
+
+
+def test_trim_low_abund_threads():
+    infile = utils.get_temp_filename('test.fq')
+    in_dir = os.path.dirname(infile)
+
+    shutil.copyfile(utils.get_test_data('paired-mixed.fq'), infile)
+
+    args = ["-k", "17", "-x", "1e7", "-N", "2", "-Z", "2", "-C", "2",
+            "--threads", "3", infile]
+    _, out, err = utils.runscript('trim-low-abund.py', args, in_dir)
+
+    assert 'read 11 reads' in err, err
+    names = [r.name for r in screed.open(infile + '.abundtrim')]
+    assert names
+    # pairs are kept together.
+    for n, name in enumerate(names):
+        if name.endswith('/1') and name[:-1] + '2' in names:
+            assert names[n + 1] == name[:-1] + '2'
+
 # test that -o/--out option outputs to STDOUT
 
 
@@ -3624,6 +3813,21 @@ def test_unique_kmers_defaults():
     assert 'Total estimated number of unique 20-mers: 3950' in err
 
 
+def test_unique_kmers_rolling_hash():
+    infile = utils.get_temp_filename('random-20-a.fa')
+    shutil.copyfile(utils.get_test_data('random-20-a.fa'), infile)
+
+    args = ['-k', '20', '-e', '0.01', '--rolling-hash', infile]
+
+    _, out, err = utils.runscript('unique-kmers.py', args,
+                                  os.path.dirname(infile))
+
+    total = [line for line in err.splitlines()
+             if line.startswith('Total estimated number of unique 20-mers:')]
+    assert len(total) == 1, err
+    assert abs(int(total[0].split()[-1]) - 3960) < 3960 * 0.01
+
+
 def test_unique_kmers_streaming():
     infile = utils.get_temp_filename('random-20-a.fa')
     shutil.copyfile(utils.get_test_data('random-20-a.fa'), infile)
@@ -3694,3 +3898,73 @@ def test_unique_kmers_multiple_inputs():
     assert ('Estimated number of unique 20-mers in {0}: 232'.format(infiles[1])
             in err)
     assert 'Total estimated number of unique 20-mers: 4170' in err
+
+
+def test_unique_kmers_save_and_merge_hll():
+    infiles = []
+    hllfiles = []
+    for fname in ('random-20-a.fa', 'paired-mixed.fa'):
+        infile = utils.get_temp_filename(fname)
+        shutil.copyfile(utils.get_test_data(fname), infile)
+        infiles.append(infile)
+        hllfiles.append(infile + '.hll')
+
+        args = ['-k', '20', '-e', '0.01', '--save-hll', hllfiles[-1], infile]
+        utils.runscript('unique-kmers.py', args, os.path.dirname(infile))
+        assert os.path.exists(hllfiles[-1])
+
+    args = ['--merge-hll'] + hllfiles
+    _, out, err = utils.runscript('unique-kmers.py', args,
+                                  os.path.dirname(infile))
+
+    err = err.splitlines()
+    assert ('Estimated number of unique 20-mers in {0}: 3950'
+            .format(hllfiles[0]) in err)
+    assert ('Estimated number of unique 20-mers in {0}: 232'
+            .format(hllfiles[1]) in err)
+    assert 'Total estimated number of unique 20-mers: 4170' in err
+
+
+def test_unique_kmers_merge_hll_error_rate():
+    infile = utils.get_temp_filename('random-20-a.fa')
+    shutil.copyfile(utils.get_test_data('random-20-a.fa'), infile)
+    hllfile = infile + '.hll'
+
+    args = ['-k', '20', '-e', '0.05', '--save-hll', hllfile, infile]
+    utils.runscript('unique-kmers.py', args, os.path.dirname(infile))
+
+    # the report uses the saved counter's error rate, not --error-rate's.
+    args = ['--merge-hll', '--diagnostics', hllfile]
+    _, out, err = utils.runscript('unique-kmers.py', args,
+                                  os.path.dirname(infile))
+    error_rate = khmer.load_hllcounter(hllfile).error_rate
+    assert abs(error_rate - 0.05) < 0.01 and error_rate != 0.01
+    assert 'false positive rate: \t{0:.3f}'.format(error_rate) in err, err
+
+
+def test_unique_kmers_merge_hll_mismatch():
+    infile = utils.get_temp_filename('random-20-a.fa')
+    shutil.copyfile(utils.get_test_data('random-20-a.fa'), infile)
+
+    hllfiles = []
+    for ksize in ('20', '21'):
+        hllfiles.append(utils.get_temp_filename(ksize + '.hll'))
+        args = ['-k', ksize, '--save-hll', hllfiles[-1], infile]
+        utils.runscript('unique-kmers.py', args, os.path.dirname(infile))
+
+    args = ['--merge-hll'] + hllfiles
+    status, out, err = utils.runscript('unique-kmers.py', args,
+                                       os.path.dirname(infile), fail_ok=True)
+    assert status == 1
+    assert 'not counted with the same k-mer size' in err, err
+
+
+def test_unique_kmers_merge_hll_not_hll():
+    infile = utils.get_temp_filename('random-20-a.fa')
+    shutil.copyfile(utils.get_test_data('random-20-a.fa'), infile)
+
+    args = ['--merge-hll', infile]
+    status, out, err = utils.runscript('unique-kmers.py', args,
+                                       os.path.dirname(infile), fail_ok=True)
+    assert status == 1
+    assert 'cannot load HLL counter' in err, err
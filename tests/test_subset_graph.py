@@ -11,6 +11,8 @@ import khmer
 import screed
 
 import os
+import random
+import struct
 from . import khmer_tst_utils as utils
 
 
@@ -528,6 +530,192 @@ def test_output_partitions():
 test_output_partitions.runme = True
 
 
+def test_join_partitions_keeps_larger():
+    ht = khmer._Nodegraph(10, [1])
+    kmers = ['AAAAAAAAAC', 'AAAAAAAACA', 'AAAAAAACAA', 'AAAAAACAAA']
+    for i, kmer in enumerate(kmers):
+        ht.set_partition_id(kmer, i + 2)
+
+    assert ht.join_partitions(3, 4) == 3
+
+    # partition 3 now holds two partitions, so it wins over 2.
+    assert ht.join_partitions(2, 3) == 2
+    assert [ht.get_partition_id(k) for k in kmers] == [3, 3, 3, 5]
+
+    # partition 2 is gone.
+    assert ht.join_partitions(2, 5) == 0
+
+    outfile = utils.get_temp_filename('join.pmap')
+    ht.save_partitionmap(outfile)
+
+    ht2 = khmer._Nodegraph(10, [1])
+    ht2.load_partitionmap(outfile)
+    pids = [ht2.get_partition_id(k) for k in kmers]
+    assert pids[0] == pids[1] == pids[2]
+    assert pids[3] not in (0, pids[0])
+
+
+def _partition_groups(ht, filename):
+    outfile = utils.get_temp_filename('groups.part')
+    ht.output_partitions(filename, outfile)
+
+    groups = {}
+    for record in screed.open(outfile):
+        name, pid = record.name.split('\t')
+        groups.setdefault(pid, set()).add(name)
+    return sorted(sorted(names) for names in groups.values())
+
+
+def test_partition_graph_matches_subsets():
+    filename = utils.get_test_data('random-20-a.fa')
+
+    for ksize, n_expected in ((20, 1), (21, 99)):
+        ht = khmer.Nodegraph(ksize, 1e6, 2)
+        total_reads, _ = ht.consume_fasta_and_tag(filename)
+        divvy = ht.divide_tags_into_subsets(total_reads // 3)
+        divvy.append(0)
+        for start, end in zip(divvy, divvy[1:]):
+            ht.merge_subset(ht.do_subset_partition(start, end))
+        expected = _partition_groups(ht, filename)
+        assert len(expected) == n_expected
+
+        for n_threads in (1, 4):
+            ht = khmer.Nodegraph(ksize, 1e6, 2)
+            ht.consume_fasta_and_tag(filename)
+            ht.partition_graph(n_threads)
+
+            assert ht.count_partitions() == (n_expected, 0)
+            assert _partition_groups(ht, filename) == expected
+
+
+def test_partition_graph_stop_big_traversals():
+    filename = utils.get_test_data('biglump-random-20-a.fa')
+
+    ht = khmer.Nodegraph(20, 1e7, 2)
+    ht.consume_fasta_and_tag(filename)
+    ht.merge_subset(ht.do_subset_partition(0, 0, True, True))
+    expected = ht.count_partitions()
+    assert expected == (4, 55)      # broken at the knot
+
+    for n_threads in (1, 4):
+        ht = khmer.Nodegraph(20, 1e7, 2)
+        ht.consume_fasta_and_tag(filename)
+        ht.partition_graph(n_threads, True, True)
+        assert ht.count_partitions() == expected
+
+
+def test_partition_graph_empty():
+    ht = khmer.Nodegraph(20, 4 ** 7 + 1, 2)
+    ht.partition_graph(2)
+    assert ht.count_partitions() == (0, 0)
+
+
+def test_save_load_pmap_many_blocks():
+    # enough tags to spread over several compressed blocks.
+    random.seed(1)
+    kmers = set()
+    while len(kmers) < 150000:
+        kmers.add(''.join(random.choice('ACGT') for _ in range(20)))
+    kmers = sorted(kmers)
+
+    ht = khmer._Nodegraph(20, [1])
+    for i, kmer in enumerate(kmers):
+        ht.set_partition_id(kmer, i % 7 + 1)
+
+    outfile = utils.get_temp_filename('many.pmap')
+    ht.save_partitionmap(outfile)
+
+    ht2 = khmer._Nodegraph(20, [1])
+    ht2.load_partitionmap(outfile)
+    mapping = set((i % 7 + 1, ht2.get_partition_id(kmer))
+                  for i, kmer in enumerate(kmers))
+    assert len(mapping) == 7
+    assert len(set(pid for _, pid in mapping)) == 7
+
+
+def test_load_flat_pmap():
+    # the unpacked format written by earlier versions is still readable.
+    ht = khmer._Nodegraph(10, [1])
+    kmers = ['AAAAAAAAAC', 'AAAAAAAACA', 'AAAAAAACAA']
+    tags = [khmer.forward_hash(kmer, 10) for kmer in kmers]
+    records = sorted(zip(tags, [5, 9, 5]))
+
+    outfile = utils.get_temp_filename('flat.pmap')
+    with open(outfile, 'wb') as fp:
+        fp.write(b'OXLI' + struct.pack('<BBIQ', 4, 5, 10, len(records)))
+        for tag, pid in records:
+            fp.write(struct.pack('<QI', tag, pid))
+
+    ht.load_partitionmap(outfile)
+    pids = [ht.get_partition_id(kmer) for kmer in kmers]
+    assert pids[0] == pids[2] != pids[1]
+    assert 0 not in pids
+
+    # chop off part of the last record.
+    with open(outfile, 'r+b') as fp:
+        fp.truncate(os.path.getsize(outfile) - 4)
+    try:
+        khmer._Nodegraph(10, [1]).load_partitionmap(outfile)
+        assert 0, "this should fail"
+    except OSError as e:
+        print(str(e))
+
+
+def test_load_corrupt_packed_pmap():
+    ht = khmer._Nodegraph(10, [1])
+    ht.set_partition_id('AAAAAAAAAC', 2)
+    ht.set_partition_id('AAAAAAAACA', 3)
+
+    outfile = utils.get_temp_filename('corrupt.pmap')
+    ht.save_partitionmap(outfile)
+
+    with open(outfile, 'r+b') as fp:
+        fp.seek(-3, os.SEEK_END)
+        fp.write(b'\xff\xff\xff')
+    try:
+        khmer._Nodegraph(10, [1]).load_partitionmap(outfile)
+        assert 0, "this should fail"
+    except OSError as e:
+        print(str(e))
+
+
+def test_merge_partitionmap_files():
+    filename = utils.get_test_data('random-20-a.fa')
+
+    ht = khmer.Nodegraph(21, 1e6, 2)
+    total_reads, _ = ht.consume_fasta_and_tag(filename)
+    divvy = ht.divide_tags_into_subsets(total_reads // 3)
+    divvy.append(0)
+
+    pmap_files = []
+    for start, end in zip(divvy, divvy[1:]):
+        pmap_file = utils.get_temp_filename('%d.pmap' % len(pmap_files))
+        ht.save_subset_partitionmap(ht.do_subset_partition(start, end),
+                                    pmap_file)
+        pmap_files.append(pmap_file)
+
+    for pmap_file in pmap_files:
+        ht.merge_subset_from_disk(pmap_file)
+    expected = _partition_groups(ht, filename)
+
+    merged_file = utils.get_temp_filename('merged.pmap')
+    khmer.Nodegraph(21, 1, 1).merge_partitionmap_files(pmap_files,
+                                                       merged_file)
+
+    ht = khmer.Nodegraph(21, 1e6, 2)
+    ht.consume_fasta_and_tag(filename)
+    ht.load_partitionmap(merged_file)
+    assert _partition_groups(ht, filename) == expected
+    assert ht.count_partitions() == (99, 0)
+
+    try:
+        khmer.Nodegraph(20, 1, 1).merge_partitionmap_files(pmap_files,
+                                                           merged_file)
+        assert 0, "this should fail"
+    except OSError as e:
+        print(str(e))
+
+
 def test_tiny_real_partitions():
     filename = utils.get_test_data('real-partition-tiny.fa')
 
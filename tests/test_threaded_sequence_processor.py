@@ -1,5 +1,6 @@
 import sys
 from khmer.thread_utils import ThreadedSequenceProcessor, SequenceGroup
+from khmer.thread_utils import BatchSequenceProcessor
 from io import StringIO
 from screed.fasta import fasta_iter
 from screed.fastq import fastq_iter
@@ -205,3 +206,24 @@ def test_paired_2thread_more_seq():
     assert x['a/2'] == 'TTT'
     assert x['b/1'] == 'AAA'
     assert x['c/2'] == 'AAA'
+
+
+def test_batch_2thread():
+    def drop_a(records):
+        assert len(records) <= 2
+        return [(None, None) if r['name'] == 'a' else
+                (r['name'], r['sequence'][:2]) for r in records]
+
+    tsp = BatchSequenceProcessor(drop_a, 2, 2, verbose=False)
+
+    input = [dict(name='a', sequence='AAA'),
+             dict(name='b', sequence='TTT'),
+             dict(name='c', sequence='GGG'), ]
+    outfp = StringIO()
+
+    tsp.start(input, outfp)
+
+    x = load_records_d(outfp)
+    assert len(x) == 2, x
+    assert x['b'] == 'TT'
+    assert x['c'] == 'GG'